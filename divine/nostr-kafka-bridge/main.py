@@ -131,7 +131,8 @@ def _wrap_nostr_event(event: dict) -> dict:
         'data': {
             'action_id': str(_next_action_id()),
             'action_name': f'nostr_kind_{kind}',
-            'data': data,
+            # As a string of JSON, which the worker keeps and stores as is rather than encoding the data again
+            'data': json.dumps(data),
         },
     }
 
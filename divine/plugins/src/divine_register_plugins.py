@@ -29,7 +29,11 @@ def register_output_sinks(config: Config) -> Sequence[BaseOutputSink]:
     # ClickHouse output sink for query UI
     if config.get_bool('OSPREY_CLICKHOUSE_OUTPUT_SINK', False):
         import clickhouse_connect
-        from osprey.worker.sinks.sink.clickhouse_output_sink import ClickHouseOutputSink
+        from osprey.worker.sinks.sink.clickhouse_output_sink import (
+            DEFAULT_FLUSH_INTERVAL_SECONDS,
+            DEFAULT_MAX_PENDING_ROWS,
+            ClickHouseOutputSink,
+        )
 
         ch_client = clickhouse_connect.get_client(
             host=config.expect_str('OSPREY_CLICKHOUSE_HOST'),
@@ -44,6 +48,10 @@ def register_output_sinks(config: Config) -> Sequence[BaseOutputSink]:
                 table=config.get_str('OSPREY_CLICKHOUSE_TABLE', 'osprey_events'),
                 database=config.get_str('OSPREY_CLICKHOUSE_DATABASE', 'osprey'),
                 batch_size=config.get_int('OSPREY_CLICKHOUSE_BATCH_SIZE', 100),
+                flush_interval_seconds=config.get_float(
+                    'OSPREY_CLICKHOUSE_FLUSH_INTERVAL_SECONDS', DEFAULT_FLUSH_INTERVAL_SECONDS
+                ),
+                max_pending_rows=config.get_int('OSPREY_CLICKHOUSE_MAX_PENDING_ROWS', DEFAULT_MAX_PENDING_ROWS),
             )
         )
 
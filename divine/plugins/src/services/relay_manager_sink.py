@@ -24,6 +24,9 @@ class RelayManagerSink(BaseOutputSink):
 
     timeout: float = 5.0
     max_retries: int = 2
+    # Bans are the point of the rules, so don't ack events before they are applied.
+    durable: bool = True
+    workers: int = 4
 
     def __init__(self, relay_manager_url: str | None = None) -> None:
         self._url = relay_manager_url or os.environ.get('DIVINE_RELAY_MANAGER_URL', DEFAULT_RELAY_MANAGER_URL)
@@ -1,11 +1,12 @@
 from contextlib import contextmanager
-from typing import Any, Generator
+from typing import Any, Dict, Generator, List, Sequence
 
 from osprey.engine.language_types.entities import EntityT
 from osprey.worker.lib.osprey_shared.labels import EntityLabels
 from osprey.worker.lib.osprey_shared.logging import get_logger
 from osprey.worker.lib.storage.labels import LabelsServiceBase
 from osprey.worker.lib.storage.postgres import Model, init_from_config, scoped_session
+from result import Err, Ok, Result
 from sqlalchemy import Column, String, select
 from sqlalchemy.dialects.postgresql import JSONB, insert
 
@@ -69,6 +70,37 @@ class PostgresLabelsService(LabelsServiceBase):
             logger.debug(f'Read labels for entity {entity_key}', result)
             return labels
 
+    def batch_read_labels(self, entities: Sequence[EntityT[Any]]) -> Sequence[Result[EntityLabels, Exception]]:
+        """
+        Read labels for many entities from PostgreSQL with a single `WHERE entity_key IN (...)` query.
+
+        Results are in the same order as the entities, and entities without labels get an empty EntityLabels.
+        """
+        if not entities:
+            return []
+
+        entity_keys = [str(entity) for entity in entities]
+
+        with scoped_session(database=self._database_name) as session:
+            stmt = select(EntityLabelsModel.entity_key, EntityLabelsModel.labels).where(
+                EntityLabelsModel.entity_key.in_(set(entity_keys))
+            )
+            serialized_labels_by_key: Dict[str, Any] = {row.entity_key: row.labels for row in session.execute(stmt)}
+
+        logger.debug(f'Read labels for {len(serialized_labels_by_key)} of {len(entity_keys)} entities')
+
+        results: List[Result[EntityLabels, Exception]] = []
+        for entity_key in entity_keys:
+            serialized_labels = serialized_labels_by_key.get(entity_key)
+            if serialized_labels is None:
+                results.append(Ok(EntityLabels()))
+                continue
+            try:
+                results.append(Ok(EntityLabels.deserialize(serialized_labels)))
+            except Exception as e:
+                results.append(Err(e))
+        return results
+
     @contextmanager
     def read_modify_write_labels_atomically(self, entity: EntityT[Any]) -> Generator[EntityLabels, None, None]:
         """
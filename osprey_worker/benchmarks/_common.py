@@ -0,0 +1,132 @@
+"""Shared helpers for the executor micro-benchmarks in this directory.
+
+These are not part of the test suite. Run them directly, with tracing and statsd disabled so that the numbers
+aren't dominated by failed agent connections, eg:
+
+    DD_TRACE_ENABLED=False DD_DOGSTATSD_DISABLE=True \
+        uv run python osprey_worker/benchmarks/bench_executor.py --rules 200 --iterations 2000
+"""
+
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from osprey.engine.ast.sources import Sources
+from osprey.engine.ast_validator import validate_sources
+from osprey.engine.ast_validator.validator_registry import ValidatorRegistry
+from osprey.engine.config.config_registry import ConfigRegistry
+from osprey.engine.executor.execution_context import Action
+from osprey.engine.executor.execution_graph import ExecutionGraph, compile_execution_graph
+from osprey.engine.stdlib import get_config_registry
+from osprey.engine.udf.registry import UDFRegistry
+
+EXAMPLE_RULES_PATH = Path(__file__).resolve().parents[2] / 'example_rules'
+EXAMPLE_PLUGINS_PATH = Path(__file__).resolve().parents[2] / 'example_plugins' / 'src'
+
+
+def stdlib_udf_registry() -> UDFRegistry:
+    from osprey.engine.stdlib.udfs.labels import HasLabel, LabelAdd, LabelRemove
+    from osprey.worker._stdlibplugin.udf_register import register_udfs
+
+    return UDFRegistry.with_udfs(*register_udfs(), HasLabel, LabelAdd, LabelRemove)
+
+
+def stdlib_validator_registry(config_registry: Optional[ConfigRegistry] = None) -> ValidatorRegistry:
+    from osprey.worker._stdlibplugin.validator_regsiter import register_ast_validators
+
+    registry = ValidatorRegistry.from_validator_classes(set(register_ast_validators()))
+    registry.register((config_registry or get_config_registry()).get_validator())
+    return registry
+
+
+def synthetic_sources(num_rule_files: int, rules_per_file: int = 4) -> Sources:
+    """Builds a rule set shaped like a production one: a shared model file, one file per action, and many
+    rule files that are pulled in through `Require`."""
+    files: Dict[str, str] = {}
+    files['models/base.sml'] = '\n'.join(
+        [
+            'ActionName = GetActionName()',
+            "UserId: str = JsonData(path='$.user_id', coerce_type=True)",
+            "Text: str = JsonData(path='$.post.text', required=False, coerce_type=True)",
+            "Score: int = JsonData(path='$.score', required=False, coerce_type=True)",
+            "Tags: List[str] = JsonData(path='$.tags', required=False)",
+            'LowerText = StringToLower(s=Text)',
+            'TextLength = StringLength(s=Text)',
+        ]
+    )
+    requires: List[str] = []
+    for file_index in range(num_rule_files):
+        path = f'rules/rule_{file_index}.sml'
+        lines = ["Import(rules=['models/base.sml'])"]
+        for rule_index in range(rules_per_file):
+            name = f'Rule_{file_index}_{rule_index}'
+            lines.append(
+                f"_Contains_{rule_index} = StringStartsWith(s=LowerText, start='w{file_index}_{rule_index}')\n"
+                f'{name} = Rule(\n'
+                f'  when_all=[_Contains_{rule_index}, TextLength > {rule_index}, Score != {file_index}],\n'
+                f"  description='synthetic rule {file_index}/{rule_index}',\n"
+                ')'
+            )
+        files[path] = '\n'.join(lines)
+        requires.append(f"Require(rule='{path}')")
+
+    files['main.sml'] = '\n'.join(["Import(rules=['models/base.sml'])", *requires])
+    return Sources.from_dict(files)
+
+
+def compile_sources(
+    sources: Sources, udf_registry: Optional[UDFRegistry] = None, config_registry: Optional[ConfigRegistry] = None
+) -> ExecutionGraph:
+    if udf_registry is None:
+        udf_registry = stdlib_udf_registry()
+    validated_sources = validate_sources(sources, udf_registry, stdlib_validator_registry(config_registry))
+    return compile_execution_graph(validated_sources)
+
+
+def compile_example_rules() -> ExecutionGraph:
+    """Compiles the rules in `example_rules`, with the UDFs from `example_plugins` and the worker's config subkeys."""
+    if str(EXAMPLE_PLUGINS_PATH) not in sys.path:
+        sys.path.insert(0, str(EXAMPLE_PLUGINS_PATH))
+    from osprey.worker.lib.sources_config import get_config_registry as get_worker_config_registry
+    from udfs.ban_user import BanUser
+    from udfs.text_contains import TextContains
+
+    udf_registry = stdlib_udf_registry()
+    udf_registry.register(BanUser)
+    udf_registry.register(TextContains)
+    return compile_sources(Sources.from_path(EXAMPLE_RULES_PATH), udf_registry, get_worker_config_registry())
+
+
+def make_action(action_id: int = 1, data: Optional[Dict[str, Any]] = None) -> Action:
+    return Action(
+        action_id=action_id,
+        action_name='create_post',
+        data=data
+        if data is not None
+        else {
+            'event_type': 'create_post',
+            'user_id': '1234',
+            'post': {'text': f'W1_1 hello world {action_id}'},
+            'score': action_id % 7,
+            'tags': ['a', 'b'],
+        },
+        timestamp=datetime.now(),
+    )
+
+
+def time_it(fn: Callable[[], Any], iterations: int, warmup: int = 50) -> Tuple[float, float]:
+    """Runs `fn` `iterations` times, returning (total seconds, per-call microseconds)."""
+    for _ in range(warmup):
+        fn()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed / iterations * 1e6
+
+
+def report(name: str, iterations: int, elapsed: float, per_call_us: float) -> None:
+    print(f'{name:<48} {iterations:>8} iters {elapsed:>8.3f}s {per_call_us:>10.1f} us/iter')
@@ -0,0 +1,105 @@
+"""Measures the per-message cost of decoding the actions consumed by the rules sink.
+
+Compares the input streams' decoders against how messages used to be decoded: parsing Kafka timestamps with the
+general date parser, trying the old PubSub msgpack format before the new one, and looking up the proto deserializer
+plugin for every message.
+
+uv run python osprey_worker/benchmarks/bench_action_decoding.py --iterations 20000
+"""
+
+import argparse
+import json
+from typing import Any, Dict
+
+import msgpack
+from _common import make_action, report, time_it
+from dateutil import parser as date_parser
+from osprey.engine.executor.execution_context import Action
+from osprey.worker.adaptor.plugin_manager import bootstrap_action_proto_deserializer
+from osprey.worker.sinks.utils.action_decoding import PubSubActionDecoder, decode_kafka_action
+
+SEND_TIME = '2024-05-01T12:34:56.123456789Z'
+
+
+def kafka_value(data_as_json: bool = False) -> bytes:
+    action = make_action(1234)
+    data: Any = json.dumps(action.data) if data_as_json else action.data
+    envelope = {
+        'send_time': SEND_TIME,
+        'data': {'action_id': action.action_id, 'action_name': action.action_name, 'data': data},
+    }
+    return json.dumps(envelope).encode('utf-8')
+
+
+def pubsub_data() -> bytes:
+    action = make_action(1234)
+    action_dict: Dict[str, Any] = {'id': action.action_id, 'name': action.action_name, 'data': action.data}
+    return msgpack.dumps(json.dumps(action_dict))
+
+
+def decode_kafka_action_before(value: bytes) -> Action:
+    envelope = json.loads(value)
+    action_data = envelope['data']
+    return Action(
+        action_id=int(action_data['action_id']),
+        action_name=action_data['action_name'],
+        data=action_data['data'],
+        timestamp=date_parser.parse(envelope['send_time']),
+    )
+
+
+def decode_pubsub_action_before(data: bytes) -> Action:
+    try:
+        action = msgpack.loads(data)
+        return Action(
+            action_id=int(action['id']),
+            action_name=action['name'],
+            data=action['data'],
+            secret_data=action.get('secret_data', {}),
+            timestamp=None,
+        )
+    except Exception:
+        action = json.loads(msgpack.loads(data))
+        return Action(
+            action_id=int(action['id']),
+            action_name=action['name'],
+            data=action['data'],
+            secret_data=action.get('secret_data', {}),
+            timestamp=None,
+        )
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--iterations', type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    value = kafka_value()
+    assert decode_kafka_action(value) == decode_kafka_action_before(value)
+    elapsed, per_call = time_it(lambda: decode_kafka_action_before(value), args.iterations)
+    report('kafka json, general date parser', args.iterations, elapsed, per_call)
+    elapsed, per_call = time_it(lambda: decode_kafka_action(value), args.iterations)
+    report('kafka json, decode_kafka_action', args.iterations, elapsed, per_call)
+
+    # Decoding and then encoding the data again for the output sinks, unless it was sent as a string of JSON.
+    elapsed, per_call = time_it(lambda: decode_kafka_action(value).data_json, args.iterations)
+    report('kafka json + data_json', args.iterations, elapsed, per_call)
+    value_with_data_json = kafka_value(data_as_json=True)
+    elapsed, per_call = time_it(lambda: decode_kafka_action(value_with_data_json).data_json, args.iterations)
+    report('kafka json, data as a string + data_json', args.iterations, elapsed, per_call)
+
+    data = pubsub_data()
+    decoder = PubSubActionDecoder()
+    assert decoder.decode(data, 'msgpack', None) == decode_pubsub_action_before(data)
+    elapsed, per_call = time_it(lambda: decode_pubsub_action_before(data), args.iterations)
+    report('pubsub msgpack, try old format first', args.iterations, elapsed, per_call)
+    elapsed, per_call = time_it(lambda: decoder.decode(data, 'msgpack', None), args.iterations)
+    report('pubsub msgpack, PubSubActionDecoder', args.iterations, elapsed, per_call)
+
+    # What every proto message paid before the deserializer was kept by the stream's decoder.
+    elapsed, per_call = time_it(bootstrap_action_proto_deserializer, args.iterations)
+    report('proto deserializer lookup', args.iterations, elapsed, per_call)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Measures how the executor copes with many async nodes in flight at once.
+
+Each action fans out into `--width` independent async UDF calls, each followed by a short chain of dependent calls, so
+that the executor has to keep handling completions while most of the calls are still in progress.
+
+uv run python osprey_worker/benchmarks/bench_async_completion.py --width 500 --iterations 50
+"""
+
+import argparse
+
+import gevent
+import gevent.pool
+from _common import compile_sources, make_action, report, stdlib_udf_registry, time_it
+from osprey.engine.ast.sources import Sources
+from osprey.engine.executor.execution_context import ExecutionContext
+from osprey.engine.executor.executor import execute
+from osprey.engine.executor.udf_execution_helpers import UDFHelpers
+from osprey.engine.udf.arguments import ArgumentsBase
+from osprey.engine.udf.base import UDFBase
+
+
+class BenchAsyncArguments(ArgumentsBase):
+    value: int
+
+
+class BenchAsync(UDFBase[BenchAsyncArguments, int]):
+    """Yields to the hub a varying number of times, so that calls finish in a different order than they started."""
+
+    execute_async = True
+
+    def execute(self, execution_context: ExecutionContext, arguments: BenchAsyncArguments) -> int:
+        for _ in range(arguments.value % 3):
+            gevent.sleep(0)
+        return arguments.value + 1
+
+
+def fan_out_sources(width: int, depth: int) -> Sources:
+    lines = []
+    for i in range(width):
+        lines.append(f'Fan_{i}_0 = BenchAsync(value={i})')
+        for j in range(1, depth):
+            lines.append(f'Fan_{i}_{j} = BenchAsync(value=Fan_{i}_{j - 1})')
+    return Sources.from_dict({'main.sml': '\n'.join(lines)})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--width', type=int, default=500, help='Number of independent async call chains.')
+    parser.add_argument('--depth', type=int, default=3, help='Number of dependent async calls in each chain.')
+    parser.add_argument('--pool', type=int, default=0, help='Async pool size, 0 for unbounded.')
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    udf_registry = stdlib_udf_registry()
+    udf_registry.register(BenchAsync)
+    graph = compile_sources(fan_out_sources(args.width, args.depth), udf_registry)
+    helpers = UDFHelpers()
+    action = make_action()
+    pool_size = args.pool or None
+
+    elapsed, per_call = time_it(
+        lambda: execute(graph, helpers, action, gevent.pool.Pool(pool_size)), args.iterations, warmup=5
+    )
+    report(f'execute ({args.width * args.depth} async nodes)', args.iterations, elapsed, per_call)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Measures what output sinks spend turning an execution result into what they send.
+
+A result fans out to the Kafka, stored execution result, label and verdict sinks, which each need an encoding of it.
+This compares reading those through the result's shared views against each sink computing its own.
+
+uv run python osprey_worker/benchmarks/bench_execution_result_views.py --iterations 20000
+"""
+
+import argparse
+import json
+from typing import Any, Dict
+
+from _common import make_action, report, time_it
+from osprey.engine.executor.execution_context import (
+    ExecutionResult,
+    _get_error_traces_json,
+    _get_verdicts_pb2_proto,
+)
+from osprey.engine.language_types.entities import EntityT
+from osprey.engine.language_types.labels import LabelEffect
+from osprey.engine.language_types.rules import RuleT
+from osprey.engine.language_types.verdicts import VerdictEffect
+from osprey.worker.lib.osprey_shared.labels import LabelStatus
+from osprey.worker.sinks.sink.output_sink import LABEL_MUTATIONS, _get_label_effects_from_result
+
+
+def make_result(action_id: int) -> ExecutionResult:
+    rule = RuleT(name='SpamRule', value=True, description='spam', features={'UserId': '1234'})
+    features: Dict[str, Any] = {f'Feature{i}': f'value {i} {action_id}' for i in range(40)}
+    features.update({'ActionName': 'create_post', 'UserId': '1234', 'Score': action_id % 7})
+    return ExecutionResult(
+        extracted_features=features,
+        action=make_action(action_id),
+        effects={
+            LabelEffect: [
+                LabelEffect(entity=EntityT(type='User', id='1234'), status=LabelStatus.ADDED, name='spam', rules=[rule])
+            ],
+            VerdictEffect: [VerdictEffect(verdict='reject', rules=[rule])],
+        },
+        error_infos=[],
+    )
+
+
+def consume_shared(result: ExecutionResult) -> None:
+    # Kafka
+    result.extracted_features_json_bytes
+    # Stored execution results
+    result.extracted_features_json
+    result.error_traces_json
+    result.action.data_json
+    # Labels, in `will_do_work` and then `push`
+    len(result.get_view(LABEL_MUTATIONS))
+    result.get_view(LABEL_MUTATIONS).items()
+    # Verdicts
+    result.get_verdicts_pb2_proto()
+
+
+def consume_separately(result: ExecutionResult) -> None:
+    json.dumps(result.extracted_features).encode('utf-8')
+    json.dumps(result.extracted_features)
+    _get_error_traces_json(result)
+    json.dumps(result.action.data)
+    len(_get_label_effects_from_result(result))
+    _get_label_effects_from_result(result).items()
+    _get_verdicts_pb2_proto(result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    elapsed, per_call = time_it(lambda: make_result(1), args.iterations)
+    report('build result', args.iterations, elapsed, per_call)
+
+    elapsed, per_call = time_it(lambda: consume_separately(make_result(1)), args.iterations)
+    report('build + per-sink encodings', args.iterations, elapsed, per_call)
+
+    elapsed, per_call = time_it(lambda: consume_shared(make_result(1)), args.iterations)
+    report('build + shared views', args.iterations, elapsed, per_call)
+
+
+if __name__ == '__main__':
+    main()
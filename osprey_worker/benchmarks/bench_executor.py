@@ -0,0 +1,54 @@
+"""Measures per-action executor overhead over a synthetic rule set (and optionally the example rules).
+
+uv run python osprey_worker/benchmarks/bench_executor.py --rules 200 --iterations 2000
+"""
+
+import argparse
+
+import gevent.pool
+from _common import compile_sources, make_action, report, synthetic_sources, time_it
+from osprey.engine.executor.execution_context import ExecutionContext
+from osprey.engine.executor.executor import execute, execute_many
+from osprey.engine.executor.udf_execution_helpers import UDFHelpers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rules', type=int, default=200, help='Number of synthetic rule files to generate.')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--window', type=int, default=16, help='Number of actions per `execute_many` call.')
+    parser.add_argument('--short-circuit', action='store_true', help='Skip nodes that can no longer affect the result.')
+    args = parser.parse_args()
+
+    graph = compile_sources(synthetic_sources(args.rules))
+    helpers = UDFHelpers()
+    action = make_action()
+
+    elapsed, per_call = time_it(
+        lambda: ExecutionContext(execution_graph=graph, action=action, helpers=helpers), args.iterations
+    )
+    report('ExecutionContext construction', args.iterations, elapsed, per_call)
+
+    elapsed, per_call = time_it(
+        lambda: execute(graph, helpers, action, async_pool=None, short_circuit=args.short_circuit), args.iterations
+    )
+    report('execute (sync)', args.iterations, elapsed, per_call)
+
+    elapsed, per_call = time_it(
+        lambda: execute(graph, helpers, action, gevent.pool.Pool(12), short_circuit=args.short_circuit), args.iterations
+    )
+    report('execute (async pool)', args.iterations, elapsed, per_call)
+
+    window = [make_action(i) for i in range(args.window)]
+    window_iterations = max(1, args.iterations // args.window)
+    elapsed, per_call = time_it(
+        lambda: execute_many(
+            graph, helpers, window, gevent.pool.Pool(12 * args.window), short_circuit=args.short_circuit
+        ),
+        window_iterations,
+    )
+    report(f'execute_many (window={args.window}, per action)', window_iterations, elapsed, per_call / args.window)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Measures recompiling a synthetic rule set after a push that edits a single rule file, fully and incrementally.
+
+    DD_TRACE_ENABLED=False DD_DOGSTATSD_DISABLE=True \
+        uv run python osprey_worker/benchmarks/bench_incremental_compile.py --rules 500
+"""
+
+import argparse
+import time
+
+from _common import stdlib_udf_registry, stdlib_validator_registry, synthetic_sources
+from osprey.engine.ast.sources import Sources
+from osprey.engine.ast_validator import validate_sources
+from osprey.engine.executor.execution_graph import compile_execution_graph
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rules', type=int, default=500)
+    args = parser.parse_args()
+
+    udf_registry = stdlib_udf_registry()
+    validator_registry = stdlib_validator_registry()
+    sources = synthetic_sources(args.rules)
+    graph = compile_execution_graph(validate_sources(sources, udf_registry, validator_registry))
+
+    # Edit a single rule file, as a typical rule push would.
+    sources_dict = {source.path: source.contents for source in sources}
+    sources_dict['rules/rule_0.sml'] = sources_dict['rules/rule_0.sml'].replace('synthetic rule', 'edited rule')
+    pushed_sources = Sources.from_dict(sources_dict)
+    # Parsed ASTs are cached by source contents, so parse the edited file up front to only measure the compilation.
+    for source in pushed_sources:
+        source.ast_root
+
+    for name, previous in (('full', None), ('incremental', graph)):
+        start = time.perf_counter()
+        validated_sources = validate_sources(
+            pushed_sources, udf_registry, validator_registry, previous=previous.validated_sources if previous else None
+        )
+        validated_at = time.perf_counter()
+        compile_execution_graph(validated_sources, previous=previous)
+        compiled_at = time.perf_counter()
+        print(
+            f'{name:<12} validation {validated_at - start:>7.3f}s  compilation {compiled_at - validated_at:>7.3f}s  '
+            f'total {compiled_at - start:>7.3f}s  ({len(validated_sources.unchanged_sources)} unchanged sources)'
+        )
+
+
+if __name__ == '__main__':
+    main()
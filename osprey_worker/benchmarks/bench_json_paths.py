@@ -0,0 +1,55 @@
+"""Measures the cost of `JsonData` (and `EntityJson`) lookups, with compiled paths and with `jsonpath_rw`.
+
+Looks up every such path of the rules in `example_rules` (and of the synthetic rule set of `bench_executor.py`)
+in the action data the executor benchmarks use.
+
+uv run python osprey_worker/benchmarks/bench_json_paths.py --iterations 20000
+"""
+
+import argparse
+from typing import Any, List
+
+from _common import compile_example_rules, compile_sources, make_action, report, synthetic_sources, time_it
+from osprey.engine.ast_validator.validators.validate_call_kwargs import ValidateCallKwargs
+from osprey.engine.executor.execution_graph import ExecutionGraph
+from osprey.engine.stdlib.udfs.entity import EntityJson
+from osprey.engine.stdlib.udfs.json_data import JsonData
+from osprey.engine.stdlib.udfs.json_utils import MISSING, CompiledJsonPath
+
+
+def json_data_paths(graph: ExecutionGraph) -> List[CompiledJsonPath]:
+    udfs = graph.validated_sources.get_validator_result(ValidateCallKwargs).values()
+    return [udf._expr for udf, _ in udfs if isinstance(udf, (JsonData, EntityJson))]
+
+
+def find_all_compiled(paths: List[CompiledJsonPath], data: Any) -> None:
+    for path in paths:
+        path.find_first(data)
+
+
+def find_all_jsonpath(paths: List[CompiledJsonPath], data: Any) -> None:
+    for path in paths:
+        matches = path.expr.find(data)
+        matches[0].value if matches else MISSING
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    data = make_action(1).data
+    for name, graph in [
+        ('example_rules', compile_example_rules()),
+        ('synthetic', compile_sources(synthetic_sources(num_rule_files=1))),
+    ]:
+        paths = json_data_paths(graph)
+        print(f'{name}: {len(paths)} paths, {sum(path.is_compiled for path in paths)} compiled')
+        elapsed, per_call = time_it(lambda: find_all_jsonpath(paths, data), args.iterations)
+        report(f'{name}, jsonpath_rw', args.iterations, elapsed, per_call)
+        elapsed, per_call = time_it(lambda: find_all_compiled(paths, data), args.iterations)
+        report(f'{name}, compiled', args.iterations, elapsed, per_call)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Measures the cost of counting `udf_execution` for each UDF call, over the example rules.
+
+Compares formatting tags and sending a statsd packet per call (as the executor used to) with the interned tags and
+in-process aggregated counters that it uses now. Unlike the other benchmarks, run this one *with* statsd enabled, so
+that packets are actually built and sent (to an agent or not, they're UDP):
+
+    DD_TRACE_ENABLED=False uv run python osprey_worker/benchmarks/bench_udf_metrics.py --iterations 200000
+"""
+
+import argparse
+
+from _common import compile_example_rules, make_action, report, time_it
+from osprey.engine.executor.execution_context import ExecutionContext
+from osprey.engine.executor.executor import _get_metric_tags, _udf_execution_counters, execute
+from osprey.engine.executor.node_executor.call_executor import CallExecutor
+from osprey.engine.executor.udf_execution_helpers import UDFHelpers
+from osprey.worker.lib.instruments import metrics
+
+
+def _legacy_increment(context: ExecutionContext, udf_name: str) -> None:
+    tags = [
+        f'action:{context.get_action_name()}',
+        f'encoding:{context.get_data_encoding()}',
+        'batch_type:none',
+        'host:none',
+        'kube_node:none',
+        'instance-id:none',
+        'internal-hostname:none',
+        'name:none',
+    ]
+    tags += [f'udf:{udf_name}']
+    metrics.increment('udf_execution', tags=tags + ['exc_name:none', 'result:success'])
+
+
+def _aggregated_increment(context: ExecutionContext, udf_name: str) -> None:
+    _udf_execution_counters.increment(
+        'udf_execution', _get_metric_tags(context, udf_name=udf_name, exc_name='none', result='success')
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+
+    graph = compile_example_rules()
+    helpers = UDFHelpers()
+    action = make_action()
+    context = ExecutionContext(execution_graph=graph, action=action, helpers=helpers)
+    udf_names = [
+        chain.executor._udf.__class__.__name__
+        for chain in (graph.execution_plan.get_chain(i) for i in range(len(graph.execution_plan)))
+        if isinstance(chain.executor, CallExecutor)
+    ]
+
+    elapsed, per_call = time_it(lambda: execute(graph, helpers, action, async_pool=None), args.iterations // 10)
+    report('execute example rules', args.iterations // 10, elapsed, per_call)
+
+    for name, increment in (('legacy', _legacy_increment), ('aggregated', _aggregated_increment)):
+        udf_name = udf_names[0]
+        elapsed, per_call = time_it(lambda: increment(context, udf_name), args.iterations)
+        report(f'{name} udf_execution increment', args.iterations, elapsed, per_call)
+        report(
+            f'  x {len(udf_names)} UDF calls per example action', args.iterations, elapsed, per_call * len(udf_names)
+        )
+
+    _udf_execution_counters.stop()
+
+
+if __name__ == '__main__':
+    main()
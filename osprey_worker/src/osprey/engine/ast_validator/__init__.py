@@ -1,3 +1,5 @@
+from typing import Optional
+
 from osprey.engine.ast.sources import Sources
 from osprey.engine.udf.registry import UDFRegistry
 
@@ -6,8 +8,15 @@ from .validator_registry import ValidatorRegistry
 
 
 def validate_sources(
-    sources: Sources, udf_registry: UDFRegistry, validator_registry: ValidatorRegistry
+    sources: Sources,
+    udf_registry: UDFRegistry,
+    validator_registry: ValidatorRegistry,
+    previous: Optional[ValidatedSources] = None,
 ) -> ValidatedSources:
     """Given a sources collection, run the set of validators, returning a ValidatedSources if the sources
-    are valid, or throwing a ValidationFailed error if there are any validation errors."""
-    return ValidationContext(sources, udf_registry=udf_registry, validator_registry=validator_registry).run()
+    are valid, or throwing a ValidationFailed error if there are any validation errors.
+
+    If `previous` is given, the sources are validated incrementally against it, see `ValidationContext`."""
+    return ValidationContext(
+        sources, udf_registry=udf_registry, validator_registry=validator_registry, previous=previous
+    ).run()
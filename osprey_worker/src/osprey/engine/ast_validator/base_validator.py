@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Dict, Generic, Type, TypeVar
+from typing import TYPE_CHECKING, ClassVar, Dict, Generic, Type, TypeVar
 
 from osprey.engine.utils.periodic_execution_yielder import maybe_periodic_yield
 from pydantic import BaseModel
@@ -38,15 +38,33 @@ class SourceValidator(BaseValidator):
     This is useful when you don't need to look at global state across all sources, and just want to look at each
     source file individually."""
 
+    reuses_unchanged_sources: ClassVar[bool] = False
+    """Whether the outcome of validating a source only depends on that source, and on the sources it imports. If so,
+    when sources are validated incrementally, unchanged sources are not validated again, and `reuse_source` is called
+    instead, see `ValidationContext.is_unchanged_source`."""
+
     def run(self) -> None:
         for source in self.context.sources:
-            self.validate_source(source)
+            self.validate_or_reuse_source(source)
             maybe_periodic_yield()
 
+    def validate_or_reuse_source(self, source: 'Source') -> None:
+        if self.reuses_unchanged_sources and self.context.is_unchanged_source(source):
+            self.reuse_source(source)
+        else:
+            self.validate_source(source)
+
     def validate_source(self, source: 'Source') -> None:
         """Implement this to validate a single source file, similar to how BaseValidator.run() would be implemented."""
         raise NotImplementedError
 
+    def reuse_source(self, source: 'Source') -> None:
+        """Carries the outcome of the previous validation of an unchanged source over, instead of validating it again.
+
+        This replays the warnings that were emitted for the source. Validators that have a result must extend this to
+        carry over their part of the previous result, see `ValidationContext.get_previous_validator_result`."""
+        self.context.replay_previous_warnings(source)
+
 
 class ValidatorFailed(Exception):
     """Thrown when a validator completes and has emitted one or more error."""
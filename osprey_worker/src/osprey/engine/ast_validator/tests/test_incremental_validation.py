@@ -0,0 +1,146 @@
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+import pytest
+from osprey.engine.ast.sources import Sources
+from osprey.engine.ast_validator import validate_sources
+from osprey.engine.ast_validator.validation_context import ValidatedSources
+from osprey.engine.ast_validator.validator_registry import ValidatorRegistry
+from osprey.engine.ast_validator.validators.imports_must_not_have_cycles import ImportsMustNotHaveCycles
+from osprey.engine.ast_validator.validators.no_unused_locals import NoUnusedLocals
+from osprey.engine.ast_validator.validators.unique_stored_names import UniqueStoredNames
+from osprey.engine.ast_validator.validators.validate_call_kwargs import ValidateCallKwargs
+from osprey.engine.ast_validator.validators.validate_call_rvalue import ValidateCallRValue
+from osprey.engine.ast_validator.validators.validate_dynamic_calls_have_annotated_rvalue import (
+    ValidateDynamicCallsHaveAnnotatedRValue,
+)
+from osprey.engine.ast_validator.validators.validate_static_types import ValidateStaticTypes
+from osprey.engine.ast_validator.validators.variables_must_be_defined import VariablesMustBeDefined
+from osprey.engine.executor.execution_context import Action
+from osprey.engine.executor.execution_graph import compile_execution_graph
+from osprey.engine.executor.executor import execute
+from osprey.engine.executor.udf_execution_helpers import UDFHelpers
+from osprey.engine.stdlib import get_config_registry
+from osprey.engine.stdlib.udfs.import_ import Import
+from osprey.engine.stdlib.udfs.json_data import JsonData
+from osprey.engine.stdlib.udfs.string import StringLength
+from osprey.engine.udf.registry import UDFRegistry
+
+_SOURCES = {
+    'main.sml': "Import(rules=['a.sml', 'b.sml', 'features.sml'])",
+    'features.sml': "Name: str = JsonData(path='$.name')",
+    'a.sml': "Import(rules=['features.sml'])\nNameLength = StringLength(s=Name)",
+    'b.sml': "Count: int = JsonData(path='$.count')\nDoubled = Count * 2",
+}
+
+
+@pytest.fixture()
+def udf_registry() -> UDFRegistry:
+    return UDFRegistry.with_udfs(Import, JsonData, StringLength)
+
+
+@pytest.fixture()
+def validator_registry() -> ValidatorRegistry:
+    return ValidatorRegistry.from_validator_classes(
+        {
+            ImportsMustNotHaveCycles,
+            NoUnusedLocals,
+            UniqueStoredNames,
+            ValidateCallKwargs,
+            ValidateCallRValue,
+            ValidateDynamicCallsHaveAnnotatedRValue,
+            ValidateStaticTypes,
+            VariablesMustBeDefined,
+            get_config_registry().get_validator(),
+        }
+    )
+
+
+def _validate(
+    sources_dict: Dict[str, str],
+    udf_registry: UDFRegistry,
+    validator_registry: ValidatorRegistry,
+    previous: Optional[ValidatedSources] = None,
+) -> ValidatedSources:
+    return validate_sources(Sources.from_dict(dict(sources_dict)), udf_registry, validator_registry, previous=previous)
+
+
+def _paths(validated_sources: ValidatedSources) -> Set[str]:
+    return {source.path for source in validated_sources.unchanged_sources}
+
+
+def test_full_validation_has_no_unchanged_sources(
+    udf_registry: UDFRegistry, validator_registry: ValidatorRegistry
+) -> None:
+    assert _paths(_validate(_SOURCES, udf_registry, validator_registry)) == set()
+
+
+def test_edited_source_and_its_importers_are_changed(
+    udf_registry: UDFRegistry, validator_registry: ValidatorRegistry
+) -> None:
+    previous = _validate(_SOURCES, udf_registry, validator_registry)
+
+    assert _paths(_validate(_SOURCES, udf_registry, validator_registry, previous)) == set(_SOURCES)
+
+    edited = {**_SOURCES, 'features.sml': "Name: str = JsonData(path='$.username')"}
+    assert _paths(_validate(edited, udf_registry, validator_registry, previous)) == {'b.sml'}
+
+    added = {**_SOURCES, 'c.sml': 'C = 1'}
+    assert _paths(_validate(added, udf_registry, validator_registry, previous)) == set()
+
+
+def test_reuses_results_of_unchanged_sources(udf_registry: UDFRegistry, validator_registry: ValidatorRegistry) -> None:
+    previous = _validate(_SOURCES, udf_registry, validator_registry)
+    edited = {**_SOURCES, 'b.sml': "Count: int = JsonData(path='$.total')\nDoubled = Count * 2"}
+    validated = _validate(edited, udf_registry, validator_registry, previous)
+    full = _validate(edited, udf_registry, validator_registry)
+
+    previous_udfs = previous.get_validator_result(ValidateCallKwargs)
+    udfs = validated.get_validator_result(ValidateCallKwargs)
+    assert udfs.keys() == full.get_validator_result(ValidateCallKwargs).keys()
+    features = validated.sources.get_by_path('features.sml')
+    assert features is not None
+    [statement] = features.ast_root.statements
+    name_call_id = id(statement.value)
+    assert udfs[name_call_id] is previous_udfs[name_call_id]
+
+    assert (
+        validated.get_validator_result(ValidateStaticTypes).name_type_and_span_cache
+        == full.get_validator_result(ValidateStaticTypes).name_type_and_span_cache
+    )
+
+
+def test_type_errors_in_imported_sources_are_still_detected(
+    udf_registry: UDFRegistry, validator_registry: ValidatorRegistry
+) -> None:
+    previous = _validate(_SOURCES, udf_registry, validator_registry)
+    edited = {**_SOURCES, 'features.sml': "Name: int = JsonData(path='$.name')"}
+
+    with pytest.raises(Exception, match='StringLength'):
+        _validate(edited, udf_registry, validator_registry, previous)
+
+
+def test_incremental_compilation_reuses_dependency_chains(
+    udf_registry: UDFRegistry, validator_registry: ValidatorRegistry
+) -> None:
+    previous_graph = compile_execution_graph(_validate(_SOURCES, udf_registry, validator_registry))
+    edited = {**_SOURCES, 'b.sml': "Count: int = JsonData(path='$.total')\nDoubled = Count * 2"}
+    validated = _validate(edited, udf_registry, validator_registry, previous_graph.validated_sources)
+    graph = compile_execution_graph(validated, previous=previous_graph)
+
+    features = validated.sources.get_by_path('features.sml')
+    assert features is not None
+    [statement] = features.ast_root.statements
+    assert graph.get_dependency_chain(statement) is previous_graph.get_dependency_chain(statement)
+
+    action = Action(action_id=1, action_name='test', data={'name': 'abc', 'total': 4}, timestamp=datetime.now())
+    result = execute(graph, UDFHelpers(), action, async_pool=None)
+    full_result = execute(
+        compile_execution_graph(_validate(edited, udf_registry, validator_registry)),
+        UDFHelpers(),
+        action,
+        async_pool=None,
+    )
+    assert result.extracted_features == full_result.extracted_features
+    assert result.extracted_features['NameLength'] == 3
+    assert result.extracted_features['Doubled'] == 8
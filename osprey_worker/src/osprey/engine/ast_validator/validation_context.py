@@ -1,5 +1,20 @@
 from abc import ABC
-from typing import TYPE_CHECKING, Any, ClassVar, Dict, List, Optional, Sequence, Tuple, Type, Union, cast
+from collections import defaultdict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    ClassVar,
+    DefaultDict,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
 
 from osprey.engine.ast.error_utils import SpanWithHint, render_span_context_with_message
 from osprey.engine.ast.errors import OspreySyntaxError
@@ -50,13 +65,26 @@ class ValidationContext:
     _warning_as_error: bool
     """Whether or not to treat warnings as errors."""
 
+    _previous: Optional['ValidatedSources']
+    """The result of a previous validation, that unchanged sources can carry their outcome over from."""
+
+    _unchanged_sources: FrozenSet[Source]
+    """The sources which, along with all the sources they import, are identical to the previously validated ones."""
+
+    _previous_warnings: Dict[Tuple[Optional[Type[BaseValidator]], str], List['ValidationWarning']]
+    """The warnings of the previous validation, by the validator that emitted them and the path of their source."""
+
     def __init__(
         self,
         sources: Sources,
         udf_registry: 'UDFRegistry',
         validator_registry: Optional[ValidatorRegistry] = None,
         warning_as_error: bool = False,
+        previous: Optional['ValidatedSources'] = None,
     ):
+        """If `previous` is given, validation is incremental: validators that support it (see
+        `SourceValidator.reuses_unchanged_sources`) carry the outcome of unchanged sources over from it, rather than
+        validating them again. `previous` must have been validated with the same UDF and validator registries."""
         self.sources = sources
 
         self._validation_results = {}
@@ -67,6 +95,17 @@ class ValidationContext:
         self._validator_stack = []
         self._validator_inputs = {}
         self._warning_as_error = warning_as_error
+        self._previous = previous
+        self._unchanged_sources = frozenset()
+        self._previous_warnings = {}
+        if previous is not None:
+            self._unchanged_sources = _find_unchanged_sources(sources, previous)
+            previous_warnings: DefaultDict[Tuple[Optional[Type[BaseValidator]], str], List[ValidationWarning]] = (
+                defaultdict(list)
+            )
+            for warning in previous.warnings:
+                previous_warnings[warning.validator_class, warning.source.path].append(warning)
+            self._previous_warnings = dict(previous_warnings)
 
     def set_validator_input(self, validator_class: Type[HasInput[T]], value: T) -> 'ValidationContext':
         self._validator_inputs[validator_class] = value
@@ -178,7 +217,12 @@ class ValidationContext:
             if issubclass(k, HasResult):
                 validation_results[k] = v
 
-        return ValidatedSources(sources=self.sources, warnings=self._warnings, validation_results=validation_results)
+        return ValidatedSources(
+            sources=self.sources,
+            warnings=self._warnings,
+            validation_results=validation_results,
+            unchanged_sources=self._unchanged_sources,
+        )
 
     def run_validator(self, validator_class: Type[BaseValidator]) -> None:
         """Gets the validation result of a given validator class"""
@@ -242,6 +286,23 @@ class ValidationContext:
             if isinstance(result, ValidatorFailed):
                 raise result
 
+    def is_unchanged_source(self, source: Source) -> bool:
+        """Whether the source, and all the sources it imports (transitively), are identical to the ones of the previous
+        validation, in which case validators that only look at a source and its imports can reuse their outcome."""
+        return source in self._unchanged_sources
+
+    def get_previous_validator_result(self, validator_class: Type[HasResult[T_co]]) -> T_co:
+        """Returns the result that a validator had in the previous validation. Only valid for validators that reuse
+        unchanged sources, while they are reusing one."""
+        assert self._previous is not None, 'there is no previous validation'
+        return self._previous.get_validator_result(validator_class)
+
+    def replay_previous_warnings(self, source: Source) -> None:
+        """Emits the warnings that the currently running validator emitted for an unchanged source in the previous
+        validation again."""
+        for warning in self._previous_warnings.get((self.current_validator, source.path), ()):
+            self.add_message(warning)
+
     def _has_errors_for(self, validator_class: Type[BaseValidator]) -> bool:
         """Returns if any errors were emitted by the given validator class."""
         return any(e.validator_class == validator_class for e in self._errors)
@@ -369,10 +430,14 @@ class ValidatedSources:
         sources: Sources,
         validation_results: Dict[Type[HasResult[Any]], Any],
         warnings: Sequence[ValidationWarning],
+        unchanged_sources: FrozenSet[Source] = frozenset(),
     ):
         self.sources = sources
         self.warnings = warnings
         self._validation_results = validation_results
+        self.unchanged_sources = unchanged_sources
+        """If the sources were validated incrementally, the sources that were unchanged since the previous validation
+        (along with all the sources they import). See `ValidationContext.is_unchanged_source`."""
 
     @property
     def validation_results(self) -> Dict[Type[HasResult[Any]], Any]:
@@ -396,6 +461,42 @@ class ValidatedSources:
         return _render_validation_messages(self.warnings, 'warning')
 
 
+def _find_unchanged_sources(sources: Sources, previous: ValidatedSources) -> FrozenSet[Source]:
+    """Returns the sources which are identical to a previously validated source, and which only import such sources."""
+    from .validators.imports_must_not_have_cycles import ImportsMustNotHaveCycles
+
+    # Validators may look sources up by path (e.g. `Require`), or read the config, so if either changed, the outcome of
+    # validating any source may have changed too.
+    if sources.paths() != previous.sources.paths() or sources.config.sources != previous.sources.config.sources:
+        return frozenset()
+
+    try:
+        import_graph = previous.get_validator_result(ImportsMustNotHaveCycles).import_graph
+    except KeyError:
+        return frozenset()
+
+    unchanged: Dict[str, bool] = {}
+
+    def is_unchanged(source: Source) -> bool:
+        result = unchanged.get(source.path)
+        if result is None:
+            previous_source = previous.sources.get_by_path(source.path)
+            # Sources compare by path and contents, which also means that they share their parsed AST. Validation results
+            # refer to AST nodes, so make sure that the AST wasn't parsed again.
+            result = (
+                previous_source == source
+                and previous_source.ast_root is source.ast_root
+                and all(
+                    is_unchanged(sources.get_by_path(imported.path) or imported)
+                    for imported in import_graph.iter_edges(previous_source)
+                )
+            )
+            unchanged[source.path] = result
+        return result
+
+    return frozenset(source for source in sources if is_unchanged(source))
+
+
 def _render_validation_messages(messages: Sequence[_ValidationMessage], message_type: str) -> str:
     total = len(messages)
     if total == 1:
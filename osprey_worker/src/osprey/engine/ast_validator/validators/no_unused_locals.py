@@ -11,6 +11,8 @@ class NoUnusedLocals(SourceValidator):
     Validates that all locals that are defined are read at least once.
     """
 
+    reuses_unchanged_sources = True
+
     def validate_source(self, source: 'Source') -> None:
         seen_locals: Dict[str, Tuple[int, Name]] = {}
 
@@ -31,6 +31,8 @@ class ValidateCallKwargs(SourceValidator, HasResult[UDFNodeMapping]):
     and creating a udf node mapping
     """
 
+    reuses_unchanged_sources = True
+
     def __init__(self, context: 'ValidationContext'):
         super().__init__(context)
         self._udf_node_mapping: UDFNodeMapping = {}
@@ -43,6 +45,14 @@ class ValidateCallKwargs(SourceValidator, HasResult[UDFNodeMapping]):
         for call_node in filter_nodes(source.ast_root, Call):
             self.validate_call_node(call_node)
 
+    def reuse_source(self, source: Source) -> None:
+        super().reuse_source(source)
+        # Reusing the unchanged source's UDFs, rather than constructing them again, is what makes incremental
+        # validation cheap. It is safe since the source's AST nodes are shared with the previous validation.
+        previous_udf_node_mapping = self.context.get_previous_validator_result(ValidateCallKwargs)
+        for call_node in filter_nodes(source.ast_root, Call):
+            self._udf_node_mapping[id(call_node)] = previous_udf_node_mapping[id(call_node)]
+
     def get_result(self) -> UDFNodeMapping:
         return self._udf_node_mapping
 
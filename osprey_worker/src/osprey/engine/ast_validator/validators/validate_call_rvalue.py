@@ -10,6 +10,8 @@ class ValidateCallRValue(SourceValidator):
     if it does not have a result.
     """
 
+    reuses_unchanged_sources = True
+
     def validate_source(self, source: Source) -> None:
         for call_node in filter_nodes(source.ast_root, Call):
             self.validate_call_node(source, call_node)
@@ -22,6 +22,9 @@ class ValidateDynamicCallsHaveAnnotatedRValue(SourceValidator):
     Validates that if a dynamic function is called, it's got an RValue Type
     """
 
+    # The rvalue type checkers of reused UDFs were already set when they were validated.
+    reuses_unchanged_sources = True
+
     def __init__(self, context: 'ValidationContext'):
         super().__init__(context)
         self._udf_node_mapping = context.get_validator_result(ValidateCallKwargs)
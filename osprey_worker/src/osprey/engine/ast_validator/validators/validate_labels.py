@@ -19,6 +19,8 @@ class ValidateLabels(SourceValidator):
     # that constructs the UDFs. Therefore it would create a circular dependency.
 
     exclude_from_query_validation = True
+    # The config can't have changed if any source is unchanged, and entities are always defined in imported sources.
+    reuses_unchanged_sources = True
 
     def __init__(self, context: 'ValidationContext'):
         super().__init__(context)
@@ -1,8 +1,10 @@
+from collections import defaultdict
 from dataclasses import dataclass, replace
 from functools import lru_cache
-from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Set, Type, Union, cast
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, Type, Union, cast
 
 from osprey.engine.ast import grammar
+from osprey.engine.ast.ast_utils import iter_nodes
 from osprey.engine.ast.error_utils import SpanWithHint
 from osprey.engine.language_types.entities import EntityT
 from osprey.engine.language_types.post_execution_convertible import PostExecutionConvertible
@@ -62,12 +64,17 @@ _INT_OR_FLOAT_T = cast(type, Union[int, float])
 
 
 class ValidateStaticTypes(SourceValidator, HasInput[Dict[str, _TypeAndSpan]], HasResult[ValidateStaticTypesResult]):
+    # The types of the names that a source defines only depend on the source, and on the sources that it imports.
+    reuses_unchanged_sources = True
+
     def __init__(self, context: 'ValidationContext'):
         super().__init__(context)
         # Get type information passed in from previous runs, used to type check queries.
         self._name_type_and_span_cache: Dict[str, _TypeAndSpan] = context.get_validator_input(type(self), {})
         self._nodes_to_unwrap: Set[int] = set()
         self._checked_sources: Set[grammar.Source] = set()
+        # Lazily built when reusing the first unchanged source: source path -> names defined in that source.
+        self._previous_names_by_source_path: Optional[Dict[str, List[Tuple[str, _TypeAndSpan]]]] = None
         self._udf_node_mapping: UDFNodeMapping = context.get_validator_result(ValidateCallKwargs)
 
         # Allows us to skip cycle checking, assume unique/existing names, have rtype checkers set
@@ -159,6 +166,27 @@ class ValidateStaticTypes(SourceValidator, HasInput[Dict[str, _TypeAndSpan]], Ha
             else:
                 raise TypeError(f'Unknown statement type {statement} ({type(statement)})')
 
+    def reuse_source(self, source: grammar.Source) -> None:
+        if source in self._checked_sources:
+            return
+
+        self._checked_sources.add(source)
+        super().reuse_source(source)
+
+        previous_result = self.context.get_previous_validator_result(ValidateStaticTypes)
+        if self._previous_names_by_source_path is None:
+            self._previous_names_by_source_path = defaultdict(list)
+            for identifier_key, type_and_span in previous_result.name_type_and_span_cache.items():
+                self._previous_names_by_source_path[type_and_span.span.source.path].append(
+                    (identifier_key, type_and_span)
+                )
+
+        self._name_type_and_span_cache.update(self._previous_names_by_source_path.get(source.path, ()))
+        previous_nodes_to_unwrap = previous_result.nodes_to_unwrap
+        self._nodes_to_unwrap.update(
+            id(node) for node in iter_nodes(source.ast_root) if id(node) in previous_nodes_to_unwrap
+        )
+
     def _validate_assign(self, assign: grammar.Assign) -> None:
         value_type = self._validate_expression(assign.value)
         if assign.annotation is None:
@@ -306,7 +334,7 @@ class ValidateStaticTypes(SourceValidator, HasInput[Dict[str, _TypeAndSpan]], Ha
         # Special case to handle import. Need to do this so we populate name types.
         if isinstance(udf, Import):
             for source, _ in udf.sources_and_spans:
-                self.validate_source(source)
+                self.validate_or_reuse_source(source)
             # Continue on with the rest of the function
 
         param_items = arguments.items()
@@ -1,5 +1,5 @@
 from collections import defaultdict
-from typing import DefaultDict, Mapping, Sequence, Set, cast
+from typing import DefaultDict, Dict, Mapping, Sequence, Set, cast
 
 from osprey.engine.ast.ast_utils import filter_nodes, iter_nodes
 from osprey.engine.ast.grammar import Assign, ASTNode, Call, Load, Name, Source, Store
@@ -28,9 +28,15 @@ class VariablesMustBeDefined(BaseValidator, HasInput[Set[str]], HasResult[Mappin
         for identifier, span in identifier_index.items():
             identifiers_by_source[span.source].add(identifier)
 
-        self.known_identifiers_by_source: Mapping[Source, Set[str]] = {}
+        self.known_identifiers_by_source: Dict[Source, Set[str]] = {}
 
         for source in self.context.sources:
+            # The identifiers known to a source only depend on the source and its imports, see `is_unchanged_source`.
+            if self.context.is_unchanged_source(source):
+                previous_result = self.context.get_previous_validator_result(VariablesMustBeDefined)
+                self.known_identifiers_by_source[source] = previous_result[source]
+                continue
+
             known_identifiers: Set[str] = set(global_names)
             for node in iter_nodes(source.ast_root):
                 if is_import(node):
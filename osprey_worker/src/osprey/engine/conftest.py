@@ -260,6 +260,7 @@ class ExecuteWithResultFunction(Protocol):
         udf_helpers: Optional[UDFHelpers] = None,
         async_pool: Optional[gevent.pool.Pool] = ...,
         action_time: Optional[datetime] = ...,
+        short_circuit: bool = ...,
     ) -> ExecutionResult: ...
 
 
@@ -275,6 +276,7 @@ class ExecuteFunction(Protocol):
         async_pool: Optional[gevent.pool.Pool] = ...,
         action_time: Optional[datetime] = ...,
         allow_errors: bool = ...,
+        short_circuit: bool = ...,
     ) -> Dict[str, object]: ...
 
 
@@ -291,6 +293,7 @@ def execute_with_result(udf_registry: UDFRegistry) -> ExecuteWithResultFunction:
         udf_helpers: Optional[UDFHelpers] = None,
         async_pool: Optional[gevent.pool.Pool] = None,
         action_time: Optional[datetime] = None,
+        short_circuit: bool = False,
     ) -> ExecutionResult:
         sources = into_sources(sources_dict)
 
@@ -318,7 +321,9 @@ def execute_with_result(udf_registry: UDFRegistry) -> ExecuteWithResultFunction:
             action_name=action_name,
             timestamp=action_time or datetime.utcnow(),
         )
-        return osprey_execute(execution_graph, udf_helpers or UDFHelpers(), action, async_pool)
+        return osprey_execute(
+            execution_graph, udf_helpers or UDFHelpers(), action, async_pool, short_circuit=short_circuit
+        )
 
     return execute_with_result_
 
@@ -342,6 +347,7 @@ def execute(execute_with_result: ExecuteWithResultFunction) -> ExecuteFunction:
         async_pool: Optional[gevent.pool.Pool] = None,
         action_time: Optional[datetime] = None,
         allow_errors: bool = False,
+        short_circuit: bool = False,
     ) -> Dict[str, object]:
         result = execute_with_result(
             sources_dict=sources_dict,
@@ -352,6 +358,7 @@ def execute(execute_with_result: ExecuteWithResultFunction) -> ExecuteFunction:
             udf_helpers=udf_helpers,
             async_pool=async_pool,
             action_time=action_time,
+            short_circuit=short_circuit,
         )
         if not allow_errors and len(result.error_infos) > 0:
             # Raise the first error, that should help track it down more easily.
@@ -1,22 +1,27 @@
+import copy
 import json
 import logging
 import traceback
 from collections import defaultdict
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, replace
 from datetime import datetime
 from typing import (
     TYPE_CHECKING,
     Any,
+    Callable,
     DefaultDict,
     Dict,
+    Generic,
     Iterable,
     List,
     Mapping,
+    Optional,
     Sequence,
     Set,
     Type,
     TypeAlias,
     TypeVar,
+    cast,
 )
 
 from google.protobuf.timestamp_pb2 import Timestamp
@@ -27,8 +32,9 @@ from osprey.engine.executor.custom_extracted_features import (
 )
 from osprey.engine.executor.dependency_chain import DependencyChain
 from osprey.engine.executor.execution_graph import ExecutionGraph
+from osprey.engine.executor.execution_plan import ExecutionPlanState
 from osprey.engine.executor.external_service_utils import ExternalService, ExternalServiceAccessor, KeyT, ValueT
-from osprey.engine.executor.topological_sorter import TopologicalSorter
+from osprey.engine.executor.node_profiler import ExecutionProfile
 from osprey.engine.executor.udf_execution_helpers import HasHelperInternal, HelperT, UDFHelpers
 from osprey.engine.language_types.effects import (
     EffectBase,
@@ -38,7 +44,7 @@ from osprey.engine.language_types.post_execution_convertible import PostExecutio
 from osprey.engine.language_types.verdicts import VerdictEffect
 from osprey.engine.utils.types import add_slots, cached_property
 from osprey.rpc.common.v1.verdicts_pb2 import Verdicts
-from result import Result, UnwrapError
+from result import Err, Ok, Result, UnwrapError
 
 if TYPE_CHECKING:
     from osprey.engine.ast_validator.validation_context import ValidatedSources
@@ -80,12 +86,21 @@ class ExecutionContext:
         '_effects',
         '_udf_helpers',
         '_external_service_accessors_by_getter_id',
-        '_dependency_dag',
-        '_chain_by_id',
+        '_plan_state',
+        '_short_circuit',
         '_custom_extracted_features',
+        '_profile',
     )
 
-    def __init__(self, execution_graph: ExecutionGraph, action: 'Action', helpers: UDFHelpers):
+    def __init__(
+        self,
+        execution_graph: ExecutionGraph,
+        action: 'Action',
+        helpers: UDFHelpers,
+        external_service_accessors: Optional[Dict[int, ExternalServiceAccessor[Any, Any]]] = None,
+        short_circuit: bool = False,
+        profile: Optional[ExecutionProfile] = None,
+    ):
         self._action = action
         self._data = action.data
         self._input_encoding = action.encoding
@@ -97,13 +112,26 @@ class ExecutionContext:
         self._visited_executions: Set[DependencyChain] = set()
         # a k/v store of effects, by effect type
         self._effects: DefaultDict[Type[EffectBase], List[EffectBase]] = defaultdict(list)
-        self._external_service_accessors_by_getter_id: Dict[int, ExternalServiceAccessor[Any, Any]] = {}
-        self._dependency_dag = TopologicalSorter()
-        self._chain_by_id: Dict[int, DependencyChain] = {}
+        # May be shared between the contexts of actions that are executed together, see `executor.execute_many`.
+        self._external_service_accessors_by_getter_id: Dict[int, ExternalServiceAccessor[Any, Any]] = (
+            external_service_accessors if external_service_accessors is not None else {}
+        )
+        # The entry-point is already enqueued in a fresh plan state.
+        self._plan_state: ExecutionPlanState = execution_graph.execution_plan.new_state()
+        # Whether gates are resolved as soon as they are decided, see `executor.short_circuit`.
+        self._short_circuit = short_circuit
         # feature name -> serializable feature
         self._custom_extracted_features: Dict[str, Any] = {}
+        # Set when this execution was sampled for profiling, see `executor.execute`.
+        self._profile = profile
+
+    @property
+    def execution_graph(self) -> ExecutionGraph:
+        return self._execution_graph
 
-        self.enqueue_source(execution_graph.get_entry_point())
+    @property
+    def profile(self) -> Optional[ExecutionProfile]:
+        return self._profile
 
     @property
     def validated_sources(self) -> 'ValidatedSources':
@@ -142,7 +170,39 @@ class ExecutionContext:
     def set_resolved_value(self, chain: DependencyChain, value: NodeResult) -> None:
         """Called by the main executor once a node has been resolved, to store its value for dependent executors."""
         self._resolved_node_values[id(chain.executor.node)] = value
-        self._dependency_dag.done(id(chain))
+        self._plan_state.done(chain)
+        if self._short_circuit:
+            self._short_circuit_gates_depending_on(chain)
+
+    def _short_circuit_gates_depending_on(self, chain: DependencyChain) -> None:
+        plan = self._execution_graph.execution_plan
+        resolved_chains = [chain]
+        while resolved_chains:
+            resolved_chain = resolved_chains.pop()
+            for gate_chain, gate, dependency_node in plan.get_gates_depending_on(resolved_chain):
+                if not self._plan_state.is_pending(gate_chain):
+                    continue
+                # Resolve the dependency the same way that the gate's executor would.
+                try:
+                    dependency_result: NodeResult = Ok(self.resolved(dependency_node))
+                except NodeFailurePropagationException:
+                    dependency_result = Err(None)
+
+                gate_value = gate.get_short_circuit_value(dependency_result)
+                if gate_value is not None:
+                    self._plan_state.short_circuit(gate_chain)
+                    self._resolved_node_values[id(gate_chain.executor.node)] = gate_value
+                    # The gate may decide another gate in turn, e.g. `(a and b) or c`.
+                    resolved_chains.append(gate_chain)
+
+    def is_needed(self, chain: DependencyChain) -> bool:
+        """Whether a ready chain still needs to be executed. Always true, unless short-circuiting is enabled."""
+        return not self._short_circuit or self._plan_state.is_needed(chain)
+
+    def skip(self, chain: DependencyChain) -> None:
+        """Marks a ready chain which is not needed as done, without executing it. Nothing will read its value."""
+        self._resolved_node_values[id(chain.executor.node)] = Err(None)
+        self._plan_state.done(chain)
 
     def set_output_value(self, key: str, value: Any) -> None:
         """Called by the assignment node executor to store an output key/value pair."""
@@ -177,24 +237,11 @@ class ExecutionContext:
         return self._action.timestamp
 
     def enqueue_source(self, source: Source) -> None:
-        sorted_dependency_chain = self._execution_graph.get_sorted_dependency_chain(source)
-
-        for chain in sorted_dependency_chain:
-            chainid = id(chain)
-            if self._dependency_dag.already_added(chainid):
-                continue
-            self._dependency_dag.add(chainid, *(id(pred) for pred in chain.dependent_on))
-            self._chain_by_id[chainid] = chain
-
-        self._dependency_dag.prepare()
+        """Adds the dependency chains required to resolve `source` to this execution, e.g. when a rule is required."""
+        self._plan_state.enqueue_source(source)
 
     def get_ready_to_execute(self) -> Sequence[DependencyChain]:
-        ready_nodeids = self._dependency_dag.get_ready()
-        ready = []
-        for nodeid in ready_nodeids:
-            ready.append(self._chain_by_id[nodeid])
-
-        return ready
+        return self._plan_state.get_ready()
 
     def add_effect(self, effect: EffectBase) -> None:
         self._effects[type(effect)].append(effect)
@@ -280,11 +327,12 @@ class ExecutionContext:
         self, external_service: ExternalService[KeyT, ValueT]
     ) -> ExternalServiceAccessor[KeyT, ValueT]:
         """Given an external service, wraps that service in an accessor that ensures that requests to the service are
-        cached and debounced by key within this execution."""
+        cached and debounced by key within this execution (and across executions, if the UDF helpers have a shared
+        external service cache)."""
         # No need to lock since not doing any IO
         accessor = self._external_service_accessors_by_getter_id.get(id(external_service))
         if accessor is None:
-            accessor = ExternalServiceAccessor(external_service)
+            accessor = ExternalServiceAccessor(external_service, self._udf_helpers.shared_external_service_cache)
             self._external_service_accessors_by_getter_id[id(external_service)] = accessor
 
         return accessor
@@ -305,6 +353,9 @@ class Action:
     timestamp: datetime
     secret_data: Dict[str, Any] = field(default_factory=dict)
     encoding: str = 'unknown'
+    raw_data_json: Optional[str] = field(default=None, compare=False, repr=False)
+    """The JSON that `data` was decoded from, if the action arrived with it, which is then used as `data_json`
+    rather than encoding `data` again."""
 
     @classmethod
     def from_dict(cls: Type[_ActionT], d: Dict[str, Any]) -> '_ActionT':
@@ -329,6 +380,8 @@ class Action:
     def data_json(self) -> str:
         """Convenience method for returning the action data json to avoid serializing multiple times,
         if this result is consumed by multiple output streams."""
+        if self.raw_data_json is not None:
+            return self.raw_data_json
         return json.dumps(self.data)
 
 
@@ -341,6 +394,29 @@ class NodeErrorInfo:
     node: ASTNode
 
 
+_ViewT = TypeVar('_ViewT')
+
+
+class ExecutionResultView(Generic[_ViewT]):
+    """A representation derived from an `ExecutionResult`, such as the encoding that an output sink writes.
+
+    A result computes each view at most once, the first time it is asked for it with `ExecutionResult.get_view`, and
+    then shares it with everything else that asks, eg all of the output sinks that the result is pushed to. Views are
+    shared, so must not be mutated."""
+
+    __slots__ = ('name', '_compute')
+
+    def __init__(self, name: str, compute: Callable[['ExecutionResult'], _ViewT]) -> None:
+        self.name = name
+        self._compute = compute
+
+    def compute(self, result: 'ExecutionResult') -> _ViewT:
+        return self._compute(result)
+
+    def __repr__(self) -> str:
+        return f'ExecutionResultView({self.name!r})'
+
+
 @add_slots
 @dataclass
 class ExecutionResult:
@@ -355,6 +431,25 @@ class ExecutionResult:
     # some kind of typing when outputing `validator_results`
     validator_results: Dict[Any, Any] = field(default_factory=dict)
     sample_rate: int = 100
+    # The per-node timings of the execution, if it was sampled for profiling.
+    profile: Optional[ExecutionProfile] = None
+    # The views of this result that have been computed so far, see `get_view`.
+    _views: Dict[ExecutionResultView[Any], Any] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __copy__(self) -> 'ExecutionResult':
+        # Views are derived from the rest of the result, so copies start without them, in case the copy is changed.
+        return replace(self)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> 'ExecutionResult':
+        return replace(self, **{f.name: copy.deepcopy(getattr(self, f.name), memo) for f in fields(self) if f.init})
+
+    def get_view(self, view: ExecutionResultView[_ViewT]) -> _ViewT:
+        """Returns the given view of this result, computing it if this is the first time it's been asked for."""
+        try:
+            return cast(_ViewT, self._views[view])
+        except KeyError:
+            value = self._views[view] = view.compute(self)
+            return value
 
     def add_custom_extracted_feature(self, custom_extracted_feature: CustomExtractedFeature[Any]) -> None:
         name = custom_extracted_feature.feature_name()
@@ -372,13 +467,9 @@ class ExecutionResult:
         for custom_extracted_feature in custom_extracted_features:
             self.add_custom_extracted_feature(custom_extracted_feature)
 
-    @cached_property
+    @property
     def verdicts(self) -> Sequence[VerdictEffect]:
-        return [
-            osprey_verdict_effect
-            for osprey_verdict_effect in self.effects.get(VerdictEffect, [])
-            if isinstance(osprey_verdict_effect, VerdictEffect)
-        ].copy()
+        return self.get_view(VERDICTS)
 
     def _get_timestamp_pb2_proto(self) -> Timestamp:
         timestamp = Timestamp()
@@ -389,35 +480,75 @@ class ExecutionResult:
         """
         returns a pb2 protobuf of the verdicts declared by the action, along with some extra metadata~
         ╰(*°▽°*)╯
+
+        The protobuf is built once and shared, so must not be mutated.
         """
-        return Verdicts(
-            action_id=self.action.action_id,
-            action_name=self.action.action_name,
-            verdicts=[v.verdict for v in self.verdicts],
-            timestamp=self._get_timestamp_pb2_proto(),
-        )
+        return self.get_view(VERDICTS_PB2_PROTO)
 
-    @cached_property
+    @property
     def extracted_features_json(self) -> str:
         """Convenience method for returning the extracted features json to avoid serializing multiple times,
         if this result is consumed by multiple output streams."""
-        return json.dumps(self.extracted_features)
+        return self.get_view(EXTRACTED_FEATURES_JSON)
 
-    @cached_property
+    @property
+    def extracted_features_json_bytes(self) -> bytes:
+        """The extracted features json, utf-8 encoded, for outputs that write bytes."""
+        return self.get_view(EXTRACTED_FEATURES_JSON_BYTES)
+
+    @property
     def error_traces_json(self) -> str:
-        formatted_errors = []
-        for error_info in self.error_infos:
-            traceback_lines = traceback.format_exception(
-                type(error_info.error), error_info.error, error_info.error.__traceback__
-            )
-            span = error_info.node.span
-            if span is None:
-                span_text = '<unknown location>'
-            else:
-                span_text = f'{span.source.path}:{span.start_line}:{span.start_pos}'
-            rules_source_location = f'{span_text} - {print_ast(error_info.node)}'
+        return self.get_view(ERROR_TRACES_JSON)
 
-            formatted_errors.append(
-                {'traceback': ''.join(traceback_lines), 'rules_source_location': rules_source_location}
-            )
-        return json.dumps(formatted_errors)
+
+def _get_verdicts(result: ExecutionResult) -> Sequence[VerdictEffect]:
+    return [
+        osprey_verdict_effect
+        for osprey_verdict_effect in result.effects.get(VerdictEffect, [])
+        if isinstance(osprey_verdict_effect, VerdictEffect)
+    ]
+
+
+def _get_verdicts_pb2_proto(result: ExecutionResult) -> Verdicts:
+    return Verdicts(
+        action_id=result.action.action_id,
+        action_name=result.action.action_name,
+        verdicts=[v.verdict for v in result.verdicts],
+        timestamp=result._get_timestamp_pb2_proto(),
+    )
+
+
+def _get_extracted_features_json(result: ExecutionResult) -> str:
+    return json.dumps(result.extracted_features)
+
+
+def _get_extracted_features_json_bytes(result: ExecutionResult) -> bytes:
+    return result.extracted_features_json.encode('utf-8')
+
+
+def _get_error_traces_json(result: ExecutionResult) -> str:
+    formatted_errors = []
+    for error_info in result.error_infos:
+        traceback_lines = traceback.format_exception(
+            type(error_info.error), error_info.error, error_info.error.__traceback__
+        )
+        span = error_info.node.span
+        if span is None:
+            span_text = '<unknown location>'
+        else:
+            span_text = f'{span.source.path}:{span.start_line}:{span.start_pos}'
+        rules_source_location = f'{span_text} - {print_ast(error_info.node)}'
+
+        formatted_errors.append({'traceback': ''.join(traceback_lines), 'rules_source_location': rules_source_location})
+    return json.dumps(formatted_errors)
+
+
+VERDICTS: ExecutionResultView[Sequence[VerdictEffect]] = ExecutionResultView('verdicts', _get_verdicts)
+VERDICTS_PB2_PROTO: ExecutionResultView[Verdicts] = ExecutionResultView('verdicts_pb2_proto', _get_verdicts_pb2_proto)
+EXTRACTED_FEATURES_JSON: ExecutionResultView[str] = ExecutionResultView(
+    'extracted_features_json', _get_extracted_features_json
+)
+EXTRACTED_FEATURES_JSON_BYTES: ExecutionResultView[bytes] = ExecutionResultView(
+    'extracted_features_json_bytes', _get_extracted_features_json_bytes
+)
+ERROR_TRACES_JSON: ExecutionResultView[str] = ExecutionResultView('error_traces_json', _get_error_traces_json)
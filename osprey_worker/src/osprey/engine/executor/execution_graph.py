@@ -4,6 +4,7 @@ from osprey.engine.ast.grammar import Assign, ASTNode, Load, Name, Source, State
 from osprey.engine.utils.periodic_execution_yielder import maybe_periodic_yield
 
 from .dependency_chain import DependencyChain
+from .execution_plan import ExecutionPlan
 
 if TYPE_CHECKING:
     from osprey.engine.ast_validator.validation_context import ValidatedSources
@@ -27,6 +28,7 @@ class ExecutionGraph:
         '_validated_sources',
         '_sorted_dependency_chains',
         '_nodes_to_unwrap',
+        '_execution_plan',
     )
 
     _root_node_executor_mapping: Dict[int, DependencyChain]
@@ -48,6 +50,9 @@ class ExecutionGraph:
     _nodes_to_unwrap: Set[int]
     """ID's for nodes that need to be unwrapped to its inner type when used."""
 
+    _execution_plan: Optional[ExecutionPlan]
+    """The precompiled execution plan, built once all the sorted dependency chains have been added."""
+
     def __init__(
         self, node_executor_registry: 'NodeExecutorRegistry', sources: 'ValidatedSources', nodes_to_unwrap: Set[int]
     ):
@@ -57,6 +62,7 @@ class ExecutionGraph:
         self._validated_sources = sources
         self._sorted_dependency_chains = {}
         self._nodes_to_unwrap = nodes_to_unwrap
+        self._execution_plan = None
 
     @property
     def validated_sources(self) -> 'ValidatedSources':
@@ -80,6 +86,12 @@ class ExecutionGraph:
         fully resolved - in the order it must be executed."""
         return self._sorted_dependency_chains[source]
 
+    @property
+    def execution_plan(self) -> ExecutionPlan:
+        """The precompiled plan that executions of this graph use to track which dependency chains are ready."""
+        assert self._execution_plan is not None, 'execution plan has not been compiled'
+        return self._execution_plan
+
     def should_unwrap(self, node: ASTNode) -> bool:
         """Whether we need to unwrap the value that is represented by this node before using it."""
         return id(node) in self._nodes_to_unwrap
@@ -96,9 +108,13 @@ class ExecutionGraph:
         dependent_on = tuple(self._build_dependency_chain(node) for node in executor.get_dependent_nodes())
         return DependencyChain(executor=executor, dependent_on=dependent_on)
 
-    def _add_validated_source(self, source: Source) -> None:
+    def _add_validated_source(self, source: Source, previous: Optional['ExecutionGraph'] = None) -> None:
+        """Builds the dependency chains of the source's statements, or reuses them from `previous` if given."""
         for statement in source.ast_root.statements:
-            chain = self._build_dependency_chain(statement)
+            if previous is not None:
+                chain = previous.get_dependency_chain(statement)
+            else:
+                chain = self._build_dependency_chain(statement)
             self._root_node_executor_mapping[id(statement)] = chain
 
             if isinstance(statement, Assign):
@@ -107,12 +123,22 @@ class ExecutionGraph:
     def _add_sorted_dependency_chain(self, source: Source, sorted_dependency_chain: Sequence[DependencyChain]) -> None:
         self._sorted_dependency_chains[source] = sorted_dependency_chain
 
+    def _compile_execution_plan(self) -> None:
+        self._execution_plan = ExecutionPlan(self._sorted_dependency_chains, entry_point=self.get_entry_point())
+
 
 def compile_execution_graph(
-    validated_sources: 'ValidatedSources', node_executor_registry: Optional['NodeExecutorRegistry'] = None
+    validated_sources: 'ValidatedSources',
+    node_executor_registry: Optional['NodeExecutorRegistry'] = None,
+    previous: Optional[ExecutionGraph] = None,
 ) -> ExecutionGraph:
     """Given a validated sources collection, compiles it into an execution graph that can then be used by
-    the executor."""
+    the executor.
+
+    If the sources were validated incrementally, `previous` may be the graph that was compiled from the sources they
+    were validated against, in which case the dependency chains of the unchanged sources are reused from it rather
+    than built again. Since an unchanged source only imports unchanged sources, its chains never refer to the chains
+    of a changed source."""
     from osprey.engine.ast_validator.validators.imports_must_not_have_cycles import ImportsMustNotHaveCycles
     from osprey.engine.ast_validator.validators.validate_static_types import ValidateStaticTypes
 
@@ -135,17 +161,25 @@ def compile_execution_graph(
     )
     ordered_sources: List[Source] = list(chain_dedupe(iter(sorted_sources), iter(validated_sources.sources)))
 
+    unchanged_sources = validated_sources.unchanged_sources if previous is not None else frozenset()
+
     for source in ordered_sources:
         # noinspection PyProtectedMember
-        instance._add_validated_source(source)
+        instance._add_validated_source(source, previous if source in unchanged_sources else None)
         maybe_periodic_yield()
 
     for source in ordered_sources:
-        sorted_dependency_chain = _topologically_sort_dependency_chain_for(instance, source)
+        if previous is not None and source in unchanged_sources:
+            sorted_dependency_chain = previous.get_sorted_dependency_chain(source)
+        else:
+            sorted_dependency_chain = _topologically_sort_dependency_chain_for(instance, source)
         # noinspection PyProtectedMember
         instance._add_sorted_dependency_chain(source, sorted_dependency_chain)
         maybe_periodic_yield()
 
+    # noinspection PyProtectedMember
+    instance._compile_execution_plan()
+
     return instance
 
 
@@ -0,0 +1,340 @@
+"""
+A precompiled, array-backed representation of an `ExecutionGraph`'s dependency DAG.
+
+Every dependency chain in the graph is assigned a dense integer index once, at compile time, along with its
+predecessor and successor indices. Executing an action then only needs to copy a compact list of outstanding
+predecessor counts, rather than re-building a hash-keyed DAG from the sorted dependency chains of every source that
+gets enqueued.
+
+Sources that are enqueued at execution time (e.g. by `Require` and `Import`) are handled incrementally: their nodes
+are switched from "not enqueued" to pending, counting only the predecessors which have not yet finished.
+
+The plan also records the short-circuit gates of the graph (see `short_circuit`), and which nodes are observable, so
+that an execution can resolve gates early and skip nodes whose values are no longer needed.
+
+Ready nodes are handed out most critical first, see `scheduling`.
+"""
+
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from osprey.engine.ast.grammar import ASTNode, Source
+
+from .dependency_chain import DependencyChain
+from .scheduling import compute_critical_path_priorities, get_async_udf_name, get_udf_latency_stats
+from .short_circuit import ShortCircuitGate, get_short_circuit_gates, is_observable
+
+GateDependencyType = Tuple[DependencyChain, ShortCircuitGate, ASTNode]
+"""
+A gate that depends on a chain, along with the node that the gate uses to refer to that chain's value.
+"""
+
+_NODE_OUT = -1
+"""The node has been handed out by `get_ready()`, but has not yet been marked done."""
+_NODE_DONE = -2
+"""The node has been marked done."""
+_NODE_NOT_ENQUEUED = -3
+"""The node belongs to a source that has not (yet) been enqueued in this execution."""
+
+
+class ExecutionPlan:
+    """An immutable, per-graph execution plan. Generally, this is constructed by `compile_execution_graph`, and should
+    not be constructed directly."""
+
+    __slots__ = (
+        '_chains',
+        '_index_by_chain_id',
+        '_predecessors',
+        '_successors',
+        '_source_indices',
+        '_entry_point',
+        '_entry_point_predecessor_counts',
+        '_entry_point_ready',
+        '_observable',
+        '_prunable',
+        '_gates_by_predecessor',
+        '_async_udf_names',
+        '_priorities',
+        '_priorities_generation',
+    )
+
+    _chains: Tuple[DependencyChain, ...]
+    """Every dependency chain in the graph, in index order."""
+
+    _index_by_chain_id: Dict[int, int]
+    """A mapping of `id(chain)` to the index of that chain."""
+
+    _predecessors: Tuple[Tuple[int, ...], ...]
+    """For each node index, the indices of the nodes it depends on."""
+
+    _successors: Tuple[Tuple[int, ...], ...]
+    """For each node index, the indices of the nodes that depend on it."""
+
+    _source_indices: Dict[Source, Tuple[int, ...]]
+    """For each source, the topologically sorted node indices that must run for the source to be fully resolved."""
+
+    _entry_point: Source
+    """The entry-point source, which is always enqueued at the start of an execution."""
+
+    _entry_point_predecessor_counts: Tuple[int, ...]
+    """The outstanding predecessor counts of every node, right after the entry-point has been enqueued."""
+
+    _entry_point_ready: Tuple[int, ...]
+    """The nodes that are ready to execute, right after the entry-point has been enqueued."""
+
+    _observable: Tuple[bool, ...]
+    """For each node index, whether the node must be executed even if none of its successors need its value."""
+
+    _prunable: Tuple[bool, ...]
+    """For each node index, whether the node could ever become unneeded, i.e. it is not observable and every path from
+    it to an observable node goes through a short-circuit gate."""
+
+    _gates_by_predecessor: Tuple[Tuple[GateDependencyType, ...], ...]
+    """For each node index, the short-circuit gates that depend on it."""
+
+    _async_udf_names: Tuple[Optional[str], ...]
+    """For each node index, the name of the UDF that the node calls, if it is an async UDF call."""
+
+    _priorities: List[float]
+    """For each node index, the estimated cost of its critical path. This is the only part of the plan that changes
+    after it has been built, as it is recomputed when new latency statistics are published."""
+
+    _priorities_generation: int
+    """The generation of the latency statistics that `_priorities` was computed from."""
+
+    def __init__(
+        self, sorted_dependency_chains: Mapping[Source, Sequence[DependencyChain]], entry_point: Source
+    ) -> None:
+        chains: List[DependencyChain] = []
+        index_by_chain_id: Dict[int, int] = {}
+        source_indices: Dict[Source, Tuple[int, ...]] = {}
+
+        for source, sorted_chain in sorted_dependency_chains.items():
+            indices = []
+            for chain in sorted_chain:
+                index = index_by_chain_id.get(id(chain))
+                if index is None:
+                    index = len(chains)
+                    index_by_chain_id[id(chain)] = index
+                    chains.append(chain)
+                indices.append(index)
+            source_indices[source] = tuple(indices)
+
+        # The list of predecessors can contain duplicates, as long as they are mirrored in the successors,
+        # as each one will be counted (and then decremented) separately.
+        predecessors = tuple(
+            tuple(index_by_chain_id[id(dependency)] for dependency in chain.dependent_on) for chain in chains
+        )
+        successors: List[List[int]] = [[] for _ in chains]
+        for index, node_predecessors in enumerate(predecessors):
+            for predecessor in node_predecessors:
+                successors[predecessor].append(index)
+
+        self._chains = tuple(chains)
+        self._index_by_chain_id = index_by_chain_id
+        self._predecessors = predecessors
+        self._successors = tuple(tuple(s) for s in successors)
+        self._source_indices = source_indices
+        self._entry_point = entry_point
+
+        predecessor_counts = [_NODE_NOT_ENQUEUED] * len(chains)
+        ready: List[int] = []
+        for index in source_indices.get(entry_point, ()):
+            if predecessor_counts[index] != _NODE_NOT_ENQUEUED:
+                continue
+            count = len(predecessors[index])
+            predecessor_counts[index] = count
+            if count == 0:
+                ready.append(index)
+
+        self._entry_point_predecessor_counts = tuple(predecessor_counts)
+        self._entry_point_ready = tuple(ready)
+
+        self._observable = tuple(is_observable(chain, bool(successors[index])) for index, chain in enumerate(chains))
+        gates = get_short_circuit_gates(chains)
+
+        # Chains are indexed in topological order, so every successor has a higher index than its predecessors.
+        prunable = [False] * len(chains)
+        for index in reversed(range(len(chains))):
+            prunable[index] = not self._observable[index] and all(
+                id(chains[successor]) in gates or prunable[successor] for successor in successors[index]
+            )
+        self._prunable = tuple(prunable)
+
+        gates_by_predecessor: List[List[GateDependencyType]] = [[] for _ in chains]
+        for chain_id, gate in gates.items():
+            gate_chain = chains[index_by_chain_id[chain_id]]
+            # A chain's dependencies are in the same order as its executor's dependent nodes.
+            for dependency, dependency_node in zip(gate_chain.dependent_on, gate_chain.executor.get_dependent_nodes()):
+                gates_by_predecessor[index_by_chain_id[id(dependency)]].append((gate_chain, gate, dependency_node))
+        self._gates_by_predecessor = tuple(tuple(g) for g in gates_by_predecessor)
+
+        self._async_udf_names = tuple(get_async_udf_name(chain) for chain in chains)
+        self._priorities_generation = -1
+        self._priorities = []
+        self.get_priorities()
+
+    def __len__(self) -> int:
+        return len(self._chains)
+
+    def get_index(self, chain: DependencyChain) -> int:
+        """Returns the index that was assigned to a given dependency chain."""
+        return self._index_by_chain_id[id(chain)]
+
+    def get_chain(self, index: int) -> DependencyChain:
+        """Returns the dependency chain with the given index."""
+        return self._chains[index]
+
+    def get_source_indices(self, source: Source) -> Tuple[int, ...]:
+        """Returns the topologically sorted indices of the nodes that must run for the source to be resolved."""
+        return self._source_indices[source]
+
+    def get_predecessors(self, index: int) -> Tuple[int, ...]:
+        return self._predecessors[index]
+
+    def get_successors(self, index: int) -> Tuple[int, ...]:
+        return self._successors[index]
+
+    def is_observable(self, index: int) -> bool:
+        return self._observable[index]
+
+    def get_priorities(self) -> List[float]:
+        """Returns the critical path cost of each node index, recomputing them if the latency statistics changed."""
+        stats = get_udf_latency_stats()
+        if self._priorities_generation != stats.generation:
+            self._priorities = compute_critical_path_priorities(self._async_udf_names, self._successors, stats)
+            self._priorities_generation = stats.generation
+        return self._priorities
+
+    def get_priority(self, chain: DependencyChain) -> float:
+        return self.get_priorities()[self._index_by_chain_id[id(chain)]]
+
+    def get_gates_depending_on(self, chain: DependencyChain) -> Tuple[GateDependencyType, ...]:
+        """Returns the short-circuit gates that depend on a given chain."""
+        return self._gates_by_predecessor[self._index_by_chain_id[id(chain)]]
+
+    def new_state(self) -> 'ExecutionPlanState':
+        """Creates the mutable per-execution state, with the entry-point already enqueued."""
+        return ExecutionPlanState(self)
+
+
+class ExecutionPlanState:
+    """The mutable, per-execution progress through an `ExecutionPlan`. Tracks which nodes are ready to run, handed
+    out, or done.
+
+    Mirrors the `graphlib.TopologicalSorter` interface (`get_ready()` / `done()`), but allows new sources to be
+    enqueued after execution has started."""
+
+    __slots__ = ('_plan', '_predecessor_counts', '_ready', '_enqueued_sources')
+
+    def __init__(self, plan: ExecutionPlan) -> None:
+        self._plan = plan
+        self._predecessor_counts: List[int] = list(plan._entry_point_predecessor_counts)
+        self._ready: List[int] = list(plan._entry_point_ready)
+        self._enqueued_sources: Set[Source] = {plan._entry_point}
+
+    def enqueue_source(self, source: Source) -> None:
+        """Adds the nodes required to resolve `source` that are not already part of this execution."""
+        if source in self._enqueued_sources:
+            return
+        self._enqueued_sources.add(source)
+
+        predecessor_counts = self._predecessor_counts
+        predecessors = self._plan._predecessors
+        for index in self._plan.get_source_indices(source):
+            if predecessor_counts[index] != _NODE_NOT_ENQUEUED:
+                continue
+
+            # The source indices are topologically sorted, so every predecessor has been enqueued by now. We're only
+            # waiting on the predecessors which have not been completed yet.
+            count = 0
+            for predecessor in predecessors[index]:
+                if predecessor_counts[predecessor] != _NODE_DONE:
+                    count += 1
+
+            predecessor_counts[index] = count
+            if count == 0:
+                self._ready.append(index)
+
+    def get_ready(self) -> Sequence[DependencyChain]:
+        """Returns all the chains that have become ready since the last call, most critical first, marking them as
+        handed out."""
+        if not self._ready:
+            return ()
+
+        ready = self._ready
+        self._ready = []
+        if len(ready) > 1:
+            ready.sort(key=self._plan.get_priorities().__getitem__, reverse=True)
+        predecessor_counts = self._predecessor_counts
+        chains = self._plan._chains
+        result = []
+        for index in ready:
+            predecessor_counts[index] = _NODE_OUT
+            result.append(chains[index])
+        return result
+
+    def done(self, chain: DependencyChain) -> None:
+        """Marks a chain that was returned by `get_ready()` as done, unblocking any enqueued successors."""
+        index = self._plan._index_by_chain_id[id(chain)]
+        predecessor_counts = self._predecessor_counts
+
+        status = predecessor_counts[index]
+        if status != _NODE_OUT:
+            if status >= 0:
+                raise ValueError(f'node {chain!r} was not passed out (still not ready)')
+            elif status == _NODE_DONE:
+                raise ValueError(f'node {chain!r} was already marked done')
+            else:
+                raise ValueError(f'node {chain!r} was not enqueued')
+
+        self._mark_done(index)
+
+    def is_pending(self, chain: DependencyChain) -> bool:
+        """Whether a chain has been enqueued, but is still waiting on some of its predecessors."""
+        return self._predecessor_counts[self._plan._index_by_chain_id[id(chain)]] > 0
+
+    def short_circuit(self, chain: DependencyChain) -> bool:
+        """Marks a chain that is still waiting on some of its predecessors as done, because its value has already been
+        decided. Returns False (and does nothing) if the chain is not pending."""
+        index = self._plan._index_by_chain_id[id(chain)]
+        if self._predecessor_counts[index] <= 0:
+            return False
+        self._mark_done(index)
+        return True
+
+    def is_needed(self, chain: DependencyChain) -> bool:
+        """Whether the value of a chain can still be observed, either because the chain itself is observable, or
+        because it has a successor that is still needed and not yet done."""
+        plan = self._plan
+        start = plan._index_by_chain_id[id(chain)]
+        if not plan._prunable[start]:
+            return True
+
+        predecessor_counts = self._predecessor_counts
+        to_visit = [start]
+        visited = {start}
+        while to_visit:
+            index = to_visit.pop()
+            if plan._observable[index]:
+                return True
+            for successor in plan._successors[index]:
+                status = predecessor_counts[successor]
+                if status == _NODE_DONE or successor in visited:
+                    continue
+                if status == _NODE_NOT_ENQUEUED:
+                    # The successor's source may still be enqueued later on in this execution.
+                    return True
+                visited.add(successor)
+                to_visit.append(successor)
+        return False
+
+    def _mark_done(self, index: int) -> None:
+        predecessor_counts = self._predecessor_counts
+        predecessor_counts[index] = _NODE_DONE
+        for successor in self._plan._successors[index]:
+            # Successors that belong to sources which have not been enqueued are skipped, once (and if) they are
+            # enqueued, they will only count the predecessors that are not done.
+            if predecessor_counts[successor] > 0:
+                predecessor_counts[successor] -= 1
+                if predecessor_counts[successor] == 0:
+                    self._ready.append(successor)
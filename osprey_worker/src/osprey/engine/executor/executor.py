@@ -1,8 +1,12 @@
+import random
+import time
 from collections import defaultdict
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Set, Tuple
 
 import gevent
 import gevent.pool
+import gevent.queue
 from ddtrace import tracer
 from ddtrace.span import Span as TracerSpan
 from osprey.engine.ast.grammar import ASTNode
@@ -14,7 +18,9 @@ from osprey.engine.executor.custom_extracted_features import (
 )
 from osprey.engine.stdlib.udfs.json_utils import MissingJsonPath
 from osprey.engine.udf.base import BatchableUDFBase
+from osprey.engine.utils.types import add_slots
 from osprey.worker.lib.instruments import metrics
+from osprey.worker.lib.instruments.aggregating_counters import AggregatingCounters, TagsType
 from osprey.worker.lib.osprey_shared.logging import get_logger
 from osprey.worker.lib.pigeon.exceptions import RPCException
 from result import Err, Ok
@@ -30,43 +36,83 @@ from .execution_context import (
     NodeResult,
 )
 from .execution_graph import ExecutionGraph
+from .external_service_utils import ExternalServiceAccessor
 from .node_executor.call_executor import CallExecutor
+from .node_profiler import ExecutionProfile, get_node_profile_aggregates
+from .scheduling import get_udf_latency_stats
 from .udf_execution_helpers import UDFHelpers
 
 logger = get_logger(__name__)
 
-InProgressSingletsType = Dict['gevent.Greenlet[NodeResult]', DependencyChain]
+
+@add_slots
+@dataclass
+class _ActionExecution:
+    """The state of a single action's execution, while it is being driven by the executor loop."""
+
+    context: ExecutionContext
+    error_infos: List[NodeErrorInfo] = field(default_factory=list)
+
+
+ScheduledChainType = Tuple[_ActionExecution, DependencyChain]
 """
-A dictionary mapping in-progress async greenlets to the chain that they are executing.
+A chain, along with the action execution that it belongs to.
 """
-InProgressBatchesType = Dict['gevent.Greenlet[Sequence[NodeResult]]', Sequence[DependencyChain]]
+InProgressSingletsType = Dict['gevent.Greenlet[NodeResult]', ScheduledChainType]
 """
-A dictionary mapping in-progress batch async greenlets to the sequence of chains that they are executing.
+A dictionary mapping in-progress async greenlets to the chain that they are executing.
 """
-FinishedSingletsType = Sequence['gevent.Greenlet[NodeResult]']
+InProgressBatchesType = Dict['gevent.Greenlet[Sequence[NodeResult]]', Sequence[ScheduledChainType]]
 """
-A sequence of finished async singlets.
+A dictionary mapping in-progress batch async greenlets to the sequence of chains that they are executing.
 """
-FinishedBatchesType = Sequence['gevent.Greenlet[Sequence[NodeResult]]']
+CompletionQueueType = 'gevent.queue.Queue[gevent.Greenlet[Any]]'
 """
-A sequence of finished async batches.
+A queue that in-progress async greenlets (singlets and batches alike) are pushed onto as soon as they finish.
 """
 
 
 def _get_ready_sync_and_async(
-    allow_async: bool, context: ExecutionContext
-) -> Tuple[Sequence[DependencyChain], Sequence[DependencyChain]]:
+    allow_async: bool, executions: Sequence[_ActionExecution], short_circuit: bool = False
+) -> Tuple[Sequence[ScheduledChainType], Sequence[ScheduledChainType]]:
     _ready_sync = []
     _ready_async = []
     # Partition the ready chains into sync and async
-    for ready_chain in context.get_ready_to_execute():
-        if ready_chain.executor.execute_async and allow_async:
-            _ready_async.append(ready_chain)
-        else:
-            _ready_sync.append(ready_chain)
+    for execution in executions:
+        context = execution.context
+        ready_chains = context.get_ready_to_execute()
+        while ready_chains:
+            skipped_any = False
+            for ready_chain in ready_chains:
+                # Sync chains are cheap enough that it's not worth checking whether they are still needed.
+                if short_circuit and ready_chain.executor.execute_async and not context.is_needed(ready_chain):
+                    context.skip(ready_chain)
+                    skipped_any = True
+                elif ready_chain.executor.execute_async and allow_async:
+                    _ready_async.append((execution, ready_chain))
+                else:
+                    _ready_sync.append((execution, ready_chain))
+            # Skipping a chain may have made its successors ready.
+            ready_chains = context.get_ready_to_execute() if skipped_any else ()
+
+    # Each context hands out its ready chains most critical first, but when several actions are executed together,
+    # their async chains need to be interleaved by priority too.
+    if len(executions) > 1 and len(_ready_async) > 1:
+        plan = executions[0].context.execution_graph.execution_plan
+        _ready_async.sort(key=lambda scheduled: plan.get_priority(scheduled[1]), reverse=True)
     return _ready_sync, _ready_async
 
 
+def _skip_unneeded(scheduled_chains: Sequence[ScheduledChainType]) -> List[ScheduledChainType]:
+    needed = []
+    for execution, chain in scheduled_chains:
+        if execution.context.is_needed(chain):
+            needed.append((execution, chain))
+        else:
+            execution.context.skip(chain)
+    return needed
+
+
 def _is_spammy_exception(e: Optional[Exception]) -> bool:
     """
     Add any spammy exceptions here to avoid sending them in metrics
@@ -80,46 +126,101 @@ def _is_spammy_exception(e: Optional[Exception]) -> bool:
     )
 
 
+_udf_execution_counters = AggregatingCounters(metrics)
+"""
+The `udf_execution` and `udf_execution_batch` counters are incremented for (nearly) every call node, so they are
+aggregated in-process rather than sent to statsd one at a time.
+"""
+
+_MetricTagsKeyType = Tuple[str, str, Optional[type], Optional[str], Optional[str], Optional[str]]
+_interned_metric_tags: Dict[_MetricTagsKeyType, TagsType] = {}
+"""Metric tags, interned by everything that goes into them, so that they are only formatted once."""
+
+
 def _get_metric_tags(
-    context: ExecutionContext, batchable_udf: Optional[BatchableUDFBase[Any, Any, Any]] = None
-) -> List[str]:
-    return [
-        f'action:{context.get_action_name()}',
-        f'encoding:{context.get_data_encoding()}',
-        f'batch_type:{batchable_udf.get_batchable_arguments_type().__name__}'
-        if batchable_udf is not None
-        else 'batch_type:none',
-        # These are autodiscovery tags with high cardinality that we want to override so we do not ingest them
-        'host:none',
-        'kube_node:none',
-        'instance-id:none',
-        'internal-hostname:none',
-        'name:none',
-    ]
+    context: ExecutionContext,
+    batchable_udf: Optional[BatchableUDFBase[Any, Any, Any]] = None,
+    udf_name: Optional[str] = None,
+    exc_name: Optional[str] = None,
+    result: Optional[str] = None,
+) -> TagsType:
+    key: _MetricTagsKeyType = (
+        context.get_action_name(),
+        context.get_data_encoding(),
+        type(batchable_udf) if batchable_udf is not None else None,
+        udf_name,
+        exc_name,
+        result,
+    )
+    tags = _interned_metric_tags.get(key)
+    if tags is None:
+        tags = (
+            f'action:{key[0]}',
+            f'encoding:{key[1]}',
+            f'batch_type:{batchable_udf.get_batchable_arguments_type().__name__}'
+            if batchable_udf is not None
+            else 'batch_type:none',
+            # These are autodiscovery tags with high cardinality that we want to override so we do not ingest them
+            'host:none',
+            'kube_node:none',
+            'instance-id:none',
+            'internal-hostname:none',
+            'name:none',
+        )
+        if udf_name is not None:
+            tags += (f'udf:{udf_name}',)
+        if exc_name is not None:
+            tags += (f'exc_name:{exc_name}',)
+        if result is not None:
+            tags += (f'result:{result}',)
+        _interned_metric_tags[key] = tags
+    return tags
+
+
+def _get_exc_name(e: Exception) -> str:
+    exc_name = e.__class__.__name__
+    if isinstance(e, RPCException):
+        exc_name = exc_name + f'.{e.code().name.lower()}'
+    return exc_name
 
 
 def _wrapped_batch_execution(
     udfs: Sequence[BatchableUDFBase[Any, Any, Any]],
     nodes: Sequence[ASTNode],  # these are passed in for error tracking ^^
     batchable_args: Sequence[Any],
-    context: ExecutionContext,
-    error_info_: List[NodeErrorInfo],
+    contexts: Sequence[ExecutionContext],
+    error_infos: Sequence[List[NodeErrorInfo]],
 ) -> Sequence[NodeResult]:
     """
     Executes a batch of batchable UDFs, and returns an ordered list of the results of the execution.
 
     This function expects that the UDFs have already been sorted by their batchable arguments type and routing key.
+    `contexts` and `error_infos` are per-UDF, as a batch may span several actions when the UDF supports
+    cross-action batching. In that case, `execute_batch` is called with the context of the first UDF in the batch.
     """
-    assert len(udfs) == len(nodes) == len(batchable_args), (
-        '_wrapped_batch_execution invariant: udfs, nodes, and batchable_args must be the same length'
+    assert len(udfs) == len(nodes) == len(batchable_args) == len(contexts) == len(error_infos), (
+        '_wrapped_batch_execution invariant: udfs, nodes, batchable_args, contexts and error_infos must be the same '
+        'length'
     )
     num_executions = len(udfs)
 
-    metric_tags = _get_metric_tags(context, udfs[0])
-
     try:
-        with metrics.timed('udf_execution_batch_duration', tags=metric_tags, sample_rate=0.01):
-            results = udfs[0].execute_batch(context, udfs, batchable_args)
+        start_time = time.perf_counter()
+        cpu_start_time = time.thread_time()
+        try:
+            results = udfs[0].execute_batch(contexts[0], udfs, batchable_args)
+        finally:
+            duration = time.perf_counter() - start_time
+            _record_batch_profile(udfs, nodes, contexts, duration, time.thread_time() - cpu_start_time)
+            metrics.timing(
+                'udf_execution_batch_duration',
+                duration,
+                tags=list(_get_metric_tags(contexts[0], udfs[0])),
+                sample_rate=0.01,
+            )
+        latency_stats = get_udf_latency_stats()
+        for udf_name in {udf.__class__.__name__ for udf in udfs}:
+            latency_stats.record(udf_name, duration)
         # if the result length doesn't properly return the number of executions,
         # we cant guarantee which result corresponds to which execution
         assert len(results) == num_executions, (
@@ -128,68 +229,84 @@ def _wrapped_batch_execution(
     except Exception as e:
         # no need to re-add this to errors, it's not the root cause
         if not isinstance(e, NodeFailurePropagationException):
-            for n in nodes:
+            for n, error_info_ in zip(nodes, error_infos):
                 error_info_.append(NodeErrorInfo(e, n))
         # if we couldn't even execute the batch, then everything failed ! :c
         if not _is_spammy_exception(e):
-            metrics.increment(
+            exc_name = e.__class__.__name__
+            _udf_execution_counters.increment(
                 'udf_execution_batch',
-                tags=metric_tags + [f'exc_name:{e.__class__.__name__}', 'result:unexpected_failure'],
+                _get_metric_tags(contexts[0], udfs[0], exc_name=exc_name, result='unexpected_failure'),
             )
-            for udf in udfs:
-                metrics.increment(
+            for udf, context in zip(udfs, contexts):
+                _udf_execution_counters.increment(
                     'udf_execution',
-                    tags=metric_tags
-                    + [
-                        f'udf:{udf.__class__.__name__}',
-                        f'exc_name:{e.__class__.__name__}',
-                        'result:unexpected_failure',
-                    ],
+                    _get_metric_tags(
+                        context, udfs[0], udf.__class__.__name__, exc_name=exc_name, result='unexpected_failure'
+                    ),
                 )
         return [Err(None)] * num_executions
 
     type_checked_results = []
-    for udf, node, result in zip(udfs, nodes, results):
+    for udf, node, result, error_info_, context in zip(udfs, nodes, results, error_infos, contexts):
         if result.is_err():
             if not isinstance(result.value, NodeFailurePropagationException):
                 error_info_.append(NodeErrorInfo(result.value, node))
             if not _is_spammy_exception(result.value):
-                exc_name = result.value.__class__.__name__
-                if isinstance(result.value, RPCException):
-                    exc_name = exc_name + f'.{result.value.code().name.lower()}'
-                metrics.increment(
+                _udf_execution_counters.increment(
                     'udf_execution',
-                    tags=metric_tags
-                    + [f'udf:{udf.__class__.__name__}', f'exc_name:{exc_name}', 'result:unexpected_failure'],
+                    _get_metric_tags(
+                        context,
+                        udfs[0],
+                        udf.__class__.__name__,
+                        exc_name=_get_exc_name(result.value),
+                        result='unexpected_failure',
+                    ),
                 )
             type_checked_results.append(Err(None))
             continue
         try:
             type_checked_results.append(Ok(udf.check_result_type(result.value)))
-            metrics.increment(
+            _udf_execution_counters.increment(
                 'udf_execution',
-                tags=metric_tags + [f'udf:{udf.__class__.__name__}', 'exc_name:none', 'result:success'],
+                _get_metric_tags(context, udfs[0], udf.__class__.__name__, exc_name='none', result='success'),
             )
         except Exception as e:
             # No need to re-add this to errors, it's not the root cause
             if not isinstance(e, NodeFailurePropagationException):
                 error_info_.append(NodeErrorInfo(e, node))
             if not _is_spammy_exception(e):
-                exc_name = e.__class__.__name__
-                if isinstance(e, RPCException):
-                    exc_name = exc_name + f'.{e.code().name.lower()}'
-                metrics.increment(
+                _udf_execution_counters.increment(
                     'udf_execution',
-                    tags=metric_tags
-                    + [f'udf:{udf.__class__.__name__}', f'exc_name:{exc_name}', 'result:unexpected_failure'],
+                    _get_metric_tags(
+                        context, udfs[0], udf.__class__.__name__, exc_name=_get_exc_name(e), result='unexpected_failure'
+                    ),
                 )
             type_checked_results.append(Err(None))
 
-    metrics.increment('udf_execution_batch', tags=metric_tags + ['exc_name:none', 'result:success'])
+    _udf_execution_counters.increment(
+        'udf_execution_batch', _get_metric_tags(contexts[0], udfs[0], exc_name='none', result='success')
+    )
 
     return type_checked_results
 
 
+def _record_batch_profile(
+    udfs: Sequence[BatchableUDFBase[Any, Any, Any]],
+    nodes: Sequence[ASTNode],
+    contexts: Sequence[ExecutionContext],
+    wall_seconds: float,
+    cpu_seconds: float,
+) -> None:
+    """Records a batch in the profiles of the profiled executions it is part of, splitting its cost evenly between the
+    batched nodes."""
+    share = 1 / len(udfs)
+    for udf, node, context in zip(udfs, nodes, contexts):
+        profile = context.profile
+        if profile is not None:
+            profile.record(node, udf.__class__.__name__, wall_seconds * share, cpu_seconds * share)
+
+
 def _wrapped_execution(
     chain: DependencyChain,
     context: ExecutionContext,
@@ -197,19 +314,35 @@ def _wrapped_execution(
 ) -> NodeResult:
     caught_exception: Optional[Exception] = None
 
-    metric_tags = _get_metric_tags(context)
+    udf_name: Optional[str] = None
     if isinstance(chain.executor, CallExecutor):
         # This half step is necessary as mypy has a difficult time linting build in class variables
         call_node: CallExecutor = chain.executor
-        metric_tags += [f'udf:{call_node._udf.__class__.__name__}']
+        udf_name = call_node._udf.__class__.__name__
+
+    profile = context.profile
+    if profile is not None:
+        profile_wall_start = time.perf_counter()
+        profile_cpu_start = time.thread_time()
 
     # Make mypy happy
     execution_result: NodeResult = Err(None)
     try:
         # only track time if using an async function
         if chain.executor.execute_async:
-            with metrics.timed('udf_execution_duration', tags=metric_tags, sample_rate=0.01):
+            start_time = time.perf_counter()
+            try:
                 execution_result = Ok(chain.executor.execute(execution_context=context))
+            finally:
+                duration = time.perf_counter() - start_time
+                metrics.timing(
+                    'udf_execution_duration',
+                    duration,
+                    tags=list(_get_metric_tags(context, udf_name=udf_name)),
+                    sample_rate=0.01,
+                )
+            if udf_name is not None:
+                get_udf_latency_stats().record(udf_name, duration)
         else:
             execution_result = Ok(chain.executor.execute(execution_context=context))
     except Exception as e:
@@ -220,41 +353,55 @@ def _wrapped_execution(
         caught_exception = e
 
     finally:
-        # If this is a call node which executed a UDF, push the results of the execution to the datadog metrics.
-        if isinstance(chain.executor, CallExecutor):
-            if execution_result.is_ok() and chain.executor and chain.executor.execute_async:
-                metrics.increment('udf_execution', tags=metric_tags + ['exc_name:none', 'result:success'])
+        # If this is a call node which executed a UDF, count the results of the execution in the datadog metrics.
+        if udf_name is not None:
+            if execution_result.is_ok() and chain.executor.execute_async:
+                _udf_execution_counters.increment(
+                    'udf_execution', _get_metric_tags(context, udf_name=udf_name, exc_name='none', result='success')
+                )
 
             # Ignore some well-known "unexpected" exceptions that are spammy.
-            elif not _is_spammy_exception(caught_exception):
-                exc_name = caught_exception.__class__.__name__
-                if isinstance(caught_exception, RPCException):
-                    exc_name = exc_name + f'.{caught_exception.code().name.lower()}'
-                metrics.increment(
+            elif caught_exception is not None and not _is_spammy_exception(caught_exception):
+                _udf_execution_counters.increment(
                     'udf_execution',
-                    tags=metric_tags + [f'exc_name:{exc_name}', 'result:unexpected_failure'],
+                    _get_metric_tags(
+                        context,
+                        udf_name=udf_name,
+                        exc_name=_get_exc_name(caught_exception),
+                        result='unexpected_failure',
+                    ),
                 )
 
+        if profile is not None:
+            profile.record(
+                chain.executor.node,
+                udf_name,
+                time.perf_counter() - profile_wall_start,
+                time.thread_time() - profile_cpu_start,
+            )
+
         return execution_result
 
 
 def _enqueue_batches(
-    context: ExecutionContext,
-    error_infos: List[NodeErrorInfo],
     async_pool: gevent.pool.Pool,
     in_progress_async_batches: InProgressBatchesType,
-    ready_async: Sequence[DependencyChain],
-) -> Sequence[DependencyChain]:
+    completed_async: CompletionQueueType,
+    ready_async: Sequence[ScheduledChainType],
+) -> Sequence[ScheduledChainType]:
     """
     Collects all the ready async chains that can be batched together and batches
     them according to their batchable arguments type and routing key.
 
+    Chains are only batched with chains of the same action, unless their UDF sets `supports_cross_action_batching`.
+
     Returns the remaining ready async chains that could not be batched together.
     """
-    # tuple( batch_type, routing_key ) -> list of tuple( chain, args )
-    batch_chains: Dict[Tuple[type, str], List[Tuple[DependencyChain, Any]]] = defaultdict(list)
-    chains_to_remove: List[DependencyChain] = []
-    for async_chain in ready_async:
+    # tuple( batch_type, routing_key[, execution id] ) -> list of tuple( execution, chain, args )
+    batch_chains: Dict[Tuple[Hashable, ...], List[Tuple[_ActionExecution, DependencyChain, Any]]] = defaultdict(list)
+    # Chains are shared between all executions of the same graph, so they are tracked along with their execution.
+    chain_ids_to_remove: Set[Tuple[int, int]] = set()
+    for execution, async_chain in ready_async:
         if not isinstance(async_chain.executor, CallExecutor):
             continue
         call_executor: CallExecutor = async_chain.executor
@@ -268,17 +415,22 @@ def _enqueue_batches(
         batch_type = udf.get_batchable_arguments_type()
 
         try:
-            resolved_arguments = udf.resolve_arguments(context, call_executor)
+            resolved_arguments = udf.resolve_arguments(execution.context, call_executor)
             batchable_arguments = udf.get_batchable_arguments(resolved_arguments)
 
             routing_key = udf.get_batch_routing_key(batchable_arguments)
-            batch_chains[(batch_type, routing_key)].append((async_chain, batchable_arguments))
+            batch_key: Tuple[Hashable, ...] = (
+                (batch_type, routing_key)
+                if udf.supports_cross_action_batching
+                else (batch_type, routing_key, id(execution))
+            )
+            batch_chains[batch_key].append((execution, async_chain, batchable_arguments))
         except Exception as e:
             # No need to re-add this to errors, it's not the root cause
             if not isinstance(e, NodeFailurePropagationException):
-                error_infos.append(NodeErrorInfo(e, call_executor.node))
-            chains_to_remove.append(async_chain)
-            context.set_resolved_value(async_chain, Err(None))
+                execution.error_infos.append(NodeErrorInfo(e, call_executor.node))
+            chain_ids_to_remove.add((id(execution), id(async_chain)))
+            execution.context.set_resolved_value(async_chain, Err(None))
 
     # we can batch the chains together now that they are sorted by type & routing key ₍^ >ヮ<^₎ .ᐟ.ᐟ
     for _, chains_and_args in batch_chains.items():
@@ -286,9 +438,9 @@ def _enqueue_batches(
             # if there is only one element, we will simply run it as a single async task later
             continue
 
-        chains, args = zip(*chains_and_args)
+        executions, chains, args = zip(*chains_and_args)
 
-        chains_to_remove.extend(chains)
+        chain_ids_to_remove.update((id(execution), id(chain)) for execution, chain in zip(executions, chains))
 
         in_progress_batch_greenlet = async_pool.apply_async(
             _wrapped_batch_execution,
@@ -296,103 +448,105 @@ def _enqueue_batches(
                 [chain.executor._udf for chain in chains],
                 [chain.executor.node for chain in chains],
                 args,
-                context,
-                error_infos,
+                [execution.context for execution in executions],
+                [execution.error_infos for execution in executions],
             ),
         )
-        in_progress_async_batches[in_progress_batch_greenlet] = chains
+        in_progress_async_batches[in_progress_batch_greenlet] = list(zip(executions, chains))
+        in_progress_batch_greenlet.rawlink(completed_async.put)
 
-    return [chain for chain in ready_async if chain not in chains_to_remove]
+    if not chain_ids_to_remove:
+        return ready_async
+    return [
+        (execution, chain) for execution, chain in ready_async if (id(execution), id(chain)) not in chain_ids_to_remove
+    ]
 
 
-def execute(
-    execution_graph: ExecutionGraph,
-    udf_helpers: UDFHelpers,
-    action: Action,
+def _run_executions(
+    executions: Sequence[_ActionExecution],
     async_pool: Optional[gevent.pool.Pool],
-    sample_rate: int = 100,
-    parent_tracer_span: Optional[TracerSpan] = None,
-) -> ExecutionResult:
-    """A 'parallel' executor using gevent greenlets.
-
-    :param execution_graph: The graph of rules
-    :param udf_helpers: Holds additional helpers that UDFs need to operate
-    :param action: The action to execute against the rules
-    :param async_pool: A pool to run asynchronous tasks in. Can be used to limit how many tasks can be run at any time.
-        If None then everything will be run synchronously.
-    :param sample_rate: From 0 to 100, what percentage of actions should actually be executed.
-    :return: The result of the execution.
-    """
-    if parent_tracer_span:
-        parent_tracer_span.set_tag('action-name', action.action_name)
+    parent_tracer_span: Optional[TracerSpan],
+    short_circuit: bool = False,
+) -> None:
+    """Drives the given action executions to completion, interleaving them so that they share the async pool.
 
-    context = ExecutionContext(execution_graph=execution_graph, helpers=udf_helpers, action=action)
+    When `short_circuit` is set, ready async chains are held back until there is no sync work left to do, as the
+    (cheap) sync work may decide gates that make the (expensive) async work unnecessary."""
     allow_async = async_pool is not None
     assert async_pool is None or async_pool.size is None or async_pool.size > 0
-    error_infos: List[NodeErrorInfo] = []
 
     in_progress_async_singlets: InProgressSingletsType = {}
     in_progress_async_batches: InProgressBatchesType = {}
-
-    ready_sync, ready_async = _get_ready_sync_and_async(allow_async, context)
-
-    while ready_sync or ready_async or in_progress_async_singlets or in_progress_async_batches:
-        # Get however many async tasks happen to be done already, without blocking.
-        finished_async_singlets: FinishedSingletsType = [
-            greenlet for greenlet in in_progress_async_singlets.keys() if greenlet.ready()
-        ]
-        finished_async_batches: FinishedBatchesType = [
-            greenlet for greenlet in in_progress_async_batches.keys() if greenlet.ready()
-        ]
-
-        if not ready_sync and not ready_async:
+    # Rather than polling every in-progress greenlet, each one pushes itself onto this queue when it finishes.
+    completed_async: CompletionQueueType = gevent.queue.Queue()
+    deferred_async: List[ScheduledChainType] = []
+
+    ready_sync, ready_async = _get_ready_sync_and_async(allow_async, executions, short_circuit)
+
+    while ready_sync or ready_async or deferred_async or in_progress_async_singlets or in_progress_async_batches:
+        if short_circuit:
+            if ready_sync:
+                deferred_async.extend(ready_async)
+                ready_async = []
+            elif deferred_async:
+                ready_async = _skip_unneeded([*deferred_async, *ready_async])
+                deferred_async = []
+                if not ready_async:
+                    # Skipping may have made other chains ready.
+                    ready_sync, ready_async = _get_ready_sync_and_async(allow_async, executions, short_circuit)
+                    continue
+
+        if not ready_sync and not ready_async and completed_async.empty():
             # Since we have nothing else to do (and are therefore fully blocked on existing async) block/wait for
             # at least one to finish.
-            if in_progress_async_singlets:
-                with tracer.start_span('osprey.rules.gevent_wait_async_nodes', child_of=parent_tracer_span):
-                    finished_async_singlets = gevent.wait(in_progress_async_singlets.keys(), count=1)
-            elif in_progress_async_batches:
-                with tracer.start_span('osprey.rules.gevent_wait_async_batch_nodes', child_of=parent_tracer_span):
-                    finished_async_batches = gevent.wait(in_progress_async_batches.keys(), count=1)
-
-        # Handle finished async tasks
-        for finished_async_singlet in finished_async_singlets:
-            async_chain = in_progress_async_singlets.pop(finished_async_singlet)
-            result = finished_async_singlet.get()
-            context.set_resolved_value(async_chain, result)
-        # Handle finished async batch tasks
-        for finished_async_batch in finished_async_batches:
-            async_chains = in_progress_async_batches.pop(finished_async_batch)
-            results = finished_async_batch.get()
-            for i, chain in enumerate(async_chains):
-                context.set_resolved_value(chain, results[i])
+            with tracer.start_span('osprey.rules.gevent_wait_async_nodes', child_of=parent_tracer_span):
+                completed_async.peek()
+
+        # Handle however many async tasks are done, in the order that they finished.
+        while not completed_async.empty():
+            finished_greenlet = completed_async.get_nowait()
+            scheduled_chain = in_progress_async_singlets.pop(finished_greenlet, None)
+            if scheduled_chain is not None:
+                execution, async_chain = scheduled_chain
+                execution.context.set_resolved_value(async_chain, finished_greenlet.get())
+                continue
+            scheduled_chains = in_progress_async_batches.pop(finished_greenlet)
+            results = finished_greenlet.get()
+            for i, (execution, chain) in enumerate(scheduled_chains):
+                execution.context.set_resolved_value(chain, results[i])
 
         # enqueue all ready async tasks
         if async_pool is not None:
             # enqueue any ready async tasks that can be batched
             with tracer.start_span('osprey.rules.try_enqueue_batches', child_of=parent_tracer_span):
                 remaining_ready_async = _enqueue_batches(
-                    context, error_infos, async_pool, in_progress_async_batches, ready_async
+                    async_pool, in_progress_async_batches, completed_async, ready_async
                 )
 
             # enqueue the remaining non-batched async tasks
-            for async_chain in remaining_ready_async:
+            for execution, async_chain in remaining_ready_async:
                 in_progress_greenlet = async_pool.apply_async(
-                    _wrapped_execution, args=(async_chain, context, error_infos)
+                    _wrapped_execution, args=(async_chain, execution.context, execution.error_infos)
                 )
-                in_progress_async_singlets[in_progress_greenlet] = async_chain
+                in_progress_async_singlets[in_progress_greenlet] = (execution, async_chain)
+                in_progress_greenlet.rawlink(completed_async.put)
 
-        for i, sync_chain in enumerate(ready_sync):
+        for i, (execution, sync_chain) in enumerate(ready_sync):
             # If we have a lot of things running, give async a chance every so often.
             if (in_progress_async_singlets or in_progress_async_batches) and i % 100 == 0:
                 gevent.sleep(0)
-            result = _wrapped_execution(sync_chain, context, error_infos)
-            context.set_resolved_value(sync_chain, result)
+            result = _wrapped_execution(sync_chain, execution.context, execution.error_infos)
+            execution.context.set_resolved_value(sync_chain, result)
 
-        ready_sync, ready_async = _get_ready_sync_and_async(allow_async, context)
+        ready_sync, ready_async = _get_ready_sync_and_async(allow_async, executions, short_circuit)
 
+
+def _build_execution_result(
+    execution_graph: ExecutionGraph, action: Action, execution: _ActionExecution, sample_rate: int
+) -> ExecutionResult:
+    context = execution.context
     unexpected_error_infos = [
-        error_info for error_info in error_infos if not isinstance(error_info.error, ExpectedUdfException)
+        error_info for error_info in execution.error_infos if not isinstance(error_info.error, ExpectedUdfException)
     ]
     validator_results = execution_graph.validated_sources.validation_results
 
@@ -406,6 +560,11 @@ def execute(
         ]
     )
 
+    profile = context.profile
+    if profile is not None:
+        profile.finish()
+        get_node_profile_aggregates().add(profile)
+
     result = ExecutionResult(
         extracted_features=context.get_extracted_features(),
         action=action,
@@ -413,5 +572,113 @@ def execute(
         validator_results=validator_results,
         error_infos=unexpected_error_infos,
         sample_rate=sample_rate,
+        profile=profile,
     )
     return result
+
+
+def _maybe_new_profile(profile_sample_rate: float) -> Optional[ExecutionProfile]:
+    """Returns a profile to record an execution into, if the execution is sampled for profiling."""
+    if profile_sample_rate > 0 and random.random() < profile_sample_rate:
+        return ExecutionProfile()
+    return None
+
+
+def execute(
+    execution_graph: ExecutionGraph,
+    udf_helpers: UDFHelpers,
+    action: Action,
+    async_pool: Optional[gevent.pool.Pool],
+    sample_rate: int = 100,
+    parent_tracer_span: Optional[TracerSpan] = None,
+    short_circuit: bool = False,
+    profile_sample_rate: float = 0.0,
+) -> ExecutionResult:
+    """A 'parallel' executor using gevent greenlets.
+
+    :param execution_graph: The graph of rules
+    :param udf_helpers: Holds additional helpers that UDFs need to operate
+    :param action: The action to execute against the rules
+    :param async_pool: A pool to run asynchronous tasks in. Can be used to limit how many tasks can be run at any time.
+        If None then everything will be run synchronously.
+    :param sample_rate: From 0 to 100, what percentage of actions should actually be executed.
+    :param short_circuit: Whether to resolve `and`/`or` operations and `Rule(when_all=[...])` conditions as soon as
+        they are decided, skipping the nodes that are then no longer observable. Extracted features are always
+        executed, but a rule with a failing condition may evaluate to False rather than failing, and errors from
+        skipped nodes are not reported.
+    :param profile_sample_rate: From 0 to 1, the probability that the execution is profiled. The wall and CPU time of
+        each node of a profiled execution are recorded in `ExecutionResult.profile`, and in the process-wide
+        aggregates, see `node_profiler.get_node_profile_aggregates`.
+    :return: The result of the execution.
+    """
+    if parent_tracer_span:
+        parent_tracer_span.set_tag('action-name', action.action_name)
+
+    execution = _ActionExecution(
+        context=ExecutionContext(
+            execution_graph=execution_graph,
+            helpers=udf_helpers,
+            action=action,
+            short_circuit=short_circuit,
+            profile=_maybe_new_profile(profile_sample_rate),
+        )
+    )
+    _run_executions([execution], async_pool, parent_tracer_span, short_circuit)
+    return _build_execution_result(execution_graph, action, execution, sample_rate)
+
+
+def execute_many(
+    execution_graph: ExecutionGraph,
+    udf_helpers: UDFHelpers,
+    actions: Sequence[Action],
+    async_pool: Optional[gevent.pool.Pool],
+    sample_rates: Optional[Sequence[int]] = None,
+    parent_tracer_span: Optional[TracerSpan] = None,
+    short_circuit: bool = False,
+    profile_sample_rate: float = 0.0,
+) -> List[ExecutionResult]:
+    """Executes a window of actions against the same graph together, returning one result per action, in order.
+
+    The actions are interleaved, and share the async pool. Batchable UDFs which set `supports_cross_action_batching`
+    are batched across actions (e.g. `HasLabel` calls for the same entity in adjacent actions are collapsed into a
+    single lookup), and external service accessors are shared by the whole window, so a given key is only fetched
+    once. Each result is otherwise identical to what `execute` would have returned for that action. Note that this
+    means that every action in the window observes external state (e.g. labels) as of the window, rather than
+    seeing the side-effects of earlier actions in the same window.
+
+    :param execution_graph: The graph of rules
+    :param udf_helpers: Holds additional helpers that UDFs need to operate
+    :param actions: The actions to execute against the rules
+    :param async_pool: A pool to run asynchronous tasks in, shared by all actions. If None then everything will be run
+        synchronously.
+    :param sample_rates: The sample rate of each action, see `execute`. Defaults to 100 for every action.
+    :param short_circuit: Whether to short-circuit evaluation, see `execute`.
+    :param profile_sample_rate: The probability that each action is profiled, see `execute`.
+    :return: The results of the executions, in the same order as `actions`.
+    """
+    if sample_rates is None:
+        sample_rates = [100] * len(actions)
+    assert len(sample_rates) == len(actions), 'execute_many invariant: sample_rates must match actions'
+
+    if parent_tracer_span:
+        parent_tracer_span.set_tag('action-count', len(actions))
+
+    external_service_accessors: Dict[int, ExternalServiceAccessor[Any, Any]] = {}
+    executions = [
+        _ActionExecution(
+            context=ExecutionContext(
+                execution_graph=execution_graph,
+                helpers=udf_helpers,
+                action=action,
+                external_service_accessors=external_service_accessors,
+                short_circuit=short_circuit,
+                profile=_maybe_new_profile(profile_sample_rate),
+            )
+        )
+        for action in actions
+    ]
+    _run_executions(executions, async_pool, parent_tracer_span, short_circuit)
+    return [
+        _build_execution_result(execution_graph, action, execution, sample_rate)
+        for action, execution, sample_rate in zip(actions, executions, sample_rates)
+    ]
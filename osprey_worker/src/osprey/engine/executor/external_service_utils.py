@@ -1,8 +1,13 @@
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, Generic, Hashable, Optional, Sequence, Tuple, TypeVar, cast
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, Sequence, Tuple, TypeVar, cast
 
 from gevent.event import AsyncResult
+from osprey.engine.utils.types import add_slots
+from osprey.worker.lib.instruments import metrics
 from result import Err, Ok, Result
 
 KeyT = TypeVar('KeyT', bound=Hashable)
@@ -33,11 +38,168 @@ class ExternalService(ABC, Generic[KeyT, ValueT]):
         return None
 
 
+@add_slots
+@dataclass
+class _SharedCacheEntry:
+    result: 'AsyncResult[Any]'
+    """Resolves once the value has been fetched. Entries that are still being fetched are shared by all callers."""
+
+    expires_at: Optional[float] = None
+    """The monotonic time after which the entry is stale, or `None` if it doesn't expire."""
+
+
+_SharedCacheKey = Tuple[int, Hashable]
+
+
+class SharedExternalServiceCache:
+    """A process-wide, bounded LRU cache in front of external services, shared by all executions.
+
+    `ExternalServiceAccessor` only caches for the duration of a single action. When given one of these, the
+    accessor falls through to it on a miss, so that lookups for the same key across consecutive actions don't all go
+    back to the service. Concurrent requests for the same key are coalesced across greenlets, entries expire according
+    to each service's `cache_ttl()`, and failed lookups are never cached."""
+
+    __slots__ = ('_max_size', '_clock', '_entries')
+
+    def __init__(self, max_size: int, clock: Callable[[], float] = time.monotonic) -> None:
+        assert max_size > 0, 'max_size must be positive'
+        self._max_size = max_size
+        self._clock = clock
+        self._entries: 'OrderedDict[_SharedCacheKey, _SharedCacheEntry]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, service: ExternalService[KeyT, ValueT], key: KeyT) -> ValueT:
+        cache_key = (id(service), key)
+        entry, outcome = self._lookup(cache_key)
+        _report_lookups(service, outcome, 1)
+        if outcome != 'miss':
+            return cast(ValueT, entry.result.get())
+
+        try:
+            value = service.get_from_service(key)
+        except Exception as e:
+            entry.result.set_exception(e)
+            self._discard(cache_key, entry)
+            raise
+
+        entry.result.set(value)
+        self._store(service, cache_key, entry)
+        return value
+
+    def batch_get(
+        self, service: ExternalService[KeyT, ValueT], keys: Sequence[KeyT]
+    ) -> Sequence[Result[ValueT, Exception]]:
+        entries: List[_SharedCacheEntry] = []
+        fetch_keys: List[KeyT] = []
+        fetch_entries: List[_SharedCacheEntry] = []
+        outcome_counts: Dict[str, int] = {}
+        for key in keys:
+            entry, outcome = self._lookup((id(service), key))
+            if outcome == 'miss':
+                fetch_keys.append(key)
+                fetch_entries.append(entry)
+            entries.append(entry)
+            outcome_counts[outcome] = outcome_counts.get(outcome, 0) + 1
+
+        for outcome, count in outcome_counts.items():
+            _report_lookups(service, outcome, count)
+
+        if fetch_keys:
+            try:
+                results = service.batch_get_from_service(fetch_keys)
+                for key, entry, result in zip(fetch_keys, fetch_entries, results):
+                    if result.is_ok():
+                        entry.result.set(result.value)
+                        self._store(service, (id(service), key), entry)
+                    else:
+                        entry.result.set_exception(cast(BaseException, result.value))
+                        self._discard((id(service), key), entry)
+            except Exception as e:
+                for key, entry in zip(fetch_keys, fetch_entries):
+                    if not entry.result.ready():
+                        entry.result.set_exception(e)
+                        self._discard((id(service), key), entry)
+
+        return [_to_result(entry.result) for entry in entries]
+
+    def invalidate(self, service: ExternalService[KeyT, ValueT], key: KeyT) -> None:
+        """Drops the cached value for a key, eg because it was just written. A fetch of the key that is in progress
+        will still resolve for the callers waiting on it, but won't be cached."""
+        if self._entries.pop((id(service), key), None) is not None:
+            metrics.increment('external_service_cache.invalidated', tags=[f'service:{type(service).__name__}'])
+
+    def _lookup(self, cache_key: _SharedCacheKey) -> Tuple[_SharedCacheEntry, str]:
+        """Returns the entry for a key, along with whether it was a `hit`, `coalesced` with an in-progress fetch, or a
+        `miss`. On a miss, a new in-progress entry is inserted that the caller must resolve."""
+        # No lock needed since the check-and-update happens without IO.
+        entry = self._entries.get(cache_key)
+        if entry is not None:
+            if not entry.result.ready():
+                return entry, 'coalesced'
+            if entry.expires_at is None or self._clock() < entry.expires_at:
+                self._entries.move_to_end(cache_key)
+                return entry, 'hit'
+
+        entry = _SharedCacheEntry(result=AsyncResult())
+        self._entries[cache_key] = entry
+        self._entries.move_to_end(cache_key)
+        self._evict()
+        return entry, 'miss'
+
+    def _store(
+        self, service: ExternalService[KeyT, ValueT], cache_key: _SharedCacheKey, entry: _SharedCacheEntry
+    ) -> None:
+        if self._entries.get(cache_key) is not entry:
+            # Invalidated or evicted while it was being fetched.
+            return
+        ttl = service.cache_ttl()
+        if ttl is None:
+            return
+        ttl_seconds = ttl.total_seconds()
+        if ttl_seconds <= 0:
+            del self._entries[cache_key]
+        else:
+            entry.expires_at = self._clock() + ttl_seconds
+
+    def _discard(self, cache_key: _SharedCacheKey, entry: _SharedCacheEntry) -> None:
+        if self._entries.get(cache_key) is entry:
+            del self._entries[cache_key]
+
+    def _evict(self) -> None:
+        evicted = 0
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            evicted += 1
+        if evicted:
+            metrics.increment('external_service_cache.evicted', value=evicted)
+
+
+def _report_lookups(service: ExternalService[Any, Any], outcome: str, count: int) -> None:
+    metrics.increment(
+        'external_service_cache.lookup', value=count, tags=[f'service:{type(service).__name__}', f'result:{outcome}']
+    )
+
+
+def _to_result(async_result: 'AsyncResult[ValueT]') -> Result[ValueT, Exception]:
+    try:
+        return Ok(async_result.get())
+    except Exception as e:
+        return Err(e)
+
+
 class ExternalServiceAccessor(Generic[KeyT, ValueT]):
-    """Facilitates accessing an external service in a way that caches and debounces requests based on a key."""
+    """Facilitates accessing an external service in a way that caches and debounces requests based on a key.
+
+    If a `shared_cache` is given, requests that miss this accessor's cache go through it rather than straight to the
+    service."""
 
-    def __init__(self, service: ExternalService[KeyT, ValueT]):
+    def __init__(
+        self, service: ExternalService[KeyT, ValueT], shared_cache: Optional[SharedExternalServiceCache] = None
+    ):
         self._service = service
+        self._shared_cache = shared_cache
         # Key -> Tuple[ AsyncResult[ValueT], Expiration datetime ]
         self._cache: Dict[KeyT, Tuple[AsyncResult[ValueT], Optional[datetime]]] = {}
 
@@ -56,6 +218,16 @@ class ExternalServiceAccessor(Generic[KeyT, ValueT]):
         ttl = self._service.cache_ttl()
         return datetime.now() + ttl if ttl is not None else None
 
+    def _get_from_service(self, key: KeyT) -> ValueT:
+        if self._shared_cache is not None:
+            return self._shared_cache.get(self._service, key)
+        return self._service.get_from_service(key)
+
+    def _batch_get_from_service(self, keys: Sequence[KeyT]) -> Sequence[Result[ValueT, Exception]]:
+        if self._shared_cache is not None:
+            return self._shared_cache.batch_get(self._service, keys)
+        return self._service.batch_get_from_service(keys)
+
     def get_without_cache(self, key: KeyT) -> ValueT:
         """
         Ignores any cached values and performs a read-through `get` to the external service.
@@ -67,8 +239,10 @@ class ExternalServiceAccessor(Generic[KeyT, ValueT]):
             self._get_cache_expiration_datetime(),
         )
         self._cache[key] = cache_entry
+        if self._shared_cache is not None:
+            self._shared_cache.invalidate(self._service, key)
         try:
-            cache_entry[0].set(self._service.get_from_service(key))
+            cache_entry[0].set(self._get_from_service(key))
         except Exception as e:
             cache_entry[0].set_exception(e)
 
@@ -82,7 +256,7 @@ class ExternalServiceAccessor(Generic[KeyT, ValueT]):
             cache_entry = (AsyncResult(), self._get_cache_expiration_datetime())
             self._cache[key] = cache_entry
             try:
-                cache_entry[0].set(self._service.get_from_service(key))
+                cache_entry[0].set(self._get_from_service(key))
             except Exception as e:
                 cache_entry[0].set_exception(e)
 
@@ -100,7 +274,7 @@ class ExternalServiceAccessor(Generic[KeyT, ValueT]):
             for key in non_cached_keys:
                 self._cache[key] = (AsyncResult(), self._get_cache_expiration_datetime())
             try:
-                result = self._service.batch_get_from_service(non_cached_keys)
+                result = self._batch_get_from_service(non_cached_keys)
                 for i, key in enumerate(non_cached_keys):
                     if result[i].is_ok():
                         self._cache[key][0].set(result[i].value)
@@ -0,0 +1,260 @@
+"""
+Per-node execution profiling.
+
+When an execution is profiled, the executor records the wall time and the CPU time of every node that it executes.
+Nodes are identified by a `ProfileKey`: the source file they are in, the top-level statement they are part of (usually
+the name that the statement assigns to, i.e. the rule or feature), and the kind of node (the UDF class for calls, and
+the AST node class otherwise). Timings can then be grouped by any prefix of that key, see `GroupBy`.
+
+Profiling is opt-in and sampled, see `executor.execute`: executions that aren't profiled only pay for a `None` check
+per node. The profile of a sampled execution is attached to its `ExecutionResult`, and also merged into process-wide
+rolling aggregates, see `get_node_profile_aggregates`, whose most expensive nodes are periodically reported as gauges.
+
+Note that async nodes run in greenlets, so their wall time includes the time spent waiting on I/O (and on the pool),
+and their CPU time is only approximate: it is measured on the OS thread, which is shared with other greenlets.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Literal, Mapping, Optional, Tuple
+
+import gevent
+from datadog.dogstatsd.base import DogStatsd
+from osprey.engine.ast.grammar import Assign, ASTNode, Call, Name, Root
+from osprey.engine.utils.types import add_slots
+from osprey.worker.lib.instruments import metrics
+from osprey.worker.lib.osprey_shared.logging import get_logger
+
+logger = get_logger(__name__)
+
+ProfileKey = Tuple[str, str, str]
+"""The source path, the statement name and the node kind of a profiled node."""
+
+GroupBy = Literal['source', 'statement', 'udf', 'node']
+"""How timings are grouped when reporting: by source file, by statement, by node kind (UDF), or not at all."""
+
+_GROUP_KEY_FUNCTIONS: Mapping[str, Callable[[ProfileKey], Tuple[str, ...]]] = {
+    'source': lambda key: key[:1],
+    'statement': lambda key: key[:2],
+    'udf': lambda key: key[2:],
+    'node': lambda key: key,
+}
+
+_DEFAULT_WINDOW_SECONDS = 60.0
+"""The length of a window of the rolling aggregates."""
+
+_DEFAULT_REPORTED_NODES = 20
+"""How many of the most expensive nodes the aggregates report, see `NodeProfileAggregates.report`."""
+
+
+@add_slots
+@dataclass
+class NodeTiming:
+    """The accumulated timings of a node (or a group of nodes)."""
+
+    count: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+
+    def add(self, wall_seconds: float, cpu_seconds: float, count: int = 1) -> None:
+        self.count += count
+        self.wall_seconds += wall_seconds
+        self.cpu_seconds += cpu_seconds
+
+    def merge(self, other: 'NodeTiming') -> None:
+        self.add(other.wall_seconds, other.cpu_seconds, other.count)
+
+
+def get_profile_key(node: ASTNode, udf_name: Optional[str] = None) -> ProfileKey:
+    """Returns the key that a node's timings are recorded under. `udf_name` is set if the node is a UDF call."""
+    return node.span.source.path, _get_statement_name(node), udf_name or node.__class__.__name__
+
+
+def _get_statement_name(node: ASTNode) -> str:
+    statement = node
+    while statement.parent is not None and not isinstance(statement.parent, Root):
+        statement = statement.parent
+
+    if isinstance(statement, Assign):
+        return statement.target.identifier
+    if isinstance(statement, Call) and isinstance(statement.func, Name):
+        return f'{statement.func.identifier}:{statement.span.start_line}'
+    return f'{statement.__class__.__name__}:{statement.span.start_line}'
+
+
+def _group(timings: Iterable[Tuple[ProfileKey, NodeTiming]], group_by: GroupBy) -> Dict[Tuple[str, ...], NodeTiming]:
+    group_key = _GROUP_KEY_FUNCTIONS[group_by]
+    grouped: Dict[Tuple[str, ...], NodeTiming] = {}
+    for key, timing in timings:
+        grouped_key = group_key(key)
+        grouped_timing = grouped.get(grouped_key)
+        if grouped_timing is None:
+            grouped_timing = grouped[grouped_key] = NodeTiming()
+        grouped_timing.merge(timing)
+    return grouped
+
+
+def _top(
+    timings: Iterable[Tuple[ProfileKey, NodeTiming]], n: Optional[int], group_by: GroupBy
+) -> List[Tuple[Tuple[str, ...], NodeTiming]]:
+    ranked = sorted(_group(timings, group_by).items(), key=lambda item: item[1].wall_seconds, reverse=True)
+    return ranked if n is None else ranked[:n]
+
+
+class ExecutionProfile:
+    """The per-node timings of a single profiled execution."""
+
+    __slots__ = ('_timings', '_started_at', '_wall_seconds')
+
+    def __init__(self) -> None:
+        self._timings: Dict[ProfileKey, NodeTiming] = {}
+        self._started_at = time.perf_counter()
+        self._wall_seconds: Optional[float] = None
+
+    @property
+    def timings(self) -> Mapping[ProfileKey, NodeTiming]:
+        return self._timings
+
+    @property
+    def wall_seconds(self) -> float:
+        """The wall time of the whole execution, which is less than the sum of its nodes' when nodes ran concurrently."""
+        if self._wall_seconds is None:
+            return time.perf_counter() - self._started_at
+        return self._wall_seconds
+
+    def record(self, node: ASTNode, udf_name: Optional[str], wall_seconds: float, cpu_seconds: float) -> None:
+        key = get_profile_key(node, udf_name)
+        timing = self._timings.get(key)
+        if timing is None:
+            timing = self._timings[key] = NodeTiming()
+        timing.add(wall_seconds, cpu_seconds)
+
+    def finish(self) -> None:
+        """Marks the end of the execution."""
+        if self._wall_seconds is None:
+            self._wall_seconds = time.perf_counter() - self._started_at
+
+    def top(self, n: Optional[int] = 10, group_by: GroupBy = 'node') -> List[Tuple[Tuple[str, ...], NodeTiming]]:
+        """Returns the `n` most expensive groups of nodes, by wall time."""
+        return _top(self._timings.items(), n, group_by)
+
+    def to_dict(self) -> Dict[str, object]:
+        """Returns a JSON serializable breakdown of the profile."""
+        return {
+            'wall_seconds': self.wall_seconds,
+            'nodes': [
+                {
+                    'source': source,
+                    'statement': statement,
+                    'kind': kind,
+                    'count': timing.count,
+                    'wall_seconds': timing.wall_seconds,
+                    'cpu_seconds': timing.cpu_seconds,
+                }
+                for (source, statement, kind), timing in self._timings.items()
+            ],
+        }
+
+
+class NodeProfileAggregates:
+    """Rolling aggregates of the profiles of sampled executions.
+
+    Profiles are accumulated in the current window, and reports cover the current and the previous window, so that they
+    always reflect between one and two windows' worth of recent executions.
+
+    If a `statsd` client is given, the most expensive nodes are reported to it once per window (see `report`), by a
+    greenlet that is started when the first profile is added."""
+
+    __slots__ = (
+        '_window_seconds',
+        '_clock',
+        '_current',
+        '_previous',
+        '_window_started_at',
+        '_profile_count',
+        '_statsd',
+        '_reported_nodes',
+        '_reporter',
+    )
+
+    def __init__(
+        self,
+        window_seconds: float = _DEFAULT_WINDOW_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        statsd: Optional[DogStatsd] = None,
+        reported_nodes: int = _DEFAULT_REPORTED_NODES,
+    ) -> None:
+        self._window_seconds = window_seconds
+        self._clock = clock
+        self._current: Dict[ProfileKey, NodeTiming] = {}
+        self._previous: Dict[ProfileKey, NodeTiming] = {}
+        self._window_started_at = clock()
+        self._profile_count = 0
+        self._statsd = statsd
+        self._reported_nodes = reported_nodes
+        self._reporter: Optional['gevent.Greenlet[None]'] = None
+
+    @property
+    def profile_count(self) -> int:
+        """The number of profiles that were added since the aggregates were created (or reset)."""
+        return self._profile_count
+
+    def add(self, profile: ExecutionProfile) -> None:
+        self._maybe_rotate()
+        current = self._current
+        for key, timing in profile.timings.items():
+            aggregated = current.get(key)
+            if aggregated is None:
+                aggregated = current[key] = NodeTiming()
+            aggregated.merge(timing)
+        self._profile_count += 1
+        if self._statsd is not None and self._reporter is None:
+            self._reporter = gevent.spawn(self._report_periodically)
+
+    def top(self, n: Optional[int] = 10, group_by: GroupBy = 'node') -> List[Tuple[Tuple[str, ...], NodeTiming]]:
+        """Returns the `n` most expensive groups of nodes over the recent windows, by wall time."""
+        self._maybe_rotate()
+        return _top([*self._previous.items(), *self._current.items()], n, group_by)
+
+    def report(self) -> None:
+        """Sends the total wall time, CPU time and call count of each of the most expensive nodes over the recent
+        windows to statsd, as gauges tagged with the node's source, statement and UDF."""
+        if self._statsd is None:
+            return
+        for (source, statement, kind), timing in self.top(self._reported_nodes, group_by='node'):
+            tags = [f'source:{source}', f'statement:{statement}', f'udf:{kind}']
+            self._statsd.gauge('execution_profile.node.wall_ms', timing.wall_seconds * 1000, tags=tags)
+            self._statsd.gauge('execution_profile.node.cpu_ms', timing.cpu_seconds * 1000, tags=tags)
+            self._statsd.gauge('execution_profile.node.count', timing.count, tags=tags)
+
+    def reset(self) -> None:
+        self._current = {}
+        self._previous = {}
+        self._window_started_at = self._clock()
+        self._profile_count = 0
+
+    def _maybe_rotate(self) -> None:
+        now = self._clock()
+        elapsed = now - self._window_started_at
+        if elapsed < self._window_seconds:
+            return
+        # If more than a whole window went by without any profiles, the current window is stale too.
+        self._previous = self._current if elapsed < 2 * self._window_seconds else {}
+        self._current = {}
+        self._window_started_at = now
+
+    def _report_periodically(self) -> None:
+        while True:
+            gevent.sleep(self._window_seconds)
+            try:
+                self.report()
+            except Exception:
+                logger.exception('Failed to report node profile aggregates')
+
+
+_NODE_PROFILE_AGGREGATES = NodeProfileAggregates(statsd=metrics)
+
+
+def get_node_profile_aggregates() -> NodeProfileAggregates:
+    """Returns the process-wide aggregates of the profiles of sampled executions."""
+    return _NODE_PROFILE_AGGREGATES
@@ -0,0 +1,104 @@
+"""
+Cost-based scheduling of ready nodes.
+
+Each node is given a priority: the estimated time along the most expensive path from the node to the end of the
+execution (its "critical path"). Async UDF calls are costed using latency statistics that are collected at runtime,
+while sync nodes are treated as (nearly) free. Ready nodes are then handed to the executor most critical first, so that
+async I/O on the critical path is started as early as possible, and cheap sync work fills in the gaps.
+"""
+
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .dependency_chain import DependencyChain
+
+_SYNC_NODE_COST_SECONDS = 0.00001
+"""The estimated cost of executing a sync node. Non-zero, so that longer chains of sync nodes are preferred."""
+
+_DEFAULT_ASYNC_NODE_COST_SECONDS = 0.005
+"""The estimated cost of an async UDF that we have no latency statistics for yet."""
+
+_EWMA_ALPHA = 0.1
+"""The weight of the newest sample in the moving average of a UDF's latency."""
+
+_REFRESH_INTERVAL_SECONDS = 10.0
+"""How often updated latency statistics are published, causing priorities to be recomputed."""
+
+
+class UdfLatencyStats:
+    """Tracks an exponentially weighted moving average of the latency of each async UDF type.
+
+    Estimates are only published every `refresh_interval_seconds`, so that the priorities derived from them don't need
+    to be recomputed on every execution."""
+
+    __slots__ = ('_refresh_interval_seconds', '_averages', '_published', '_generation', '_last_published_at')
+
+    def __init__(self, refresh_interval_seconds: float = _REFRESH_INTERVAL_SECONDS) -> None:
+        self._refresh_interval_seconds = refresh_interval_seconds
+        self._averages: Dict[str, float] = {}
+        self._published: Dict[str, float] = {}
+        self._generation = 0
+        self._last_published_at = time.monotonic()
+
+    @property
+    def generation(self) -> int:
+        """Incremented every time new estimates are published."""
+        return self._generation
+
+    def record(self, udf_name: str, duration_seconds: float) -> None:
+        average = self._averages.get(udf_name)
+        if average is None:
+            self._averages[udf_name] = duration_seconds
+        else:
+            self._averages[udf_name] = average + _EWMA_ALPHA * (duration_seconds - average)
+
+        now = time.monotonic()
+        if now - self._last_published_at >= self._refresh_interval_seconds or udf_name not in self._published:
+            self.publish(now)
+
+    def publish(self, now: Optional[float] = None) -> None:
+        """Publishes the current averages as the estimates used for scheduling."""
+        self._published = dict(self._averages)
+        self._generation += 1
+        self._last_published_at = time.monotonic() if now is None else now
+
+    def estimate(self, udf_name: str) -> float:
+        """Returns the published latency estimate for a UDF, in seconds."""
+        return self._published.get(udf_name, _DEFAULT_ASYNC_NODE_COST_SECONDS)
+
+
+_UDF_LATENCY_STATS = UdfLatencyStats()
+
+
+def get_udf_latency_stats() -> UdfLatencyStats:
+    """Returns the process-wide latency statistics, which are shared between all execution graphs."""
+    return _UDF_LATENCY_STATS
+
+
+def get_async_udf_name(chain: DependencyChain) -> Optional[str]:
+    """Returns the name of the UDF that a chain calls, if the chain is an async UDF call."""
+    from .node_executor.call_executor import CallExecutor
+
+    executor = chain.executor
+    if isinstance(executor, CallExecutor) and executor.execute_async:
+        return executor._udf.__class__.__name__
+    return None
+
+
+def compute_critical_path_priorities(
+    async_udf_names: Sequence[Optional[str]],
+    successors: Sequence[Tuple[int, ...]],
+    stats: UdfLatencyStats,
+) -> List[float]:
+    """Given nodes in topological order, returns the estimated cost of the most expensive path from each node to a
+    node without successors, including the node itself."""
+    priorities = [0.0] * len(async_udf_names)
+    for index in reversed(range(len(async_udf_names))):
+        udf_name = async_udf_names[index]
+        cost = _SYNC_NODE_COST_SECONDS if udf_name is None else stats.estimate(udf_name)
+        downstream = 0.0
+        for successor in successors[index]:
+            if priorities[successor] > downstream:
+                downstream = priorities[successor]
+        priorities[index] = cost + downstream
+    return priorities
@@ -0,0 +1,113 @@
+"""
+Support for short-circuit evaluation in the executor.
+
+A "gate" is a node whose value can be decided by a single one of its dependencies, before the rest have resolved:
+
+- `a and b and c` is `False` as soon as any value is falsey (failed values count as `None`, as they do when executed).
+- `a or b or c` is `True` as soon as any value is truthy.
+- `Rule(when_all=[a, b, c])` fails as soon as any condition fails, and evaluates to `False` as soon as any condition is
+  falsey.
+
+When short-circuiting is enabled, a gate is resolved as soon as it has been decided, and any pending node whose value is
+no longer observable (see `is_observable`) is skipped instead of executed.
+"""
+
+import inspect
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Sequence
+
+from osprey.engine.ast.grammar import And, Assign, BooleanOperation, List, Or
+from osprey.engine.language_types.effects import EffectBase
+from result import Err, Ok
+
+from .dependency_chain import DependencyChain
+
+if TYPE_CHECKING:
+    from .execution_context import NodeResult
+
+
+class ShortCircuitGate:
+    """Decides a gate's value, given the result of one of its dependencies (as the gate would resolve it)."""
+
+    __slots__ = ('_decide',)
+
+    def __init__(self, decide: Callable[['NodeResult'], Optional['NodeResult']]) -> None:
+        self._decide = decide
+
+    def get_short_circuit_value(self, dependency_result: 'NodeResult') -> Optional['NodeResult']:
+        """Returns the gate's value if `dependency_result` decides it, regardless of the gate's other dependencies,
+        or `None` if the gate still has to wait for them."""
+        return self._decide(dependency_result)
+
+
+def _decide_and(dependency_result: 'NodeResult') -> Optional['NodeResult']:
+    if dependency_result.is_err() or not dependency_result.value:
+        return Ok(False)
+    return None
+
+
+def _decide_or(dependency_result: 'NodeResult') -> Optional['NodeResult']:
+    if dependency_result.is_ok() and dependency_result.value:
+        return Ok(True)
+    return None
+
+
+def _decide_rule_when_all(dependency_result: 'NodeResult') -> Optional['NodeResult']:
+    if dependency_result.is_err():
+        # The list would have failed to resolve, and therefore so would the rule.
+        return Err(None)
+    if not dependency_result.value:
+        # The list is only consumed by the rule, which takes `all()` of it, so the deciding condition is enough.
+        return Ok([dependency_result.value])
+    return None
+
+
+_AND_GATE = ShortCircuitGate(_decide_and)
+_OR_GATE = ShortCircuitGate(_decide_or)
+_RULE_WHEN_ALL_GATE = ShortCircuitGate(_decide_rule_when_all)
+
+
+def get_short_circuit_gates(chains: Sequence[DependencyChain]) -> Dict[int, ShortCircuitGate]:
+    """Returns a mapping of `id(chain)` to gate, for each of the given chains which is a gate."""
+    # Avoid circular imports, the stdlib depends on the executor.
+    from osprey.engine.stdlib.udfs.rules import Rule
+
+    from .node_executor.call_executor import CallExecutor
+
+    gates: Dict[int, ShortCircuitGate] = {}
+    for chain in chains:
+        node = chain.executor.node
+        if isinstance(node, BooleanOperation):
+            if isinstance(node.operand, And):
+                gates[id(chain)] = _AND_GATE
+            elif isinstance(node.operand, Or):
+                gates[id(chain)] = _OR_GATE
+        elif isinstance(chain.executor, CallExecutor) and isinstance(chain.executor._udf, Rule):
+            when_all = chain.executor.dependent_node_dict.get('when_all')
+            if not isinstance(when_all, List):
+                continue
+            for dependency in chain.dependent_on:
+                if dependency.executor.node is when_all:
+                    gates[id(dependency)] = _RULE_WHEN_ALL_GATE
+    return gates
+
+
+def is_observable(chain: DependencyChain, has_successors: bool) -> bool:
+    """Whether a node must always be executed, even if none of its successors need its value. This is the case for
+    statements that nothing depends on (e.g. `WhenRules(...)`), for extracted features, and for calls of UDFs that
+    have side effects or produce effects, wherever they are used."""
+    if not has_successors:
+        return True
+    node = chain.executor.node
+    if isinstance(node, Assign) and node.should_extract:
+        return True
+
+    # Avoid circular imports, the stdlib depends on the executor.
+    from .node_executor.call_executor import CallExecutor
+
+    if isinstance(chain.executor, CallExecutor):
+        udf = chain.executor._udf
+        if udf.has_side_effects:
+            return True
+        rvalue_type = udf.get_rvalue_type()
+        return inspect.isclass(rvalue_type) and issubclass(rvalue_type, EffectBase)
+    return False
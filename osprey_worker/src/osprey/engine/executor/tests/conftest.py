@@ -0,0 +1,11 @@
+from datetime import datetime
+from typing import List
+
+from osprey.engine.executor.execution_context import Action
+
+
+def make_actions(count: int) -> List[Action]:
+    """Returns `count` actions, a second apart."""
+    return [
+        Action(action_id=i, action_name='test', data={}, timestamp=datetime(2024, 1, 1, 0, 0, i)) for i in range(count)
+    ]
@@ -0,0 +1,168 @@
+import pytest
+from osprey.engine.ast.grammar import BooleanOperation
+from osprey.engine.ast_validator.validators.imports_must_not_have_cycles import ImportsMustNotHaveCycles
+from osprey.engine.ast_validator.validators.unique_stored_names import UniqueStoredNames
+from osprey.engine.ast_validator.validators.validate_call_kwargs import ValidateCallKwargs
+from osprey.engine.conftest import RunValidationFunction
+from osprey.engine.executor.execution_graph import ExecutionGraph, compile_execution_graph
+from osprey.engine.stdlib.udfs.import_ import Import
+from osprey.engine.udf.registry import UDFRegistry
+
+pytestmark = [
+    pytest.mark.use_validators([ValidateCallKwargs, UniqueStoredNames, ImportsMustNotHaveCycles]),
+    pytest.mark.use_udf_registry(UDFRegistry.with_udfs(Import)),
+]
+
+
+def _compile(run_validation: RunValidationFunction, sources_dict: dict) -> ExecutionGraph:
+    return compile_execution_graph(run_validation(sources_dict))
+
+
+def _drain(graph: ExecutionGraph) -> int:
+    state = graph.execution_plan.new_state()
+    executed = 0
+    ready = state.get_ready()
+    while ready:
+        for chain in ready:
+            state.done(chain)
+            executed += 1
+        ready = state.get_ready()
+    return executed
+
+
+def test_plan_indexes_every_sorted_chain_once(run_validation: RunValidationFunction) -> None:
+    graph = _compile(
+        run_validation,
+        {
+            'main.sml': """
+                Import(rules=['foo.sml'])
+                Bar = Foo + 1
+            """,
+            'foo.sml': """
+                Foo = 1 + 2
+            """,
+        },
+    )
+    plan = graph.execution_plan
+
+    all_chains = {
+        id(chain) for source in graph.validated_sources.sources for chain in graph.get_sorted_dependency_chain(source)
+    }
+    assert len(plan) == len(all_chains)
+
+    for source in graph.validated_sources.sources:
+        sorted_chain = graph.get_sorted_dependency_chain(source)
+        assert [plan.get_chain(i) for i in plan.get_source_indices(source)] == list(sorted_chain)
+
+    for index in range(len(plan)):
+        chain = plan.get_chain(index)
+        assert plan.get_index(chain) == index
+        assert plan.get_predecessors(index) == tuple(plan.get_index(dep) for dep in chain.dependent_on)
+        for predecessor in plan.get_predecessors(index):
+            assert index in plan.get_successors(predecessor)
+
+
+def test_state_only_enqueues_entry_point(run_validation: RunValidationFunction) -> None:
+    graph = _compile(
+        run_validation,
+        {
+            'main.sml': """
+                Main = 1
+            """,
+            'other.sml': """
+                Other = 2 + 3
+            """,
+        },
+    )
+    entry_point = graph.get_entry_point()
+
+    assert _drain(graph) == len(graph.get_sorted_dependency_chain(entry_point))
+
+
+def test_state_is_independent_per_execution(run_validation: RunValidationFunction) -> None:
+    graph = _compile(run_validation, 'Foo = 1 + 2')
+
+    first = graph.execution_plan.new_state()
+    for chain in first.get_ready():
+        first.done(chain)
+
+    second = graph.execution_plan.new_state()
+    assert len(second.get_ready()) > 0
+
+
+def test_state_enqueue_after_predecessor_done(run_validation: RunValidationFunction) -> None:
+    graph = _compile(
+        run_validation,
+        {
+            'main.sml': """
+                Parent = 4
+            """,
+            'child.sml': """
+                Import(rules=['main.sml'])
+                Child = Parent + 4
+            """,
+        },
+    )
+    state = graph.execution_plan.new_state()
+
+    executed = []
+    ready = state.get_ready()
+    while ready:
+        for chain in ready:
+            state.done(chain)
+            executed.append(chain)
+        ready = state.get_ready()
+
+    child_source = graph.validated_sources.sources.get_by_path('child.sml')
+    assert child_source is not None
+    state.enqueue_source(child_source)
+    # Enqueueing twice is a no-op.
+    state.enqueue_source(child_source)
+
+    ready = state.get_ready()
+    while ready:
+        for chain in ready:
+            state.done(chain)
+            executed.append(chain)
+        ready = state.get_ready()
+
+    expected = {id(chain) for chain in graph.get_sorted_dependency_chain(child_source)}
+    expected |= {id(chain) for chain in graph.get_sorted_dependency_chain(graph.get_entry_point())}
+    assert {id(chain) for chain in executed} == expected
+    assert len(executed) == len(expected)
+
+
+def test_state_rejects_invalid_done(run_validation: RunValidationFunction) -> None:
+    graph = _compile(run_validation, 'Foo = 1 + 2')
+    state = graph.execution_plan.new_state()
+
+    # The assignment is last in the sorted chain, and depends on the binary operation.
+    chain = graph.get_sorted_dependency_chain(graph.get_entry_point())[-1]
+    with pytest.raises(ValueError, match='not passed out'):
+        state.done(chain)
+
+    ready = state.get_ready()
+    state.done(ready[0])
+    with pytest.raises(ValueError, match='already marked done'):
+        state.done(ready[0])
+
+
+def test_state_short_circuit_and_is_needed(run_validation: RunValidationFunction) -> None:
+    graph = _compile(run_validation, 'Foo = 1 == 2 and 3 + 4 == 7')
+    state = graph.execution_plan.new_state()
+    sorted_chain = graph.get_sorted_dependency_chain(graph.get_entry_point())
+    [gate] = [chain for chain in sorted_chain if isinstance(chain.executor.node, BooleanOperation)]
+
+    ready = state.get_ready()
+    # Ready and handed out nodes can't be short-circuited.
+    assert not state.short_circuit(ready[0])
+    # The extracted assignment is observable, so everything it depends on is needed.
+    assert all(state.is_needed(chain) for chain in ready)
+
+    assert state.short_circuit(gate)
+    assert not state.short_circuit(gate)
+    # Nothing depends on the operands of the gate anymore.
+    assert not any(state.is_needed(chain) for chain in ready)
+    assert not any(state.is_needed(chain) for chain in gate.dependent_on)
+    # But the assignment, which was waiting on the gate, is now ready.
+    assert state.get_ready() == [sorted_chain[-1]]
@@ -0,0 +1,62 @@
+import copy
+import json
+import pickle
+from datetime import datetime
+from typing import List
+
+from osprey.engine.executor.execution_context import Action, ExecutionResult, ExecutionResultView
+
+
+def _result() -> ExecutionResult:
+    return ExecutionResult(
+        extracted_features={'UserId': 'abc', 'Score': 1},
+        action=Action(action_id=1, action_name='test', data={'user_id': 'abc'}, timestamp=datetime(2024, 1, 1)),
+        effects={},
+        error_infos=[],
+    )
+
+
+def test_views_are_computed_once_per_result() -> None:
+    calls: List[int] = []
+
+    def compute(result: ExecutionResult) -> str:
+        calls.append(result.action.action_id)
+        return result.extracted_features['UserId']
+
+    view = ExecutionResultView('user_id', compute)
+    result = _result()
+    assert result.get_view(view) == 'abc'
+    assert result.get_view(view) == 'abc'
+    assert calls == [1]
+
+    assert _result().get_view(view) == 'abc'
+    assert calls == [1, 1]
+
+
+def test_encodings_are_shared() -> None:
+    result = _result()
+    assert result.extracted_features_json is result.extracted_features_json
+    assert json.loads(result.extracted_features_json) == {'UserId': 'abc', 'Score': 1}
+    assert result.extracted_features_json_bytes == result.extracted_features_json.encode()
+    assert result.get_verdicts_pb2_proto() is result.get_verdicts_pb2_proto()
+    assert result.get_verdicts_pb2_proto().action_id == 1
+    assert result.action.data_json is result.action.data_json
+    assert json.loads(result.error_traces_json) == []
+
+
+def test_views_are_not_part_of_equality_or_copies() -> None:
+    result = _result()
+    result.extracted_features_json
+    assert result == _result()
+
+    copied = copy.deepcopy(result)
+    copied.extracted_features['UserId'] = 'def'
+    assert json.loads(copied.extracted_features_json)['UserId'] == 'def'
+    assert json.loads(result.extracted_features_json)['UserId'] == 'abc'
+
+    shallow = copy.copy(result)
+    assert shallow.extracted_features is result.extracted_features
+    assert shallow.extracted_features_json is not result.extracted_features_json
+
+    unpickled = pickle.loads(pickle.dumps(result))
+    assert unpickled.extracted_features_json == result.extracted_features_json
@@ -8,10 +8,19 @@ import gevent.event
 import gevent.pool
 import pytest
 from osprey.engine.ast_validator.validation_context import ValidationContext
-from osprey.engine.conftest import ExecuteFunction, ExecuteWithResultFunction
+from osprey.engine.ast_validator.validators.unique_stored_names import UniqueStoredNames
+from osprey.engine.ast_validator.validators.validate_call_kwargs import ValidateCallKwargs
+from osprey.engine.conftest import ExecuteFunction, ExecuteWithResultFunction, RunValidationFunction
 from osprey.engine.executor.execution_context import ExecutionContext, ExpectedUdfException
+from osprey.engine.executor.execution_graph import compile_execution_graph
+from osprey.engine.executor.executor import execute as osprey_execute
+from osprey.engine.executor.executor import execute_many
+from osprey.engine.executor.tests.conftest import make_actions
+from osprey.engine.executor.udf_execution_helpers import UDFHelpers
+from osprey.engine.language_types.effects import EffectBase
 from osprey.engine.language_types.post_execution_convertible import PostExecutionConvertible
 from osprey.engine.stdlib.udfs.import_ import Import
+from osprey.engine.stdlib.udfs.rules import Rule
 from osprey.engine.udf.arguments import ArgumentsBase
 from osprey.engine.udf.base import BatchableUDFBase, UDFBase
 from osprey.engine.udf.registry import UDFRegistry
@@ -294,14 +303,18 @@ def test_batch_grouping_with_routing_keys(
     )
 
     assert data == {'A': 'a3a2a1', 'B': 'b3b2b1', 'C': 'c1', 'D': 'd1', 'E': 'e1', 'F': 'f1', 'G': 'g1'}
-    assert batch_recording_udf.order_called() == [
+    # Calls that become ready as others finish are dispatched as soon as the executor is woken up, so they may be
+    # interleaved with batches that are still waiting for the pool. The grouping is what matters here.
+    order_called = batch_recording_udf.order_called()
+    assert order_called[:2] == [['a1', 'c1'], ['b1', 'd1']]
+    assert sorted(order_called) == [
         ['a1', 'c1'],
-        ['b1', 'd1'],
-        ['e1', 'f1', 'g1'],
         ['a2a1'],
         ['a3a2a1'],
+        ['b1', 'd1'],
         ['b2b1'],
         ['b3b2b1'],
+        ['e1', 'f1', 'g1'],
     ]
 
 
@@ -533,8 +546,8 @@ def test_errors_propagate_through_features_with_batching(
     assert result.extracted_features['D'] is None
     assert result.extracted_features['E'] == 5
     assert result.extracted_features['F'] is None
-    # Ensure batching actually happened
-    assert batch_failing_udf.order_called() == [[1, 2, 3]]
+    # Ensure batching actually happened (the order within the batch depends on scheduling priorities)
+    assert [sorted(batch) for batch in batch_failing_udf.order_called()] == [[1, 2, 3]]
 
 
 # TODO: if we're enforcing strict optionals then this won't work anymore. We might need to come up with a way to
@@ -791,3 +804,182 @@ def test_dependent_node_imported_after_parent_node_executed(
         }
     )
     assert data == {'Child': 8}
+
+
+@pytest.mark.use_validators([ValidateCallKwargs, UniqueStoredNames])
+def test_execute_many_matches_execute(
+    batch_recording_udf: Type[BatchRecordingUdf], run_validation: RunValidationFunction
+) -> None:
+    graph = compile_execution_graph(
+        run_validation(
+            """
+            A = BatchRecordingUdf(id=("a2" + BatchRecordingUdf(id="a1")))
+            B = BatchRecordingUdf(id="b1")
+            C = A + B
+            """
+        )
+    )
+    actions = make_actions(3)
+    sample_rates = [100, 50, 10]
+
+    results = execute_many(graph, UDFHelpers(), actions, gevent.pool.Pool(4), sample_rates=sample_rates)
+
+    assert len(results) == len(actions)
+    for action, sample_rate, result in zip(actions, sample_rates, results):
+        expected = osprey_execute(graph, UDFHelpers(), action, gevent.pool.Pool(4), sample_rate=sample_rate)
+        assert result.action is action
+        assert result.sample_rate == sample_rate
+        assert result.extracted_features == expected.extracted_features
+        assert result.error_infos == expected.error_infos
+
+
+@pytest.mark.use_validators([ValidateCallKwargs, UniqueStoredNames])
+def test_execute_many_only_batches_across_actions_if_supported(
+    batch_recording_udf: Type[BatchRecordingUdf], run_validation: RunValidationFunction
+) -> None:
+    graph = compile_execution_graph(run_validation('A = BatchRecordingUdf(id="a")'))
+
+    results = execute_many(graph, UDFHelpers(), make_actions(3), gevent.pool.Pool(4))
+    assert [r.extracted_features['A'] for r in results] == ['a', 'a', 'a']
+    assert batch_recording_udf.order_called() == [['a'], ['a'], ['a']]
+
+    batch_recording_udf.order_called().clear()
+    batch_recording_udf.supports_cross_action_batching = True
+
+    results = execute_many(graph, UDFHelpers(), make_actions(3), gevent.pool.Pool(4))
+    assert [r.extracted_features['A'] for r in results] == ['a', 'a', 'a']
+    assert batch_recording_udf.order_called() == [['a', 'a', 'a']]
+
+
+@pytest.mark.use_validators([ValidateCallKwargs, UniqueStoredNames])
+def test_execute_many_propagates_batch_errors_per_action(
+    batch_failing_udf: Type[BatchFailingUdf], run_validation: RunValidationFunction
+) -> None:
+    batch_failing_udf.supports_cross_action_batching = True
+    graph = compile_execution_graph(
+        run_validation(
+            """
+            A = 1 + BatchFailingUdf(id=1)
+            B = 2 + BatchFailingUdf(id=2)
+            """
+        )
+    )
+
+    results = execute_many(graph, UDFHelpers(), make_actions(2), gevent.pool.Pool(4))
+
+    for result in results:
+        assert result.extracted_features['A'] is None
+        assert result.extracted_features['B'] == 4
+        assert len(result.error_infos) == 1
+    # Both actions' calls were made in a single batch.
+    assert batch_failing_udf.order_called() == [[1, 2, 1, 2]]
+
+
+@pytest.mark.parametrize('short_circuit', (True, False))
+def test_short_circuit_skips_unobservable_nodes(
+    udf_registry: UDFRegistry,
+    recording_udf: Type[RecordingUdf],
+    batch_recording_udf: Type[BatchRecordingUdf],
+    execute: ExecuteFunction,
+    short_circuit: bool,
+) -> None:
+    udf_registry.register(Rule)
+    data = execute(
+        """
+        _Local = BatchRecordingUdf(id="local")
+        Extracted = BatchRecordingUdf(id="extracted")
+        NoMatch = Rule(
+            when_all=[RecordingUdf(id="x") == "y", BatchRecordingUdf(id="inline") == "inline", _Local == "local"],
+            description="never matches",
+        )
+        AlsoNoMatch = Rule(when_all=[RecordingUdf(id="z") == "y", Extracted == "extracted"], description="nope")
+        And = RecordingUdf(id="a") == "b" and BatchRecordingUdf(id="and") == "and"
+        Or = RecordingUdf(id="c") == "c" or BatchRecordingUdf(id="or") == "or"
+        """,
+        async_pool=gevent.pool.Pool(10),
+        short_circuit=short_circuit,
+    )
+
+    assert data == {'Extracted': 'extracted', 'NoMatch': False, 'AlsoNoMatch': False, 'And': False, 'Or': True}
+    called = sorted(id_ for batch in batch_recording_udf.order_called() for id_ in batch)
+    if short_circuit:
+        # Extracted features are always executed, even if the rule that uses them has already been decided.
+        assert called == ['extracted']
+    else:
+        assert called == ['and', 'extracted', 'inline', 'local', 'or']
+
+
+def test_short_circuit_executes_undecided_nodes(
+    udf_registry: UDFRegistry,
+    recording_udf: Type[RecordingUdf],
+    batch_recording_udf: Type[BatchRecordingUdf],
+    execute: ExecuteFunction,
+) -> None:
+    udf_registry.register(Rule)
+    data = execute(
+        """
+        Match = Rule(when_all=[RecordingUdf(id="x") == "x", BatchRecordingUdf(id="a") == "a"], description="match")
+        Nested = (RecordingUdf(id="y") == "y" and BatchRecordingUdf(id="b") == "b") or RecordingUdf(id="z") == "q"
+        """,
+        async_pool=gevent.pool.Pool(10),
+        short_circuit=True,
+    )
+
+    assert data == {'Match': True, 'Nested': True}
+    assert sorted(id_ for batch in batch_recording_udf.order_called() for id_ in batch) == ['a', 'b']
+
+
+def test_short_circuit_on_failed_condition(
+    udf_registry: UDFRegistry,
+    batch_recording_udf: Type[BatchRecordingUdf],
+    execute_with_result: ExecuteWithResultFunction,
+) -> None:
+    udf_registry.register(Rule)
+    udf_registry.register(FailingUdf)
+    result = execute_with_result(
+        """
+        Failed = Rule(when_all=[FailingUdf() == 1, BatchRecordingUdf(id="a") == "a"], description="fails")
+        """,
+        async_pool=gevent.pool.Pool(10),
+        short_circuit=True,
+    )
+
+    assert result.extracted_features['Failed'] is False
+    # The error of the node that decided the rule is still reported.
+    assert [type(error_info.error) for error_info in result.error_infos] == [ValueError]
+    assert batch_recording_udf.order_called() == []
+
+
+def test_short_circuit_executes_udfs_with_side_effects(
+    udf_registry: UDFRegistry,
+    recording_udf: Type[RecordingUdf],
+    execute: ExecuteFunction,
+) -> None:
+    class SideEffectUdf(RecordingUdf):
+        has_side_effects = True
+        _order_called: List[str] = []
+
+        @classmethod
+        def order_called(cls) -> List[str]:
+            return cls._order_called
+
+    class EffectUdf(UDFBase[RecordingArguments, EffectBase]):
+        def execute(self, execution_context: ExecutionContext, arguments: RecordingArguments) -> EffectBase:
+            SideEffectUdf.order_called().append(arguments.id)
+            return EffectBase()
+
+    udf_registry.register(Rule)
+    udf_registry.register(SideEffectUdf)
+    udf_registry.register(EffectUdf)
+    data = execute(
+        """
+        NoMatch = Rule(when_all=[RecordingUdf(id="x") == "y", SideEffectUdf(id="rule") == "rule"], description="no")
+        And = RecordingUdf(id="a") == "b" and SideEffectUdf(id="and") == "and"
+        Or = RecordingUdf(id="c") == "c" or EffectUdf(id="or") != None
+        """,
+        async_pool=gevent.pool.Pool(10),
+        short_circuit=True,
+    )
+
+    assert data == {'NoMatch': False, 'And': False, 'Or': True}
+    assert sorted(SideEffectUdf.order_called()) == ['and', 'or', 'rule']
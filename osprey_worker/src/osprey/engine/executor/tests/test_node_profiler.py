@@ -0,0 +1,139 @@
+from typing import List, Sequence
+from unittest.mock import MagicMock, call
+
+import gevent.pool
+import pytest
+from osprey.engine.ast_validator.validators.unique_stored_names import UniqueStoredNames
+from osprey.engine.ast_validator.validators.validate_call_kwargs import ValidateCallKwargs
+from osprey.engine.conftest import RunValidationFunction
+from osprey.engine.executor.execution_context import ExecutionContext
+from osprey.engine.executor.execution_graph import ExecutionGraph, compile_execution_graph
+from osprey.engine.executor.executor import execute, execute_many
+from osprey.engine.executor.node_profiler import ExecutionProfile, NodeProfileAggregates, NodeTiming
+from osprey.engine.executor.tests.conftest import make_actions
+from osprey.engine.executor.udf_execution_helpers import UDFHelpers
+from osprey.engine.udf.arguments import ArgumentsBase
+from osprey.engine.udf.base import BatchableUDFBase, UDFBase
+from osprey.engine.udf.registry import UDFRegistry
+from result import Ok, Result
+
+
+class SleepArguments(ArgumentsBase):
+    id: str
+
+
+class SleepUdf(BatchableUDFBase[SleepArguments, str, SleepArguments]):
+    execute_async = True
+    supports_cross_action_batching = True
+
+    def execute(self, execution_context: ExecutionContext, arguments: SleepArguments) -> str:
+        gevent.sleep(0.01)
+        return arguments.id
+
+    def get_batchable_arguments(self, arguments: SleepArguments) -> SleepArguments:
+        return arguments
+
+    def execute_batch(
+        self,
+        execution_context: ExecutionContext,
+        udfs: Sequence[UDFBase[SleepArguments, str]],
+        arguments: Sequence[SleepArguments],
+    ) -> Sequence[Result[str, Exception]]:
+        gevent.sleep(0.01)
+        return [Ok(arg.id) for arg in arguments]
+
+
+@pytest.fixture()
+def graph(udf_registry: UDFRegistry, run_validation: RunValidationFunction) -> ExecutionGraph:
+    udf_registry.register(SleepUdf)
+    return compile_execution_graph(
+        run_validation(
+            """
+            Slow = SleepUdf(id="slow")
+            Fast = "a" + "b"
+            """
+        )
+    )
+
+
+@pytest.mark.use_validators([ValidateCallKwargs, UniqueStoredNames])
+def test_unsampled_executions_are_not_profiled(graph: ExecutionGraph) -> None:
+    result = execute(graph, UDFHelpers(), make_actions(1)[0], gevent.pool.Pool(4))
+    assert result.profile is None
+
+
+@pytest.mark.use_validators([ValidateCallKwargs, UniqueStoredNames])
+def test_profiles_nodes_by_statement_and_udf(graph: ExecutionGraph) -> None:
+    result = execute(graph, UDFHelpers(), make_actions(1)[0], gevent.pool.Pool(4), profile_sample_rate=1.0)
+
+    assert result.profile is not None
+    timings = {(statement, kind): timing for (_, statement, kind), timing in result.profile.timings.items()}
+    assert timings[('Slow', 'SleepUdf')].count == 1
+    assert timings[('Slow', 'SleepUdf')].wall_seconds >= 0.01
+    # Sleeping doesn't use any CPU.
+    assert timings[('Slow', 'SleepUdf')].cpu_seconds < 0.01
+    assert timings[('Fast', 'BinaryOperation')].count == 1
+
+    [((_, statement), _)] = result.profile.top(1, group_by='statement')
+    assert statement == 'Slow'
+
+
+@pytest.mark.use_validators([ValidateCallKwargs, UniqueStoredNames])
+def test_splits_batches_between_profiled_actions(graph: ExecutionGraph) -> None:
+    results = execute_many(graph, UDFHelpers(), make_actions(2), gevent.pool.Pool(4), profile_sample_rate=1.0)
+
+    wall_seconds = []
+    for result in results:
+        assert result.profile is not None
+        [timing] = [timing for (_, _, kind), timing in result.profile.timings.items() if kind == 'SleepUdf']
+        assert timing.count == 1
+        wall_seconds.append(timing.wall_seconds)
+    # The two calls were executed as a single batch, and each action is charged for half of it.
+    assert wall_seconds[0] == wall_seconds[1]
+    assert wall_seconds[0] >= 0.005
+
+
+def _profile_with(timings: List[NodeTiming]) -> ExecutionProfile:
+    profile = ExecutionProfile()
+    for i, timing in enumerate(timings):
+        profile._timings[('main.sml', f'Feature{i}', 'Udf')] = timing
+    return profile
+
+
+def test_aggregates_roll_over_windows() -> None:
+    now = 0.0
+    aggregates = NodeProfileAggregates(window_seconds=10, clock=lambda: now)
+
+    aggregates.add(_profile_with([NodeTiming(1, 0.5, 0.5)]))
+    now = 15
+    aggregates.add(_profile_with([NodeTiming(1, 2.0, 0.5), NodeTiming(1, 3.0, 0.5)]))
+    # The previous window is still reported.
+    assert [(key[1], timing.wall_seconds) for key, timing in aggregates.top(None)] == [
+        ('Feature1', 3.0),
+        ('Feature0', 2.5),
+    ]
+    assert aggregates.top(None, group_by='udf') == [(('Udf',), NodeTiming(3, 5.5, 1.5))]
+
+    now = 25
+    assert [(key[1], timing.wall_seconds) for key, timing in aggregates.top(None)] == [
+        ('Feature1', 3.0),
+        ('Feature0', 2.0),
+    ]
+
+    now = 100
+    assert aggregates.top(None) == []
+    assert aggregates.profile_count == 2
+
+
+def test_aggregates_report_most_expensive_nodes() -> None:
+    statsd = MagicMock()
+    aggregates = NodeProfileAggregates(statsd=statsd, reported_nodes=1)
+    aggregates.add(_profile_with([NodeTiming(1, 0.5, 0.25), NodeTiming(2, 3.0, 0.5)]))
+    aggregates.report()
+
+    tags = ['source:main.sml', 'statement:Feature1', 'udf:Udf']
+    assert statsd.gauge.call_args_list == [
+        call('execution_profile.node.wall_ms', 3000.0, tags=tags),
+        call('execution_profile.node.cpu_ms', 500.0, tags=tags),
+        call('execution_profile.node.count', 2, tags=tags),
+    ]
@@ -0,0 +1,48 @@
+from osprey.engine.executor.scheduling import (
+    _DEFAULT_ASYNC_NODE_COST_SECONDS,
+    _SYNC_NODE_COST_SECONDS,
+    UdfLatencyStats,
+    compute_critical_path_priorities,
+)
+
+
+def test_latency_stats_publishes_new_udfs_immediately() -> None:
+    stats = UdfLatencyStats(refresh_interval_seconds=3600)
+    assert stats.estimate('Foo') == _DEFAULT_ASYNC_NODE_COST_SECONDS
+
+    generation = stats.generation
+    stats.record('Foo', 1.0)
+    assert stats.estimate('Foo') == 1.0
+    assert stats.generation == generation + 1
+
+
+def test_latency_stats_only_publishes_averages_on_refresh() -> None:
+    stats = UdfLatencyStats(refresh_interval_seconds=3600)
+    stats.record('Foo', 1.0)
+    generation = stats.generation
+
+    stats.record('Foo', 2.0)
+    assert stats.estimate('Foo') == 1.0
+    assert stats.generation == generation
+
+    stats.publish()
+    assert stats.estimate('Foo') == 1.1
+    assert stats.generation == generation + 1
+
+
+def test_critical_path_priorities() -> None:
+    stats = UdfLatencyStats(refresh_interval_seconds=3600)
+    stats.record('Slow', 1.0)
+
+    # 0 -> 1 -> 3, 0 -> 2 -> 3, where only 2 is a (slow) async call.
+    priorities = compute_critical_path_priorities(
+        [None, None, 'Slow', None],
+        [(1, 2), (3,), (3,), ()],
+        stats,
+    )
+
+    assert priorities[3] == _SYNC_NODE_COST_SECONDS
+    assert priorities[1] == 2 * _SYNC_NODE_COST_SECONDS
+    assert priorities[2] == 1.0 + _SYNC_NODE_COST_SECONDS
+    assert priorities[0] == priorities[2] + _SYNC_NODE_COST_SECONDS
+    assert priorities[2] > priorities[1]
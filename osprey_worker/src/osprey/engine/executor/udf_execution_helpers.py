@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Any, Dict, Generic, Hashable, Type, TypeVar, cast
+from typing import TYPE_CHECKING, Any, Dict, Generic, Hashable, Optional, Type, TypeVar, cast
 
 from osprey.engine.executor.external_service_utils import (
     ExternalService,
     ExternalServiceAccessor,
+    SharedExternalServiceCache,
 )
 
 if TYPE_CHECKING:
@@ -42,6 +43,7 @@ class UDFHelpers:
 
     def __init__(self) -> None:
         self._helpers: Dict[Type[HasHelperInternal[Any]], object] = {}
+        self._shared_external_service_cache: Optional[SharedExternalServiceCache] = None
 
     def set_udf_helper(self, udf_class: Type[HasHelperInternal[HelperT]], helper: HelperT) -> 'UDFHelpers':
         self._helpers[udf_class] = helper
@@ -49,3 +51,12 @@ class UDFHelpers:
 
     def get_udf_helper(self, udf: HasHelperInternal[HelperT]) -> HelperT:
         return cast(HelperT, self._helpers[type(udf)])
+
+    def set_shared_external_service_cache(self, cache: Optional[SharedExternalServiceCache]) -> 'UDFHelpers':
+        """Sets a cache that external service lookups fall through to, which is shared across executions."""
+        self._shared_external_service_cache = cache
+        return self
+
+    @property
+    def shared_external_service_cache(self) -> Optional[SharedExternalServiceCache]:
+        return self._shared_external_service_cache
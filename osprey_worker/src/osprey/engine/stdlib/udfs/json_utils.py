@@ -1,16 +1,92 @@
-from typing import Any, Dict, TypeVar
+from typing import Any, Dict, Optional, Tuple, TypeVar, Union
 
 from jsonpath_rw import JSONPath, parse
+from jsonpath_rw.jsonpath import Child, Fields, Index, Root
 from osprey.engine.executor.execution_context import ExpectedUdfException
 from osprey.engine.udf.arguments import ConstExpr
 from osprey.engine.udf.rvalue_type_checker import RValueTypeChecker
 from osprey.engine.udf.type_helpers import to_display_str
 
+MISSING = object()
+"""Returned by `CompiledJsonPath.find_first` when nothing is at the path."""
 
-def parse_path(path: ConstExpr[str]) -> JSONPath:
+
+class CompiledJsonPath:
+    """A parsed JSON path.
+
+    Paths that are only field names and indexes, like `$.post.tags[0]`, are compiled into the keys and indexes to
+    look up in turn, which is much faster than having `jsonpath_rw` find them. Other paths, eg with wildcards, slices
+    or filters, are still found with `jsonpath_rw`."""
+
+    __slots__ = ('expr', '_steps')
+
+    def __init__(self, expr: JSONPath) -> None:
+        self.expr = expr
+        self._steps = _compile_steps(expr)
+
+    def find_first(self, data: object) -> Any:
+        """Returns the first value at the path, or `MISSING` if there is none."""
+        steps = self._steps
+        if steps is None:
+            matches = self.expr.find(data)
+            return matches[0].value if matches else MISSING
+
+        value: Any = data
+        # These mirror the lookups of `jsonpath_rw`'s `Fields` and `Index`, including which errors mean no match.
+        for step in steps:
+            if isinstance(step, int):
+                if len(value) <= step:
+                    return MISSING
+                value = value[step]
+            else:
+                try:
+                    value = value[step]
+                except (TypeError, KeyError, AttributeError):
+                    return MISSING
+        return value
+
+    @property
+    def is_compiled(self) -> bool:
+        return self._steps is not None
+
+    def __str__(self) -> str:
+        return str(self.expr)
+
+
+def _compile_steps(expr: JSONPath) -> Optional[Tuple[Union[str, int], ...]]:
+    """Returns the field names and indexes to look up in turn, if the path is made of only those, optionally
+    starting from the root."""
+    steps = []
+    while isinstance(expr, Child):
+        step = _compile_step(expr.right)
+        if step is None:
+            return None
+        steps.append(step)
+        expr = expr.left
+
+    if not isinstance(expr, Root):
+        step = _compile_step(expr)
+        if step is None:
+            return None
+        steps.append(step)
+
+    return tuple(reversed(steps))
+
+
+def _compile_step(expr: JSONPath) -> Union[str, int, None]:
+    if isinstance(expr, Fields) and len(expr.fields) == 1:
+        [field] = expr.fields
+        if isinstance(field, str) and field != '*':
+            return field
+    elif isinstance(expr, Index) and isinstance(expr.index, int):
+        return expr.index
+    return None
+
+
+def parse_path(path: ConstExpr[str]) -> CompiledJsonPath:
     with path.attribute_errors():
         try:
-            return parse(path.value)
+            return CompiledJsonPath(parse(path.value))
         except Exception as e:
             # There is a bug in jsonpath_rw that is throwing an error while trying to generate an error.
             # that's cool, but we can catch it and transmute it to something a little more relevant for now.
@@ -44,17 +120,15 @@ _T = TypeVar('_T')
 
 
 def get_from_data(
-    expr: JSONPath,
+    expr: CompiledJsonPath,
     data: Dict[str, object],
     required: bool,
     coerce_type: bool,
     rvalue_type_checker: RValueTypeChecker,
 ) -> Any:
-    matches = expr.find(data)
+    value = expr.find_first(data)
 
-    if matches:
-        value = matches[0].value
-    else:
+    if value is MISSING:
         # If we can return None, do that
         if rvalue_type_checker.check(None):
             return None
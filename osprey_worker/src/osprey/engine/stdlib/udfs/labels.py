@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from enum import Enum, auto
-from typing import Any, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence
 
 from osprey.engine.executor.udf_execution_helpers import HasHelperInternal
 from osprey.engine.language_types.effects import (
@@ -161,6 +161,7 @@ class HasLabel(
     """Returns `True` if the specified label is currently present in a given non-expired state on a provided Entity."""
 
     category = UdfCategories.ENGINE
+    supports_cross_action_batching = True
 
     def __init__(self, validation_context: ValidationContext, arguments: HasLabelArguments) -> None:
         super().__init__(validation_context, arguments)
@@ -221,7 +222,7 @@ class HasLabel(
                 label_state = None
 
         if label_state is None:
-            return self.desired_status == _SimpleStatus.REMOVED and desired_manual != _ManualType.YES
+            return arguments.desired_status == _SimpleStatus.REMOVED and desired_manual != _ManualType.YES
 
         if label_state.status == LabelStatus.ADDED:
             actual_status = _SimpleStatus.ADDED
@@ -248,7 +249,7 @@ class HasLabel(
             actual_delay = now - oldest_non_expired
 
         return (
-            self.desired_status == actual_status
+            arguments.desired_status == actual_status
             and desired_manual in (_ManualType.EITHER, actual_manual)
             and (desired_delay is None or actual_delay > desired_delay)
         )
@@ -272,12 +273,10 @@ class HasLabel(
 
     def get_batch_routing_key(self, arguments: BatchableHasLabelArguments) -> str:
         """
-        Returns routing key based on entity to ensure same-entity labels are batched together.
-
-        This ensures that execute_batch() always receives arguments for a single unique entity,
-        avoiding the NotImplementedError for multiple entities.
+        Returns the same routing key for every label check, so that all the label reads that are ready at the same
+        time are batched together, and fetched with a single multi-entity read from the labels provider.
         """
-        return arguments.entity.type + '/' + str(arguments.entity.id)
+        return ''
 
     def execute_batch(
         self,
@@ -285,40 +284,29 @@ class HasLabel(
         udfs: Sequence[UDFBase[Any, Any]],
         arguments: Sequence[BatchableHasLabelArguments],
     ) -> Sequence[Result[bool, Exception]]:
-        unique_entities = set()
-        for arg in arguments:
-            unique_entities.add(arg.entity)
+        # dicts keep insertion order, so entities are fetched in the order that they were first checked
+        unique_entities = list(dict.fromkeys(arg.entity for arg in arguments))
 
         label_provider = execution_context.get_udf_helper(self)
         accessor = execution_context.get_external_service_accessor(label_provider)
 
         if len(unique_entities) == 1:
-            # no need to batch if there is only one unique entity.
-            # we actually expect all execute_batches to take this route, since the executor
-            # batches based on the routing key (which is the entity string).
-            entity_labels_pb2 = accessor.get(unique_entities.pop())
-            output = []
-            for args in arguments:
-                try:
-                    output.append(Ok(self._execute(execution_context, args, entity_labels_pb2)))
-                except Exception as e:
-                    output.append(Err(e))
-            return output
-
-        # in case the routing key ever gets changed to allow for multiple unique entities,
-        # i went ahead and made sure we had that supported ^^ p.s. you might want to test this locally
-        raise NotImplementedError
-        # unique_entities_list = list(unique_entities)
-        # entity_labels_list = accessor.batch_get([entity for entity in unique_entities_list])
-        # entity_to_labels = {entity: labels for entity, labels in zip(unique_entities_list, entity_labels_list)}
-        # output = []
-        # for args in arguments:
-        #     if entity_to_labels[args.entity].is_err():
-        #         output.append(Err(entity_to_labels[args.entity].value))
-        #         continue
-        #     try:
-        #         # unfortunately, mypy doesn't recognize that entity_to_labels[args.entity] is an Ok type
-        #         output.append(Ok(self._execute(execution_context, args, entity_to_labels[args.entity].value)))  # type: ignore
-        #     except Exception as e:
-        #         output.append(Err(e))
-        # return output
+            # no need for a batch read if there is only one unique entity
+            entity_labels = accessor.get(unique_entities[0])
+            entity_to_labels: Dict[EntityT[Any], Result[EntityLabels, Exception]] = {
+                unique_entities[0]: Ok(entity_labels)
+            }
+        else:
+            entity_to_labels = dict(zip(unique_entities, accessor.batch_get(unique_entities)))
+
+        output: List[Result[bool, Exception]] = []
+        for args in arguments:
+            entity_labels_result = entity_to_labels[args.entity]
+            if entity_labels_result.is_err():
+                output.append(Err(entity_labels_result.value))
+                continue
+            try:
+                output.append(Ok(self._execute(execution_context, args, entity_labels_result.value)))
+            except Exception as e:
+                output.append(Err(e))
+        return output
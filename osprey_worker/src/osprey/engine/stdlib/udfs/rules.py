@@ -119,6 +119,7 @@ class WhenRulesArguments(ArgumentsBase):
 
 class WhenRules(UDFBase[WhenRulesArguments, None]):
     category = UdfCategories.ENGINE
+    has_side_effects = True
 
     def resolve_arguments(self, execution_context: ExecutionContext, call_executor: CallExecutor) -> WhenRulesArguments:
         # WhenRules has some custom resolve logic, in order to tolerate a failure in the `rules_any` dependency chain.
@@ -1,8 +1,15 @@
-from typing import List
+from datetime import timedelta
+from typing import List, Optional, Sequence
 
 import gevent
+import pytest
 from gevent.event import Event
-from osprey.engine.executor.external_service_utils import ExternalService, ExternalServiceAccessor
+from osprey.engine.executor.external_service_utils import (
+    ExternalService,
+    ExternalServiceAccessor,
+    SharedExternalServiceCache,
+)
+from result import Err, Ok, Result
 
 
 class CountingService(ExternalService[str, int]):
@@ -89,3 +96,141 @@ def test_can_request_different_keys_in_parallel() -> None:
     assert g1.get() == 1
     assert g2.get() == 2
     assert g3.get() == 1
+
+
+class ExpiringService(CountingService):
+    def __init__(self, ttl: Optional[timedelta]) -> None:
+        super().__init__()
+        self.ttl = ttl
+
+    def cache_ttl(self) -> Optional[timedelta]:
+        return self.ttl
+
+    def batch_get_from_service(self, keys: Sequence[str]) -> Sequence[Result[int, Exception]]:
+        results: List[Result[int, Exception]] = []
+        for key in keys:
+            if key == 'bad':
+                results.append(Err(ValueError(key)))
+            else:
+                results.append(Ok(self.get_from_service(key)))
+        return results
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_shared_cache_is_used_across_accessors() -> None:
+    service = CountingService()
+    cache = SharedExternalServiceCache(max_size=10)
+
+    assert ExternalServiceAccessor(service, cache).get('a') == 1
+    assert ExternalServiceAccessor(service, cache).get('a') == 1
+    assert service.calls == ['a']
+
+    # Services don't share entries.
+    other_service = CountingService()
+    assert ExternalServiceAccessor(other_service, cache).get('a') == 1
+    assert other_service.calls == ['a']
+
+
+def test_shared_cache_honours_ttl() -> None:
+    service = ExpiringService(ttl=timedelta(seconds=10))
+    clock = FakeClock()
+    cache = SharedExternalServiceCache(max_size=10, clock=clock)
+
+    assert cache.get(service, 'a') == 1
+    clock.now = 9.0
+    assert cache.get(service, 'a') == 1
+    clock.now = 10.0
+    assert cache.get(service, 'a') == 2
+    assert service.calls == ['a', 'a']
+
+    service.ttl = timedelta(days=-1)
+    cache.invalidate(service, 'a')
+    assert cache.get(service, 'a') == 3
+    assert cache.get(service, 'a') == 4
+    assert len(cache) == 0
+
+
+def test_shared_cache_evicts_least_recently_used() -> None:
+    service = CountingService()
+    cache = SharedExternalServiceCache(max_size=2)
+
+    cache.get(service, 'a')
+    cache.get(service, 'b')
+    cache.get(service, 'a')
+    cache.get(service, 'c')
+    assert len(cache) == 2
+
+    cache.get(service, 'a')
+    cache.get(service, 'c')
+    assert service.calls == ['a', 'b', 'c']
+    cache.get(service, 'b')
+    assert service.calls == ['a', 'b', 'c', 'b']
+
+
+def test_shared_cache_coalesces_requests_across_accessors() -> None:
+    service = BlockingService()
+    cache = SharedExternalServiceCache(max_size=10)
+
+    g1 = gevent.spawn(lambda: ExternalServiceAccessor(service, cache).get('a'))
+    g2 = gevent.spawn(lambda: ExternalServiceAccessor(service, cache).get('a'))
+    gevent.idle()
+
+    assert len(service.blocking_events) == 1
+    service.blocking_events[0].set()
+    gevent.idle()
+
+    assert service.calls == ['a']
+    assert g1.get() == 1
+    assert g2.get() == 1
+
+
+def test_shared_cache_does_not_store_value_invalidated_while_fetching() -> None:
+    service = BlockingService()
+    cache = SharedExternalServiceCache(max_size=10)
+
+    g1 = gevent.spawn(lambda: cache.get(service, 'a'))
+    gevent.idle()
+    cache.invalidate(service, 'a')
+    service.blocking_events[0].set()
+
+    assert g1.get() == 1
+    assert len(cache) == 0
+
+
+def test_shared_cache_does_not_store_errors() -> None:
+    class FailingService(CountingService):
+        def get_from_service(self, key: str) -> int:
+            super().get_from_service(key)
+            raise ValueError(key)
+
+    service = FailingService()
+    cache = SharedExternalServiceCache(max_size=10)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.get(service, 'a')
+    assert service.calls == ['a', 'a']
+
+
+def test_shared_cache_batch_get() -> None:
+    service = ExpiringService(ttl=None)
+    cache = SharedExternalServiceCache(max_size=10)
+    accessor = ExternalServiceAccessor(service, cache)
+
+    assert cache.get(service, 'a') == 1
+    results = accessor.batch_get(['a', 'b', 'bad'])
+    assert results[:2] == [Ok(1), Ok(2)]
+    assert isinstance(results[2].value, ValueError)
+    assert service.calls == ['a', 'b']
+
+    results = ExternalServiceAccessor(service, cache).batch_get(['b', 'bad', 'c'])
+    assert results[0] == Ok(2)
+    assert results[2] == Ok(3)
+    assert service.calls == ['a', 'b', 'c']
@@ -1,6 +1,7 @@
 from typing import Any, Callable, List
 
 import pytest
+from jsonpath_rw import parse
 from osprey.engine.ast_validator.validators.unique_stored_names import UniqueStoredNames
 from osprey.engine.ast_validator.validators.validate_call_kwargs import ValidateCallKwargs
 from osprey.engine.ast_validator.validators.validate_dynamic_calls_have_annotated_rvalue import (
@@ -13,6 +14,7 @@ from osprey.engine.conftest import (
     RunValidationFunction,
 )
 from osprey.engine.stdlib.udfs.json_data import JsonData
+from osprey.engine.stdlib.udfs.json_utils import MISSING, CompiledJsonPath
 from osprey.engine.udf.registry import UDFRegistry
 
 pytestmark: List[Callable[[Any], Any]] = [
@@ -75,3 +77,61 @@ def test_execute_coerce_type(execute: ExecuteFunction) -> None:
     )
 
     assert data == {'Foo': 123, 'Bar': None, 'Foo2': 123}
+
+
+def test_execute_indexed_path(execute: ExecuteFunction) -> None:
+    data = execute(
+        """
+        First: str = JsonData(path='$.tags[0][1]')
+        Last: str = JsonData(path='$.tags[-1][1]')
+        Missing: Optional[str] = JsonData(path='$.tags[5][1]', required=False)
+        """,
+        data={'tags': [['e', 'abc'], ['p', 'def']]},
+    )
+
+    assert data == {'First': 'abc', 'Last': 'def', 'Missing': None}
+
+
+@pytest.mark.parametrize(
+    'path, compiled',
+    [
+        ('$', True),
+        ('$.foo', True),
+        ('foo.bar', True),
+        ('$.foo.bar[0]', True),
+        ('$.foo[-1]', True),
+        ('$.foo[1].bar', True),
+        ('$."odd key"', True),
+        ('$.*', False),
+        ('$.foo[*]', False),
+        ('$.foo,bar', False),
+        ('$..bar', False),
+    ],
+)
+def test_compiled_paths_find_what_jsonpath_finds(path: str, compiled: bool) -> None:
+    expr = parse(path)
+    compiled_path = CompiledJsonPath(expr)
+    assert compiled_path.is_compiled == compiled
+    assert str(compiled_path) == str(expr)
+
+    for data in [
+        {'foo': {'bar': ['x', 'y']}},
+        {'foo': [{'bar': 1}, {'bar': None}], 'bar': 2},
+        {'foo': 'string', 'odd key': 3},
+        {'foo': None},
+        {},
+    ]:
+        assert _outcome(lambda: compiled_path.find_first(data)) == _outcome(lambda: _find_first(expr, data)), data
+
+
+def _find_first(expr: Any, data: Any) -> Any:
+    matches = expr.find(data)
+    return matches[0].value if matches else MISSING
+
+
+def _outcome(find: Callable[[], Any]) -> Any:
+    # `jsonpath_rw` raises for some lookups, like an index into a dict, which compiled paths should keep doing.
+    try:
+        return find()
+    except Exception as e:
+        return type(e)
@@ -683,3 +683,57 @@ def test_error_on_empty_false_returns_false_when_entity_has_no_labels(execute: E
     )
 
     assert data == {'L': False}
+
+
+class RecordingBatchLabelProvider(StaticLabelProvider):
+    def __init__(self, entity_labels: Dict[EntityT[Any], EntityLabels]) -> None:
+        super().__init__(entity_labels)
+        self.batch_calls: List[List[EntityT[Any]]] = []
+
+    def batch_get_from_service(self, keys: Sequence[EntityT[Any]]) -> Sequence[Result[EntityLabels, Exception]]:
+        self.batch_calls.append(list(keys))
+        return [
+            Result.Ok(self._entity_labels[key]) if key in self._entity_labels else Result.Err(KeyError(key))
+            for key in keys
+        ]
+
+
+def test_has_label_batches_entities_into_one_read(execute_with_result: ExecuteWithResultFunction) -> None:
+    added = LabelState(status=LabelStatus.ADDED, reasons=LabelReasons({'TestReason': LabelReason()}))
+    label_provider = RecordingBatchLabelProvider(
+        {
+            EntityT('User', 'alice'): EntityLabels(labels={'my_label': added}),
+            EntityT('User', 'bob'): EntityLabels(labels={}),
+        }
+    )
+
+    result = execute_with_result(
+        source_with_labels_config(
+            """
+            L1 = HasLabel(entity=Entity(type='User', id='alice'), label='my_label')
+            L2 = HasLabel(entity=Entity(type='User', id='bob'), label='my_label')
+            L3 = HasLabel(entity=Entity(type='User', id='alice'), label='my_label', status='removed')
+            L4 = HasLabel(entity=Entity(type='User', id='carol'), label='my_label')
+            """,
+            labels={'my_label'},
+        ),
+        udf_helpers=UDFHelpers().set_udf_helper(HasLabel, label_provider),
+        async_pool=Pool(size=10),
+    )
+
+    assert {name: result.extracted_features[name] for name in ('L1', 'L2', 'L3', 'L4')} == {
+        'L1': True,
+        'L2': False,
+        'L3': False,
+        'L4': None,
+    }
+    assert len(result.error_infos) == 1
+    assert isinstance(result.error_infos[0].error, KeyError)
+    # Every entity is read once, in a single batch.
+    assert len(label_provider.batch_calls) == 1
+    assert len(label_provider.batch_calls[0]) == 3
+    assert set(label_provider.batch_calls[0]) == {
+        EntityT('User', 'alice'),
+        EntityT('User', 'bob'),
+        EntityT('User', 'carol'),
+    }
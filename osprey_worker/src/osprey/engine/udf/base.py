@@ -89,6 +89,11 @@ class UDFBase(Generic[Arguments, RValue], ABC):
     the `execute_async` field in `BaseNodeExecutor`.
     """
 
+    has_side_effects: ClassVar[bool] = False
+    """Whether executing this function does something besides returning its value (e.g. adds effects to the execution
+    context). Such functions are always executed, even when short-circuiting would otherwise skip them (see
+    `is_observable` in `short_circuit.py`). Functions that return effects are always executed regardless."""
+
     category: ClassVar[Optional[str]] = None
     """If present, a string name for what category this UDF falls into. Can be used for, say, grouping UDFs
     in documentation."""
@@ -217,6 +222,11 @@ class BatchableUDFBase(Generic[Arguments, RValue, BatchableArguments], UDFBase[A
 
     execute_async = True
 
+    supports_cross_action_batching: ClassVar[bool] = False
+    """Whether calls from different actions may be combined into the same batch, when several actions are executed
+    together (see `executor.execute_many`). `execute_batch` is then called with the execution context of only one of
+    those actions, so this should only be enabled if it does not read anything action-specific from the context."""
+
     @classmethod
     def get_batchable_arguments_type(cls) -> Type[BatchableArguments]:
         arguments_type = cls._get_udf_base_args()[2]
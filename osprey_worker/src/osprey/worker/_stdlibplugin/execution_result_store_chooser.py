@@ -3,6 +3,11 @@ from typing import Optional
 from osprey.worker.adaptor.plugin_manager import bootstrap_execution_result_store
 from osprey.worker.lib.singletons import CONFIG
 from osprey.worker.lib.storage import ExecutionResultStorageBackendType
+from osprey.worker.lib.storage.execution_result_segments import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_FLUSH_INTERVAL_SECONDS,
+    DEFAULT_READ_CACHE_BYTES,
+)
 from osprey.worker.lib.storage.stored_execution_result import (
     ExecutionResultStore,
     StoredExecutionResultBigTable,
@@ -18,11 +23,20 @@ def get_rules_execution_result_storage_backend(
     results. For more details, see `ExecutionResultStore`."""
 
     config = CONFIG.instance()
+    # Inserts are buffered, and written once this many are buffered or after the flush interval.
+    batch_size = config.get_int('OSPREY_EXECUTION_RESULT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    flush_interval_seconds = config.get_float(
+        'OSPREY_EXECUTION_RESULT_FLUSH_INTERVAL_SECONDS', DEFAULT_FLUSH_INTERVAL_SECONDS
+    )
+    # Object store backends cache recently read execution results, up to this many bytes of JSON.
+    read_cache_bytes = config.get_int('OSPREY_EXECUTION_RESULT_READ_CACHE_BYTES', DEFAULT_READ_CACHE_BYTES)
 
     if backend_type == ExecutionResultStorageBackendType.BIGTABLE:
-        return StoredExecutionResultBigTable()
+        return StoredExecutionResultBigTable(batch_size=batch_size, flush_interval_seconds=flush_interval_seconds)
     elif backend_type == ExecutionResultStorageBackendType.GCS:
-        return StoredExecutionResultGCS()
+        return StoredExecutionResultGCS(
+            batch_size=batch_size, flush_interval_seconds=flush_interval_seconds, read_cache_bytes=read_cache_bytes
+        )
     elif backend_type == ExecutionResultStorageBackendType.MINIO:
         endpoint = config.get_str('OSPREY_MINIO_ENDPOINT', 'minio:9000')
         access_key = config.get_str('OSPREY_MINIO_ACCESS_KEY', 'minioadmin')
@@ -31,7 +45,14 @@ def get_rules_execution_result_storage_backend(
         bucket_name = config.get_str('OSPREY_MINIO_EXECUTION_RESULTS_BUCKET', 'execution-output')
 
         return StoredExecutionResultMinIO(
-            endpoint=endpoint, access_key=access_key, secret_key=secret_key, secure=secure, bucket_name=bucket_name
+            endpoint=endpoint,
+            access_key=access_key,
+            secret_key=secret_key,
+            secure=secure,
+            bucket_name=bucket_name,
+            batch_size=batch_size,
+            flush_interval_seconds=flush_interval_seconds,
+            read_cache_bytes=read_cache_bytes,
         )
     elif backend_type == ExecutionResultStorageBackendType.PLUGIN:
         store = bootstrap_execution_result_store(config=config)
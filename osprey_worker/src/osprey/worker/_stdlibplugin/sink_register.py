@@ -1,11 +1,10 @@
 from typing import List, Sequence
 
-from kafka import KafkaProducer
 from osprey.worker._stdlibplugin.execution_result_store_chooser import get_rules_execution_result_storage_backend
 from osprey.worker.adaptor.plugin_manager import hookimpl_osprey
 from osprey.worker.lib.config import Config
 from osprey.worker.lib.storage import ExecutionResultStorageBackendType
-from osprey.worker.sinks.sink.kafka_output_sink import KafkaOutputSink
+from osprey.worker.sinks.sink.kafka_output_sink import DEFAULT_MAX_IN_FLIGHT, KafkaOutputSink, create_kafka_producer
 from osprey.worker.sinks.sink.output_sink import BaseOutputSink, StdoutOutputSink
 from osprey.worker.sinks.sink.stored_execution_result_output_sink import StoredExecutionResultOutputSink
 
@@ -22,7 +21,9 @@ def register_output_sinks(config: Config) -> Sequence[BaseOutputSink]:
         sinks.append(
             KafkaOutputSink(
                 kafka_topic=output_topic,
-                kafka_producer=KafkaProducer(bootstrap_servers=bootstrap_servers, client_id=client_id),
+                kafka_producer=create_kafka_producer(config, bootstrap_servers, client_id),
+                partition_key_feature=config.get_optional_str('OSPREY_KAFKA_OUTPUT_PARTITION_KEY_FEATURE'),
+                max_in_flight=config.get_int('OSPREY_KAFKA_OUTPUT_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT),
             )
         )
 
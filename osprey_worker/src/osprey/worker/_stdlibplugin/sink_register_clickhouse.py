@@ -16,8 +16,11 @@ def register_output_sinks(config: Config) -> Sequence[BaseOutputSink]:
 
     # Kafka output sink (if still needed for other consumers)
     if config.get_bool('OSPREY_KAFKA_OUTPUT_SINK', False):
-        from kafka import KafkaProducer
-        from osprey.worker.sinks.sink.kafka_output_sink import KafkaOutputSink
+        from osprey.worker.sinks.sink.kafka_output_sink import (
+            DEFAULT_MAX_IN_FLIGHT,
+            KafkaOutputSink,
+            create_kafka_producer,
+        )
 
         output_topic = config.expect_str('OSPREY_KAFKA_OUTPUT_TOPIC')
         bootstrap_servers = config.expect_str_list('OSPREY_KAFKA_BOOTSTRAP_SERVERS')
@@ -25,7 +28,9 @@ def register_output_sinks(config: Config) -> Sequence[BaseOutputSink]:
         sinks.append(
             KafkaOutputSink(
                 kafka_topic=output_topic,
-                kafka_producer=KafkaProducer(bootstrap_servers=bootstrap_servers, client_id=client_id),
+                kafka_producer=create_kafka_producer(config, bootstrap_servers, client_id),
+                partition_key_feature=config.get_optional_str('OSPREY_KAFKA_OUTPUT_PARTITION_KEY_FEATURE'),
+                max_in_flight=config.get_int('OSPREY_KAFKA_OUTPUT_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT),
             )
         )
 
@@ -47,6 +52,8 @@ def register_output_sinks(config: Config) -> Sequence[BaseOutputSink]:
                 table=config.get_str('OSPREY_CLICKHOUSE_TABLE', 'osprey_events'),
                 database=config.get_str('OSPREY_CLICKHOUSE_DATABASE', 'osprey'),
                 batch_size=config.get_int('OSPREY_CLICKHOUSE_BATCH_SIZE', 500),
+                flush_interval_seconds=config.get_float('OSPREY_CLICKHOUSE_FLUSH_INTERVAL_SECONDS', 5.0),
+                max_pending_rows=config.get_int('OSPREY_CLICKHOUSE_MAX_PENDING_ROWS', 50_000),
             )
         )
 
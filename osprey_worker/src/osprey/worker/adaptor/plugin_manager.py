@@ -12,10 +12,16 @@ from osprey.engine.udf.registry import UDFRegistry
 from osprey.worker.adaptor.constants import OSPREY_ADAPTOR
 from osprey.worker.adaptor.hookspecs import osprey_hooks
 from osprey.worker.lib.action_proto_deserializer import ActionProtoDeserializer
-from osprey.worker.lib.singletons import LABELS_PROVIDER
+from osprey.worker.lib.singletons import LABELS_PROVIDER, SHARED_EXTERNAL_SERVICE_CACHE
 from osprey.worker.lib.storage.labels import LabelsProvider, LabelsServiceBase
 from osprey.worker.sinks.sink.input_stream import BaseInputStream
-from osprey.worker.sinks.sink.output_sink import BaseOutputSink, LabelOutputSink, MultiOutputSink
+from osprey.worker.sinks.sink.output_sink import (
+    DEFAULT_LABEL_WRITE_WINDOW_SECONDS,
+    DEFAULT_MAX_COALESCED_LABEL_WRITES,
+    BaseOutputSink,
+    LabelOutputSink,
+    MultiOutputSink,
+)
 from osprey.worker.sinks.utils.acking_contexts import BaseAckingContext
 
 if TYPE_CHECKING:
@@ -46,7 +52,7 @@ def _labels_service_or_provider_is_registered() -> bool:
 
 def bootstrap_udfs() -> tuple[UDFRegistry, UDFHelpers]:
     load_all_osprey_plugins()
-    udf_helpers = UDFHelpers()
+    udf_helpers = UDFHelpers().set_shared_external_service_cache(SHARED_EXTERNAL_SERVICE_CACHE.instance())
 
     udfs: List[Type[UDFBase[Any, Any]]] = flatten(plugin_manager.hook.register_udfs())
 
@@ -83,7 +89,19 @@ def bootstrap_output_sinks(config: Config) -> BaseOutputSink:
         if custom_label_sink:
             sinks.append(custom_label_sink)
         else:
-            sinks.append(LabelOutputSink(labels_provider))
+            sinks.append(
+                LabelOutputSink(
+                    labels_provider,
+                    SHARED_EXTERNAL_SERVICE_CACHE.instance(),
+                    write_window_seconds=config.get_float(
+                        'OSPREY_LABEL_OUTPUT_WRITE_WINDOW_SECONDS', DEFAULT_LABEL_WRITE_WINDOW_SECONDS
+                    ),
+                    max_coalesced_writes=config.get_int(
+                        'OSPREY_LABEL_OUTPUT_MAX_COALESCED_WRITES', DEFAULT_MAX_COALESCED_LABEL_WRITES
+                    ),
+                    affinity_feature=config.get_optional_str('OSPREY_LABEL_OUTPUT_AFFINITY_FEATURE'),
+                )
+            )
 
     return MultiOutputSink(sinks)
 
@@ -7,6 +7,7 @@ from osprey.worker.lib.patcher import patch_all
 patch_all(ddtrace_args={'cassandra': True, 'psycopg': True})
 
 import signal
+import sys
 from uuid import uuid1
 
 # this is required to avoid memory leaks with gRPC
@@ -17,9 +18,10 @@ from osprey.worker.sinks.input_stream_chooser import get_rules_sink_input_stream
 gevent_config.track_greenlet_tree = False
 
 import multiprocessing
+import multiprocessing.connection
 import os
 from concurrent.futures import ProcessPoolExecutor
-from typing import Optional, Set, TextIO, cast
+from typing import Dict, Optional, Set, TextIO, cast
 
 import click
 import gevent
@@ -48,7 +50,7 @@ from osprey.worker.sinks import (
 )
 from osprey.worker.sinks.sink.base_sink import BaseSink, PooledSink
 from osprey.worker.sinks.sink.bulk_label_sink import BulkLabelSink
-from osprey.worker.sinks.sink.input_stream import PostgresInputStream
+from osprey.worker.sinks.sink.input_stream import KafkaInputStream, PostgresInputStream
 from osprey.worker.sinks.sink.osprey_coordinator_input_stream import OspreyCoordinatorInputStream
 from osprey.worker.sinks.sink.rules_sink import RulesSink
 from osprey.worker.sinks.utils.kafka import PatchedKafkaConsumer
@@ -133,14 +135,24 @@ def run_rules_sink(
 
     config = init_config()
 
-    engine, udf_helpers = bootstrap_engine_with_helpers()
-
     input_stream_source_string = config.get_str('OSPREY_INPUT_STREAM_SOURCE', 'plugin')
     try:
         input_stream_source = InputStreamSource(input_stream_source_string.lower())
     except ValueError:
         raise NotImplementedError(f'{input_stream_source_string} is not a valid input stream source.')
 
+    num_processes = config.get_int('OSPREY_RULES_SINK_PROCESS_COUNT', 1)
+    if input_stream_source == InputStreamSource.KAFKA and num_processes > 1:
+        # Each process gets a consumer in the group, so without one they would all read every partition.
+        config.expect_str('OSPREY_KAFKA_GROUP_ID')
+        return _run_kafka_rules_sink_processes(num_processes, pooled)
+
+    _run_rules_sink_process(config, input_stream_source, pooled)
+
+
+def _run_rules_sink_process(config: Config, input_stream_source: InputStreamSource, pooled: bool) -> None:
+    engine, udf_helpers = bootstrap_engine_with_helpers()
+
     input_stream = get_rules_sink_input_stream(input_stream_source)
     output_sink = bootstrap_output_sinks(config=config)
 
@@ -150,6 +162,7 @@ def run_rules_sink(
             input_stream=input_stream,
             output_sink=output_sink,
             udf_helpers=udf_helpers,
+            **_get_rules_sink_pipeline_kwargs(config),
         )
 
     if pooled:
@@ -157,9 +170,86 @@ def run_rules_sink(
     else:
         rules_sink = factory()
 
+    if isinstance(input_stream, KafkaInputStream):
+        # Finish the actions that were read and commit them before leaving the consumer group.
+        signal.signal(signal.SIGTERM, lambda *args: input_stream.stop())
+        signal.signal(signal.SIGINT, lambda *args: input_stream.stop())
+
     gevent.spawn(gevent_liveliness_watcher)
 
-    rules_sink.run()
+    try:
+        rules_sink.run()
+    finally:
+        # Flush whatever the output sinks still buffer, before the Kafka offsets of the actions are committed.
+        output_sink.stop()
+        if isinstance(input_stream, KafkaInputStream):
+            input_stream.close()
+
+
+def _run_kafka_rules_sink_process(pooled: bool) -> None:
+    """
+    Internal helper to run one of the processes of `_run_kafka_rules_sink_processes`
+    """
+    config = CONFIG.instance()
+    try:
+        config.configure_from_env()  # needed when start_method for multiprocessing is spawn
+    except RuntimeError:
+        LOGGER.debug(
+            f'{os.getpid()}: Config has already been bound to an underlying config dict. Proceeding without re-configuring.'
+        )
+
+    LOGGER.info(f'{os.getpid()}: Kafka rules sink process spawned')
+    _run_rules_sink_process(config, InputStreamSource.KAFKA, pooled)
+
+
+def _run_kafka_rules_sink_processes(num_processes: int, pooled: bool) -> None:
+    """Runs a rules sink with its own Kafka consumer in each of `num_processes` processes.
+
+    The consumers are in the same group, so the topic's partitions are spread over the processes, and the sink scales
+    with the number of partitions. Stopping the processes makes each one drain and commit its partitions before it
+    leaves the group. If a process exits, the others are stopped too, so that the worker is restarted as a whole. If
+    any of them failed, so does the worker.
+    """
+    LOGGER.info(f'OSPREY_RULES_SINK_PROCESS_COUNT was set to {num_processes}, running multi-process Kafka rules sink')
+
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=_run_kafka_rules_sink_process, args=(pooled,), name=f'rules-sink-{i}')
+        for i in range(num_processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop_processes(*args: object) -> None:
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop_processes)
+    signal.signal(signal.SIGINT, stop_processes)
+
+    multiprocessing.connection.wait([process.sentinel for process in processes])
+    stop_processes()
+    failed_exit_codes = []
+    for process in processes:
+        process.join()
+        LOGGER.info(f'Kafka rules sink process {process.name} exited with {process.exitcode}')
+        if process.exitcode != 0:
+            failed_exit_codes.append(process.exitcode)
+
+    if failed_exit_codes:
+        # A process killed by a signal has a negative exit code.
+        sys.exit(failed_exit_codes[0] if failed_exit_codes[0] > 0 else 1)
+
+
+def _get_rules_sink_pipeline_kwargs(config: Config) -> Dict[str, int]:
+    """Reads the `RulesSink` pipeline settings, which default to a non-pipelined sink."""
+    return {
+        'prefetch_size': config.get_int('OSPREY_RULES_SINK_PREFETCH_SIZE', 0),
+        'execute_concurrency': config.get_int('OSPREY_RULES_SINK_EXECUTE_CONCURRENCY', 1),
+        'output_concurrency': config.get_int('OSPREY_RULES_SINK_OUTPUT_CONCURRENCY', 1),
+        'execute_window': config.get_int('OSPREY_RULES_SINK_EXECUTE_WINDOW', 1),
+    }
 
 
 def _run_rules_worker_process() -> None:
@@ -187,6 +277,7 @@ def _run_rules_worker_process() -> None:
         client_id=f'{uuid1()}',
         input_stream_ready_signaler=input_stream_ready_signaler,
         coordinator_service_name=coordinator_service_name,
+        num_streams=config.get_int('OSPREY_COORDINATOR_NUM_STREAMS', 1),
     )
     signal.signal(signal.SIGTERM, lambda *args: input_stream.stop())
     signal.signal(signal.SIGINT, lambda *args: input_stream.stop())
@@ -205,6 +296,7 @@ def _run_rules_worker_process() -> None:
         input_stream=input_stream,
         output_sink=output_sink,
         udf_helpers=udf_helpers,
+        **_get_rules_sink_pipeline_kwargs(config),
     )
     try:
         LOGGER.info(f'{pid}: Rules worker spawned')
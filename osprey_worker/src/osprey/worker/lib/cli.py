@@ -5,12 +5,13 @@ from pathlib import Path  # noqa: E402
 from osprey.engine.language_types.entities import EntityT
 from osprey.worker.lib.osprey_shared.labels import EntityLabelMutation, LabelStatus
 from osprey.worker.lib.patcher import patch_all
-from osprey.worker.lib.singletons import LABELS_PROVIDER  # noqa: E402
+from osprey.worker.lib.singletons import CONFIG, LABELS_PROVIDER  # noqa: E402
 
 patch_all()  # please ensure this occurs before *any* other imports !
 
 
 import datetime  # noqa: E402
+import json  # noqa: E402
 import os  # noqa: E402
 from typing import Any, Optional, Set  # noqa: E402
 
@@ -21,6 +22,10 @@ configure_logging()
 
 # Import safety record and common protos
 from osprey.engine.ast.sources import Sources  # noqa: E402
+from osprey.engine.executor.execution_context import Action  # noqa: E402
+from osprey.engine.executor.node_profiler import NodeProfileAggregates  # noqa: E402
+from osprey.worker.lib.osprey_engine import bootstrap_engine_with_helpers  # noqa: E402
+from osprey.worker.lib.sources_provider import StaticSourcesProvider  # noqa: E402
 from osprey.worker.lib.sources_publisher import (  # noqa: E402
     upload_dependencies_mapping,
     validate_and_push,
@@ -31,6 +36,7 @@ from osprey.worker.lib.storage import (  # noqa: E402
     stored_execution_result,
 )
 from osprey.worker.lib.utils.click_utils import EnumChoice  # noqa: E402
+from osprey.worker.sinks.utils.action_decoding import decode_kafka_action  # noqa: E402
 
 
 @click.group()
@@ -335,3 +341,63 @@ def bulk_apply_label(
         progress_tracker.increment()
 
     print(f'Bulk labelling complete! Total labels applied: {progress_tracker.total_actions}')
+
+
+def _parse_replayed_action(line: str) -> Action:
+    """Parses an action from a line of a JSONL file, either in the format of the Kafka input stream (with `send_time`
+    and the action under `data`), or as a bare action."""
+    data = json.loads(line)
+    if 'send_time' in data:
+        return decode_kafka_action(line.encode())
+    return Action(
+        action_id=int(data['action_id']),
+        action_name=data['action_name'],
+        data=data['data'],
+        timestamp=datetime.datetime.now(datetime.timezone.utc),
+    )
+
+
+@cli.command()
+@click.argument('rules_path', type=click.Path(dir_okay=True, file_okay=False, exists=True))
+@click.argument('actions_path', type=click.Path(dir_okay=False, file_okay=True, exists=True))
+@click.option('--top', default=20, help='How many of the most expensive entries to print.')
+@click.option(
+    '--group-by',
+    type=click.Choice(['node', 'statement', 'udf', 'source']),
+    default='node',
+    help='Whether to aggregate the timings by node, statement (rule or feature), UDF class, or source file.',
+)
+def profile_rules(rules_path: str, actions_path: str, top: int, group_by: str) -> None:
+    """Replays the actions in a JSONL file against the rules, profiling every execution, and prints the hottest nodes.
+
+    Note that UDFs which call external services (e.g. labels) will do so, as they would when executing in a worker.
+    """
+    CONFIG.instance().configure_from_env()
+    engine, udf_helpers = bootstrap_engine_with_helpers(
+        StaticSourcesProvider(Sources.from_path(Path(rules_path))), profile_sample_rate=1.0
+    )
+    # A single window, long enough to span the whole replay.
+    aggregates = NodeProfileAggregates(window_seconds=float('inf'))
+    total_wall_seconds = 0.0
+    with open(actions_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = engine.execute(udf_helpers, _parse_replayed_action(line))
+            assert result.profile is not None
+            aggregates.add(result.profile)
+            total_wall_seconds += result.profile.wall_seconds
+
+    if not aggregates.profile_count:
+        print('No actions to replay.')
+        return
+
+    print(
+        f'Replayed {aggregates.profile_count} action(s) in {total_wall_seconds:.3f}s '
+        f'({total_wall_seconds / aggregates.profile_count * 1e6:.1f}us per action)'
+    )
+    print(f'{"wall ms":>10} {"cpu ms":>10} {"calls":>8}  {group_by}')
+    for key, timing in aggregates.top(top, group_by):
+        print(
+            f'{timing.wall_seconds * 1e3:>10.3f} {timing.cpu_seconds * 1e3:>10.3f} {timing.count:>8}  {" / ".join(key)}'
+        )
@@ -0,0 +1,61 @@
+import atexit
+from typing import Dict, Optional, Tuple
+
+import gevent
+from datadog.dogstatsd.base import DogStatsd
+from osprey.worker.lib.osprey_shared.logging import get_logger
+
+logger = get_logger(__name__)
+
+TagsType = Tuple[str, ...]
+"""Tags of an aggregated counter. These are tuples, so that callers can intern them and reuse them as keys."""
+
+DEFAULT_FLUSH_INTERVAL_SECONDS = 10.0
+
+
+class AggregatingCounters:
+    """Counters that are aggregated in-process, and flushed to DogStatsd in bulk every `flush_interval_seconds`.
+
+    This is meant for very high volume counters, eg ones that are incremented for every node of every execution, where
+    formatting and sending a statsd packet per increment would be a noticeable part of the cost of the work itself.
+    Incrementing a counter is a single dict update, and the flushing greenlet is started on the first increment."""
+
+    __slots__ = ('_statsd', '_flush_interval_seconds', '_counts', '_flusher')
+
+    def __init__(self, statsd: DogStatsd, flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS) -> None:
+        self._statsd = statsd
+        self._flush_interval_seconds = flush_interval_seconds
+        self._counts: Dict[Tuple[str, TagsType], float] = {}
+        self._flusher: Optional['gevent.Greenlet[None]'] = None
+
+    def increment(self, metric: str, tags: TagsType, value: float = 1) -> None:
+        key = (metric, tags)
+        counts = self._counts
+        counts[key] = counts.get(key, 0) + value
+        if self._flusher is None:
+            self._start()
+
+    def flush(self) -> None:
+        """Sends all the counts aggregated since the last flush."""
+        counts, self._counts = self._counts, {}
+        for (metric, tags), value in counts.items():
+            self._statsd.increment(metric, value, tags=list(tags))
+
+    def stop(self) -> None:
+        """Stops the periodic flushing, and flushes whatever is left."""
+        if self._flusher is not None:
+            self._flusher.kill()
+            self._flusher = None
+        self.flush()
+
+    def _start(self) -> None:
+        self._flusher = gevent.spawn(self._flush_periodically)
+        atexit.register(self.flush)
+
+    def _flush_periodically(self) -> None:
+        while True:
+            gevent.sleep(self._flush_interval_seconds)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush aggregated counters')
@@ -0,0 +1,41 @@
+from typing import Any, List, Tuple
+
+import gevent
+from osprey.worker.lib.instruments.aggregating_counters import AggregatingCounters
+
+
+class RecordingStatsd:
+    def __init__(self) -> None:
+        self.increments: List[Tuple[str, float, List[str]]] = []
+
+    def increment(self, metric: str, value: float = 1, tags: Any = None) -> None:
+        self.increments.append((metric, value, tags))
+
+
+def test_aggregates_until_flushed() -> None:
+    statsd = RecordingStatsd()
+    counters = AggregatingCounters(statsd, flush_interval_seconds=3600)  # type: ignore[arg-type]
+
+    counters.increment('foo', ('a:1',))
+    counters.increment('foo', ('a:1',), value=2)
+    counters.increment('foo', ('a:2',))
+    counters.increment('bar', ('a:1',))
+    assert statsd.increments == []
+
+    counters.stop()
+    assert sorted(statsd.increments) == [('bar', 1, ['a:1']), ('foo', 1, ['a:2']), ('foo', 3, ['a:1'])]
+
+    counters.flush()
+    assert len(statsd.increments) == 3
+
+
+def test_flushes_periodically() -> None:
+    statsd = RecordingStatsd()
+    counters = AggregatingCounters(statsd, flush_interval_seconds=0.01)  # type: ignore[arg-type]
+
+    counters.increment('foo', ())
+    gevent.sleep(0.05)
+    assert statsd.increments == [('foo', 1, [])]
+
+    counters.stop()
+    assert statsd.increments == [('foo', 1, [])]
@@ -2,7 +2,7 @@ import logging
 from dataclasses import dataclass
 from pathlib import Path
 from time import time
-from typing import Callable, Dict, Generic, List, Optional, Set, Tuple, Type, TypeVar
+from typing import Callable, Dict, Generic, List, Optional, Sequence, Set, Tuple, Type, TypeVar
 
 import gevent
 import gevent.pool
@@ -28,7 +28,7 @@ from osprey.engine.ast_validator.validators.validate_static_types import (
 from osprey.engine.config.config_subkey_handler import ConfigSubkeyHandler, ModelT
 from osprey.engine.executor.execution_context import Action, ExecutionResult
 from osprey.engine.executor.execution_graph import ExecutionGraph, compile_execution_graph
-from osprey.engine.executor.executor import execute
+from osprey.engine.executor.executor import execute, execute_many
 from osprey.engine.executor.udf_execution_helpers import UDFHelpers
 from osprey.engine.udf.registry import UDFRegistry
 from osprey.engine.utils.periodic_execution_yielder import periodic_execution_yield
@@ -78,9 +78,15 @@ class OspreyEngine:
         udf_registry: UDFRegistry,
         should_yield_during_compilation: bool = False,
         validation_exporter: BaseValidationResultExporter = NullValidationResultExporter(),
+        short_circuit_execution: bool = False,
+        profile_sample_rate: float = 0.0,
+        incremental_compilation: bool = True,
     ):
         self._sources_provider = sources_provider
         self._should_yield_during_compilation = should_yield_during_compilation
+        self._short_circuit_execution = short_circuit_execution
+        self._profile_sample_rate = profile_sample_rate
+        self._incremental_compilation = incremental_compilation
         self._udf_registry = udf_registry
         config_registry = get_config_registry()
         # Note: _validator_registry must be set before calling _compile_execution_graph
@@ -93,7 +99,12 @@ class OspreyEngine:
         self._config_subkey_handler = ConfigSubkeyHandler(config_registry, self._execution_graph.validated_sources)
         self._validation_result_exporter = validation_exporter
 
-    def _compile_execution_graph(self, disable_periodic_yield: bool = False) -> ExecutionGraph:
+    def _compile_execution_graph(
+        self, disable_periodic_yield: bool = False, previous: Optional[ExecutionGraph] = None
+    ) -> ExecutionGraph:
+        """Validates and compiles the current sources. If `previous` is given, only the sources that changed since it
+        was compiled (and the sources that import them) are validated and compiled again."""
+
         def _do_compile_execution_graph() -> ExecutionGraph:
             with periodic_execution_yield(
                 on=self._should_yield_during_compilation and not disable_periodic_yield,
@@ -104,20 +115,25 @@ class OspreyEngine:
 
                 start_time = time()
                 validated_sources = validate_sources(
-                    sources, udf_registry=self._udf_registry, validator_registry=self._validator_registry
+                    sources,
+                    udf_registry=self._udf_registry,
+                    validator_registry=self._validator_registry,
+                    previous=previous.validated_sources if previous is not None else None,
                 )
                 validation_time = time() - start_time
 
                 start_time = time()
-                execution_graph = compile_execution_graph(validated_sources)
+                execution_graph = compile_execution_graph(validated_sources, previous=previous)
                 compile_time = time() - start_time
 
             log.debug(
                 'execution graph has been re-compiled: validation took %.2f sec, '
-                'compilation took %.2f sec, total: %.2f',
+                'compilation took %.2f sec, total: %.2f, %d/%d sources unchanged',
                 validation_time,
                 compile_time,
                 validation_time + compile_time,
+                len(validated_sources.unchanged_sources),
+                len(sources),
             )
 
             return execution_graph
@@ -127,7 +143,9 @@ class OspreyEngine:
     def _handle_updated_sources(self) -> None:
         # noinspection PyBroadException
         try:
-            self._execution_graph = self._compile_execution_graph()
+            self._execution_graph = self._compile_execution_graph(
+                previous=self._execution_graph if self._incremental_compilation else None
+            )
             log.info(f'Compiled new execution graph for sources={self._sources_provider.get_current_sources().hash()}')
         except Exception:
             log.exception(
@@ -214,6 +232,30 @@ class OspreyEngine:
             gevent.pool.Pool(_DEFAULT_MAX_ASYNC_PER_EXECUTION),
             sample_rate,
             parent_tracer_span,
+            short_circuit=self._short_circuit_execution,
+            profile_sample_rate=self._profile_sample_rate,
+        )
+
+    def execute_many(
+        self,
+        udf_helpers: UDFHelpers,
+        actions: Sequence[Action],
+        sample_rates: Optional[Sequence[int]] = None,
+        parent_tracer_span: Optional[TracerSpan] = None,
+    ) -> List[ExecutionResult]:
+        """Given a window of input actions, execute them together against the execution engine, and return their
+        results in order. See `osprey.engine.executor.executor.execute_many` for details."""
+        if not actions:
+            return []
+        return execute_many(
+            self._execution_graph,
+            udf_helpers,
+            actions,
+            gevent.pool.Pool(_DEFAULT_MAX_ASYNC_PER_EXECUTION * len(actions)),
+            sample_rates,
+            parent_tracer_span,
+            short_circuit=self._short_circuit_execution,
+            profile_sample_rate=self._profile_sample_rate,
         )
 
     def watch_config_subkey(self, model_class: Type[ModelT], update_callback: Callable[[ModelT], None]) -> None:
@@ -271,6 +313,24 @@ def should_yield_during_compilation() -> bool:
     return config.get_bool('OSPREY_PERIODIC_YIELD_DURING_COMPILATION', False)
 
 
+def should_short_circuit_execution() -> bool:
+    """Skip the nodes whose values can no longer affect the result of an execution, see `executor.execute`"""
+    config = CONFIG.instance()
+    return config.get_bool('OSPREY_SHORT_CIRCUIT_EXECUTION', False)
+
+
+def should_compile_incrementally() -> bool:
+    """Only validate and compile the sources that changed when the sources are updated"""
+    config = CONFIG.instance()
+    return config.get_bool('OSPREY_INCREMENTAL_RULES_COMPILATION', True)
+
+
+def get_execution_profile_sample_rate() -> float:
+    """The probability that an execution is profiled, see `executor.execute`"""
+    config = CONFIG.instance()
+    return config.get_float('OSPREY_EXECUTION_PROFILE_SAMPLE_RATE', 0.0)
+
+
 def extract_source_snippet(span: Span) -> str:
     """Extracts a snippet, handling multi-line statements with parentheses."""
     lines = span.source.contents.splitlines()
@@ -303,6 +363,7 @@ def extract_source_snippet(span: Span) -> str:
 
 def bootstrap_engine_with_helpers(
     sources_provider: Optional[BaseSourcesProvider] = None,
+    profile_sample_rate: Optional[float] = None,
 ) -> Tuple[OspreyEngine, UDFHelpers]:
     # Avoid circular imports
     from osprey.worker.adaptor.plugin_manager import bootstrap_ast_validators, bootstrap_udfs
@@ -322,6 +383,11 @@ def bootstrap_engine_with_helpers(
             sources_provider=sources_provider,
             udf_registry=udf_registry,
             should_yield_during_compilation=should_yield_during_compilation(),
+            short_circuit_execution=should_short_circuit_execution(),
+            incremental_compilation=should_compile_incrementally(),
+            profile_sample_rate=(
+                get_execution_profile_sample_rate() if profile_sample_rate is None else profile_sample_rate
+            ),
         ),
         udf_helpers,
     )
@@ -6,6 +6,7 @@ from osprey.worker.lib.config import Config
 from osprey.worker.lib.singleton import Singleton
 
 if TYPE_CHECKING:
+    from osprey.engine.executor.external_service_utils import SharedExternalServiceCache
     from osprey.worker.lib.osprey_engine import OspreyEngine
     from osprey.worker.lib.storage.labels import LabelsProvider
 
@@ -59,3 +60,27 @@ if labels_provider:
 Because this is a Singleton, implementers of `LabelsServiceBase` / `LabelsProvider` can implement statefulness
 and expect that the statefulness will be present across all references within a given Osprey worker.
 """
+
+
+def _init_shared_external_service_cache() -> 'SharedExternalServiceCache | None':
+    """
+    a helper method to initialize the SHARED_EXTERNAL_SERVICE_CACHE singleton from the config
+    """
+    from osprey.engine.executor.external_service_utils import SharedExternalServiceCache
+
+    max_size = CONFIG.instance().get_int('OSPREY_SHARED_EXTERNAL_SERVICE_CACHE_SIZE', 0)
+    if max_size <= 0:
+        return None
+    return SharedExternalServiceCache(max_size=max_size)
+
+
+SHARED_EXTERNAL_SERVICE_CACHE: Singleton['SharedExternalServiceCache | None'] = Singleton(
+    _init_shared_external_service_cache
+)
+"""
+A Singleton that holds the process-wide `SharedExternalServiceCache`, if `OSPREY_SHARED_EXTERNAL_SERVICE_CACHE_SIZE` is
+set to a positive number of entries. Otherwise, this Singleton will hold `None`, and external service lookups are only
+cached within a single execution.
+
+The label output sink invalidates the entries of the entities that it writes labels for.
+"""
@@ -0,0 +1,230 @@
+"""Batched writes of execution results to object stores and BigTable.
+
+Object stores pack many execution results into a single segment object rather than writing an object per action. A
+segment is a sequence of independently gzipped records followed by a gzipped JSON index of each record's byte range, so
+a single record can be fetched with two ranged reads. Everything needed to find a record is in the segment's name:
+
+    segments/<key prefix>/<partition>/<min action id>-<max action id>-<token>-<index offset>.segment
+
+Segments are partitioned by the minute of their actions' snowflake timestamps, so a lookup only has to list one
+partition and read the index of the segments whose action id range covers the action. Results that are close in time,
+like a page of scan results, mostly share segments, so they are fetched with a few reads.
+"""
+
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generic, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+import gevent
+import gevent.event
+from osprey.engine.utils.types import add_slots
+from osprey.worker.lib.instruments import metrics
+from osprey.worker.lib.osprey_shared.logging import get_logger
+from osprey.worker.lib.snowflake import Snowflake
+
+logger = get_logger()
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL_SECONDS = 5.0
+DEFAULT_READ_CACHE_BYTES = 64 * 1024 * 1024
+
+PARTITION_MILLISECONDS = 60_000
+SEGMENT_SUFFIX = '.segment'
+
+DEFAULT_MAX_WRITE_ATTEMPTS = 5
+
+# zlib's default level, a balance of speed and ratio. Records are compressed when a batch is written, by the writer's
+# greenlet, which still shares the CPU with the sink.
+_COMPRESS_LEVEL = 6
+
+_RETRY_BACKOFF_MIN_SECONDS = 0.5
+_RETRY_BACKOFF_MAX_SECONDS = 10.0
+
+_T = TypeVar('_T')
+
+
+@add_slots
+@dataclass(frozen=True)
+class SegmentName:
+    """The parsed name of a segment object."""
+
+    name: str
+    min_action_id: int
+    max_action_id: int
+    index_offset: int
+    """The byte offset of the index, which runs to the end of the segment."""
+
+    def may_contain(self, action_id: int) -> bool:
+        return self.min_action_id <= action_id <= self.max_action_id
+
+    @classmethod
+    def parse(cls, name: str) -> Optional['SegmentName']:
+        if not name.endswith(SEGMENT_SUFFIX):
+            return None
+        _, _, base_name = name[: -len(SEGMENT_SUFFIX)].rpartition('/')
+        try:
+            min_action_id, max_action_id, _token, index_offset = base_name.split('-')
+            return cls(
+                name=name,
+                min_action_id=int(min_action_id),
+                max_action_id=int(max_action_id),
+                index_offset=int(index_offset),
+            )
+        except ValueError:
+            return None
+
+
+@add_slots
+@dataclass(frozen=True)
+class EncodedSegment:
+    name: str
+    data: bytes
+
+
+def partition_of(action_id: int) -> int:
+    return (action_id >> 22) // PARTITION_MILLISECONDS
+
+
+def partition_prefix(partition: int) -> str:
+    """The object name prefix of all segments in a partition. The partition number is put through
+    `Snowflake.to_key_prefix` so that consecutive partitions are spread over the key space."""
+    key_prefix = Snowflake(partition << 22).to_key_prefix()
+    return f'segments/{key_prefix}/{partition}/'
+
+
+def encode_segments(records: Sequence[Dict[str, Any]]) -> List[EncodedSegment]:
+    """Packs execution result records (as dicts with at least an `id`) into one segment per partition."""
+    records_by_partition: Dict[int, List[Dict[str, Any]]] = {}
+    for record in records:
+        records_by_partition.setdefault(partition_of(record['id']), []).append(record)
+
+    segments = []
+    for partition, partition_records in records_by_partition.items():
+        chunks = []
+        index: Dict[str, Tuple[int, int]] = {}
+        offset = 0
+        for record in partition_records:
+            chunk = gzip.compress(json.dumps(record).encode('utf-8'), compresslevel=_COMPRESS_LEVEL)
+            index[str(record['id'])] = (offset, len(chunk))
+            chunks.append(chunk)
+            offset += len(chunk)
+        chunks.append(gzip.compress(json.dumps(index).encode('utf-8'), compresslevel=_COMPRESS_LEVEL))
+
+        action_ids = [record['id'] for record in partition_records]
+        # Derived from the records rather than random, so that writing a batch again, eg when retrying it, overwrites
+        # its segments rather than adding copies of them.
+        token = hashlib.blake2b(','.join(map(str, action_ids)).encode('utf-8'), digest_size=4).hexdigest()
+        base_name = f'{min(action_ids)}-{max(action_ids)}-{token}-{offset}'
+        segments.append(
+            EncodedSegment(name=f'{partition_prefix(partition)}{base_name}{SEGMENT_SUFFIX}', data=b''.join(chunks))
+        )
+
+    return segments
+
+
+def decode_index(data: bytes) -> Dict[int, Tuple[int, int]]:
+    """Decodes a segment's index into a mapping of action id to the `(offset, length)` of its record."""
+    return {
+        int(action_id): (offset, length) for action_id, (offset, length) in json.loads(gzip.decompress(data)).items()
+    }
+
+
+def decompress_record(data: bytes) -> bytes:
+    """Decompresses a record read from a segment into its JSON."""
+    return gzip.decompress(data)
+
+
+def coalesce_ranges(ranges: Iterable[Tuple[int, int]], max_gap: int) -> List[Tuple[int, int]]:
+    """Merges `(offset, length)` byte ranges that are at most `max_gap` bytes apart, so that nearby records of a
+    segment can be fetched with a single ranged read."""
+    coalesced: List[Tuple[int, int]] = []
+    for offset, length in sorted(ranges):
+        if coalesced:
+            last_offset, last_length = coalesced[-1]
+            if offset - (last_offset + last_length) <= max_gap:
+                coalesced[-1] = (last_offset, max(last_length, offset + length - last_offset))
+                continue
+        coalesced.append((offset, length))
+    return coalesced
+
+
+class BatchingWriter(Generic[_T]):
+    """Accumulates items and writes them in batches from a background greenlet, once `batch_size` items are buffered
+    or every `flush_interval_seconds`.
+
+    Writes that fail are retried with exponential backoff, so `write_batch` must be safe to call again with the same
+    batch. A batch that still fails after `max_attempts` is logged and dropped. If the buffer grows past
+    `max_buffered`, because writes can't keep up, `add` writes a batch itself, which applies backpressure to the
+    caller."""
+
+    def __init__(
+        self,
+        name: str,
+        write_batch: Callable[[List[_T]], None],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+        max_buffered: Optional[int] = None,
+        max_attempts: int = DEFAULT_MAX_WRITE_ATTEMPTS,
+    ) -> None:
+        self._name = name
+        self._write_batch = write_batch
+        self._batch_size = batch_size
+        self._flush_interval_seconds = flush_interval_seconds
+        self._max_buffered = max_buffered if max_buffered is not None else 4 * batch_size
+        self._max_attempts = max_attempts
+        self._buffer: List[_T] = []
+        self._flush_requested = gevent.event.Event()
+        self._flusher: Optional[gevent.Greenlet] = None
+        self._closing = False
+
+    def add(self, item: _T) -> None:
+        if self._flusher is None:
+            self._flusher = gevent.spawn(self._flush_periodically)
+        self._buffer.append(item)
+        if len(self._buffer) >= self._max_buffered:
+            metrics.increment('batching_writer.backpressure', tags=[f'writer:{self._name}'])
+            self.flush()
+        elif len(self._buffer) >= self._batch_size:
+            self._flush_requested.set()
+
+    def flush(self) -> None:
+        """Writes everything buffered so far."""
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+
+        tags = [f'writer:{self._name}']
+        metrics.histogram('batching_writer.batch_size', len(batch), tags=tags)
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                with metrics.timed('batching_writer.write_batch', tags=tags):
+                    self._write_batch(batch)
+                return
+            except Exception:
+                if attempt >= self._max_attempts:
+                    logger.exception(
+                        f'Failed to write a batch of {len(batch)} items to {self._name} after {attempt} attempts'
+                    )
+                    metrics.increment('batching_writer.dropped', value=len(batch), tags=tags)
+                    return
+                metrics.increment('batching_writer.retry', tags=[*tags, f'attempt:{attempt}'])
+                gevent.sleep(min(_RETRY_BACKOFF_MIN_SECONDS * 2 ** (attempt - 1), _RETRY_BACKOFF_MAX_SECONDS))
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stops the background greenlet, letting it finish its current write, and writes everything that's left."""
+        if self._flusher is not None:
+            self._closing = True
+            self._flush_requested.set()
+            self._flusher.join(timeout=timeout)
+            self._flusher.kill()
+            self._flusher = None
+            self._closing = False
+        self.flush()
+
+    def _flush_periodically(self) -> None:
+        while not self._closing:
+            self._flush_requested.wait(timeout=self._flush_interval_seconds)
+            self._flush_requested.clear()
+            self.flush()
@@ -225,43 +225,35 @@ class LabelsProvider(ExternalService[EntityT[Any], EntityLabels]):
             dropped_mutations=dropped_mutations,
         )
 
+    def _drop_mutations_for_invalid_entity(
+        self, mutations: Sequence[EntityLabelMutation]
+    ) -> EntityLabelMutationsResult:
+        labels = EntityLabels()
+        dropped_mutations = [
+            DroppedEntityLabelMutation(mutation=mut, reason=MutationDropReason.INVALID_ENTITY_ID) for mut in mutations
+        ]
+        return EntityLabelMutationsResult(
+            old_entity_labels=labels,
+            new_entity_labels=labels,
+            labels_added=[],
+            labels_updated=[],
+            labels_removed=[],
+            dropped_mutations=dropped_mutations,
+        )
+
     @retry(wait=wait_exponential(min=0.5, max=5), stop=stop_after_attempt(3))
     def apply_entity_label_mutations_with_retry(
         self, entity: EntityT[Any], mutations: Sequence[EntityLabelMutation]
     ) -> EntityLabelMutationsResult:
         if str(entity.id) == '':
-            labels = EntityLabels()
-            dropped_mutations = [
-                DroppedEntityLabelMutation(mutation=mut, reason=MutationDropReason.INVALID_ENTITY_ID)
-                for mut in mutations
-            ]
-            return EntityLabelMutationsResult(
-                old_entity_labels=labels,
-                new_entity_labels=labels,
-                labels_added=[],
-                labels_updated=[],
-                labels_removed=[],
-                dropped_mutations=dropped_mutations,
-            )
+            return self._drop_mutations_for_invalid_entity(mutations)
         return self.apply_entity_label_mutations(entity=entity, mutations=mutations)
 
     def apply_entity_label_mutations(
         self, entity: EntityT[Any], mutations: Sequence[EntityLabelMutation]
     ) -> EntityLabelMutationsResult:
         if str(entity.id) == '':
-            labels = EntityLabels()
-            dropped_mutations = [
-                DroppedEntityLabelMutation(mutation=mut, reason=MutationDropReason.INVALID_ENTITY_ID)
-                for mut in mutations
-            ]
-            return EntityLabelMutationsResult(
-                old_entity_labels=labels,
-                new_entity_labels=labels,
-                labels_added=[],
-                labels_updated=[],
-                labels_removed=[],
-                dropped_mutations=dropped_mutations,
-            )
+            return self._drop_mutations_for_invalid_entity(mutations)
         try:
             with self._labels_service.read_modify_write_labels_atomically(entity) as entity_labels:
                 result = self._compute_new_labels_from_mutations(entity_labels, mutations)
@@ -270,6 +262,37 @@ class LabelsProvider(ExternalService[EntityT[Any], EntityLabels]):
             logger.error(f'Could not read-modify-write labels for entity {entity.__repr__()}:', e)
             raise e
 
+    def apply_entity_label_mutations_in_order(
+        self, entity: EntityT[Any], mutation_groups: Sequence[Sequence[EntityLabelMutation]]
+    ) -> list[EntityLabelMutationsResult]:
+        """
+        applies several groups of mutations (eg, those of several actions) to an entity with a single read-modify-write,
+        with the same outcome as calling apply_entity_label_mutations with each group in turn. conflicts are only
+        resolved within a group, so a later group still overrides an earlier one.
+
+        returns a result per group, as apply_entity_label_mutations would have.
+        """
+        if type(self).apply_entity_label_mutations is not LabelsProvider.apply_entity_label_mutations:
+            # providers that write labels their own way keep doing so, one group at a time
+            return [
+                self.apply_entity_label_mutations(entity=entity, mutations=mutations) for mutations in mutation_groups
+            ]
+        if str(entity.id) == '':
+            return [self._drop_mutations_for_invalid_entity(mutations) for mutations in mutation_groups]
+        try:
+            with self._labels_service.read_modify_write_labels_atomically(entity) as entity_labels:
+                results = [
+                    self._compute_new_labels_from_mutations(entity_labels, mutations) for mutations in mutation_groups
+                ]
+        except Exception as e:
+            logger.error(f'Could not read-modify-write labels for entity {entity.__repr__()}:', e)
+            raise e
+
+        # every group modified the same labels object, so each result's new labels are the next one's old labels
+        for result, next_result in zip(results, results[1:]):
+            result.new_entity_labels = next_result.old_entity_labels
+        return results
+
     def cache_ttl(self) -> Optional[timedelta]:
         return timedelta(minutes=1)
 
@@ -1,18 +1,20 @@
 from __future__ import annotations
 
-import gzip
 import json
 from abc import ABC, abstractmethod
 from datetime import datetime
 from io import BytesIO
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Set, Tuple
 
 import gevent
+import gevent.pool
 import google.cloud.storage as storage
 import pytz
+from cachetools import LRUCache
 from google.api_core import retry
+from google.api_core.exceptions import NotFound
 from google.cloud.bigtable import row_filters, row_set
-from google.cloud.bigtable.row import Row
+from google.cloud.bigtable.row import DirectRow, Row
 from minio import Minio
 from minio.error import S3Error
 from osprey.engine.executor.execution_context import ExecutionResult
@@ -21,6 +23,20 @@ from osprey.worker.lib.osprey_shared.logging import get_logger
 from osprey.worker.lib.snowflake import Snowflake
 from osprey.worker.lib.storage import ExecutionResultStorageBackendType
 from osprey.worker.lib.storage.bigtable import osprey_bigtable
+from osprey.worker.lib.storage.execution_result_segments import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_FLUSH_INTERVAL_SECONDS,
+    DEFAULT_READ_CACHE_BYTES,
+    BatchingWriter,
+    EncodedSegment,
+    SegmentName,
+    coalesce_ranges,
+    decode_index,
+    decompress_record,
+    encode_segments,
+    partition_of,
+    partition_prefix,
+)
 from pydantic.main import BaseModel
 
 logger = get_logger()
@@ -33,6 +49,11 @@ BIGTABLE_CONCURRENCY_LIMIT = 100
 GCS_CONCURRENCY_LIMIT = 100
 MINIO_CONCURRENCY_LIMIT = 100
 
+# Segment indexes to keep in memory, each is ~40 bytes per execution result in the segment.
+_INDEX_CACHE_SIZE = 1024
+# Records of a segment that are at most this far apart are fetched with a single ranged read.
+_MAX_COALESCED_GAP_BYTES = 64 * 1024
+
 
 class ExecutionResultStore(ABC):
     """Abstract base class for execution result storage backends."""
@@ -59,6 +80,10 @@ class ExecutionResultStore(ABC):
         """Insert an execution result."""
         pass
 
+    def close(self) -> None:
+        """Write out any execution results that `insert` has buffered."""
+        pass
+
 
 class ErrorTrace(BaseModel):
     rules_source_location: str
@@ -178,10 +203,22 @@ class StoredExecutionResult(BaseModel):
         )
 
 
-# TODO: Add tests
 class StoredExecutionResultBigTable(ExecutionResultStore):
+    """Stores execution results as BigTable rows. Inserts are buffered and written with batched `mutate_rows`
+    calls."""
+
     retry_policy = retry.Retry(initial=1.0, maximum=2.0, multiplier=1.25, deadline=120.0)
 
+    def __init__(
+        self, batch_size: int = DEFAULT_BATCH_SIZE, flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS
+    ):
+        self._writer: BatchingWriter[DirectRow] = BatchingWriter(
+            'bigtable_stored_execution_result',
+            self._mutate_rows,
+            batch_size=batch_size,
+            flush_interval_seconds=flush_interval_seconds,
+        )
+
     def select_one(self, action_id: int) -> Optional[Dict[str, Any]]:
         row = osprey_bigtable.table('stored_execution_result').read_row(
             StoredExecutionResultBigTable._encode_action_id(action_id), row_filters.CellsColumnLimitFilter(1)
@@ -230,7 +267,18 @@ class StoredExecutionResultBigTable(ExecutionResultStore):
         row.set_cell('execution_result', b'error_traces', error_traces_json.encode(), timestamp=timestamp)
         row.set_cell('execution_result', b'timestamp', timestamp.isoformat().encode(), timestamp=timestamp)
         row.set_cell('execution_result', b'action_data', action_data_json.encode(), timestamp=timestamp)
-        osprey_bigtable.table('stored_execution_result').mutate_rows([row], retry=self.retry_policy)
+        self._writer.add(row)
+
+    def close(self) -> None:
+        self._writer.close()
+
+    def _mutate_rows(self, rows: List[DirectRow]) -> None:
+        statuses = osprey_bigtable.table('stored_execution_result').mutate_rows(rows, retry=self.retry_policy)
+        failed_rows = [row for row, status in zip(rows, statuses) if status.code != 0]
+        metrics.increment('bigtable_stored_execution_result.inserted', value=len(rows) - len(failed_rows))
+        if failed_rows:
+            metrics.increment('bigtable_stored_execution_result.insert_failed', value=len(failed_rows))
+            logger.error(f'Failed to insert {len(failed_rows)} of {len(rows)} execution results into BigTable')
 
     @staticmethod
     def _encode_action_id(action_id_snowflake: int) -> bytes:
@@ -267,57 +315,93 @@ class StoredExecutionResultBigTable(ExecutionResultStore):
         return execution_result_dict
 
 
-class StoredExecutionResultGCS(ExecutionResultStore):
-    def __init__(self):
-        self._gcs_client: storage.Client | None = None
-        self._bucket_name: str | None = None
+class SegmentedExecutionResultStore(ExecutionResultStore):
+    """Base class of the object store backends. Inserts are buffered and packed into segment objects, see
+    `execution_result_segments`. Execution results stored as an object per action, before segments were introduced,
+    can still be read."""
 
-    def _get_gcs_client(self) -> storage.Client:
-        if self._gcs_client is None:
-            from osprey.worker.lib.singletons import CONFIG
+    store_name: str
+    """The name of the object store, for logs."""
+    metric_prefix: str
+    concurrency_limit: int
 
-            config = CONFIG.instance()
-            project_id = config.get_str('OSPREY_GCP_PROJECT_ID', 'osprey-dev')
-            self._gcs_client = storage.Client(project=project_id)
-        return self._gcs_client
+    def __init__(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+        read_cache_bytes: int = DEFAULT_READ_CACHE_BYTES,
+    ):
+        self._writer: BatchingWriter[Dict[str, Any]] = BatchingWriter(
+            self.metric_prefix,
+            self._write_segments,
+            batch_size=batch_size,
+            flush_interval_seconds=flush_interval_seconds,
+        )
+        # Stored execution results never change, so recently read ones (as JSON) and segment indexes can be cached
+        # without invalidation. Execution results that aren't found aren't cached, as they may not be written yet.
+        self._read_cache: LRUCache[int, bytes] = LRUCache(maxsize=read_cache_bytes, getsizeof=len)
+        self._index_cache: LRUCache[str, Dict[int, Tuple[int, int]]] = LRUCache(maxsize=_INDEX_CACHE_SIZE)
 
-    def _get_bucket_name(self) -> str:
-        if self._bucket_name is None:
-            from osprey.worker.lib.singletons import CONFIG
+    @abstractmethod
+    def _put_object(self, object_name: str, data: bytes) -> None:
+        pass
 
-            config = CONFIG.instance()
-            self._bucket_name = config.get_str('OSPREY_GCS_EXECUTION_RESULTS_BUCKET', 'osprey-execution-results-stg')
-        return self._bucket_name
+    @abstractmethod
+    def _get_object(self, object_name: str, offset: int = 0, length: Optional[int] = None) -> Optional[bytes]:
+        """Reads an object, or `length` bytes of it from `offset`. Returns None if the object doesn't exist."""
+        pass
+
+    @abstractmethod
+    def _list_objects(self, prefix: str) -> List[str]:
+        """Lists the names of the objects under `prefix`."""
+        pass
 
     def select_one(self, action_id: int) -> Optional[Dict[str, Any]]:
-        try:
-            with metrics.timed('gcs_stored_execution_result.get_one'):
-                object_name = StoredExecutionResultGCS._encode_action_id(action_id)
-                bucket = self._get_gcs_client().bucket(self._get_bucket_name())
-                blob = bucket.get_blob(object_name)
-                if not blob:
-                    metrics.increment(
-                        'gcs_stored_execution_result.select_one.not_found', tags=[f'action_id:{action_id}']
-                    )
-                    return None
-
-                raw_data = blob.download_as_bytes()
-                data = json.loads(raw_data.decode('utf-8'))
-
-                result = StoredExecutionResultGCS._execution_result_dict_from_gcs_data(data)
-                return result
-        except Exception as e:
-            logger.error(f'Failed to retrieve execution result from GCS for action_id {action_id}: {e}')
+        with metrics.timed(f'{self.metric_prefix}.get_one'):
+            results = self._select([action_id])
+        if not results:
+            metrics.increment(f'{self.metric_prefix}.select_one.not_found', tags=[f'action_id:{action_id}'])
             return None
+        return results[0]
 
     def select_many(self, action_ids: List[int]) -> List[Dict[str, Any]]:
-        results = [
-            result
-            for result in gevent.pool.Pool(GCS_CONCURRENCY_LIMIT).imap(self.select_one, action_ids)
-            if result is not None
-        ]
+        with metrics.timed(f'{self.metric_prefix}.get_many'):
+            return self._select(action_ids)
 
-        return results
+    def _select(self, action_ids: List[int]) -> List[Dict[str, Any]]:
+        """Reads execution results, in the order of `action_ids`, skipping those that can't be found.
+
+        Cached results are returned straight away. The rest are grouped by partition, so that each partition is only
+        listed once, and records that are close together in a segment are fetched with a single ranged read."""
+        found: Dict[int, bytes] = {}
+        missing: Set[int] = set()
+        for action_id in action_ids:
+            cached = self._read_cache.get(action_id)
+            if cached is not None:
+                found[action_id] = cached
+            else:
+                missing.add(action_id)
+        metrics.increment(f'{self.metric_prefix}.read_cache.hit', value=len(found))
+
+        if missing:
+            metrics.increment(f'{self.metric_prefix}.read_cache.miss', value=len(missing))
+            found.update(self._select_from_segments(missing))
+            not_in_segments = [action_id for action_id in missing if action_id not in found]
+            pool = gevent.pool.Pool(self.concurrency_limit)
+            for action_id, data in zip(not_in_segments, pool.imap(self._select_from_action_object, not_in_segments)):
+                if data is not None:
+                    found[action_id] = data
+            for action_id in missing:
+                data = found.get(action_id)
+                # The cache refuses values larger than itself.
+                if data is not None and len(data) <= self._read_cache.maxsize:
+                    self._read_cache[action_id] = data
+
+        return [
+            self._execution_result_dict_from_data(json.loads(found[action_id]))
+            for action_id in action_ids
+            if action_id in found
+        ]
 
     def insert(
         self,
@@ -327,38 +411,101 @@ class StoredExecutionResultGCS(ExecutionResultStore):
         timestamp: datetime,
         action_data_json: str,
     ) -> None:
-        try:
-            with metrics.timed('gcs_stored_execution_result.insert'):
-                object_name = StoredExecutionResultGCS._encode_action_id(action_id)
-                data = {
-                    'id': action_id,
-                    'extracted_features': extracted_features_json,
-                    'error_traces': error_traces_json,
-                    'timestamp': timestamp.isoformat(),
-                    'action_data': action_data_json,
-                }
+        self._writer.add(
+            {
+                'id': action_id,
+                'extracted_features': extracted_features_json,
+                'error_traces': error_traces_json,
+                'timestamp': timestamp.isoformat(),
+                'action_data': action_data_json,
+            }
+        )
 
-                json_data = json.dumps(data)
-                compressed_data = gzip.compress(json_data.encode('utf-8'))
+    def close(self) -> None:
+        self._writer.close()
 
-                bucket = self._get_gcs_client().bucket(self._get_bucket_name())
-                blob = bucket.blob(object_name)
+    def _write_segments(self, records: List[Dict[str, Any]]) -> None:
+        segments: List[EncodedSegment] = encode_segments(records)
+        for segment in segments:
+            self._put_object(segment.name, segment.data)
+        metrics.increment(f'{self.metric_prefix}.inserted', value=len(records))
+        metrics.increment(f'{self.metric_prefix}.segments_written', value=len(segments))
 
-                blob.content_encoding = 'gzip'
+    def _select_from_segments(self, action_ids: Set[int]) -> Dict[int, bytes]:
+        action_ids_by_partition: Dict[int, List[int]] = {}
+        for action_id in action_ids:
+            action_ids_by_partition.setdefault(partition_of(action_id), []).append(action_id)
+
+        pool = gevent.pool.Pool(self.concurrency_limit)
+        segments: List[SegmentName] = []
+        segments_action_ids: List[List[int]] = []
+        for partition_action_ids, object_names in zip(
+            action_ids_by_partition.values(),
+            pool.imap(self._list_partition, action_ids_by_partition.keys()),
+        ):
+            for object_name in object_names:
+                segment = SegmentName.parse(object_name)
+                if segment is None:
+                    continue
+                segment_action_ids = [action_id for action_id in partition_action_ids if segment.may_contain(action_id)]
+                if segment_action_ids:
+                    segments.append(segment)
+                    segments_action_ids.append(segment_action_ids)
+
+        found: Dict[int, bytes] = {}
+        for records in pool.imap(self._read_from_segment, segments, segments_action_ids):
+            found.update(records)
+        return found
+
+    def _list_partition(self, partition: int) -> List[str]:
+        try:
+            return self._list_objects(partition_prefix(partition))
+        except Exception as e:
+            logger.error(
+                f'Failed to list execution result segments in {self.store_name} for partition {partition}: {e}'
+            )
+            return []
 
-                blob.upload_from_string(compressed_data, content_type='application/json')
+    def _read_from_segment(self, segment: SegmentName, action_ids: List[int]) -> Dict[int, bytes]:
+        try:
+            index = self._index_cache.get(segment.name)
+            if index is None:
+                index_data = self._get_object(segment.name, offset=segment.index_offset)
+                if index_data is None:
+                    return {}
+                index = self._index_cache[segment.name] = decode_index(index_data)
+
+            record_ranges = {action_id: index[action_id] for action_id in action_ids if action_id in index}
+            found: Dict[int, bytes] = {}
+            for read_offset, read_length in coalesce_ranges(record_ranges.values(), _MAX_COALESCED_GAP_BYTES):
+                data = self._get_object(segment.name, offset=read_offset, length=read_length)
+                if data is None:
+                    break
+                for action_id, (offset, length) in record_ranges.items():
+                    if read_offset <= offset < read_offset + read_length:
+                        start = offset - read_offset
+                        found[action_id] = decompress_record(data[start : start + length])
+            return found
+        except Exception as e:
+            logger.error(f'Failed to read execution results from {self.store_name} segment {segment.name}: {e}')
+            return {}
 
+    def _select_from_action_object(self, action_id: int) -> Optional[bytes]:
+        try:
+            return self._get_object(self._encode_action_id(action_id))
         except Exception as e:
-            logger.error(f'Failed to insert execution result into GCS for action_id {action_id}: {e}')
+            logger.error(f'Failed to retrieve execution result from {self.store_name} for action_id {action_id}: {e}')
+            return None
 
     @staticmethod
     def _encode_action_id(action_id_snowflake: int) -> str:
-        """Constructs a GCS object key for a given snowflake using the same distribution logic as BigTable."""
+        """Constructs the key of the object that used to store a single execution result, using the same distribution
+        logic as BigTable."""
         key_prefix = Snowflake(action_id_snowflake).to_key_prefix()
         return f'{key_prefix}:{action_id_snowflake}.json'
 
     @staticmethod
-    def _execution_result_dict_from_gcs_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    def _execution_result_dict_from_data(data: Dict[str, Any]) -> Dict[str, Any]:
         execution_result_dict = {
             'id': data['id'],
             'extracted_features': data['extracted_features'],
@@ -374,101 +521,115 @@ class StoredExecutionResultGCS(ExecutionResultStore):
         return execution_result_dict
 
 
-class StoredExecutionResultMinIO(ExecutionResultStore):
-    def __init__(self, endpoint: str, access_key: str, secret_key: str, secure: bool, bucket_name: str):
-        self._minio_client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure)
-        self._bucket_name = bucket_name
+class StoredExecutionResultGCS(SegmentedExecutionResultStore):
+    store_name = 'GCS'
+    metric_prefix = 'gcs_stored_execution_result'
+    concurrency_limit = GCS_CONCURRENCY_LIMIT
 
-    def select_one(self, action_id: int) -> Optional[Dict[str, Any]]:
-        try:
-            with metrics.timed('minio_stored_execution_result.get_one'):
-                object_name = StoredExecutionResultMinIO._encode_action_id(action_id)
-
-                try:
-                    response = self._minio_client.get_object(self._bucket_name, object_name)
-                    raw_data = response.read()
-                    response.close()
-                    response.release_conn()
-
-                    data = json.loads(raw_data.decode('utf-8'))
-                    result = StoredExecutionResultMinIO._execution_result_dict_from_minio_data(data)
-                    return result
-
-                except S3Error as e:
-                    if e.code == 'NoSuchKey':
-                        metrics.increment(
-                            'minio_stored_execution_result.select_one.not_found', tags=[f'action_id:{action_id}']
-                        )
-                        return None
-                    raise
+    def __init__(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+        read_cache_bytes: int = DEFAULT_READ_CACHE_BYTES,
+    ):
+        super().__init__(
+            batch_size=batch_size, flush_interval_seconds=flush_interval_seconds, read_cache_bytes=read_cache_bytes
+        )
+        self._gcs_client: storage.Client | None = None
+        self._bucket_name: str | None = None
 
-        except Exception as e:
-            logger.error(f'Failed to retrieve execution result from MinIO for action_id {action_id}: {e}')
-            return None
+    def _get_gcs_client(self) -> storage.Client:
+        if self._gcs_client is None:
+            from osprey.worker.lib.singletons import CONFIG
 
-    def select_many(self, action_ids: List[int]) -> List[Dict[str, Any]]:
-        results = [
-            result
-            for result in gevent.pool.Pool(MINIO_CONCURRENCY_LIMIT).imap(self.select_one, action_ids)
-            if result is not None
-        ]
-        return results
+            config = CONFIG.instance()
+            project_id = config.get_str('OSPREY_GCP_PROJECT_ID', 'osprey-dev')
+            self._gcs_client = storage.Client(project=project_id)
+        return self._gcs_client
 
-    def insert(
-        self,
-        action_id: int,
-        extracted_features_json: str,
-        error_traces_json: str,
-        timestamp: datetime,
-        action_data_json: str,
-    ) -> None:
+    def _get_bucket_name(self) -> str:
+        if self._bucket_name is None:
+            from osprey.worker.lib.singletons import CONFIG
+
+            config = CONFIG.instance()
+            self._bucket_name = config.get_str('OSPREY_GCS_EXECUTION_RESULTS_BUCKET', 'osprey-execution-results-stg')
+        return self._bucket_name
+
+    def _put_object(self, object_name: str, data: bytes) -> None:
+        blob = self._get_gcs_client().bucket(self._get_bucket_name()).blob(object_name)
+        # Segments are made of separately compressed records, so they are stored as is rather than with a gzip
+        # content encoding, which would break ranged reads.
+        blob.upload_from_string(data, content_type='application/octet-stream')
+
+    def _get_object(self, object_name: str, offset: int = 0, length: Optional[int] = None) -> Optional[bytes]:
+        blob = self._get_gcs_client().bucket(self._get_bucket_name()).blob(object_name)
+        range_kwargs: Dict[str, Optional[int]] = {}
+        if offset or length is not None:
+            # The end of a GCS range is inclusive.
+            range_kwargs = {'start': offset, 'end': offset + length - 1 if length is not None else None}
         try:
-            with metrics.timed('minio_stored_execution_result.insert'):
-                object_name = StoredExecutionResultMinIO._encode_action_id(action_id)
-                data = {
-                    'id': action_id,
-                    'extracted_features': extracted_features_json,
-                    'error_traces': error_traces_json,
-                    'timestamp': timestamp.isoformat(),
-                    'action_data': action_data_json,
-                }
-
-                json_data = json.dumps(data)
-
-                data_stream = BytesIO(json_data.encode('utf-8'))
-
-                self._minio_client.put_object(
-                    self._bucket_name,
-                    object_name,
-                    data_stream,
-                    length=len(json_data.encode('utf-8')),
-                    content_type='application/json',
-                )
+            raw_data: bytes = blob.download_as_bytes(**range_kwargs)
+        except NotFound:
+            return None
+        return raw_data
 
-        except Exception as e:
-            logger.error(f'Failed to insert execution result into MinIO for action_id {action_id}: {e}')
+    def _list_objects(self, prefix: str) -> List[str]:
+        return [blob.name for blob in self._get_gcs_client().list_blobs(self._get_bucket_name(), prefix=prefix)]
 
-    @staticmethod
-    def _encode_action_id(action_id_snowflake: int) -> str:
-        """Constructs a MinIO object key for a given snowflake using the same distribution logic as BigTable."""
-        key_prefix = Snowflake(action_id_snowflake).to_key_prefix()
-        return f'{key_prefix}:{action_id_snowflake}.json'
 
-    @staticmethod
-    def _execution_result_dict_from_minio_data(data: Dict[str, Any]) -> Dict[str, Any]:
-        execution_result_dict = {
-            'id': data['id'],
-            'extracted_features': data['extracted_features'],
-            'error_traces': data['error_traces'],
-            'timestamp': datetime.fromisoformat(data['timestamp']),
-            'action_data': None,
-        }
+class StoredExecutionResultMinIO(SegmentedExecutionResultStore):
+    store_name = 'MinIO'
+    metric_prefix = 'minio_stored_execution_result'
+    concurrency_limit = MINIO_CONCURRENCY_LIMIT
 
-        action_data = data.get('action_data')
-        if action_data:
-            execution_result_dict['action_data'] = action_data
+    def __init__(
+        self,
+        endpoint: str,
+        access_key: str,
+        secret_key: str,
+        secure: bool,
+        bucket_name: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+        read_cache_bytes: int = DEFAULT_READ_CACHE_BYTES,
+    ):
+        super().__init__(
+            batch_size=batch_size, flush_interval_seconds=flush_interval_seconds, read_cache_bytes=read_cache_bytes
+        )
+        self._minio_client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure)
+        self._bucket_name = bucket_name
 
-        return execution_result_dict
+    def _put_object(self, object_name: str, data: bytes) -> None:
+        self._minio_client.put_object(
+            self._bucket_name,
+            object_name,
+            BytesIO(data),
+            length=len(data),
+            content_type='application/octet-stream',
+        )
+
+    def _get_object(self, object_name: str, offset: int = 0, length: Optional[int] = None) -> Optional[bytes]:
+        try:
+            # A length of 0 reads to the end of the object.
+            response = self._minio_client.get_object(self._bucket_name, object_name, offset=offset, length=length or 0)
+        except S3Error as e:
+            if e.code == 'NoSuchKey':
+                return None
+            raise
+
+        try:
+            raw_data: bytes = response.read()
+            return raw_data
+        finally:
+            response.close()
+            response.release_conn()
+
+    def _list_objects(self, prefix: str) -> List[str]:
+        return [
+            obj.object_name
+            for obj in self._minio_client.list_objects(self._bucket_name, prefix=prefix, recursive=True)
+            if obj.object_name is not None
+        ]
 
 
 class ExecutionResultStorageService:
@@ -495,6 +656,10 @@ class ExecutionResultStorageService:
         """Get execution results from the configured storage backend."""
         return StoredExecutionResult.get_many(action_ids, self._storage_backend, data_censor_abilities)
 
+    def close(self) -> None:
+        """Write out any execution results that the storage backend has buffered."""
+        self._storage_backend.close()
+
 
 def bootstrap_execution_result_storage_service() -> ExecutionResultStorageService:
     """Create an ExecutionResultStorageService with the configured storage backend."""
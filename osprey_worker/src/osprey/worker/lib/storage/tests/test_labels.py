@@ -436,3 +436,33 @@ def test_compute_new_labels_from_mutations_with_pending_status(labels_provider:
     # Verify the reason is marked as pending
     reasons = result.new_entity_labels.labels['pending_label'].reasons
     assert reasons['pending_reason'].pending is True
+
+
+def test_apply_entity_label_mutations_in_order(labels_provider: LabelsProvider):
+    """Test that groups of mutations are applied one after the other, in a single write"""
+    entity = EntityT(type='User', id='123')
+    add = EntityLabelMutation(label_name='spam', reason_name='add', status=LabelStatus.ADDED)
+    remove = EntityLabelMutation(label_name='spam', reason_name='remove', status=LabelStatus.REMOVED)
+
+    results = labels_provider.apply_entity_label_mutations_in_order(entity, [[add], [add], [remove]])
+
+    # A later group overrides an earlier one, rather than the higher status winning
+    assert [(r.labels_added, r.labels_updated, r.labels_removed) for r in results] == [
+        (['spam'], [], []),
+        ([], ['spam'], []),
+        ([], [], ['spam']),
+    ]
+    assert results[0].old_entity_labels.labels == {}
+    assert results[0].new_entity_labels.labels['spam'].status == LabelStatus.ADDED
+    assert results[1].old_entity_labels.labels['spam'].status == LabelStatus.ADDED
+    assert results[2].new_entity_labels.labels['spam'].status == LabelStatus.REMOVED
+    assert labels_provider.get_from_service(entity).labels['spam'].status == LabelStatus.REMOVED
+
+
+def test_apply_entity_label_mutations_in_order_with_invalid_entity(labels_provider: LabelsProvider):
+    """Test that mutations to an entity with an empty id are dropped"""
+    mutation = EntityLabelMutation(label_name='spam', reason_name='add', status=LabelStatus.ADDED)
+
+    results = labels_provider.apply_entity_label_mutations_in_order(EntityT(type='User', id=''), [[mutation]])
+
+    assert [d.reason for d in results[0].dropped_mutations] == [MutationDropReason.INVALID_ENTITY_ID]
@@ -0,0 +1,269 @@
+import gzip
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, BinaryIO, Dict, Iterator, List
+
+import gevent
+import pytest
+from minio.error import S3Error
+from osprey.worker.lib.storage import execution_result_segments, stored_execution_result
+from osprey.worker.lib.storage.execution_result_segments import (
+    PARTITION_MILLISECONDS,
+    BatchingWriter,
+    SegmentName,
+    coalesce_ranges,
+    partition_of,
+)
+from osprey.worker.lib.storage.stored_execution_result import StoredExecutionResultBigTable, StoredExecutionResultMinIO
+
+_TIMESTAMP = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _action_id(milliseconds: int, sequence: int = 0) -> int:
+    return (milliseconds << 22) | sequence
+
+
+class FakeMinio:
+    def __init__(self) -> None:
+        self.objects: Dict[str, bytes] = {}
+        self.gets = 0
+
+    def put_object(self, bucket_name: str, object_name: str, data: BinaryIO, length: int, content_type: str) -> None:
+        self.objects[object_name] = data.read()
+        assert len(self.objects[object_name]) == length
+
+    def get_object(self, bucket_name: str, object_name: str, offset: int = 0, length: int = 0) -> Any:
+        self.gets += 1
+        if object_name not in self.objects:
+            raise S3Error(SimpleNamespace(), 'NoSuchKey', 'not found', object_name, 'request', 'host')
+        data = self.objects[object_name]
+        data = data[offset : offset + length] if length else data[offset:]
+        return SimpleNamespace(read=lambda: data, close=lambda: None, release_conn=lambda: None)
+
+    def list_objects(self, bucket_name: str, prefix: str, recursive: bool) -> Iterator[Any]:
+        for object_name in self.objects:
+            if object_name.startswith(prefix):
+                yield SimpleNamespace(object_name=object_name)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(execution_result_segments, '_RETRY_BACKOFF_MIN_SECONDS', 0.001)
+
+
+@pytest.fixture()
+def minio() -> FakeMinio:
+    return FakeMinio()
+
+
+@pytest.fixture()
+def store(minio: FakeMinio) -> Iterator[StoredExecutionResultMinIO]:
+    store = StoredExecutionResultMinIO('minio:9000', 'access', 'secret', False, 'bucket', batch_size=100)
+    store._minio_client = minio  # type: ignore[assignment]
+    yield store
+    store.close()
+
+
+def _insert(store: StoredExecutionResultMinIO, action_id: int) -> None:
+    store.insert(
+        action_id=action_id,
+        extracted_features_json=json.dumps({'ActionName': 'test', 'ActionId': action_id}),
+        error_traces_json='[]',
+        timestamp=_TIMESTAMP,
+        action_data_json=json.dumps({'id': action_id}),
+    )
+
+
+def test_packs_inserts_into_segments_per_partition(store: StoredExecutionResultMinIO, minio: FakeMinio) -> None:
+    action_ids = [_action_id(1000, i) for i in range(3)] + [_action_id(1000 + PARTITION_MILLISECONDS)]
+    for action_id in action_ids:
+        _insert(store, action_id)
+    assert minio.objects == {}
+
+    store.close()
+    segments = [SegmentName.parse(name) for name in minio.objects]
+    assert len(segments) == 2
+    assert {(segment.min_action_id, segment.max_action_id) for segment in segments if segment} == {
+        (action_ids[0], action_ids[2]),
+        (action_ids[3], action_ids[3]),
+    }
+    assert partition_of(action_ids[0]) != partition_of(action_ids[3])
+
+
+def test_retries_failed_segment_writes_without_duplicating_segments(
+    store: StoredExecutionResultMinIO, minio: FakeMinio
+) -> None:
+    action_ids = [_action_id(1000, i) for i in range(3)] + [_action_id(1000 + PARTITION_MILLISECONDS)]
+    for action_id in action_ids:
+        _insert(store, action_id)
+    # The second segment of the batch fails, after the first was written.
+    original_put_object = minio.put_object
+    puts: List[str] = []
+
+    def put_object(bucket_name: str, object_name: str, data: BinaryIO, length: int, content_type: str) -> None:
+        puts.append(object_name)
+        if len(puts) == 2:
+            raise ConnectionError('MinIO is down')
+        original_put_object(bucket_name, object_name, data, length, content_type)
+
+    minio.put_object = put_object  # type: ignore[method-assign]
+    store.close()
+
+    assert len(puts) == 4
+    assert len(minio.objects) == 2
+    assert {record['id'] for record in store.select_many(action_ids)} == set(action_ids)
+
+
+def test_select_reads_records_from_segments(store: StoredExecutionResultMinIO, minio: FakeMinio) -> None:
+    action_ids = [_action_id(1000, i) for i in range(5)]
+    for action_id in action_ids:
+        _insert(store, action_id)
+    store.close()
+
+    minio.gets = 0
+    result = store.select_one(action_ids[2])
+    assert result == {
+        'id': action_ids[2],
+        'extracted_features': json.dumps({'ActionName': 'test', 'ActionId': action_ids[2]}),
+        'error_traces': '[]',
+        'timestamp': _TIMESTAMP,
+        'action_data': json.dumps({'id': action_ids[2]}),
+    }
+    # One ranged read for the index, and one for the record.
+    assert minio.gets == 2
+
+    assert store.select_one(_action_id(1000, 99)) is None
+    assert [result['id'] for result in store.select_many(action_ids[:2])] == action_ids[:2]
+
+
+def test_select_reads_objects_written_per_action(store: StoredExecutionResultMinIO, minio: FakeMinio) -> None:
+    action_id = _action_id(1000)
+    minio.objects[store._encode_action_id(action_id)] = json.dumps(
+        {
+            'id': action_id,
+            'extracted_features': '{}',
+            'error_traces': '[]',
+            'timestamp': _TIMESTAMP.isoformat(),
+            'action_data': '{}',
+        }
+    ).encode()
+
+    result = store.select_one(action_id)
+    assert result is not None
+    assert result['id'] == action_id
+
+
+def test_select_many_reads_a_page_with_a_few_requests(store: StoredExecutionResultMinIO, minio: FakeMinio) -> None:
+    action_ids = [_action_id(1000, i) for i in range(50)] + [
+        _action_id(1000 + PARTITION_MILLISECONDS, i) for i in range(50)
+    ]
+    for action_id in action_ids:
+        _insert(store, action_id)
+    store.close()
+
+    minio.gets = 0
+    page = action_ids[25:75]
+    assert [result['id'] for result in store.select_many(page)] == page
+    # An index read and a record read for each of the two segments.
+    assert minio.gets == 4
+
+    # The index of each segment is cached.
+    minio.gets = 0
+    assert [result['id'] for result in store.select_many(action_ids[:2] + action_ids[-2:])] == (
+        action_ids[:2] + action_ids[-2:]
+    )
+    assert minio.gets == 2
+
+
+def test_select_caches_recently_read_results(minio: FakeMinio) -> None:
+    store = StoredExecutionResultMinIO('minio:9000', 'access', 'secret', False, 'bucket', read_cache_bytes=400)
+    store._minio_client = minio  # type: ignore[assignment]
+    action_ids = [_action_id(1000, i) for i in range(3)]
+    for action_id in action_ids:
+        _insert(store, action_id)
+    store.close()
+
+    first = store.select_one(action_ids[0])
+    minio.gets = 0
+    assert store.select_one(action_ids[0]) == first
+    assert minio.gets == 0
+
+    # Each result is ~200 bytes of JSON, so reading two more evicts the least recently used one.
+    store.select_many(action_ids[1:])
+    minio.gets = 0
+    store.select_one(action_ids[2])
+    assert minio.gets == 0
+    store.select_one(action_ids[0])
+    assert minio.gets > 0
+
+
+def test_coalesce_ranges() -> None:
+    assert coalesce_ranges([(100, 10), (0, 10), (12, 10), (200, 5)], max_gap=5) == [(0, 22), (100, 10), (200, 5)]
+    assert coalesce_ranges([(0, 100), (10, 10)], max_gap=0) == [(0, 100)]
+    assert coalesce_ranges([], max_gap=5) == []
+
+
+def test_segment_records_are_compressed(store: StoredExecutionResultMinIO, minio: FakeMinio) -> None:
+    _insert(store, _action_id(1000))
+    store.close()
+    [data] = minio.objects.values()
+    # A segment is a sequence of gzip members, the records followed by the index.
+    assert gzip.decompress(data).startswith(json.dumps({'id': _action_id(1000)})[:-1].encode())
+
+
+def test_bigtable_batches_mutations(monkeypatch: pytest.MonkeyPatch) -> None:
+    mutations: List[List[Any]] = []
+
+    class FakeTable:
+        def row(self, row_key: bytes) -> Any:
+            row = SimpleNamespace(row_key=row_key, cells=[])
+            row.set_cell = lambda family, column, value, timestamp: row.cells.append(column)
+            return row
+
+        def mutate_rows(self, rows: List[Any], retry: Any) -> List[Any]:
+            mutations.append(rows)
+            return [SimpleNamespace(code=0) for _ in rows]
+
+    monkeypatch.setattr(stored_execution_result.osprey_bigtable, 'table', lambda name: FakeTable())
+    store = StoredExecutionResultBigTable(batch_size=2, flush_interval_seconds=60)
+    for i in range(2):
+        store.insert(_action_id(1000, i), '{}', '[]', _TIMESTAMP, '{}')
+    gevent.sleep(0.01)
+    assert [len(rows) for rows in mutations] == [2]
+
+    store.insert(_action_id(1000, 2), '{}', '[]', _TIMESTAMP, '{}')
+    store.close()
+    assert [len(rows) for rows in mutations] == [2, 1]
+
+
+def test_batching_writer_flushes_on_interval_and_drops_failed_batches() -> None:
+    batches: List[List[int]] = []
+
+    def write_batch(batch: List[int]) -> None:
+        if batch == [0]:
+            raise ConnectionError('down')
+        batches.append(batch)
+
+    writer: BatchingWriter[int] = BatchingWriter('test', write_batch, batch_size=10, flush_interval_seconds=0.01)
+    writer.add(0)
+    gevent.sleep(0.03)
+    writer.add(1)
+    writer.add(2)
+    gevent.sleep(0.03)
+    assert batches == [[1, 2]]
+    writer.close()
+
+
+def test_batching_writer_retries_failed_batches() -> None:
+    attempts: List[List[int]] = []
+
+    def write_batch(batch: List[int]) -> None:
+        attempts.append(batch)
+        if len(attempts) < 3:
+            raise ConnectionError('down')
+
+    writer: BatchingWriter[int] = BatchingWriter('test', write_batch, batch_size=10, max_attempts=3)
+    writer.add(1)
+    writer.close()
+    assert attempts == [[1], [1], [1]]
@@ -14,7 +14,11 @@ def parse_go_timestamp(go_timestamp: str) -> datetime:
     """Parse a json-formatted golang time.Time into microseconds since the unix epoch.
 
     Format is iso rfc3339 with nanoseconds localized to UTC"""
-    return parser.parse(go_timestamp)
+    try:
+        # Handles rfc3339, truncating nanoseconds to microseconds, much faster than the general parser.
+        return datetime.fromisoformat(go_timestamp)
+    except ValueError:
+        return parser.parse(go_timestamp)
 
 
 class SnowflakeParseError(ValueError):
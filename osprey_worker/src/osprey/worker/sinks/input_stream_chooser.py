@@ -109,22 +109,39 @@ def get_rules_sink_input_stream(
         input_topic: str = config.get_str('OSPREY_KAFKA_INPUT_STREAM_TOPIC', 'osprey.actions_input')
         input_bootstrap_servers: list[str] = config.get_str_list('OSPREY_KAFKA_BOOTSTRAP_SERVERS', ['localhost'])
         group_id = config.get_optional_str('OSPREY_KAFKA_GROUP_ID')
+        # Commit each record's offset once it was handled, rather than once it was fetched.
+        commit_on_ack = config.get_bool('OSPREY_KAFKA_INPUT_STREAM_COMMIT_ON_ACK', False)
 
         if client_id_suffix:
             client_id = f'{client_id}-{client_id_suffix}'
 
         consumer: PatchedKafkaConsumer = PatchedKafkaConsumer(
-            input_topic,
             bootstrap_servers=input_bootstrap_servers,
             client_id=client_id,
             group_id=group_id,
             partition_assignment_strategy=(RoundRobinPartitionAssignor,),
+            enable_auto_commit=not commit_on_ack,
+        )
+        from osprey.worker.sinks.sink.input_stream import (
+            DEFAULT_KAFKA_COMMIT_INTERVAL_SECONDS,
+            DEFAULT_KAFKA_DRAIN_TIMEOUT_SECONDS,
+            DEFAULT_KAFKA_MAX_POLL_RECORDS,
+            KafkaInputStream,
         )
-        from osprey.worker.sinks.sink.input_stream import KafkaInputStream
 
-        return KafkaInputStream(
+        kafka_input_stream = KafkaInputStream(
             kafka_consumer=consumer,
+            max_records=config.get_int('OSPREY_KAFKA_INPUT_STREAM_MAX_POLL_RECORDS', DEFAULT_KAFKA_MAX_POLL_RECORDS),
+            commit_offsets=commit_on_ack,
+            commit_interval_seconds=config.get_float(
+                'OSPREY_KAFKA_INPUT_STREAM_COMMIT_INTERVAL_SECONDS', DEFAULT_KAFKA_COMMIT_INTERVAL_SECONDS
+            ),
+            drain_timeout_seconds=config.get_float(
+                'OSPREY_KAFKA_INPUT_STREAM_DRAIN_TIMEOUT_SECONDS', DEFAULT_KAFKA_DRAIN_TIMEOUT_SECONDS
+            ),
         )
+        consumer.subscribe([input_topic], listener=kafka_input_stream.rebalance_listener())
+        return kafka_input_stream
     elif input_stream_source == InputStreamSource.PLUGIN:
         stream = bootstrap_input_stream(config=config)
         if stream is None:
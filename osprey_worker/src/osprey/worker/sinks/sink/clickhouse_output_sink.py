@@ -5,11 +5,20 @@ routing through Kafka → Druid. The table schema mirrors what Druid
 would ingest so the query UI works unchanged.
 """
 
+import ast
 import json
-from typing import Any
+import re
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
 
+import gevent
+import gevent.event
 import sentry_sdk
 from osprey.engine.executor.execution_context import ExecutionResult
+from osprey.engine.utils.types import add_slots
+from osprey.worker.lib.instruments import metrics
 from osprey.worker.lib.osprey_shared.logging import get_logger
 from osprey.worker.sinks.sink.output_sink import BaseOutputSink
 
@@ -18,17 +27,149 @@ logger = get_logger()
 # Default batch size before flushing to ClickHouse
 DEFAULT_BATCH_SIZE = 500
 DEFAULT_FLUSH_INTERVAL_SECONDS = 5
+# Rows that are buffered or waiting to be retried, past which `push` applies backpressure
+DEFAULT_MAX_PENDING_ROWS = 50_000
+DEFAULT_BACKPRESSURE_TIMEOUT_SECONDS = 1.0
+# Attempts at inserting a batch before it is dropped, ~1 minute with the backoff below
+DEFAULT_MAX_INSERT_ATTEMPTS = 8
+DEFAULT_STOP_TIMEOUT_SECONDS = 10.0
+
+_RETRY_BACKOFF_MIN_SECONDS = 0.5
+_RETRY_BACKOFF_MAX_SECONDS = 30.0
+
+
+EXTRA_COLUMN = '_extra'
+"""The column that features without a column of their own (or with a value of the wrong type) are spilled into, as a
+JSON object. If the table doesn't have it, those features are dropped."""
+
+_WRAPPER_TYPE_RE = re.compile(r'(Nullable|LowCardinality)\((.*)\)')
+_INT_TYPE_RE = re.compile(r'U?Int\d+')
+
+
+def _to_string(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def _to_int(value: Any) -> int:
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise TypeError(f'expected an int, got {type(value).__name__}')
+
+
+def _to_float(value: Any) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    raise TypeError(f'expected a float, got {type(value).__name__}')
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    raise TypeError(f'expected a bool, got {type(value).__name__}')
+
+
+def _to_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    raise TypeError(f'expected a datetime, got {type(value).__name__}')
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+@add_slots
+@dataclass(frozen=True)
+class _Column:
+    """A column of the table, and how feature values are converted to its type."""
+
+    name: str
+    python_type: Optional[type]
+    """The type of the values of the column, which feature values of exactly that type are written as-is."""
+    convert: Callable[[Any], Any]
+    """Converts a (non-null) feature value to the column's type, raising `TypeError` or `ValueError` if it can't."""
+    default: Any
+    """The value of the column for rows that don't have it, or have it set to null."""
+
+
+def _parse_column(name: str, clickhouse_type: str, default_kind: str, default_expression: str) -> _Column:
+    base_type = clickhouse_type
+    nullable = False
+    while match := _WRAPPER_TYPE_RE.fullmatch(base_type):
+        nullable = nullable or match.group(1) == 'Nullable'
+        base_type = match.group(2)
+
+    convert: Callable[[Any], Any]
+    zero: Any
+    if base_type == 'String' or base_type.startswith(('FixedString', 'Enum', 'UUID')):
+        convert, zero = _to_string, ''
+    elif base_type == 'Bool':
+        convert, zero = _to_bool, False
+    elif _INT_TYPE_RE.fullmatch(base_type):
+        convert, zero = _to_int, 0
+    elif base_type.startswith(('Float', 'Decimal')):
+        convert, zero = _to_float, 0.0
+    elif base_type.startswith(('DateTime', 'Date')):
+        convert, zero = _to_datetime, datetime(1970, 1, 1)
+    else:
+        convert, zero = _identity, None
+    python_type = None if zero is None else type(zero)
+
+    default = None if nullable else zero
+    # Use the column's default if it's a simple literal (eg `DEFAULT '[]'`), since we have to send a value for every
+    # column of a column oriented insert.
+    if default_kind == 'DEFAULT' and default_expression:
+        try:
+            literal = ast.literal_eval(default_expression)
+        except (ValueError, SyntaxError):
+            pass
+        else:
+            if type(literal) is python_type:
+                default = literal
+
+    return _Column(name=name, python_type=python_type, convert=convert, default=default)
+
+
+class _ColumnarBatch:
+    """A batch of rows, stored as one list of values per column of the table."""
+
+    __slots__ = ('columns', 'row_count', 'attempts')
+
+    def __init__(self, column_count: int) -> None:
+        self.columns: List[List[Any]] = [[] for _ in range(column_count)]
+        self.row_count = 0
+        self.attempts = 0
+
+    def append(self, values: Sequence[Any]) -> None:
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        self.row_count += 1
 
 
 class ClickHouseOutputSink(BaseOutputSink):
     """An output sink that writes extracted features to a ClickHouse table.
 
-    Uses clickhouse-connect for efficient batch inserts with configurable
-    flush interval and batch size.
+    The table's columns are introspected once, and features are written to the column of the same name, converted to
+    its type. Features that don't have a column, or whose value can't be converted, are spilled into `EXTRA_COLUMN`.
+
+    Uses clickhouse-connect for efficient column oriented batch inserts. `push` only appends rows to a columnar
+    in-memory buffer: once the buffer is full, or every `flush_interval_seconds`, it is swapped out for an empty one
+    and queued for a background greenlet to insert, so that the rules greenlet never waits on ClickHouse. Batches that
+    fail to insert stay at the head of the queue and are retried with exponential backoff, up to `max_insert_attempts`
+    times.
+
+    The queue and the buffer are bounded by `max_pending_rows`: when they are full, `push` waits up to
+    `backpressure_timeout_seconds` for the flusher to catch up, and then drops the oldest batch (which is the buffer
+    itself if nothing else is queued) rather than growing without bound.
     """
 
     timeout: float = 10.0
-    max_retries: int = 2
+    # `push` doesn't do any I/O, failed inserts are retried by the flusher instead.
+    max_retries: int = 0
 
     def __init__(
         self,
@@ -36,83 +177,227 @@ class ClickHouseOutputSink(BaseOutputSink):
         table: str = 'osprey_events',
         database: str = 'osprey',
         batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+        max_pending_rows: int = DEFAULT_MAX_PENDING_ROWS,
+        backpressure_timeout_seconds: float = DEFAULT_BACKPRESSURE_TIMEOUT_SECONDS,
+        max_insert_attempts: int = DEFAULT_MAX_INSERT_ATTEMPTS,
+        stop_timeout_seconds: float = DEFAULT_STOP_TIMEOUT_SECONDS,
     ):
         self._client = clickhouse_client
         self._table = table
         self._database = database
         self._batch_size = batch_size
-        self._buffer: list[dict[str, Any]] = []
-        logger.info(f'ClickHouseOutputSink initialized: {database}.{table} (batch_size={batch_size})')
+        self._flush_interval_seconds = flush_interval_seconds
+        self._max_pending_rows = max_pending_rows
+        self._backpressure_timeout_seconds = backpressure_timeout_seconds
+        self._max_insert_attempts = max_insert_attempts
+        self._stop_timeout_seconds = stop_timeout_seconds
+        self._columns = self._load_columns()
+        self._column_indexes = {column.name: i for i, column in enumerate(self._columns)}
+        self._column_names = [column.name for column in self._columns]
+        self._defaults = [column.default for column in self._columns]
+        self._extra_index = self._column_indexes.get(EXTRA_COLUMN)
+        self._buffer = _ColumnarBatch(len(self._columns))
+        # Batches that were swapped out of `_buffer`, in insertion order. The batch that is being inserted is popped
+        # from here, and put back at the head if the insert fails.
+        self._pending: Deque[_ColumnarBatch] = deque()
+        # Rows of the pending batches, including the one being inserted.
+        self._pending_rows = 0
+        self._flush_requested = gevent.event.Event()
+        self._space_available = gevent.event.Event()
+        self._flusher: Optional['gevent.Greenlet[None]'] = None
+        self._stopping = False
+        logger.info(
+            f'ClickHouseOutputSink initialized: {database}.{table} with {len(self._columns)} columns '
+            f'(batch_size={batch_size}, flush_interval_seconds={flush_interval_seconds})'
+        )
+
+    def _load_columns(self) -> List[_Column]:
+        result = self._client.query(
+            'SELECT name, type, default_kind, default_expression FROM system.columns '
+            'WHERE database = {database:String} AND table = {table:String} '
+            "AND default_kind NOT IN ('MATERIALIZED', 'ALIAS') ORDER BY position",
+            parameters={'database': self._database, 'table': self._table},
+        )
+        columns = [_parse_column(*row) for row in result.result_rows]
+        if not columns:
+            raise ValueError(f'ClickHouse table {self._database}.{self._table} does not exist')
+        return columns
 
     def will_do_work(self, result: ExecutionResult) -> bool:
         return True
 
     def push(self, result: ExecutionResult) -> None:
         try:
-            features = json.loads(result.extracted_features_json)
-
-            row: dict[str, Any] = {
-                '__time': result.action.timestamp.isoformat(),
-                '__action_id': result.action.action_id,
-            }
-
-            # Add features, skipping internal __ fields already handled above
-            for key, val in features.items():
-                if key.startswith('__'):
-                    continue
-                if isinstance(val, (list, dict)):
-                    row[key] = json.dumps(val)
-                elif val is None:
-                    row[key] = ''
-                else:
-                    row[key] = val
-
-            # Persist entity label mutations from features
-            label_mutations = features.get('__entity_label_mutations')
-            if label_mutations:
-                row['__entity_label_mutations'] = json.dumps(label_mutations) if isinstance(label_mutations, list) else str(label_mutations)
+            values = self._defaults.copy()
+            extra: Dict[str, Any] = {}
+            self._set_features(values, extra, result.extracted_features.items())
 
+            internal_features: List[Tuple[str, Any]] = [
+                ('__time', result.action.timestamp),
+                ('__action_id', result.action.action_id),
+            ]
             # Add verdict info if present
             if result.verdicts:
-                row['__verdicts'] = json.dumps([v.value if hasattr(v, 'value') else str(v) for v in result.verdicts])
-
+                internal_features.append(
+                    ('__verdicts', json.dumps([v.value if hasattr(v, 'value') else str(v) for v in result.verdicts]))
+                )
             # Add rule hit info from validator_results
             if result.validator_results:
-                row['__rule_hits'] = json.dumps(
-                    {str(getattr(name, '__name__', name)): bool(val)
-                     for name, val in result.validator_results.items() if val is not None}
+                internal_features.append(
+                    (
+                        '__rule_hits',
+                        json.dumps(
+                            {
+                                str(getattr(name, '__name__', name)): bool(val)
+                                for name, val in result.validator_results.items()
+                                if val is not None
+                            }
+                        ),
+                    )
                 )
+            self._set_features(values, extra, internal_features)
 
-            self._buffer.append(row)
+            if extra:
+                if self._extra_index is not None:
+                    # Values that can't be converted to their column's type might not be JSON either, eg datetimes.
+                    values[self._extra_index] = json.dumps(extra, default=str)
+                else:
+                    metrics.increment('clickhouse_output_sink.unmatched_features', len(extra))
 
-            if len(self._buffer) >= self._batch_size:
-                self._flush()
+            self._append(values)
 
         except Exception as e:
             logger.error(f'ClickHouse sink error: {e}')
             sentry_sdk.capture_exception(error=e)
 
-    def _flush(self) -> None:
-        if not self._buffer:
+    def _set_features(self, values: List[Any], extra: Dict[str, Any], features: Iterable[Tuple[str, Any]]) -> None:
+        """Sets the values of the columns that `features` map to, and collects the ones that don't map to any column
+        in `extra`. Internal (`__`-prefixed) features are only kept if the table has a column for them."""
+        column_indexes = self._column_indexes
+        columns = self._columns
+        for name, value in features:
+            index = column_indexes.get(name)
+            if index is None:
+                if not name.startswith('__'):
+                    extra[name] = value
+                continue
+            if value is None:
+                continue
+            column = columns[index]
+            if type(value) is column.python_type:
+                values[index] = value
+                continue
+            try:
+                values[index] = column.convert(value)
+            except (TypeError, ValueError):
+                extra[name] = value
+
+    def _append(self, values: List[Any]) -> None:
+        if self._flusher is None and not self._stopping:
+            self._flusher = gevent.spawn(self._flush_periodically)
+
+        if self._pending_rows + self._buffer.row_count >= self._max_pending_rows:
+            self._wait_for_space()
+
+        self._buffer.append(values)
+        if self._buffer.row_count >= self._batch_size:
+            self._swap_buffer()
+            self._flush_requested.set()
+
+    def _wait_for_space(self) -> None:
+        metrics.increment('clickhouse_output_sink.backpressure')
+        with metrics.timed('clickhouse_output_sink.backpressure_wait', use_ms=True):
+            self._space_available.clear()
+            if self._space_available.wait(self._backpressure_timeout_seconds):
+                return
+
+        # The flusher couldn't catch up in time (ClickHouse is most likely down): make room by dropping the oldest
+        # batch that isn't being inserted. If that is the buffer (e.g. the flusher holds the only other batch), it is
+        # queued first, so that it is dropped like any other batch.
+        if not self._pending:
+            self._swap_buffer()
+        if self._pending:
+            self._drop(self._pending.popleft(), reason='overflow')
+
+    def _swap_buffer(self) -> None:
+        """Queues the current buffer for insertion, and starts filling a new one."""
+        if not self._buffer.row_count:
             return
+        batch, self._buffer = self._buffer, _ColumnarBatch(len(self._columns))
+        self._pending.append(batch)
+        self._pending_rows += batch.row_count
+
+    def _release(self, batch: _ColumnarBatch) -> None:
+        self._pending_rows -= batch.row_count
+        self._space_available.set()
+
+    def _drop(self, batch: _ColumnarBatch, reason: str) -> None:
+        logger.error(f'Dropping {batch.row_count} rows for ClickHouse ({reason}, {batch.attempts} attempts)')
+        metrics.increment('clickhouse_output_sink.dropped_rows', batch.row_count, tags=[f'reason:{reason}'])
+        self._release(batch)
+
+    def _flush_periodically(self) -> None:
+        while True:
+            self._flush_requested.wait(self._flush_interval_seconds)
+            self._flush_requested.clear()
+            self._swap_buffer()
+            try:
+                self._drain()
+            except Exception as e:
+                logger.exception('ClickHouse flusher error')
+                sentry_sdk.capture_exception(error=e)
+            metrics.gauge('clickhouse_output_sink.pending_rows', self._pending_rows)
+            if self._stopping and not self._buffer.row_count and not self._pending:
+                return
+
+    def _drain(self) -> None:
+        """Inserts the pending batches in order, backing off while inserts fail."""
+        while self._pending:
+            batch = self._pending.popleft()
+            if self._insert(batch):
+                self._release(batch)
+                continue
+
+            batch.attempts += 1
+            if batch.attempts >= self._max_insert_attempts:
+                self._drop(batch, reason='max_attempts')
+                continue
+
+            self._pending.appendleft(batch)
+            metrics.increment('clickhouse_output_sink.retry', tags=[f'attempt:{batch.attempts}'])
+            gevent.sleep(min(_RETRY_BACKOFF_MIN_SECONDS * 2 ** (batch.attempts - 1), _RETRY_BACKOFF_MAX_SECONDS))
 
-        rows_to_flush = len(self._buffer)
+    def _insert(self, batch: _ColumnarBatch) -> bool:
+        """Inserts a batch of rows, returning whether it succeeded."""
         try:
-            # clickhouse-connect requires column_names + list-of-lists, not dicts
-            column_names = list(self._buffer[0].keys())
-            data = [list(row.get(col, '') for col in column_names) for row in self._buffer]
-            self._client.insert(
-                f'{self._database}.{self._table}',
-                data=data,
-                column_names=column_names,
-                column_oriented=False,
-            )
-            logger.info(f'Flushed {rows_to_flush} rows to ClickHouse')
+            with metrics.timed('clickhouse_output_sink.insert', use_ms=True):
+                self._client.insert(
+                    f'{self._database}.{self._table}',
+                    data=batch.columns,
+                    column_names=self._column_names,
+                    column_oriented=True,
+                )
         except Exception as e:
-            logger.error(f'ClickHouse flush error ({rows_to_flush} rows): {e}')
+            logger.error(f'ClickHouse flush error ({batch.row_count} rows): {e}')
+            metrics.increment('clickhouse_output_sink.insert_error', tags=[f'error:{e.__class__.__name__}'])
             sentry_sdk.capture_exception(error=e)
-        finally:
-            self._buffer.clear()
+            return False
+
+        logger.info(f'Flushed {batch.row_count} rows to ClickHouse')
+        metrics.increment('clickhouse_output_sink.inserted_rows', batch.row_count)
+        return True
 
     def stop(self) -> None:
-        self._flush()
+        """Flushes whatever is buffered, giving the flusher up to `stop_timeout_seconds` to insert it."""
+        self._stopping = True
+        if self._flusher is None:
+            return
+
+        self._flush_requested.set()
+        self._flusher.join(timeout=self._stop_timeout_seconds)
+        if not self._flusher.dead:
+            self._flusher.kill()
+            logger.error(
+                f'Timed out flushing to ClickHouse on stop, {self._pending_rows + self._buffer.row_count} rows lost'
+            )
@@ -1,12 +1,26 @@
 import abc
+import functools
 import inspect
-import json
+import time
 from collections import deque
 from datetime import datetime, timezone
-from typing import TYPE_CHECKING, Generic, Iterator, List, Optional, Sequence, Type, TypeVar, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
 
 import gevent
-import msgpack
 import sentry_sdk
 from gevent.lock import RLock
 from gevent.queue import Queue as GeventQueue
@@ -16,20 +30,23 @@ from google.cloud.pubsub_v1.subscriber.message import Message
 from google.protobuf.message import DecodeError
 from google.protobuf.message import Message as ProtoMessage
 from google.pubsub_v1 import PubsubMessage
+from kafka import ConsumerRebalanceListener
 from kafka.consumer.fetcher import ConsumerRecord
+from kafka.structs import OffsetAndMetadata, TopicPartition
 from osprey.engine.executor.execution_context import Action
 from osprey.worker.lib.encryption.envelope import Envelope
 from osprey.worker.lib.instruments import metrics
 from osprey.worker.lib.osprey_shared.logging import get_logger
 from osprey.worker.lib.storage.postgres import Model, scoped_session
-from osprey.worker.lib.utils.dates import parse_go_timestamp
 from osprey.worker.sinks.utils.acking_contexts import (
     BaseAckingContext,
+    KafkaAckingContext,
     NoopAckingContext,
     PubSubMessageAckingContext,
     PullPubSubMessageContext,
 )
-from osprey.worker.sinks.utils.kafka import PatchedKafkaConsumer
+from osprey.worker.sinks.utils.action_decoding import KafkaActionDecoder, PubSubActionDecoder, decode_kafka_action
+from osprey.worker.sinks.utils.kafka import KafkaOffsetTracker, PatchedKafkaConsumer
 from pydantic import BaseModel
 from tenacity import RetryCallState, retry_if_exception_type, stop_never, wait_exponential
 from tenacity import retry as tenacity_retry
@@ -145,10 +162,12 @@ class PubSubOspreyActionInputStream(BasePubSubInputStream[BaseAckingContext[Acti
         kek_uri: str = '',
         max_messages: int = 250,
         gevent_queue_size: int = 1000,
+        action_decoder: Optional[PubSubActionDecoder] = None,
     ):
         super().__init__(subscriber, subscription_path, max_messages)
         self.queue = GeventQueue(maxsize=gevent_queue_size)
         self.encryption_envelope = Envelope(kek_uri=kek_uri, gcp_credential_path='')  # use default gcp credentials
+        self._action_decoder = action_decoder or PubSubActionDecoder()
 
     def _handle_message_data_if_is_secure(self, message: Message) -> bytes:
         is_secure = message.attributes.get('encrypted', 'false') == 'true'
@@ -166,48 +185,8 @@ class PubSubOspreyActionInputStream(BasePubSubInputStream[BaseAckingContext[Acti
         Until we have strict protobuf types, if this method is changed, make sure
         content_cop/pydantic_models/messages.py::OspreyRulesInput is still compatible.
         """
-        encoding = message.attributes.get('encoding')
-
         message_data: bytes = self._handle_message_data_if_is_secure(message)
-
-        if encoding == 'proto':
-            from osprey.worker.adaptor.plugin_manager import bootstrap_action_proto_deserializer
-
-            deserializer = bootstrap_action_proto_deserializer()
-            if deserializer is not None:
-                res = deserializer.proto_bytes_to_dict(message_data)
-                return Action(
-                    action_id=res.action_id,
-                    action_name=res.action_name,
-                    data=res.data,
-                    timestamp=message.publish_time,
-                )
-            else:
-                logger.warning('Proto deserializer plugin not available, falling back to JSON processing')
-        # Process as JSON (either explicitly requested or fallback from proto)
-        # Right now there are two formats for loading messages
-        # This code will prevent errors until the old format is flushed out
-        # This will mainly affect the hasher
-        try:
-            # old format
-            action = msgpack.loads(message_data)
-            return Action(
-                action_id=int(action['id']),
-                action_name=action['name'],
-                data=action['data'],
-                secret_data=action.get('secret_data', {}),
-                timestamp=message.publish_time,
-            )
-        except Exception:
-            # new format
-            action = json.loads(msgpack.loads(message_data))
-            return Action(
-                action_id=int(action['id']),
-                action_name=action['name'],
-                data=action['data'],
-                secret_data=action.get('secret_data', {}),
-                timestamp=message.publish_time,
-            )
+        return self._action_decoder.decode(message_data, message.attributes.get('encoding'), message.publish_time)
 
 
 # TODO: this maybe not needed anymore with Coordinator
@@ -410,35 +389,205 @@ class PostgresInputStream(BaseInputStream[_ModelT]):
                     gevent.sleep(self._cooldown)
 
 
+DEFAULT_KAFKA_MAX_POLL_RECORDS = 500
+DEFAULT_KAFKA_POLL_TIMEOUT_MS = 1000
+DEFAULT_KAFKA_COMMIT_INTERVAL_SECONDS = 1.0
+# How long to wait for the actions of revoked partitions to be handled before giving them up. This has to be well
+# within the consumer's `max_poll_interval_ms`, since the rebalance waits for it.
+DEFAULT_KAFKA_DRAIN_TIMEOUT_SECONDS = 30.0
+_KAFKA_LAG_REPORT_INTERVAL_SECONDS = 10.0
+_KAFKA_DRAIN_POLL_INTERVAL_SECONDS = 0.01
+
+
 class KafkaInputStream(BaseInputStream[BaseAckingContext[Action]]):
-    """An input stream that consumes messages from a Kafka topic and yields Action objects wrapped in an AckingContext."""
+    """An input stream that consumes messages from a Kafka topic and yields Action objects wrapped in an AckingContext.
 
-    def __init__(self, kafka_consumer: PatchedKafkaConsumer):
+    Records are fetched and decoded in batches of up to `max_records`. If `commit_offsets` is set, the consumer must
+    not auto-commit: each action is yielded in a `KafkaAckingContext` instead, and a partition's offsets are committed,
+    asynchronously and at most every `commit_interval_seconds`, once all of its earlier actions were acked. That way
+    an action is only committed once it was handled, for at-least-once processing. Otherwise actions are yielded in a
+    `NoopAckingContext`, and the consumer commits offsets as it fetches records.
+
+    To hand partitions over cleanly when the group rebalances, the consumer should be subscribed with
+    `rebalance_listener()`. Before partitions are revoked, the listener then waits (up to `drain_timeout_seconds`) for
+    the actions already read from them to be handled, and commits them.
+
+    `stop` ends the stream, after which `close` commits what was handled and leaves the group.
+
+    Record values are decoded with `decode_action`, which defaults to the JSON envelope of `decode_kafka_action`."""
+
+    def __init__(
+        self,
+        kafka_consumer: PatchedKafkaConsumer,
+        max_records: int = DEFAULT_KAFKA_MAX_POLL_RECORDS,
+        commit_offsets: bool = False,
+        commit_interval_seconds: float = DEFAULT_KAFKA_COMMIT_INTERVAL_SECONDS,
+        drain_timeout_seconds: float = DEFAULT_KAFKA_DRAIN_TIMEOUT_SECONDS,
+        decode_action: KafkaActionDecoder = decode_kafka_action,
+    ):
         super().__init__()
         self._consumer: PatchedKafkaConsumer = kafka_consumer
+        self._decode_action = decode_action
+        self._max_records = max_records
+        self._offset_tracker = KafkaOffsetTracker() if commit_offsets else None
+        self._commit_interval_seconds = commit_interval_seconds
+        self._drain_timeout_seconds = drain_timeout_seconds
+        self._committed_at = 0.0
+        self._lag_reported_at = 0.0
+        self._stopping = False
+
+    def rebalance_listener(self) -> ConsumerRebalanceListener:
+        """The listener to subscribe the consumer with."""
+        return _KafkaInputStreamRebalanceListener(self)
+
+    def stop(self) -> None:
+        """Ends the stream, once the current batch of records was read."""
+        self._stopping = True
+
+    def close(self) -> None:
+        """Waits for the actions that were read to be handled, commits them and closes the consumer. Call it once the
+        stream was stopped and its consumers are done."""
+        if self._offset_tracker is not None:
+            self._drain(self._consumer.assignment())
+            self._commit_sync()
+        self._consumer.close(autocommit=self._offset_tracker is None)
 
     def _gen(self) -> Iterator[BaseAckingContext[Action]]:
-        while True:
+        while not self._stopping:
+            self._commit_if_due()
+            self._report_lag_if_due()
             try:
-                with metrics.timed('kafka_consumer.lock_time'):
-                    with metrics.timed('kafka_consumer.poll_time'):
-                        record: ConsumerRecord = next(self._consumer)
-                data = json.loads(record.value)
-                timestamp = parse_go_timestamp(data['send_time'])
-                action_data = data['data']
-                # this was here for when this was protobuf. If its json by default, we should just assume its all in one
-                # json blob.
-                # action_data = json.loads(action_data_json)
-
-                action = Action(
-                    action_id=int(action_data['action_id']),
-                    action_name=action_data['action_name'],
-                    data=action_data['data'],
-                    timestamp=timestamp,
-                )
-                # Wrap in NoopAckingContext for now, or implement a KafkaAckingContext if needed
-                yield NoopAckingContext(action)
+                with metrics.timed('kafka_consumer.poll_time'):
+                    records_by_partition = self._consumer.poll(
+                        timeout_ms=DEFAULT_KAFKA_POLL_TIMEOUT_MS, max_records=self._max_records
+                    )
             except Exception as e:
                 logger.exception('Error while consuming from Kafka')
                 sentry_sdk.capture_exception(e)
                 continue
+
+            for partition, records in records_by_partition.items():
+                metrics.histogram('kafka_consumer.batch_size', len(records), tags=[f'topic:{partition.topic}'])
+                yield from self._decode_batch(partition, records)
+
+    def _decode_batch(
+        self, partition: TopicPartition, records: List[ConsumerRecord]
+    ) -> List[BaseAckingContext[Action]]:
+        contexts: List[BaseAckingContext[Action]] = []
+        for record in records:
+            try:
+                action = self._decode_action(record.value)
+            except Exception as e:
+                logger.exception('Error while decoding a Kafka record')
+                sentry_sdk.capture_exception(e)
+                metrics.increment('kafka_consumer.decode_error', tags=[f'topic:{partition.topic}'])
+                if self._offset_tracker is not None:
+                    # There's nothing to retry, so don't hold up the partition's commits.
+                    generation = self._offset_tracker.track(partition, record.offset)
+                    self._offset_tracker.done(partition, record.offset, generation)
+                continue
+
+            if self._offset_tracker is None:
+                contexts.append(NoopAckingContext(action))
+            else:
+                contexts.append(KafkaAckingContext(action, self._offset_tracker, partition, record.offset))
+        return contexts
+
+    def _commit_if_due(self) -> None:
+        if self._offset_tracker is None:
+            return
+        now = time.monotonic()
+        if now - self._committed_at < self._commit_interval_seconds:
+            return
+        self._committed_at = now
+        metrics.gauge('kafka_consumer.pending_offsets', self._offset_tracker.num_pending)
+        offsets = self._offset_tracker.take_committable()
+        if offsets:
+            generations = {partition: self._offset_tracker.generation_of(partition) for partition in offsets}
+            self._consumer.commit_async(offsets=offsets, callback=functools.partial(self._on_committed, generations))
+
+    def _commit_sync(self) -> None:
+        assert self._offset_tracker is not None
+        offsets = self._offset_tracker.take_committable()
+        if not offsets:
+            return
+        try:
+            self._consumer.commit(offsets=offsets)
+            metrics.increment('kafka_consumer.commit', tags=['status:ok'])
+        except Exception as e:
+            # Eg if the group already rebalanced without this consumer. The actions are handled again by the new owner.
+            logger.warning(f'Failed to commit Kafka offsets: {e}')
+            metrics.increment('kafka_consumer.commit', tags=['status:failed', f'error:{e.__class__.__name__}'])
+
+    def _drain(self, partitions: Set[TopicPartition]) -> None:
+        """Waits for the actions read from the partitions to be handled."""
+        assert self._offset_tracker is not None
+        deadline = time.monotonic() + self._drain_timeout_seconds
+        with metrics.timed('kafka_consumer.drain_time'):
+            while self._offset_tracker.num_pending_in(partitions) and time.monotonic() < deadline:
+                gevent.sleep(_KAFKA_DRAIN_POLL_INTERVAL_SECONDS)
+        pending = self._offset_tracker.num_pending_in(partitions)
+        if pending:
+            logger.error(f'Timed out draining Kafka partitions, {pending} actions will be handled again')
+            metrics.increment('kafka_consumer.drain_timeout', value=pending)
+
+    def _on_partitions_revoked(self, revoked: Set[TopicPartition]) -> None:
+        logger.info(f'Kafka partitions revoked: {sorted(revoked)}')
+        metrics.increment('kafka_consumer.rebalance', tags=['event:revoked'], value=len(revoked))
+        if self._offset_tracker is None or not revoked:
+            return
+        self._drain(revoked)
+        self._commit_sync()
+        self._offset_tracker.forget(revoked)
+
+    def _on_partitions_assigned(self, assigned: Set[TopicPartition]) -> None:
+        logger.info(f'Kafka partitions assigned: {sorted(assigned)}')
+        metrics.increment('kafka_consumer.rebalance', tags=['event:assigned'], value=len(assigned))
+
+    def _report_lag_if_due(self) -> None:
+        now = time.monotonic()
+        if now - self._lag_reported_at < _KAFKA_LAG_REPORT_INTERVAL_SECONDS:
+            return
+        self._lag_reported_at = now
+        for partition in self._consumer.assignment():
+            # The highwater mark is only known once records were fetched from the partition.
+            highwater = self._consumer.highwater(partition)
+            if highwater is None:
+                continue
+            try:
+                position = self._consumer.position(partition)
+            except Exception:
+                continue
+            metrics.gauge(
+                'kafka_consumer.lag',
+                highwater - position,
+                tags=[f'topic:{partition.topic}', f'partition:{partition.partition}'],
+            )
+
+    def _on_committed(
+        self,
+        generations: Dict[TopicPartition, int],
+        offsets: Dict[TopicPartition, OffsetAndMetadata],
+        response: Any,
+    ) -> None:
+        if isinstance(response, Exception):
+            # Committed again with the next commit, even if the partition has no new records by then.
+            assert self._offset_tracker is not None
+            self._offset_tracker.restore(offsets, generations)
+            logger.warning(f'Failed to commit Kafka offsets: {response}')
+            metrics.increment('kafka_consumer.commit', tags=['status:failed', f'error:{response.__class__.__name__}'])
+        else:
+            metrics.increment('kafka_consumer.commit', tags=['status:ok'])
+
+
+class _KafkaInputStreamRebalanceListener(ConsumerRebalanceListener):  # type: ignore[misc]
+    """Called from `KafkaInputStream`'s `poll`, so once every record read before was handed out."""
+
+    def __init__(self, input_stream: KafkaInputStream) -> None:
+        self._input_stream = input_stream
+
+    def on_partitions_revoked(self, revoked: Set[TopicPartition]) -> None:
+        self._input_stream._on_partitions_revoked(set(revoked))
+
+    def on_partitions_assigned(self, assigned: Set[TopicPartition]) -> None:
+        self._input_stream._on_partitions_assigned(set(assigned))
@@ -1,29 +1,131 @@
-from typing import Any
+import time
+from typing import Any, List, Optional
 
+import gevent.event
 import sentry_sdk
 from kafka import KafkaProducer
+from kafka.errors import KafkaTimeoutError
 from osprey.engine.executor.execution_context import ExecutionResult
+from osprey.worker.lib.config import Config
+from osprey.worker.lib.instruments import metrics
 from osprey.worker.lib.osprey_shared.logging import get_logger
 from osprey.worker.sinks.sink.output_sink import BaseOutputSink
 
 logger = get_logger()
 
+DEFAULT_LINGER_MS = 5
+DEFAULT_BATCH_SIZE_BYTES = 64 * 1024
+# How long `send` may block on a full producer buffer (or on fetching metadata) before the record is dropped.
+DEFAULT_MAX_BLOCK_MS = 1000
+# Records sent but not yet acknowledged, past which `push` applies backpressure
+DEFAULT_MAX_IN_FLIGHT = 10_000
+DEFAULT_BACKPRESSURE_TIMEOUT_SECONDS = 1.0
+DEFAULT_STOP_TIMEOUT_SECONDS = 10.0
+
+_IN_FLIGHT_REPORT_INTERVAL_SECONDS = 10.0
+
+
+def create_kafka_producer(config: Config, bootstrap_servers: List[str], client_id: str) -> KafkaProducer:
+    """Creates the producer for a `KafkaOutputSink`, with batching and compression configured from `config`."""
+    compression_type = config.get_str('OSPREY_KAFKA_OUTPUT_COMPRESSION_TYPE', 'none').lower()
+    return KafkaProducer(
+        bootstrap_servers=bootstrap_servers,
+        client_id=client_id,
+        linger_ms=config.get_int('OSPREY_KAFKA_OUTPUT_LINGER_MS', DEFAULT_LINGER_MS),
+        batch_size=config.get_int('OSPREY_KAFKA_OUTPUT_BATCH_SIZE', DEFAULT_BATCH_SIZE_BYTES),
+        # Any of the codecs supported by the kafka client, eg `lz4` or `gzip`.
+        compression_type=None if compression_type == 'none' else compression_type,
+        max_block_ms=config.get_int('OSPREY_KAFKA_OUTPUT_MAX_BLOCK_MS', DEFAULT_MAX_BLOCK_MS),
+    )
+
 
 class KafkaOutputSink(BaseOutputSink):
-    """An output sink that sends the extracted features to a given kafka topic."""
+    """An output sink that sends the extracted features to a given kafka topic.
+
+    If `partition_key_feature` is given, records are keyed by the value of that feature, so that all the results for
+    an entity go to the same partition, in order. Records are sent asynchronously; once `max_in_flight` records are
+    waiting to be acknowledged, `push` waits for some to be, and drops the record if none are within
+    `backpressure_timeout_seconds`."""
 
-    def __init__(self, kafka_topic: str, kafka_producer: KafkaProducer):
+    def __init__(
+        self,
+        kafka_topic: str,
+        kafka_producer: KafkaProducer,
+        partition_key_feature: Optional[str] = None,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        backpressure_timeout_seconds: float = DEFAULT_BACKPRESSURE_TIMEOUT_SECONDS,
+        stop_timeout_seconds: float = DEFAULT_STOP_TIMEOUT_SECONDS,
+    ):
         self._kafka_topic = kafka_topic
         self._kafka_producer = kafka_producer
+        self._partition_key_feature = partition_key_feature
+        self._max_in_flight = max_in_flight
+        self._backpressure_timeout_seconds = backpressure_timeout_seconds
+        self._stop_timeout_seconds = stop_timeout_seconds
+        self._in_flight = 0
+        self._in_flight_reported_at = 0.0
+        # The producer's callbacks run on its sender thread, which is a greenlet once gevent has patched threading.
+        self._space_available = gevent.event.Event()
+        self._space_available.set()
 
     def will_do_work(self, result: ExecutionResult) -> bool:
         return True
 
     def push(self, result: ExecutionResult) -> None:
-        kafka_future: Any = self._kafka_producer.send(
-            topic=self._kafka_topic, value=result.extracted_features_json.encode('utf-8')
-        )
-        kafka_future.add_errback(self.push_err_to_sentry)
+        if not self._wait_for_space():
+            metrics.increment('kafka_output_sink.dropped', tags=['reason:backpressure'])
+            return
+
+        try:
+            kafka_future: Any = self._kafka_producer.send(
+                topic=self._kafka_topic,
+                key=self._get_partition_key(result),
+                value=result.extracted_features_json_bytes,
+            )
+        except KafkaTimeoutError:
+            # The producer's buffer stayed full (or the topic's metadata couldn't be fetched) for `max_block_ms`.
+            metrics.increment('kafka_output_sink.dropped', tags=['reason:buffer_full'])
+            return
+
+        self._in_flight += 1
+        if self._in_flight >= self._max_in_flight:
+            self._space_available.clear()
+        metrics.increment('kafka_output_sink.sent')
+        now = time.monotonic()
+        if now - self._in_flight_reported_at >= _IN_FLIGHT_REPORT_INTERVAL_SECONDS:
+            self._in_flight_reported_at = now
+            metrics.gauge('kafka_output_sink.in_flight', self._in_flight)
+        kafka_future.add_callback(self._on_acked)
+        kafka_future.add_errback(self._on_failed)
+
+    def _get_partition_key(self, result: ExecutionResult) -> Optional[bytes]:
+        if self._partition_key_feature is None:
+            return None
+        value = result.extracted_features.get(self._partition_key_feature)
+        if value is None:
+            # Without a key, the producer spreads records over the partitions.
+            return None
+        return str(value).encode('utf-8')
+
+    def _wait_for_space(self) -> bool:
+        if self._in_flight < self._max_in_flight:
+            return True
+        metrics.increment('kafka_output_sink.backpressure')
+        return self._space_available.wait(timeout=self._backpressure_timeout_seconds)
+
+    def _on_acked(self, record_metadata: Any) -> None:
+        metrics.increment('kafka_output_sink.acked')
+        self._record_done()
+
+    def _on_failed(self, e: Exception) -> None:
+        metrics.increment('kafka_output_sink.failed', tags=[f'error:{e.__class__.__name__}'])
+        self._record_done()
+        self.push_err_to_sentry(e)
+
+    def _record_done(self) -> None:
+        self._in_flight -= 1
+        if self._in_flight < self._max_in_flight:
+            self._space_available.set()
 
     @classmethod
     def push_err_to_sentry(cls, e: Exception) -> None:
@@ -31,4 +133,9 @@ class KafkaOutputSink(BaseOutputSink):
         sentry_sdk.capture_exception(error=e)
 
     def stop(self) -> None:
-        pass
+        metrics.gauge('kafka_output_sink.in_flight_at_stop', self._in_flight)
+        try:
+            self._kafka_producer.flush(timeout=self._stop_timeout_seconds)
+        except KafkaTimeoutError:
+            logger.error(f'Timed out flushing the kafka producer, {self._in_flight} records may be lost')
+        self._kafka_producer.close(timeout=self._stop_timeout_seconds)
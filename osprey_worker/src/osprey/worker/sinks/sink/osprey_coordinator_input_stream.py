@@ -4,6 +4,8 @@ import time
 from queue import SimpleQueue as Queue
 from typing import Any, Dict, Iterator, Optional, Tuple
 
+import gevent
+import gevent.queue
 import grpc
 import pytz
 import sentry_sdk
@@ -183,6 +185,11 @@ class OspreyCoordinatorInputStream(BaseInputStream[BaseAckingContext[OspreyEngin
     * Converting the OspreyCoordinatorActions -> OspreyEngineActions
     * Shutdown signals
     * Acking/Nacking actions
+
+    The coordinator only sends an action on a stream once the previous one was acked, and an action is only acked
+    once its acking context was exited (ie once it was fully handled), not when the next action is read. To have more
+    than one action in flight, eg for a pipelined `RulesSink`, set `num_streams` to open that many streams, whose
+    actions are interleaved.
     """
 
     _STOP_STREAMING_SIGNAL = object()
@@ -192,6 +199,7 @@ class OspreyCoordinatorInputStream(BaseInputStream[BaseAckingContext[OspreyEngin
         client_id: str,
         input_stream_ready_signaler: Optional[InputStreamReadySignaler] = None,
         coordinator_service_name: str = 'osprey_coordinator',
+        num_streams: int = 1,
     ) -> None:
         super().__init__()
 
@@ -201,6 +209,7 @@ class OspreyCoordinatorInputStream(BaseInputStream[BaseAckingContext[OspreyEngin
         self._client_id = client_id
         self._input_stream_ready_signaler = input_stream_ready_signaler
         self._current_execution_result: Optional[ExecutionResult] = None
+        self._num_streams = num_streams
 
     def stop(self) -> None:
         if self._soft_shutdown_signal_received:
@@ -287,6 +296,32 @@ class OspreyCoordinatorInputStream(BaseInputStream[BaseAckingContext[OspreyEngin
             return None
 
     def _gen(self) -> Iterator[NoopAckingContext[OspreyEngineAction]]:
+        if self._num_streams <= 1:
+            yield from self._gen_stream()
+            return
+
+        contexts: 'gevent.queue.Queue[Optional[VerdictsAckingContext[OspreyEngineAction]]]' = gevent.queue.Queue()
+
+        def pump() -> None:
+            try:
+                for context in self._gen_stream():
+                    contexts.put(context)
+            finally:
+                contexts.put(None)
+
+        pumps = [gevent.spawn(pump) for _ in range(self._num_streams)]
+        try:
+            running = len(pumps)
+            while running:
+                context = contexts.get()
+                if context is None:
+                    running -= 1
+                    continue
+                yield context
+        finally:
+            gevent.killall(pumps)
+
+    def _gen_stream(self) -> Iterator[VerdictsAckingContext[OspreyEngineAction]]:
         should_run = True
         while should_run:
             channel, service = self._channel_pool.get_connection()
@@ -315,6 +350,8 @@ class OspreyCoordinatorInputStream(BaseInputStream[BaseAckingContext[OspreyEngin
                     use_ms=True,
                 ):
                     yield context
+                    # The consumer may read ahead, so wait for the action to actually be handled before acking it.
+                    context.wait_until_done()
 
                 # First prioritize shutdown signals so we can ack the last action and disconnect gracefully
                 if self._soft_shutdown_signal_received:
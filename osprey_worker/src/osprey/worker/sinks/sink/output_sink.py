@@ -1,19 +1,25 @@
 import abc
+import time
 from collections import defaultdict
 from datetime import datetime
-from typing import Any, Callable, DefaultDict, Dict, Mapping, Optional, Sequence
+from typing import Any, Callable, DefaultDict, Dict, List, Mapping, Optional, Sequence, Tuple
 
 import gevent
+import gevent.event
+import gevent.queue
+import mmh3  # type: ignore
 import sentry_sdk
 from osprey.engine.executor.execution_context import (
     ExecutionResult,
+    ExecutionResultView,
 )
+from osprey.engine.executor.external_service_utils import SharedExternalServiceCache
 from osprey.engine.language_types.entities import EntityT
 from osprey.engine.language_types.labels import LabelEffect
 from osprey.engine.stdlib.udfs.rules import RuleT
 from osprey.worker.lib.ddtrace_utils import trace
 from osprey.worker.lib.instruments import metrics
-from osprey.worker.lib.osprey_shared.labels import EntityLabelMutation
+from osprey.worker.lib.osprey_shared.labels import EntityLabelMutation, EntityLabelMutationsResult
 from osprey.worker.lib.osprey_shared.logging import DynamicLogSampler, get_logger
 from osprey.worker.lib.storage.labels import LabelsProvider
 from tenacity import RetryCallState, retry, stop_after_attempt, wait_exponential
@@ -22,6 +28,11 @@ logger = get_logger()
 
 DEFAULT_GEVENT_TIMEOUT = 2
 DEFAULT_MAX_RETRIES = 0  # No retries by default (1 attempt total)
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_STOP_TIMEOUT_SECONDS = 10.0
+_QUEUE_DEPTH_REPORT_INTERVAL_SECONDS = 1.0
+DEFAULT_LABEL_WRITE_WINDOW_SECONDS = 0.0
+DEFAULT_MAX_COALESCED_LABEL_WRITES = 100
 
 
 class BaseOutputSink(abc.ABC):
@@ -32,6 +43,19 @@ class BaseOutputSink(abc.ABC):
     # 0 = no retries (1 attempt), 2 = up to 3 total attempts
     max_retries: int = DEFAULT_MAX_RETRIES
 
+    # Whether `MultiOutputSink` waits for this sink to be done with a result before returning from `push`, and so
+    # before the action is acked. Sinks that aren't durable are pushed to in the background, and results are dropped
+    # if they can't keep up. Subclasses can override this.
+    durable: bool = False
+
+    # The number of greenlets that `MultiOutputSink` pushes to this sink from concurrently. Subclasses whose `push`
+    # isn't safe to run concurrently must leave this at 1.
+    workers: int = 1
+
+    # If set, results with the same value of this extracted feature (eg an entity id) are always pushed by the same
+    # greenlet, one at a time and in order, rather than by whichever of the `workers` is free. Subclasses can set it.
+    affinity_feature: Optional[str] = None
+
     @abc.abstractmethod
     def will_do_work(self, result: ExecutionResult) -> bool:
         """A quick way to determine if this sink needs to do anything for this result."""
@@ -49,73 +73,189 @@ class BaseOutputSink(abc.ABC):
         raise NotImplementedError
 
 
-class MultiOutputSink(BaseOutputSink):
-    """An output sink that tees the execution results to multiple children sinks."""
+def _create_push_with_retry(sink: BaseOutputSink) -> Callable[[ExecutionResult], None]:
+    """Create a retry-wrapped push function for a sink.
 
-    def __init__(self, sinks: Sequence[BaseOutputSink]):
-        self._sinks = sinks
+    Uses tenacity for exponential backoff retries.
+    """
+    sink_name = sink.__class__.__name__
 
-    def will_do_work(self, result: ExecutionResult) -> bool:
-        return any(sink.will_do_work(result) for sink in self._sinks)
+    def log_retry_attempt(retry_state: RetryCallState) -> None:
+        attempt = retry_state.attempt_number
+        exception = retry_state.outcome.exception() if retry_state.outcome else None
+        logger.warning(f'Retrying sink {sink_name}, attempt {attempt}, error: {exception}')
+        metrics.increment('output_sink.retry', tags=[f'sink:{sink_name}', f'attempt:{attempt}'])
 
-    def _create_push_with_retry(self, sink: BaseOutputSink) -> Callable[[ExecutionResult], None]:
-        """Create a retry-wrapped push function for a sink.
+    # stop_after_attempt(1) = no retries, stop_after_attempt(3) = 2 retries
+    @retry(
+        stop=stop_after_attempt(sink.max_retries + 1),
+        wait=wait_exponential(multiplier=0.5, min=0.5, max=5),
+        before_sleep=log_retry_attempt,
+        reraise=True,
+    )
+    def push_with_retry(result: ExecutionResult) -> None:
+        with (
+            trace(f'{sink_name}.push'),
+            metrics.timed('handled_message_output', tags=[f'sink:{sink_name}'], use_ms=True),
+            gevent.Timeout(sink.timeout),
+        ):
+            sink.push(result)
 
-        Uses tenacity for exponential backoff retries.
-        """
-        sink_name = sink.__class__.__name__
-
-        def log_retry_attempt(retry_state: RetryCallState) -> None:
-            attempt = retry_state.attempt_number
-            exception = retry_state.outcome.exception() if retry_state.outcome else None
-            logger.warning(f'Retrying sink {sink_name}, attempt {attempt}, error: {exception}')
-            metrics.increment('output_sink.retry', tags=[f'sink:{sink_name}', f'attempt:{attempt}'])
-
-        # stop_after_attempt(1) = no retries, stop_after_attempt(3) = 2 retries
-        @retry(
-            stop=stop_after_attempt(sink.max_retries + 1),
-            wait=wait_exponential(multiplier=0.5, min=0.5, max=5),
-            before_sleep=log_retry_attempt,
-            reraise=True,
+    return push_with_retry
+
+
+_QueueItem = Tuple[ExecutionResult, float, Optional[gevent.event.Event]]
+"""A result to push, when it was enqueued, and the event to set once it was pushed (for durable sinks)."""
+
+
+class _SinkWorker:
+    """Pushes results to a single sink from its own bounded queue and greenlets.
+
+    If the sink has an `affinity_feature`, each greenlet has its own queue instead, and results are routed to one by a
+    hash of that feature's value."""
+
+    __slots__ = (
+        'sink',
+        '_sink_name',
+        '_tags',
+        '_push_with_retry',
+        '_queues',
+        '_greenlets',
+        '_next_queue',
+        '_depth_reported_at',
+    )
+
+    def __init__(self, sink: BaseOutputSink, queue_size: int) -> None:
+        self.sink = sink
+        self._sink_name = sink.__class__.__name__
+        self._tags = [f'sink:{self._sink_name}']
+        self._push_with_retry = _create_push_with_retry(sink)
+        num_queues = max(sink.workers, 1) if sink.affinity_feature is not None else 1
+        self._queues: List['gevent.queue.JoinableQueue[_QueueItem]'] = [
+            gevent.queue.JoinableQueue(maxsize=max(queue_size // num_queues, 1)) for _ in range(num_queues)
+        ]
+        self._greenlets: List[gevent.Greenlet] = []
+        self._next_queue = 0
+        self._depth_reported_at = 0.0
+
+    def submit(self, result: ExecutionResult) -> Optional[gevent.event.Event]:
+        """Queues the result for the sink, if it has anything to do with it. For durable sinks, returns an event that
+        is set once the sink is done with the result, which blocks while the queue is full; other sinks drop the result
+        instead."""
+        if not self.sink.will_do_work(result):
+            return None
+        if not self._greenlets:
+            if len(self._queues) > 1:
+                self._greenlets = [gevent.spawn(self._work, queue) for queue in self._queues]
+            else:
+                self._greenlets = [gevent.spawn(self._work, self._queues[0]) for _ in range(max(self.sink.workers, 1))]
+
+        queue = self._select_queue(result)
+        if self.sink.durable:
+            done = gevent.event.Event()
+            queue.put((result, time.monotonic(), done))
+            return done
+
+        try:
+            queue.put_nowait((result, time.monotonic(), None))
+        except gevent.queue.Full:
+            metrics.increment('output_sink.dropped', tags=self._tags)
+        return None
+
+    def _select_queue(self, result: ExecutionResult) -> 'gevent.queue.JoinableQueue[_QueueItem]':
+        if len(self._queues) == 1:
+            return self._queues[0]
+
+        assert self.sink.affinity_feature is not None
+        value = result.extracted_features.get(self.sink.affinity_feature)
+        if value is None:
+            # Results without the feature have nothing to be ordered with, so spread them over the queues.
+            self._next_queue = (self._next_queue + 1) % len(self._queues)
+            return self._queues[self._next_queue]
+        return self._queues[mmh3.hash(str(value), signed=False) % len(self._queues)]
+
+    def _work(self, queue: 'gevent.queue.JoinableQueue[_QueueItem]') -> None:
+        while True:
+            result, enqueued_at, done = queue.get()
+            try:
+                now = time.monotonic()
+                metrics.timing('output_sink.lag', (now - enqueued_at) * 1000, tags=self._tags)
+                if now - self._depth_reported_at >= _QUEUE_DEPTH_REPORT_INTERVAL_SECONDS:
+                    self._depth_reported_at = now
+                    metrics.gauge('output_sink.queue_depth', sum(q.qsize() for q in self._queues), tags=self._tags)
+                self._push(result)
+            finally:
+                if done is not None:
+                    done.set()
+                queue.task_done()
+
+    def _push(self, result: ExecutionResult) -> None:
+        sink_name = self._sink_name
+        try:
+            self._push_with_retry(result)
+        except gevent.Timeout:
+            logger.exception(f'Timeout exception raised when pushing event to sink: {sink_name}')
+            metrics.increment('output_sink.timeout', tags=self._tags)
+            sentry_sdk.capture_exception()
+        except Exception as exc:
+            metrics.increment('output_sink.error', tags=[*self._tags, f'error:{exc.__class__.__name__}'])
+            sentry_sdk.capture_exception()
+
+    def drain(self, timeout: Optional[float]) -> bool:
+        """Waits for the queued results to be pushed, returning whether they all were before the timeout."""
+        if not self._greenlets:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        drained = all(
+            queue.join(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+            for queue in self._queues
         )
-        def push_with_retry(result: ExecutionResult) -> None:
-            with (
-                trace(f'{sink_name}.push'),
-                metrics.timed('handled_message_output', tags=[f'sink:{sink_name}'], use_ms=True),
-                gevent.Timeout(sink.timeout),
-            ):
-                sink.push(result)
+        gevent.killall(self._greenlets)
+        self._greenlets = []
+        if not drained:
+            lost = sum(queue.qsize() for queue in self._queues)
+            logger.error(f'Timed out draining sink {self._sink_name}, {lost} results lost')
+        return drained
+
+
+class MultiOutputSink(BaseOutputSink):
+    """An output sink that tees the execution results to multiple children sinks.
+
+    Each child sink is pushed to concurrently from its own bounded queue and `workers` greenlets, so that a slow sink
+    only delays the results that it handles. `push` returns as soon as the result is queued for every sink, except
+    for durable sinks, which it waits for (concurrently), so that actions are only acked once durable sinks are done
+    with them. Failures are retried and reported per sink, and don't affect the other sinks."""
+
+    def __init__(
+        self,
+        sinks: Sequence[BaseOutputSink],
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        stop_timeout_seconds: float = DEFAULT_STOP_TIMEOUT_SECONDS,
+    ):
+        self._sinks = sinks
+        self._workers = [_SinkWorker(sink, queue_size) for sink in sinks]
+        self._stop_timeout_seconds = stop_timeout_seconds
 
-        return push_with_retry
+    def will_do_work(self, result: ExecutionResult) -> bool:
+        return any(sink.will_do_work(result) for sink in self._sinks)
 
     def push(self, result: ExecutionResult) -> None:
-        errors: Dict[BaseOutputSink, BaseException] = {}
-
-        for sink in self._sinks:
-            if sink.will_do_work(result):
-                sink_name = sink.__class__.__name__
-                push_fn = self._create_push_with_retry(sink)
-                try:
-                    push_fn(result)
-                except gevent.Timeout as timeout_exc:
-                    logger.exception(f'Timeout exception raised when pushing event to sink: {sink_name}')
-                    errors[sink] = timeout_exc
-                    metrics.increment('output_sink.timeout', tags=[f'sink:{sink_name}'])
-                    sentry_sdk.capture_exception()
-                except Exception as exc:
-                    errors[sink] = exc
-                    metrics.increment(
-                        'output_sink.error', tags=[f'sink:{sink_name}', f'error:{exc.__class__.__name__}']
-                    )
-                    sentry_sdk.capture_exception()
+        pending: List[gevent.event.Event] = []
+        for worker in self._workers:
+            done = worker.submit(result)
+            if done is not None:
+                pending.append(done)
+
+        for done in pending:
+            done.wait()
 
     def stop(self) -> None:
-        for sink in self._sinks:
-            sink.stop()
+        deadline = time.monotonic() + self._stop_timeout_seconds
+        for worker in self._workers:
+            worker.drain(timeout=max(deadline - time.monotonic(), 0))
+            worker.sink.stop()
 
-        # TODO: Uncomment after making PartialSinkFailure more useful
-        # if errors:
-        #     raise PartialSinkFailure(errors)
+        # TODO: Raise PartialSinkFailure after making it more useful
 
 
 class StdoutOutputSink(BaseOutputSink):
@@ -183,21 +323,130 @@ def _get_label_effects_from_result(result: ExecutionResult) -> Mapping[EntityT[A
     return dict(effects)
 
 
-class LabelOutputSink(BaseOutputSink):
-    """An output sink that will send event effects to the label service."""
+LABEL_MUTATIONS: ExecutionResultView[Mapping[EntityT[Any], list[EntityLabelMutation]]] = ExecutionResultView(
+    'label_mutations', _get_label_effects_from_result
+)
+"""The label mutations to apply for a result, by entity."""
+
+
+class _LabelWrite:
+    """The mutation groups waiting to be applied to an entity in a single write, in the order they arrived."""
+
+    __slots__ = ('entity', 'mutation_groups', 'previous', 'done', 'results', 'error')
 
-    def __init__(self, labels_provider: LabelsProvider) -> None:
+    def __init__(self, entity: EntityT[Any], previous: Optional['_LabelWrite']) -> None:
+        self.entity = entity
+        self.mutation_groups: List[Sequence[EntityLabelMutation]] = []
+        self.previous = previous
+        self.done = gevent.event.Event()
+        self.results: List[EntityLabelMutationsResult] = []
+        self.error: Optional[BaseException] = None
+
+
+class LabelWriteCoalescer:
+    """Coalesces concurrent label writes to the same entity.
+
+    The first write to an entity starts right away, after `window_seconds`. Writes to the entity that arrive while it's
+    pending or in progress are queued behind it, and applied together by the next one with
+    `LabelsProvider.apply_entity_label_mutations_in_order`, in a single locked read-modify-write. A burst of actions
+    against one entity then costs a transaction per round trip rather than one per action, without changing the outcome:
+    each action's mutations are still applied in order, and each `apply` gets the result for its own mutations."""
+
+    def __init__(
+        self,
+        labels_provider: LabelsProvider,
+        window_seconds: float = DEFAULT_LABEL_WRITE_WINDOW_SECONDS,
+        max_coalesced_writes: int = DEFAULT_MAX_COALESCED_LABEL_WRITES,
+    ) -> None:
+        self._labels_provider = labels_provider
+        self._window_seconds = window_seconds
+        self._max_coalesced_writes = max_coalesced_writes
+        # The write that new mutations for an entity join, until it starts.
+        self._open_writes: Dict[EntityT[Any], _LabelWrite] = {}
+        # The last write for an entity, which the next one has to wait for.
+        self._last_writes: Dict[EntityT[Any], _LabelWrite] = {}
+
+    def apply(self, entity: EntityT[Any], mutations: Sequence[EntityLabelMutation]) -> EntityLabelMutationsResult:
+        write = self._open_writes.get(entity)
+        if write is None:
+            write = _LabelWrite(entity, previous=self._last_writes.get(entity))
+            self._open_writes[entity] = write
+            self._last_writes[entity] = write
+            gevent.spawn(self._write, write)
+
+        index = len(write.mutation_groups)
+        write.mutation_groups.append(mutations)
+        if len(write.mutation_groups) >= self._max_coalesced_writes:
+            self._close(write)
+
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.results[index]
+
+    def _close(self, write: _LabelWrite) -> None:
+        if self._open_writes.get(write.entity) is write:
+            del self._open_writes[write.entity]
+
+    def _write(self, write: _LabelWrite) -> None:
+        try:
+            gevent.sleep(self._window_seconds)
+            if write.previous is not None:
+                write.previous.done.wait()
+                write.previous = None
+            self._close(write)
+
+            metrics.histogram('label_output_sink.coalesced_writes', len(write.mutation_groups))
+            write.results = self._labels_provider.apply_entity_label_mutations_in_order(
+                write.entity, write.mutation_groups
+            )
+        except BaseException as e:
+            write.error = e
+        finally:
+            self._close(write)
+            if self._last_writes.get(write.entity) is write:
+                del self._last_writes[write.entity]
+            write.done.set()
+
+
+class LabelOutputSink(BaseOutputSink):
+    """An output sink that will send event effects to the label service.
+
+    Concurrent writes to the same entity are coalesced by a `LabelWriteCoalescer`. If `affinity_feature` is set to the
+    feature that holds the entity most results label (eg `UserId`), the writes for each of its values are made by one
+    worker, in order, rather than by several workers queueing on the entity's lock."""
+
+    # Label mutations are what rules actually act with, so don't ack actions before they are applied.
+    durable: bool = True
+    workers: int = 8
+
+    def __init__(
+        self,
+        labels_provider: LabelsProvider,
+        shared_external_service_cache: Optional[SharedExternalServiceCache] = None,
+        write_window_seconds: float = DEFAULT_LABEL_WRITE_WINDOW_SECONDS,
+        max_coalesced_writes: int = DEFAULT_MAX_COALESCED_LABEL_WRITES,
+        affinity_feature: Optional[str] = None,
+    ) -> None:
+        self.affinity_feature = affinity_feature
         self._labels_provider = labels_provider
+        self._shared_external_service_cache = shared_external_service_cache
+        self._coalescer = LabelWriteCoalescer(labels_provider, write_window_seconds, max_coalesced_writes)
 
     def will_do_work(self, result: ExecutionResult) -> bool:
-        return len(_get_label_effects_from_result(result)) > 0
+        if not result.effects.get(LabelEffect):
+            return False
+        # The mutations are computed once per result, and shared with `push`.
+        return len(result.get_view(LABEL_MUTATIONS)) > 0
 
     def push(self, result: ExecutionResult) -> None:
-        for entity, mutations in _get_label_effects_from_result(result).items():
-            _ = self._labels_provider.apply_entity_label_mutations(
-                entity,
-                mutations,
-            )
+        for entity, mutations in result.get_view(LABEL_MUTATIONS).items():
+            try:
+                _ = self._coalescer.apply(entity, mutations)
+            finally:
+                # Even a failed write may have been applied, so always drop the (possibly) stale labels.
+                if self._shared_external_service_cache is not None:
+                    self._shared_external_service_cache.invalidate(self._labels_provider, entity)
 
     def stop(self) -> None:
         self._labels_provider.stop()
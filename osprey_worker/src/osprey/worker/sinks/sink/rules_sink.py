@@ -1,10 +1,13 @@
+import itertools
 import logging
 import os
 from dataclasses import dataclass
 from random import randint
-from typing import Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import gevent
+import gevent.lock
+import gevent.queue
 import sentry_sdk
 from ddtrace import tracer
 from ddtrace.span import Span as TracerSpan
@@ -84,11 +87,8 @@ class RulesRunner:
         self._output_sink = output_sink
         self._udf_helpers = udf_helpers
 
-    def classify_one(
-        self, action: Action, tag: str, parent_tracer_span: Optional[TracerSpan] = None
-    ) -> Optional[ExecutionResult]:
-        sample_config = self._sampler.sample(action)
-        tags = [
+    def _get_metric_tags(self, action: Action, tag: str, sample_config: SampleDecision) -> List[str]:
+        return [
             tag,
             f'action:{action.action_name}',
             f'sample_rate:{sample_config.sample_rate}',
@@ -96,12 +96,30 @@ class RulesRunner:
             f'rules_hash:{self._engine.execution_graph.validated_sources.sources.hash()}',
         ]
 
-        if sample_config.drop:
-            metrics.increment('dropped_message', tags=tags)
+    def classify_one(
+        self, action: Action, tag: str, parent_tracer_span: Optional[TracerSpan] = None
+    ) -> Optional[ExecutionResult]:
+        executed = self.execute_one(action, tag, parent_tracer_span)
+        if executed is None:
             return None
-        result: Optional[ExecutionResult] = None
+        result, tags = executed
+        self.push_output(action, result, tags)
+        return result
+
+    def execute_one(
+        self, action: Action, tag: str, parent_tracer_span: Optional[TracerSpan] = None
+    ) -> Optional[Tuple[ExecutionResult, List[str]]]:
+        """The first half of `classify_one`: samples and executes the action, without pushing the result to the output
+        sink. Returns the result and the metric tags to push it with, or `None` if the action was dropped or failed to
+        execute."""
         # noinspection PyBroadException
         try:
+            sample_config = self._sampler.sample(action)
+            tags = self._get_metric_tags(action, tag, sample_config)
+
+            if sample_config.drop:
+                metrics.increment('dropped_message', tags=tags)
+                return None
             with metrics.timed('handled_message', tags=tags, use_ms=True):
                 result = self._engine.execute(
                     self._udf_helpers,
@@ -109,18 +127,124 @@ class RulesRunner:
                     sample_rate=sample_config.sample_rate,
                     parent_tracer_span=parent_tracer_span,
                 )
+            _report_profile(result, tags)
+        except BaseException:
+            sentry_sdk.capture_exception()
+            return None
+        return result, tags
+
+    def push_output(self, action: Action, result: ExecutionResult, tags: List[str]) -> None:
+        """The second half of `classify_one`: pushes the result of `execute_one` to the output sink."""
+        # noinspection PyBroadException
+        try:
             with metrics.timed('handled_output', tags=tags, use_ms=True):
                 self._output_sink.push(result)
                 info_log_osprey_action(action.action_id, action.action_name, 'pushed to output sink')
-                return result
         except BaseException:
             sentry_sdk.capture_exception()
-            return result
+
+    def execute_many(
+        self, actions: Sequence[Action], tag: str, parent_tracer_span: Optional[TracerSpan] = None
+    ) -> List[Optional[Tuple[ExecutionResult, List[str]]]]:
+        """Like `execute_one`, but executes a window of actions together (see `OspreyEngine.execute_many`), so that
+        batchable UDF calls can be shared between them. Returns what `execute_one` would have for each action, in
+        order."""
+        executed: List[Optional[Tuple[ExecutionResult, List[str]]]] = [None] * len(actions)
+        # noinspection PyBroadException
+        try:
+            sampled_indices: List[int] = []
+            sample_rates: List[int] = []
+            tags_by_index: List[List[str]] = []
+            for i, action in enumerate(actions):
+                sample_config = self._sampler.sample(action)
+                tags = self._get_metric_tags(action, tag, sample_config)
+                tags_by_index.append(tags)
+                if sample_config.drop:
+                    metrics.increment('dropped_message', tags=tags)
+                    continue
+                sampled_indices.append(i)
+                sample_rates.append(sample_config.sample_rate)
+
+            if not sampled_indices:
+                return executed
+
+            with metrics.timed(
+                'handled_message_window',
+                tags=[tag, f'rules_hash:{self._engine.execution_graph.validated_sources.sources.hash()}'],
+                use_ms=True,
+            ):
+                results = self._engine.execute_many(
+                    self._udf_helpers,
+                    [actions[i] for i in sampled_indices],
+                    sample_rates=sample_rates,
+                    parent_tracer_span=parent_tracer_span,
+                )
+            for i, result in zip(sampled_indices, results):
+                _report_profile(result, tags_by_index[i])
+                executed[i] = (result, tags_by_index[i])
+        except BaseException:
+            sentry_sdk.capture_exception()
+        return executed
+
+
+class _PipelinedMessage:
+    """An action that is going through the stages of a pipelined `RulesSink`."""
+
+    __slots__ = ('seq', 'context', 'action', 'span', 'executed')
+
+    def __init__(self, seq: int, context: BaseAckingContext[Action], action: Action, span: TracerSpan) -> None:
+        self.seq = seq
+        self.context = context
+        self.action = action
+        self.span = span
+        self.executed: Optional[Tuple[ExecutionResult, List[str]]] = None
+
+
+class _InOrderCompleter:
+    """Exits the acking contexts of pipelined messages (which acks them) in the order that they were read from the
+    input stream, regardless of the order that they finish in.
+
+    At most `max_pending` messages may be in flight at once: each one has to be `reserve`d before it is read, and
+    frees its place once it has been acked. This bounds the contexts held back behind a slow message."""
+
+    __slots__ = ('_next_seq', '_completed', '_pending')
+
+    def __init__(self, max_pending: int) -> None:
+        self._next_seq = 0
+        self._completed: Dict[int, BaseAckingContext[Action]] = {}
+        self._pending = gevent.lock.Semaphore(max_pending)
+
+    def reserve(self) -> None:
+        """Blocks until there is room for another message in flight."""
+        self._pending.acquire()
+
+    def complete(self, seq: int, context: BaseAckingContext[Action]) -> None:
+        self._completed[seq] = context
+        while self._next_seq in self._completed:
+            context = self._completed.pop(self._next_seq)
+            self._next_seq += 1
+            self._pending.release()
+            try:
+                context.__exit__(None, None, None)
+            except Exception as e:
+                logging.exception('Error while acking message in rules sink')
+                metrics.increment('rules_sink.ack_error', tags=[f'err:{e.__class__.__name__}'])
+                sentry_sdk.capture_exception(e)
 
 
 class RulesSink(BaseSink):
     """A rule sink takes an input stream, output sink and engine, executing each action produced by the input stream
-    using the given engine, and pushing the result into the output sink."""
+    using the given engine, and pushing the result into the output sink.
+
+    By default, each action is read, executed and output before the next one is read. If `prefetch_size`,
+    `execute_concurrency` or `output_concurrency` are set, the sink is pipelined instead: actions are read ahead (up to
+    `prefetch_size` of them), executed by `execute_concurrency` greenlets, and pushed to the output sink by
+    `output_concurrency` greenlets, each stage feeding the next through a bounded queue. Pushing the result of an
+    action then overlaps with the execution of the following ones. Actions are still acked in the order that they
+    were read, once they have been output.
+
+    If `execute_window` is set as well, each execute greenlet takes up to that many of the actions that are waiting
+    to be executed, and executes them together (see `RulesRunner.execute_many`)."""
 
     def __init__(
         self,
@@ -129,49 +253,209 @@ class RulesSink(BaseSink):
         output_sink: BaseOutputSink,
         udf_helpers: UDFHelpers,
         envoy_check_port: int = 8001,
+        prefetch_size: int = 0,
+        execute_concurrency: int = 1,
+        output_concurrency: int = 1,
+        execute_window: int = 1,
     ):
         self._input_stream = input_stream
         self._rules_runner = RulesRunner(engine, output_sink, udf_helpers)
         self._envoy_check_port = envoy_check_port
+        self._prefetch_size = prefetch_size
+        self._execute_concurrency = execute_concurrency
+        self._output_concurrency = output_concurrency
+        self._execute_window = execute_window
+
+    @property
+    def is_pipelined(self) -> bool:
+        return (
+            self._prefetch_size > 0
+            or self._execute_concurrency > 1
+            or self._output_concurrency > 1
+            or self._execute_window > 1
+        )
 
     def run(self) -> None:
         envoy_check_server = get_envoy_check_server(self._envoy_check_port)
         envoy_check_server.start()
+        try:
+            if self.is_pipelined:
+                self._run_pipelined()
+            else:
+                self._run_serial()
+        except gevent.GreenletExit:
+            envoy_check_server.stop()
+
+    def _run_serial(self) -> None:
         for message_context in self._input_stream:
             try:
                 with message_context as action:
-                    if action.data.get('osprey_v2_skip_async_classification', False) or action.data.get(
-                        'osprey_skip_async', False
-                    ):
+                    if _should_skip(action):
                         continue
 
                     with tracer.start_span('osprey.classify_one', child_of=None) as span:
                         tracer.context_provider.activate(span.context)
 
-                        # We usually expect the coordinator to provide the action_id, but fall back to creating our own
-                        if not action.action_id and action.action_id != 0:
-                            action.action_id = generate_snowflake(retries=3).to_int()
+                        _ensure_action_id(action)
 
                         info_log_osprey_action(action.action_id, action.action_name, 'beginning classify_one')
                         result = self._rules_runner.classify_one(action, tag='sink:rules-sink', parent_tracer_span=span)
-                        if isinstance(message_context, VerdictsAckingContext):
-                            if result is None:
-                                info_log_osprey_action(
-                                    action.action_id, action.action_name, 'execution result is None :<'
-                                )
-                                metrics.increment('rules_sink.missing_result')
-                            else:
-                                info_log_osprey_action(action.action_id, action.action_name, 'sending verdicts~')
-                                message_context.set_verdicts(result.get_verdicts_pb2_proto())
-                                metrics.increment('rules_sink.captured_verdicts')
+                        _handle_result(message_context, action, result)
                         info_log_osprey_action(action.action_id, action.action_name, 'classify_one complete')
             except gevent.GreenletExit:
-                envoy_check_server.stop()
+                raise
+            except Exception as e:
+                logging.exception('Unexpected error in rules sink')
+                metrics.increment('rules_sink.unexpected_error', tags=[f'err:{e.__class__.__name__}'])
+                sentry_sdk.capture_exception(e)
+
+    def _run_pipelined(self) -> None:
+        queue_size = max(self._prefetch_size, 1)
+        execute_queue: 'gevent.queue.Queue[Optional[_PipelinedMessage]]' = gevent.queue.Queue(maxsize=queue_size)
+        output_queue: 'gevent.queue.Queue[Optional[_PipelinedMessage]]' = gevent.queue.Queue(maxsize=queue_size)
+        # Besides the messages in the queues, each greenlet of the stages holds one (or a window of them).
+        completer = _InOrderCompleter(
+            2 * queue_size + self._execute_concurrency * max(self._execute_window, 1) + self._output_concurrency
+        )
+        executors = [
+            gevent.spawn(self._execute_stage, execute_queue, output_queue) for _ in range(self._execute_concurrency)
+        ]
+        outputters = [
+            gevent.spawn(self._output_stage, output_queue, completer) for _ in range(self._output_concurrency)
+        ]
+
+        try:
+            messages = iter(self._input_stream)
+            for seq in itertools.count():
+                completer.reserve()
+                message_context = next(messages, None)
+                if message_context is None:
+                    break
+                try:
+                    action = message_context.__enter__()
+                    if _should_skip(action):
+                        completer.complete(seq, message_context)
+                        continue
+                    _ensure_action_id(action)
+                    span = tracer.start_span('osprey.classify_one', child_of=None)
+                except Exception as e:
+                    logging.exception('Unexpected error in rules sink')
+                    metrics.increment('rules_sink.unexpected_error', tags=[f'err:{e.__class__.__name__}'])
+                    sentry_sdk.capture_exception(e)
+                    completer.complete(seq, message_context)
+                    continue
+
+                info_log_osprey_action(action.action_id, action.action_name, 'beginning classify_one')
+                execute_queue.put(_PipelinedMessage(seq, message_context, action, span))
+
+            # The input stream ended, let the stages finish what was already read.
+            for _ in executors:
+                execute_queue.put(None)
+            gevent.joinall(executors)
+            for _ in outputters:
+                output_queue.put(None)
+            gevent.joinall(outputters)
+        finally:
+            gevent.killall(executors + outputters)
+
+    def _execute_stage(
+        self,
+        execute_queue: 'gevent.queue.Queue[Optional[_PipelinedMessage]]',
+        output_queue: 'gevent.queue.Queue[Optional[_PipelinedMessage]]',
+    ) -> None:
+        while True:
+            message = execute_queue.get()
+            if message is None:
                 return
+            window = [message]
+            finished = False
+            while len(window) < self._execute_window and not execute_queue.empty():
+                next_message = execute_queue.get_nowait()
+                if next_message is None:
+                    finished = True
+                    break
+                window.append(next_message)
+
+            try:
+                # A window is executed under the span of its first action.
+                tracer.context_provider.activate(message.span.context)
+                if len(window) == 1:
+                    message.executed = self._rules_runner.execute_one(
+                        message.action, tag='sink:rules-sink', parent_tracer_span=message.span
+                    )
+                else:
+                    executed = self._rules_runner.execute_many(
+                        [message.action for message in window], tag='sink:rules-sink', parent_tracer_span=message.span
+                    )
+                    for windowed_message, windowed_executed in zip(window, executed):
+                        windowed_message.executed = windowed_executed
             except Exception as e:
                 logging.exception('Unexpected error in rules sink')
                 metrics.increment('rules_sink.unexpected_error', tags=[f'err:{e.__class__.__name__}'])
                 sentry_sdk.capture_exception(e)
+            # Messages that failed to execute go on with `executed` unset, so that they are still acked in order.
+            for windowed_message in window:
+                output_queue.put(windowed_message)
+            if finished:
+                return
+
+    def _output_stage(
+        self, output_queue: 'gevent.queue.Queue[Optional[_PipelinedMessage]]', completer: _InOrderCompleter
+    ) -> None:
+        while True:
+            message = output_queue.get()
+            if message is None:
+                return
+            action = message.action
+            tracer.context_provider.activate(message.span.context)
+            try:
+                result: Optional[ExecutionResult] = None
+                if message.executed is not None:
+                    result, tags = message.executed
+                    self._rules_runner.push_output(action, result, tags)
+                _handle_result(message.context, action, result)
+                info_log_osprey_action(action.action_id, action.action_name, 'classify_one complete')
+            except Exception as e:
+                logging.exception('Unexpected error in rules sink')
+                metrics.increment('rules_sink.unexpected_error', tags=[f'err:{e.__class__.__name__}'])
+                sentry_sdk.capture_exception(e)
+            finally:
+                message.span.finish()
+                completer.complete(message.seq, message.context)
 
     def stop(self) -> None:
         pass
+
+
+def _should_skip(action: Action) -> bool:
+    return action.data.get('osprey_v2_skip_async_classification', False) or action.data.get('osprey_skip_async', False)
+
+
+def _ensure_action_id(action: Action) -> None:
+    # We usually expect the coordinator to provide the action_id, but fall back to creating our own
+    if not action.action_id and action.action_id != 0:
+        action.action_id = generate_snowflake(retries=3).to_int()
+
+
+def _handle_result(
+    message_context: BaseAckingContext[Action], action: Action, result: Optional[ExecutionResult]
+) -> None:
+    if isinstance(message_context, VerdictsAckingContext):
+        if result is None:
+            info_log_osprey_action(action.action_id, action.action_name, 'execution result is None :<')
+            metrics.increment('rules_sink.missing_result')
+        else:
+            info_log_osprey_action(action.action_id, action.action_name, 'sending verdicts~')
+            message_context.set_verdicts(result.get_verdicts_pb2_proto())
+            metrics.increment('rules_sink.captured_verdicts')
+
+
+def _report_profile(result: ExecutionResult, tags: List[str]) -> None:
+    """Reports the timings of a profiled execution (see `OspreyEngine.execute`): of the whole execution, and of each
+    UDF (or kind of node)."""
+    profile = result.profile
+    if profile is None:
+        return
+    metrics.histogram('execution_profile.wall_ms', profile.wall_seconds * 1000, tags=tags)
+    for (kind,), timing in profile.top(None, group_by='udf'):
+        metrics.histogram('execution_profile.udf.wall_ms', timing.wall_seconds * 1000, tags=[*tags, f'udf:{kind}'])
@@ -6,10 +6,8 @@ from osprey.worker.sinks.sink.output_sink import BaseOutputSink
 class StoredExecutionResultOutputSink(BaseOutputSink):
     """An output sink that persists the execution result to an EventRecord."""
 
-    # BigTable operations can be slow and may fail transiently.
-    # Allow more time and retry on failure.
-    timeout: float = 5.0
-    max_retries: int = 2  # Up to 3 total attempts with exponential backoff
+    # Pushing only buffers the result: the stores write batches from the background, with their own retries.
+    workers: int = 8
 
     def __init__(self):
         self._service = bootstrap_execution_result_storage_service()
@@ -21,4 +19,4 @@ class StoredExecutionResultOutputSink(BaseOutputSink):
         self._service.persist_from_execution_result(result)
 
     def stop(self) -> None:
-        pass
+        self._service.close()
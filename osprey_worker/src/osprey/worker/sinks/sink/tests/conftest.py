@@ -1,6 +1,21 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
 from unittest.mock import MagicMock
 
 import pytest
+from osprey.engine.executor.execution_context import Action, ExecutionResult
+
+ACTION_TIMESTAMP = datetime(2024, 1, 1)
+"""The timestamp of the actions made by `make_action`."""
+
+
+def make_action(action_id: int) -> Action:
+    return Action(action_id=action_id, action_name='test', data={}, timestamp=ACTION_TIMESTAMP)
+
+
+def make_result(action_id: int, features: Optional[Dict[str, Any]] = None) -> ExecutionResult:
+    """Returns the result of executing `make_action(action_id)`, which extracted `features`."""
+    return ExecutionResult(extracted_features=features or {}, action=make_action(action_id), effects={}, error_infos=[])
 
 
 @pytest.fixture(scope='session')
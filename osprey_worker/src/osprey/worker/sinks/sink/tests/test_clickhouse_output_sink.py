@@ -0,0 +1,197 @@
+import json
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import gevent
+import pytest
+from osprey.worker.sinks.sink import clickhouse_output_sink
+from osprey.worker.sinks.sink.clickhouse_output_sink import ClickHouseOutputSink
+from osprey.worker.sinks.sink.tests.conftest import ACTION_TIMESTAMP, make_result
+
+_COLUMNS = [
+    ('__time', "DateTime64(3, 'UTC')", '', ''),
+    ('__action_id', 'UInt64', '', ''),
+    ('__verdicts', 'String', 'DEFAULT', "''"),
+    ('EventType', 'LowCardinality(String)', 'DEFAULT', "''"),
+    ('Kind', 'Int32', 'DEFAULT', '0'),
+    ('Tags', 'String', 'DEFAULT', "'[]'"),
+    ('Score', 'Nullable(Float64)', '', ''),
+    ('NewAccountSpam', 'UInt8', 'DEFAULT', '0'),
+    ('_extra', 'String', 'DEFAULT', "'{}'"),
+]
+
+
+class FakeClickHouseClient:
+    def __init__(self, failures: int = 0, columns: List[Any] = _COLUMNS) -> None:
+        self.failures = failures
+        self.columns = columns
+        self.inserted: List[Dict[str, List[Any]]] = []
+
+    def query(self, query: str, parameters: Dict[str, str]) -> Any:
+        assert parameters == {'database': 'osprey', 'table': 'osprey_events'}
+        return SimpleNamespace(result_rows=self.columns)
+
+    def insert(self, table: str, data: List[List[Any]], column_names: List[str], column_oriented: bool) -> None:
+        assert table == 'osprey.osprey_events'
+        assert column_oriented
+        # Yield like a network call would.
+        gevent.sleep(0)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('ClickHouse is down')
+        self.inserted.append(dict(zip(column_names, data)))
+
+
+def _inserted_ids(client: FakeClickHouseClient) -> List[Any]:
+    return [action_id for batch in client.inserted for action_id in batch['__action_id']]
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(clickhouse_output_sink, '_RETRY_BACKOFF_MIN_SECONDS', 0.001)
+
+
+def test_flushes_full_batches_in_the_background() -> None:
+    client = FakeClickHouseClient()
+    sink = ClickHouseOutputSink(client, batch_size=2)
+
+    sink.push(make_result(1))
+    sink.push(make_result(2))
+    # Pushing never inserts on the caller's greenlet.
+    assert client.inserted == []
+
+    gevent.sleep(0.01)
+    assert _inserted_ids(client) == [1, 2]
+    sink.stop()
+
+
+def test_flushes_partial_batches_after_the_flush_interval() -> None:
+    client = FakeClickHouseClient()
+    sink = ClickHouseOutputSink(client, batch_size=100, flush_interval_seconds=0.02)
+
+    sink.push(make_result(1))
+    gevent.sleep(0.05)
+    assert _inserted_ids(client) == [1]
+    sink.stop()
+
+
+def test_retries_failed_inserts_in_order() -> None:
+    client = FakeClickHouseClient(failures=2)
+    sink = ClickHouseOutputSink(client, batch_size=1)
+
+    for i in range(3):
+        sink.push(make_result(i))
+    gevent.sleep(0.05)
+
+    assert _inserted_ids(client) == [0, 1, 2]
+    assert sink._pending_rows == 0
+    sink.stop()
+
+
+def test_drops_batches_after_max_attempts() -> None:
+    client = FakeClickHouseClient(failures=3)
+    sink = ClickHouseOutputSink(client, batch_size=1, max_insert_attempts=3)
+
+    sink.push(make_result(1))
+    sink.push(make_result(2))
+    gevent.sleep(0.05)
+
+    assert _inserted_ids(client) == [2]
+    sink.stop()
+
+
+def test_drops_oldest_batches_when_full() -> None:
+    client = FakeClickHouseClient(failures=1000)
+    sink = ClickHouseOutputSink(client, batch_size=2, max_pending_rows=4, backpressure_timeout_seconds=0.01)
+
+    for i in range(6):
+        sink.push(make_result(i))
+    assert sink._pending_rows + sink._buffer.row_count <= 4
+
+    client.failures = 0
+    gevent.sleep(0.05)
+    sink.stop()
+    # The first batch is either being retried by the flusher (and is kept), or was dropped to make room.
+    assert _inserted_ids(client)[-2:] == [4, 5]
+    assert len(_inserted_ids(client)) == 4
+
+
+def test_drops_the_buffer_when_nothing_else_is_pending() -> None:
+    client = FakeClickHouseClient(failures=1000)
+    # The buffer alone fills up before it is ever queued for insertion.
+    sink = ClickHouseOutputSink(
+        client, batch_size=10, flush_interval_seconds=60, max_pending_rows=2, backpressure_timeout_seconds=0.01
+    )
+
+    for i in range(5):
+        sink.push(make_result(i))
+        assert sink._pending_rows + sink._buffer.row_count <= 2
+
+    client.failures = 0
+    sink.stop()
+    assert _inserted_ids(client) == [4]
+
+
+def test_stop_flushes_buffered_rows() -> None:
+    client = FakeClickHouseClient()
+    sink = ClickHouseOutputSink(client, batch_size=100, flush_interval_seconds=60)
+
+    sink.push(make_result(1))
+    sink.stop()
+    assert _inserted_ids(client) == [1]
+
+
+def test_writes_features_to_their_columns() -> None:
+    client = FakeClickHouseClient()
+    sink = ClickHouseOutputSink(client, batch_size=100)
+
+    sink.push(
+        make_result(
+            1,
+            {
+                'EventType': 'post',
+                'Kind': 1,
+                'Tags': [['e', 'abc']],
+                'Score': 0.5,
+                'NewAccountSpam': True,
+                'Unknown': {'a': 1},
+                '__internal': 'skipped',
+            },
+        )
+    )
+    # A later row with fewer features, and a value of the wrong type.
+    sink.push(make_result(2, {'Kind': 'not a number', 'Score': None}))
+    sink.stop()
+
+    [batch] = client.inserted
+    assert batch == {
+        '__time': [ACTION_TIMESTAMP, ACTION_TIMESTAMP],
+        '__action_id': [1, 2],
+        '__verdicts': ['', ''],
+        'EventType': ['post', ''],
+        'Kind': [1, 0],
+        'Tags': ['[["e", "abc"]]', '[]'],
+        'Score': [0.5, None],
+        'NewAccountSpam': [1, 0],
+        '_extra': [json.dumps({'Unknown': {'a': 1}}), json.dumps({'Kind': 'not a number'})],
+    }
+
+
+def test_drops_unmatched_features_without_extra_column() -> None:
+    client = FakeClickHouseClient(columns=_COLUMNS[:2])
+    sink = ClickHouseOutputSink(client)
+
+    sink.push(make_result(1, {'Unknown': 1}))
+    sink.stop()
+    assert client.inserted == [{'__time': [ACTION_TIMESTAMP], '__action_id': [1]}]
+
+
+def test_writes_extra_values_that_are_not_json() -> None:
+    client = FakeClickHouseClient()
+    sink = ClickHouseOutputSink(client)
+
+    sink.push(make_result(1, {'Kind': ACTION_TIMESTAMP, 'SeenAt': ACTION_TIMESTAMP}))
+    sink.stop()
+
+    [batch] = client.inserted
+    assert json.loads(batch['_extra'][0]) == {'Kind': str(ACTION_TIMESTAMP), 'SeenAt': str(ACTION_TIMESTAMP)}
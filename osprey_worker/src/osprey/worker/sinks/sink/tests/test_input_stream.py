@@ -1,8 +1,17 @@
-from typing import Iterator, List
+import json
+from typing import Any, Callable, Dict, Iterator, List, Set
 
 import gevent
 import gevent.event
-from osprey.worker.sinks.sink.input_stream import BaseInputStream
+import pytest
+from kafka.consumer.fetcher import ConsumerRecord
+from kafka.errors import CommitFailedError
+from kafka.structs import OffsetAndMetadata, TopicPartition
+from osprey.worker.sinks.sink import input_stream
+from osprey.worker.sinks.sink.input_stream import BaseInputStream, KafkaInputStream
+from osprey.worker.sinks.utils.acking_contexts import KafkaAckingContext, NoopAckingContext
+from osprey.worker.sinks.utils.action_decoding import decode_kafka_action
+from osprey.worker.sinks.utils.kafka import KafkaOffsetTracker
 
 
 def test_does_not_lock_non_generator_iterator() -> None:
@@ -84,3 +93,214 @@ def test_does_lock_generator_iterator() -> None:
 
     assert g1.get() == 1
     assert g2.get() == 2
+
+
+_PARTITION = TopicPartition('actions', 0)
+
+
+def _record(offset: int, value: bytes = b'') -> ConsumerRecord:
+    value = (
+        value
+        or json.dumps(
+            {
+                'send_time': '2024-01-01T00:00:00Z',
+                'data': {'action_id': str(offset), 'action_name': 'test', 'data': {'offset': offset}},
+            }
+        ).encode()
+    )
+    return ConsumerRecord(
+        topic=_PARTITION.topic,
+        partition=_PARTITION.partition,
+        offset=offset,
+        timestamp=0,
+        timestamp_type=0,
+        key=None,
+        value=value,
+        headers=[],
+        checksum=None,
+        serialized_key_size=-1,
+        serialized_value_size=len(value),
+        serialized_header_size=-1,
+    )
+
+
+class FakeConsumer:
+    def __init__(self, batches: List[List[ConsumerRecord]], failed_commits: int = 0) -> None:
+        self.batches = batches
+        self.failed_commits = failed_commits
+        self.polls: List[int] = []
+        self.commits: List[Dict[TopicPartition, OffsetAndMetadata]] = []
+        self.sync_commits: List[Dict[TopicPartition, OffsetAndMetadata]] = []
+        self.closed = False
+
+    def assignment(self) -> Set[TopicPartition]:
+        return {_PARTITION}
+
+    def highwater(self, partition: TopicPartition) -> int:
+        return 10
+
+    def position(self, partition: TopicPartition) -> int:
+        return 4
+
+    def commit(self, offsets: Dict[TopicPartition, OffsetAndMetadata]) -> None:
+        self.sync_commits.append(offsets)
+
+    def close(self, autocommit: bool) -> None:
+        self.closed = True
+
+    def poll(self, timeout_ms: int, max_records: int) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        self.polls.append(max_records)
+        if not self.batches:
+            gevent.sleep(timeout_ms / 1000)
+            return {}
+        return {_PARTITION: self.batches.pop(0)}
+
+    def commit_async(self, offsets: Dict[TopicPartition, OffsetAndMetadata], callback: Callable[..., Any]) -> None:
+        self.commits.append(offsets)
+        if self.failed_commits:
+            self.failed_commits -= 1
+            callback(offsets, CommitFailedError('rebalancing'))
+        else:
+            callback(offsets, None)
+
+
+def test_offset_tracker_commits_up_to_the_first_record_not_done() -> None:
+    tracker = KafkaOffsetTracker()
+    generation = 0
+    for offset in range(4):
+        generation = tracker.track(_PARTITION, offset)
+
+    tracker.done(_PARTITION, 1, generation)
+    assert tracker.take_committable() == {}
+    tracker.done(_PARTITION, 0, generation)
+    assert tracker.take_committable() == {_PARTITION: OffsetAndMetadata(2, '')}
+    assert tracker.take_committable() == {}
+    tracker.done(_PARTITION, 3, generation)
+    assert tracker.num_pending == 2
+    tracker.done(_PARTITION, 2, generation)
+    assert tracker.take_committable() == {_PARTITION: OffsetAndMetadata(4, '')}
+    assert tracker.num_pending == 0
+
+
+def test_offset_tracker_ignores_records_of_forgotten_partitions() -> None:
+    tracker = KafkaOffsetTracker()
+    old_generation = tracker.track(_PARTITION, 0)
+    tracker.forget([_PARTITION])
+    assert tracker.num_pending_in([_PARTITION]) == 0
+
+    # The partition is assigned again, and the record is read again.
+    generation = tracker.track(_PARTITION, 0)
+    tracker.track(_PARTITION, 1)
+    tracker.done(_PARTITION, 0, old_generation)
+    assert tracker.take_committable() == {}
+    tracker.done(_PARTITION, 0, generation)
+    assert tracker.take_committable() == {_PARTITION: OffsetAndMetadata(1, '')}
+
+
+def test_kafka_input_stream_yields_batches() -> None:
+    consumer = FakeConsumer([[_record(0), _record(1)]])
+    stream = KafkaInputStream(consumer, max_records=2)  # type: ignore[arg-type]
+
+    contexts = [next(stream), next(stream)]
+    assert all(isinstance(context, NoopAckingContext) for context in contexts)
+    assert [context._item.data for context in contexts] == [{'offset': 0}, {'offset': 1}]
+    assert consumer.polls == [2]
+
+
+def test_kafka_input_stream_commits_acked_offsets() -> None:
+    consumer = FakeConsumer([[_record(0), _record(1, b'not json'), _record(2)], [_record(3)]])
+    stream = KafkaInputStream(consumer, commit_offsets=True, commit_interval_seconds=0)  # type: ignore[arg-type]
+
+    first, second = next(stream), next(stream)
+    assert isinstance(first, KafkaAckingContext)
+    # The record that couldn't be decoded is skipped, and doesn't hold up the commits.
+    assert second._item.data == {'offset': 2}
+    with second:
+        pass
+    third = next(stream)
+    assert consumer.commits == []
+
+    with first:
+        pass
+    with third:
+        pass
+    gevent.spawn(next, stream).join(timeout=0.01)
+    assert consumer.commits == [{_PARTITION: OffsetAndMetadata(4, '')}]
+
+
+def test_kafka_input_stream_commits_again_after_a_failed_commit(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(input_stream, 'DEFAULT_KAFKA_POLL_TIMEOUT_MS', 10)
+    consumer = FakeConsumer([[_record(0)]], failed_commits=1)
+    stream = KafkaInputStream(consumer, commit_offsets=True, commit_interval_seconds=0)  # type: ignore[arg-type]
+
+    with next(stream):
+        pass
+    # The partition has no more records, but the offset is still committed again.
+    gevent.spawn(next, stream).join(timeout=0.05)
+    assert consumer.commits == [{_PARTITION: OffsetAndMetadata(1, '')}] * 2
+
+
+def test_offset_tracker_restores_offsets_only_if_not_committable_further() -> None:
+    tracker = KafkaOffsetTracker()
+    generation = tracker.track(_PARTITION, 0)
+    tracker.track(_PARTITION, 1)
+    tracker.done(_PARTITION, 0, generation)
+    failed = tracker.take_committable()
+    generations = {_PARTITION: tracker.generation_of(_PARTITION)}
+
+    tracker.done(_PARTITION, 1, generation)
+    tracker.restore(failed, generations)
+    assert tracker.take_committable() == {_PARTITION: OffsetAndMetadata(2, '')}
+
+    tracker.restore(failed, generations)
+    assert tracker.take_committable() == failed
+
+    tracker.forget([_PARTITION])
+    tracker.restore(failed, generations)
+    assert tracker.take_committable() == {}
+
+
+def test_kafka_input_stream_drains_revoked_partitions() -> None:
+    consumer = FakeConsumer([[_record(0), _record(1)]])
+    stream = KafkaInputStream(consumer, commit_offsets=True, commit_interval_seconds=60)  # type: ignore[arg-type]
+    first, second = next(stream), next(stream)
+    with first:
+        pass
+
+    # Revoking the partition waits for the action that is still being handled.
+    revoker = gevent.spawn(stream.rebalance_listener().on_partitions_revoked, {_PARTITION})
+    gevent.sleep(0.02)
+    assert not revoker.ready()
+    with second:
+        pass
+    revoker.join(timeout=1)
+    assert consumer.sync_commits == [{_PARTITION: OffsetAndMetadata(2, '')}]
+
+
+def test_kafka_input_stream_gives_up_draining_after_a_timeout() -> None:
+    consumer = FakeConsumer([[_record(0)]])
+    stream = KafkaInputStream(  # type: ignore[arg-type]
+        consumer, commit_offsets=True, commit_interval_seconds=60, drain_timeout_seconds=0.01
+    )
+    context = next(stream)
+
+    stream.rebalance_listener().on_partitions_revoked({_PARTITION})
+    assert consumer.sync_commits == []
+    # Acking it after the partition was handed over doesn't commit anything.
+    with context:
+        pass
+    stream.stop()
+    stream.close()
+    assert consumer.sync_commits == [] and consumer.closed
+
+
+def test_decode_kafka_action_keeps_data_sent_as_json() -> None:
+    # Not how `json.dumps` would encode the data, to tell that it is kept as it was sent.
+    data_json = '{"user_id":"abc","post":{"text":"hi"}}'
+    action = {'action_id': '1', 'action_name': 'create_post', 'data': data_json}
+    as_object = decode_kafka_action(json.dumps({'send_time': '2024-01-01T00:00:00Z', 'data': action}).encode())
+    as_string = decode_kafka_action(json.dumps({'send_time': '2024-01-01T00:00:00Z', 'data': json.dumps(action)}))
+
+    assert as_object == as_string
+    assert as_object.data == {'user_id': 'abc', 'post': {'text': 'hi'}}
+    assert as_object.data_json == as_string.data_json == data_json
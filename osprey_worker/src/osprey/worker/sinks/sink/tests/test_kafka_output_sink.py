@@ -0,0 +1,100 @@
+from typing import Any, Callable, Dict, List, Optional
+
+import gevent
+from kafka.errors import KafkaTimeoutError
+from osprey.worker.sinks.sink.kafka_output_sink import KafkaOutputSink
+from osprey.worker.sinks.sink.tests.conftest import make_result
+
+
+class FakeFuture:
+    def __init__(self) -> None:
+        self.callbacks: List[Callable[[Any], None]] = []
+        self.errbacks: List[Callable[[Exception], None]] = []
+
+    def add_callback(self, callback: Callable[[Any], None]) -> None:
+        self.callbacks.append(callback)
+
+    def add_errback(self, errback: Callable[[Exception], None]) -> None:
+        self.errbacks.append(errback)
+
+    def ack(self) -> None:
+        for callback in self.callbacks:
+            callback(None)
+
+    def fail(self, e: Exception) -> None:
+        for errback in self.errbacks:
+            errback(e)
+
+
+class FakeProducer:
+    def __init__(self, buffer_full: bool = False) -> None:
+        self.buffer_full = buffer_full
+        self.sent: List[Dict[str, Any]] = []
+        self.futures: List[FakeFuture] = []
+        self.flushed = False
+        self.closed = False
+
+    def send(self, topic: str, key: Optional[bytes], value: bytes) -> FakeFuture:
+        if self.buffer_full:
+            raise KafkaTimeoutError('buffer full')
+        self.sent.append({'topic': topic, 'key': key, 'value': value})
+        future = FakeFuture()
+        self.futures.append(future)
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        for future in self.futures:
+            future.ack()
+        self.flushed = True
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self.closed = True
+
+
+def test_keys_records_by_the_partition_key_feature() -> None:
+    producer = FakeProducer()
+    sink = KafkaOutputSink('topic', producer, partition_key_feature='UserId')  # type: ignore[arg-type]
+
+    sink.push(make_result(1, {'UserId': 123}))
+    sink.push(make_result(2))
+
+    assert [record['key'] for record in producer.sent] == [b'123', None]
+    assert producer.sent[0]['topic'] == 'topic'
+
+
+def test_drops_records_when_too_many_are_in_flight() -> None:
+    producer = FakeProducer()
+    sink = KafkaOutputSink('topic', producer, max_in_flight=2, backpressure_timeout_seconds=0.01)  # type: ignore[arg-type]
+
+    for i in range(3):
+        sink.push(make_result(i))
+    assert len(producer.sent) == 2
+
+    # Acknowledging a record makes space, including for a push that is waiting.
+    pusher = gevent.spawn(sink.push, make_result(3))
+    gevent.sleep(0)
+    producer.futures[0].ack()
+    pusher.join()
+    assert len(producer.sent) == 3
+
+    producer.futures[1].fail(ConnectionError('down'))
+    producer.futures[2].ack()
+    assert sink._in_flight == 0
+
+
+def test_drops_records_when_the_producer_buffer_is_full() -> None:
+    producer = FakeProducer(buffer_full=True)
+    sink = KafkaOutputSink('topic', producer)  # type: ignore[arg-type]
+
+    sink.push(make_result(1))
+    assert sink._in_flight == 0
+
+
+def test_stop_flushes_the_producer() -> None:
+    producer = FakeProducer()
+    sink = KafkaOutputSink('topic', producer)  # type: ignore[arg-type]
+
+    sink.push(make_result(1))
+    sink.stop()
+    assert producer.flushed and producer.closed
+    assert sink._in_flight == 0
@@ -0,0 +1,227 @@
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import gevent
+import gevent.event
+import pytest
+from osprey.engine.executor.execution_context import ExecutionResult
+from osprey.engine.language_types.entities import EntityT
+from osprey.worker.adaptor import plugin_manager
+from osprey.worker.lib.config import Config
+from osprey.worker.lib.osprey_shared.labels import (
+    EntityLabelMutation,
+    EntityLabelMutationsResult,
+    EntityLabels,
+    LabelStatus,
+)
+from osprey.worker.lib.singletons import LABELS_PROVIDER, SHARED_EXTERNAL_SERVICE_CACHE
+from osprey.worker.lib.storage.labels import LabelsProvider
+from osprey.worker.sinks.sink.output_sink import BaseOutputSink, LabelOutputSink, LabelWriteCoalescer, MultiOutputSink
+from osprey.worker.sinks.sink.tests.conftest import make_result
+
+
+class RecordingSink(BaseOutputSink):
+    def __init__(self, release: gevent.event.Event, fail: bool = False) -> None:
+        self.release = release
+        self.fail = fail
+        self.pushed: List[int] = []
+        self.stopped = False
+
+    def will_do_work(self, result: ExecutionResult) -> bool:
+        return True
+
+    def push(self, result: ExecutionResult) -> None:
+        self.release.wait()
+        if self.fail:
+            raise ValueError('sink failed')
+        self.pushed.append(result.action.action_id)
+
+    def stop(self) -> None:
+        self.stopped = True
+
+
+class DurableRecordingSink(RecordingSink):
+    durable = True
+
+
+def _released() -> gevent.event.Event:
+    event = gevent.event.Event()
+    event.set()
+    return event
+
+
+def test_push_does_not_wait_for_non_durable_sinks() -> None:
+    release = gevent.event.Event()
+    slow = RecordingSink(release)
+    fast = RecordingSink(_released())
+    sink = MultiOutputSink([slow, fast])
+
+    sink.push(make_result(1))
+    gevent.sleep(0)
+    assert slow.pushed == []
+    assert fast.pushed == [1]
+
+    release.set()
+    sink.stop()
+    assert slow.pushed == [1]
+    assert slow.stopped and fast.stopped
+
+
+def test_push_waits_for_durable_sinks() -> None:
+    release = gevent.event.Event()
+    durable = DurableRecordingSink(release)
+    sink = MultiOutputSink([durable])
+
+    pusher = gevent.spawn(sink.push, make_result(1))
+    gevent.sleep(0.01)
+    assert not pusher.ready()
+
+    release.set()
+    pusher.join(timeout=1)
+    assert pusher.successful()
+    assert durable.pushed == [1]
+    sink.stop()
+
+
+def test_failing_sink_does_not_affect_others() -> None:
+    failing = DurableRecordingSink(_released(), fail=True)
+    working = DurableRecordingSink(_released())
+    sink = MultiOutputSink([failing, working])
+
+    sink.push(make_result(1))
+    sink.push(make_result(2))
+    assert working.pushed == [1, 2]
+    sink.stop()
+
+
+def test_drops_results_when_non_durable_queue_is_full() -> None:
+    release = gevent.event.Event()
+    slow = RecordingSink(release)
+    sink = MultiOutputSink([slow], queue_size=2)
+
+    for i in range(5):
+        sink.push(make_result(i))
+        gevent.sleep(0)
+    release.set()
+    sink.stop()
+    # One result is being pushed, two are queued, and the rest are dropped.
+    assert slow.pushed == [0, 1, 2]
+
+
+class AffinitySink(BaseOutputSink):
+    durable = True
+    workers = 4
+    affinity_feature = 'UserId'
+
+    def __init__(self) -> None:
+        self.pushed: Dict[Optional[str], List[int]] = {}
+        self.active: Set[Optional[str]] = set()
+        self.max_active = 0
+
+    def will_do_work(self, result: ExecutionResult) -> bool:
+        return True
+
+    def push(self, result: ExecutionResult) -> None:
+        user_id = result.extracted_features.get('UserId')
+        assert user_id is None or user_id not in self.active, 'pushed results for the same user concurrently'
+        self.active.add(user_id)
+        self.max_active = max(self.max_active, len(self.active))
+        gevent.sleep(0.001 * (result.action.action_id % 3))
+        self.pushed.setdefault(user_id, []).append(result.action.action_id)
+        self.active.discard(user_id)
+
+    def stop(self) -> None:
+        pass
+
+
+def test_routes_results_by_affinity_feature() -> None:
+    affinity = AffinitySink()
+    sink = MultiOutputSink([affinity])
+
+    results = [make_result(i, {'UserId': f'user-{i % 3}'}) for i in range(30)] + [make_result(30), make_result(31)]
+    gevent.joinall([gevent.spawn(sink.push, result) for result in results])
+    sink.stop()
+
+    # Each user's results are pushed one at a time, in order, while different users' are pushed concurrently.
+    assert affinity.pushed == {
+        **{f'user-{u}': [i for i in range(30) if i % 3 == u] for u in range(3)},
+        None: [30, 31],
+    }
+    assert affinity.max_active > 1
+
+
+class BlockingLabelsProvider(LabelsProvider):
+    """Records the groups of mutations written per entity, holding each write until released."""
+
+    def __init__(self) -> None:
+        self.release = gevent.event.Event()
+        self.writes: List[List[List[str]]] = []
+
+    def apply_entity_label_mutations_in_order(
+        self, entity: EntityT[Any], mutation_groups: Sequence[Sequence[EntityLabelMutation]]
+    ) -> List[EntityLabelMutationsResult]:
+        self.writes.append([[m.reason_name for m in mutations] for mutations in mutation_groups])
+        self.release.wait()
+        if entity.id == 'broken':
+            raise ConnectionError('down')
+        return [
+            EntityLabelMutationsResult(
+                new_entity_labels=EntityLabels(),
+                old_entity_labels=EntityLabels(),
+                labels_updated=[m.reason_name for m in mutations],
+            )
+            for mutations in mutation_groups
+        ]
+
+
+def _mutation(reason_name: str) -> EntityLabelMutation:
+    return EntityLabelMutation(label_name='spam', reason_name=reason_name, status=LabelStatus.ADDED)
+
+
+def test_label_write_coalescer_coalesces_writes_to_an_entity() -> None:
+    provider = BlockingLabelsProvider()
+    coalescer = LabelWriteCoalescer(provider, max_coalesced_writes=3)
+    user = EntityT(type='User', id='1')
+
+    greenlets = [gevent.spawn(coalescer.apply, user, [_mutation(str(i))]) for i in range(6)]
+    gevent.sleep(0)
+    other = gevent.spawn(coalescer.apply, EntityT(type='User', id='2'), [_mutation('other')])
+    gevent.sleep(0.01)
+    # The first write is in progress, and the next is queued behind it.
+    assert provider.writes == [[['0'], ['1'], ['2']], [['other']]]
+
+    provider.release.set()
+    gevent.joinall([*greenlets, other])
+    assert provider.writes == [[['0'], ['1'], ['2']], [['other']], [['3'], ['4'], ['5']]]
+    # Each caller gets the result for its own mutations.
+    assert [greenlet.value.labels_updated for greenlet in greenlets] == [[str(i)] for i in range(6)]
+    assert coalescer._open_writes == {} and coalescer._last_writes == {}
+
+
+def test_label_write_coalescer_raises_write_errors_to_every_caller() -> None:
+    provider = BlockingLabelsProvider()
+    provider.release.set()
+    coalescer = LabelWriteCoalescer(provider)
+    broken = EntityT(type='User', id='broken')
+
+    greenlets = [gevent.spawn(coalescer.apply, broken, [_mutation(str(i))]) for i in range(2)]
+    gevent.joinall(greenlets)
+    assert provider.writes == [[['0'], ['1']]]
+    assert all(isinstance(greenlet.exception, ConnectionError) for greenlet in greenlets)
+
+
+def test_bootstrapped_label_output_sink_routes_by_affinity_feature(monkeypatch: pytest.MonkeyPatch) -> None:
+    labels_provider = BlockingLabelsProvider()
+    monkeypatch.setattr(plugin_manager, 'load_all_osprey_plugins', lambda: None)
+    monkeypatch.setattr(plugin_manager.plugin_manager.hook, 'register_output_sinks', lambda config: [])
+    monkeypatch.setattr(
+        plugin_manager.plugin_manager.hook, 'register_label_output_sink', lambda config, labels_provider: None
+    )
+    monkeypatch.setattr(LABELS_PROVIDER, 'instance', lambda: labels_provider)
+    monkeypatch.setattr(SHARED_EXTERNAL_SERVICE_CACHE, 'instance', lambda: None)
+
+    sink = plugin_manager.bootstrap_output_sinks(Config({'OSPREY_LABEL_OUTPUT_AFFINITY_FEATURE': 'UserId'}))
+
+    assert isinstance(sink, MultiOutputSink)
+    [label_sink] = sink._sinks
+    assert isinstance(label_sink, LabelOutputSink)
+    assert label_sink.affinity_feature == 'UserId'
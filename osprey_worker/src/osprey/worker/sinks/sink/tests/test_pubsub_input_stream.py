@@ -7,8 +7,10 @@ import pytest
 from _pytest.fixtures import FixtureRequest
 from google.pubsub_v1 import PubsubMessage
 from osprey.engine.executor.execution_context import Action
+from osprey.worker.lib.action_proto_deserializer import ActionProtoDeserializer, ActionProtoDeserializeResult
 from osprey.worker.lib.encryption.envelope import Envelope
 from osprey.worker.sinks.sink.input_stream import AsyncPubSubOspreyActionInputStream
+from osprey.worker.sinks.utils.action_decoding import PubSubActionDecoder
 
 
 @pytest.fixture(params=[True, False])
@@ -63,3 +65,25 @@ def test_secret_decryption(pubsub_subscriber_mock: MagicMock, osprey_action_msgp
         pubsub_message = PubsubMessage(data=osprey_action_msgpack, attributes=attributes)
         pubsub_input_stream._create_action(pubsub_message)
         assert envelope_mock.decrypt.called == with_encryption
+
+
+@pytest.mark.parametrize('as_json', [True, False])
+def test_decodes_both_msgpack_formats(osprey_action: Action, as_json: bool) -> None:
+    action_dict = {'id': osprey_action.action_id, 'name': osprey_action.action_name, 'data': osprey_action.data}
+    data = msgpack.dumps(json.dumps(action_dict) if as_json else action_dict)
+    assert PubSubActionDecoder().decode(data, 'msgpack', None) == osprey_action
+
+
+class FakeProtoDeserializer(ActionProtoDeserializer):
+    def proto_bytes_to_dict(self, data: bytes) -> ActionProtoDeserializeResult:
+        return ActionProtoDeserializeResult(data={'raw': data.decode()}, action_id=1, action_name='proto_action')
+
+
+def test_looks_up_the_proto_deserializer_once() -> None:
+    lookup = MagicMock(return_value=FakeProtoDeserializer())
+    decoder = PubSubActionDecoder()
+    with patch('osprey.worker.adaptor.plugin_manager.bootstrap_action_proto_deserializer', lookup):
+        actions = [decoder.decode(b'abc', 'proto', None) for _ in range(3)]
+
+    assert lookup.call_count == 1
+    assert actions[0] == Action(action_id=1, action_name='proto_action', data={'raw': 'abc'}, timestamp=None)
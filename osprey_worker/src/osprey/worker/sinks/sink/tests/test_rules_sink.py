@@ -0,0 +1,246 @@
+from typing import Iterator, List, Optional, Sequence, Tuple
+from unittest.mock import MagicMock
+
+import gevent
+import gevent.event
+import pytest
+from osprey.engine.executor.execution_context import Action, ExecutionResult
+from osprey.engine.executor.node_profiler import ExecutionProfile, NodeTiming
+from osprey.worker.lib.instruments import metrics
+from osprey.worker.sinks.sink.input_stream import BaseInputStream
+from osprey.worker.sinks.sink.output_sink import BaseOutputSink
+from osprey.worker.sinks.sink.rules_sink import ActionSampler, RulesRunner, RulesSink, _InOrderCompleter
+from osprey.worker.sinks.sink.tests.conftest import make_action
+from osprey.worker.sinks.utils.acking_contexts import BaseAckingContext, VerdictsAckingContext
+
+_OUTPUT_SECONDS = 0.02
+
+
+class RecordingContext(VerdictsAckingContext[Action]):
+    def __init__(self, item: Action, acked: List[int]) -> None:
+        super().__init__(item)
+        self._acked = acked
+
+    def _ack(self) -> None:
+        self._acked.append(self._item.action_id)
+
+
+class ListInputStream(BaseInputStream[BaseAckingContext[Action]]):
+    def __init__(self, contexts: List[RecordingContext]) -> None:
+        super().__init__()
+        self._contexts = contexts
+
+    def _gen(self) -> Iterator[BaseAckingContext[Action]]:
+        yield from self._contexts
+
+
+class SlowOutputSink(BaseOutputSink):
+    def __init__(self) -> None:
+        self.pushed: List[int] = []
+
+    def will_do_work(self, result: ExecutionResult) -> bool:
+        return True
+
+    def push(self, result: ExecutionResult) -> None:
+        # Later actions are output faster, so that they finish out of order.
+        gevent.sleep(_OUTPUT_SECONDS / (result.action.action_id + 1))
+        self.pushed.append(result.action.action_id)
+
+    def stop(self) -> None:
+        pass
+
+
+def _make_engine() -> MagicMock:
+    engine = MagicMock()
+    engine.get_config_subkey.return_value.get_action_config.return_value = None
+
+    def execute(udf_helpers: object, action: Action, **kwargs: object) -> ExecutionResult:
+        return ExecutionResult(extracted_features={}, action=action, effects={}, error_infos=[])
+
+    def execute_many(udf_helpers: object, actions: List[Action], **kwargs: object) -> List[ExecutionResult]:
+        return [execute(udf_helpers, action) for action in actions]
+
+    engine.execute.side_effect = execute
+    engine.execute_many.side_effect = execute_many
+    return engine
+
+
+def _run(
+    num_actions: int,
+    engine: Optional[MagicMock] = None,
+    output_sink: Optional[SlowOutputSink] = None,
+    **pipeline_kwargs: int,
+) -> List[int]:
+    acked: List[int] = []
+    contexts = [RecordingContext(make_action(i), acked) for i in range(num_actions)]
+    output_sink = output_sink or SlowOutputSink()
+    sink = RulesSink(
+        engine=engine or _make_engine(),
+        input_stream=ListInputStream(contexts),
+        output_sink=output_sink,
+        udf_helpers=MagicMock(),
+        **pipeline_kwargs,
+    )
+    sink._run_pipelined() if sink.is_pipelined else sink._run_serial()
+
+    assert sorted(output_sink.pushed) == list(range(num_actions))
+    assert all(context.get_verdicts() is not None for context in contexts)
+    return acked
+
+
+def test_serial_sink_acks_each_action() -> None:
+    assert _run(5) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('prefetch_size,execute_concurrency,output_concurrency', [(4, 1, 4), (0, 2, 1), (8, 2, 8)])
+def test_pipelined_sink_acks_in_order(prefetch_size: int, execute_concurrency: int, output_concurrency: int) -> None:
+    acked = _run(
+        10,
+        prefetch_size=prefetch_size,
+        execute_concurrency=execute_concurrency,
+        output_concurrency=output_concurrency,
+    )
+    assert acked == list(range(10))
+
+
+@pytest.mark.parametrize('execute_concurrency', [1, 2])
+def test_pipelined_sink_executes_windows(execute_concurrency: int) -> None:
+    engine = _make_engine()
+    acked = _run(10, engine=engine, prefetch_size=10, execute_concurrency=execute_concurrency, execute_window=4)
+    assert acked == list(range(10))
+
+    windows = [[action.action_id for action in call.args[1]] for call in engine.execute_many.call_args_list]
+    assert sorted(action_id for window in windows for action_id in window) == list(range(10))
+    assert all(len(window) <= 4 for window in windows)
+    assert any(len(window) > 1 for window in windows)
+    engine.execute.assert_not_called()
+
+
+@pytest.mark.parametrize('execute_window', [1, 3])
+@pytest.mark.parametrize('failure', ['sampler', 'engine', 'runner'])
+def test_pipelined_sink_acks_actions_that_fail_to_execute(
+    monkeypatch: pytest.MonkeyPatch, failure: str, execute_window: int
+) -> None:
+    def fail_on(action_ids: Sequence[int]) -> None:
+        if 4 in action_ids:
+            raise ValueError('failed')
+
+    engine = _make_engine()
+    if failure == 'sampler':
+        sample = ActionSampler.sample
+        monkeypatch.setattr(
+            ActionSampler, 'sample', lambda self, action: fail_on([action.action_id]) or sample(self, action)
+        )
+    elif failure == 'engine':
+        execute, execute_many = engine.execute.side_effect, engine.execute_many.side_effect
+        engine.execute.side_effect = lambda udf_helpers, action, **kwargs: (
+            fail_on([action.action_id]) or execute(udf_helpers, action)
+        )
+        engine.execute_many.side_effect = lambda udf_helpers, actions, **kwargs: (
+            fail_on([action.action_id for action in actions]) or execute_many(udf_helpers, actions)
+        )
+    else:
+        execute_one, execute_many = RulesRunner.execute_one, RulesRunner.execute_many
+        monkeypatch.setattr(
+            RulesRunner,
+            'execute_one',
+            lambda self, action, *args, **kwargs: (
+                fail_on([action.action_id]) or execute_one(self, action, *args, **kwargs)
+            ),
+        )
+        monkeypatch.setattr(
+            RulesRunner,
+            'execute_many',
+            lambda self, actions, *args, **kwargs: (
+                fail_on([action.action_id for action in actions]) or execute_many(self, actions, *args, **kwargs)
+            ),
+        )
+
+    acked: List[int] = []
+    contexts = [RecordingContext(make_action(i), acked) for i in range(10)]
+    output_sink = SlowOutputSink()
+    sink = RulesSink(
+        engine=engine,
+        input_stream=ListInputStream(contexts),
+        output_sink=output_sink,
+        udf_helpers=MagicMock(),
+        prefetch_size=4,
+        execute_window=execute_window,
+    )
+    sink._run_pipelined()
+
+    assert acked == list(range(10))
+    assert 4 not in output_sink.pushed
+    assert contexts[4].get_verdicts() is None
+
+
+def test_pipelined_sink_overlaps_output() -> None:
+    output_started = [gevent.event.Event() for _ in range(10)]
+    overlapped: List[bool] = []
+
+    class RecordingOutputSink(SlowOutputSink):
+        def push(self, result: ExecutionResult) -> None:
+            output_started[result.action.action_id].set()
+            super().push(result)
+
+    engine = _make_engine()
+    execute = engine.execute.side_effect
+
+    def execute_after_previous_output(udf_helpers: object, action: Action, **kwargs: object) -> ExecutionResult:
+        # Serially, the previous action is only output once this one has been executed, so this would time out.
+        if action.action_id > 0:
+            overlapped.append(output_started[action.action_id - 1].wait(timeout=1))
+        return execute(udf_helpers, action, **kwargs)
+
+    engine.execute.side_effect = execute_after_previous_output
+    acked = _run(10, engine=engine, output_sink=RecordingOutputSink(), prefetch_size=10, output_concurrency=10)
+    assert overlapped == [True] * 9
+    assert acked == list(range(10))
+
+
+def test_in_order_completer_bounds_pending_messages() -> None:
+    acked: List[int] = []
+    contexts = [RecordingContext(make_action(i), acked) for i in range(3)]
+    completer = _InOrderCompleter(max_pending=2)
+    completer.reserve()
+    completer.reserve()
+    reserving = gevent.spawn(completer.reserve)
+    gevent.sleep(0)
+    assert not reserving.ready()
+
+    # The second message finishing first is held back, and doesn't free up a place.
+    completer.complete(1, contexts[1])
+    gevent.sleep(0)
+    assert not reserving.ready()
+    assert acked == []
+
+    completer.complete(0, contexts[0])
+    reserving.join(timeout=1)
+    assert reserving.ready()
+    assert acked == [0, 1]
+
+
+def test_rules_runner_reports_execution_profiles(monkeypatch: pytest.MonkeyPatch) -> None:
+    histograms: List[Tuple[str, float, List[str]]] = []
+    monkeypatch.setattr(
+        metrics, 'histogram', lambda metric, value, tags: histograms.append((metric, round(value, 6), tags))
+    )
+    profile = ExecutionProfile()
+    profile._timings[('main.sml', 'Feature', 'Udf')] = NodeTiming(2, 0.003, 0.001)
+    profile._timings[('main.sml', 'Other', 'Udf')] = NodeTiming(1, 0.001, 0.001)
+    profile._wall_seconds = 0.0025
+
+    engine = _make_engine()
+    engine.execute.side_effect = lambda udf_helpers, action, **kwargs: ExecutionResult(
+        extracted_features={}, action=action, effects={}, error_infos=[], profile=profile
+    )
+    runner = RulesRunner(engine, SlowOutputSink(), MagicMock())
+    action = make_action(1)
+    executed = runner.execute_one(action, tag='test')
+    assert executed is not None
+    _, tags = executed
+
+    assert histograms == [
+        ('execution_profile.wall_ms', 2.5, tags),
+        ('execution_profile.udf.wall_ms', 4.0, [*tags, 'udf:Udf']),
+    ]
@@ -4,12 +4,15 @@ from types import TracebackType
 from typing import Dict, Generic, List, Optional, Type, TypeVar, Union
 
 import gevent
+import gevent.event
 from google.api_core.exceptions import DeadlineExceeded
 from google.cloud.pubsub_v1 import SubscriberClient
 from google.cloud.pubsub_v1.subscriber.message import Message
+from kafka.structs import TopicPartition
 from osprey.rpc.common.v1.verdicts_pb2 import Verdicts
 from osprey.worker.lib.instruments import metrics
 from osprey.worker.lib.osprey_shared.logging import get_logger
+from osprey.worker.sinks.utils.kafka import KafkaOffsetTracker
 
 logger = get_logger()
 
@@ -85,6 +88,7 @@ class VerdictsAckingContext(NoopAckingContext[_T]):
     def __init__(self, item: _T) -> None:
         super().__init__(item)
         self._verdicts: Optional[Verdicts] = None
+        self._done = gevent.event.Event()
 
     def set_verdicts(self, verdicts: Verdicts) -> None:
         self._verdicts = verdicts
@@ -92,6 +96,41 @@ class VerdictsAckingContext(NoopAckingContext[_T]):
     def get_verdicts(self) -> Optional[Verdicts]:
         return self._verdicts
 
+    def __exit__(
+        self,
+        exc_type: Union[Type[BaseException], None],
+        exc_value: Union[BaseException, None],
+        exc_traceback: Union[TracebackType, None],
+    ) -> None:
+        super().__exit__(exc_type, exc_value, exc_traceback)
+        self._done.set()
+
+    def wait_until_done(self) -> None:
+        """Blocks until the context was exited, ie until the action was fully handled and its verdicts are set."""
+        self._done.wait()
+
+
+class KafkaAckingContext(BaseAckingContext[_T]):
+    """A context manager for handling a single record from a Kafka partition.
+
+    Exiting the context marks the record as done in the stream's `KafkaOffsetTracker`, which lets its offset be
+    committed once every earlier record of the partition is done too. Kafka can't redeliver a single record, so a
+    NACK'ed record is counted and skipped like an ACK'ed one."""
+
+    def __init__(self, item: _T, offset_tracker: KafkaOffsetTracker, partition: TopicPartition, offset: int) -> None:
+        super().__init__(item)
+        self._offset_tracker = offset_tracker
+        self._partition = partition
+        self._offset = offset
+        self._generation = offset_tracker.track(partition, offset)
+
+    def _ack(self) -> None:
+        self._offset_tracker.done(self._partition, self._offset, self._generation)
+
+    def _nack(self) -> None:
+        metrics.increment('kafka_consumer.nack', tags=[f'topic:{self._partition.topic}'])
+        self._offset_tracker.done(self._partition, self._offset, self._generation)
+
 
 class PubSubMessageAckingContext(BaseAckingContext[_T]):
     """A context manager for handling single pubsub messages using the push method.
@@ -0,0 +1,96 @@
+"""Decoders that turn the messages consumed by the rules sink's input streams into `Action`s.
+
+Each input stream is given a decoder, so the decoding of a message is picked once per stream (or by the message's
+`encoding` attribute) rather than found out by trying each format in turn.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import msgpack
+from osprey.engine.executor.execution_context import Action
+from osprey.worker.lib.action_proto_deserializer import ActionProtoDeserializer
+from osprey.worker.lib.osprey_shared.logging import get_logger
+from osprey.worker.lib.utils.dates import parse_go_timestamp
+
+logger = get_logger()
+
+KafkaActionDecoder = Callable[[bytes], Action]
+"""Decodes the value of a Kafka record into an `Action`."""
+
+
+def decode_kafka_action(value: bytes) -> Action:
+    """Decodes a Kafka record in the JSON envelope the input stream is fed with: the action under `data`, alongside
+    the `send_time` of the producer.
+
+    Either the action or its own `data` may be a string of JSON rather than an object. When the action's `data` is,
+    that JSON is kept as the action's `raw_data_json`, so that output sinks don't have to encode the data again."""
+    envelope = json.loads(value)
+    action = envelope['data']
+    if isinstance(action, str):
+        action = json.loads(action)
+    data = action['data']
+    raw_data_json = None
+    if isinstance(data, str):
+        raw_data_json = data
+        data = json.loads(raw_data_json)
+    return Action(
+        action_id=int(action['action_id']),
+        action_name=action['action_name'],
+        data=data,
+        timestamp=parse_go_timestamp(envelope['send_time']),
+        raw_data_json=raw_data_json,
+    )
+
+
+def _action_from_dict(action: Dict[str, Any], timestamp: Optional[datetime]) -> Action:
+    return Action(
+        action_id=int(action['id']),
+        action_name=action['name'],
+        data=action['data'],
+        secret_data=action.get('secret_data', {}),
+        timestamp=timestamp,
+    )
+
+
+class PubSubActionDecoder:
+    """Decodes the data of PubSub messages into `Action`s, by the message's `encoding` attribute.
+
+    Messages encoded as `proto` are decoded by the plugin-registered `ActionProtoDeserializer`, which is looked up on
+    the first such message and then reused. Anything else, or `proto` messages when no deserializer is registered, is
+    msgpack: either a map of the action (the old format) or a string of its JSON (the new format)."""
+
+    def __init__(self, proto_deserializer: Optional[ActionProtoDeserializer] = None) -> None:
+        self._proto_deserializer = proto_deserializer
+        self._proto_deserializer_loaded = proto_deserializer is not None
+
+    def decode(self, data: bytes, encoding: Optional[str], timestamp: Optional[datetime]) -> Action:
+        if encoding == 'proto':
+            deserializer = self._get_proto_deserializer()
+            if deserializer is not None:
+                res = deserializer.proto_bytes_to_dict(data)
+                return Action(
+                    action_id=res.action_id,
+                    action_name=res.action_name,
+                    data=res.data,
+                    timestamp=timestamp,
+                )
+        return self.decode_msgpack(data, timestamp)
+
+    @staticmethod
+    def decode_msgpack(data: bytes, timestamp: Optional[datetime]) -> Action:
+        action = msgpack.loads(data)
+        if isinstance(action, (str, bytes)):
+            action = json.loads(action)
+        return _action_from_dict(action, timestamp)
+
+    def _get_proto_deserializer(self) -> Optional[ActionProtoDeserializer]:
+        if not self._proto_deserializer_loaded:
+            from osprey.worker.adaptor.plugin_manager import bootstrap_action_proto_deserializer
+
+            self._proto_deserializer = bootstrap_action_proto_deserializer()
+            self._proto_deserializer_loaded = True
+            if self._proto_deserializer is None:
+                logger.warning('Proto deserializer plugin not available, falling back to JSON processing')
+        return self._proto_deserializer
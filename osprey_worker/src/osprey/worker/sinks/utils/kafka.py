@@ -1,6 +1,8 @@
-from typing import Any
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Set
 
 from kafka import KafkaConsumer
+from kafka.structs import OffsetAndMetadata, TopicPartition
 
 from .gevent import FairRLock
 
@@ -11,3 +13,73 @@ class PatchedKafkaConsumer(KafkaConsumer):  # type: ignore
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
         self._client._lock = FairRLock()
+
+
+class KafkaOffsetTracker:
+    """Tracks the records handed out from each partition, and which of them are done, to work out how far each
+    partition can be committed: up to, but not including, its earliest record that isn't done yet.
+
+    Records can be done in any order, eg when several sinks consume from the same stream, without the committed offset
+    ever getting ahead of a record that is still being handled. Once a partition is forgotten, eg because it was
+    revoked, records of it that were handed out before are ignored when they are done."""
+
+    def __init__(self) -> None:
+        # The offsets handed out per partition that aren't committable yet, in the order they were handed out.
+        self._pending: Dict[TopicPartition, Deque[int]] = {}
+        self._done: Dict[TopicPartition, Set[int]] = {}
+        # The offsets that can be committed, since they were last taken.
+        self._committable: Dict[TopicPartition, int] = {}
+        # Bumped whenever a partition is forgotten, so that its records from before can be told apart.
+        self._generations: Dict[TopicPartition, int] = {}
+
+    def track(self, partition: TopicPartition, offset: int) -> int:
+        """Tracks a record that is handed out, returning the generation to mark it as done with."""
+        self._pending.setdefault(partition, deque()).append(offset)
+        return self._generations.get(partition, 0)
+
+    def done(self, partition: TopicPartition, offset: int, generation: int) -> None:
+        pending = self._pending.get(partition)
+        if not pending or generation != self._generations.get(partition, 0):
+            return
+        done = self._done.setdefault(partition, set())
+        done.add(offset)
+        committable = None
+        while pending and pending[0] in done:
+            committable = pending.popleft()
+            done.discard(committable)
+        if committable is not None:
+            # A committed offset is the offset of the next record to consume.
+            self._committable[partition] = committable + 1
+
+    def forget(self, partitions: Iterable[TopicPartition]) -> None:
+        """Stops tracking the partitions, dropping their records that aren't done yet and their committable offsets."""
+        for partition in partitions:
+            self._pending.pop(partition, None)
+            self._done.pop(partition, None)
+            self._committable.pop(partition, None)
+            self._generations[partition] = self._generations.get(partition, 0) + 1
+
+    def take_committable(self) -> Dict[TopicPartition, OffsetAndMetadata]:
+        """Returns the offsets that became committable since the last call."""
+        committable, self._committable = self._committable, {}
+        return {partition: OffsetAndMetadata(offset, '') for partition, offset in committable.items()}
+
+    def generation_of(self, partition: TopicPartition) -> int:
+        return self._generations.get(partition, 0)
+
+    def restore(self, offsets: Dict[TopicPartition, OffsetAndMetadata], generations: Dict[TopicPartition, int]) -> None:
+        """Makes taken offsets whose commit failed committable again, for the partitions that weren't forgotten since
+        (as of `generations`) and that can't be committed further already."""
+        for partition, offset_and_metadata in offsets.items():
+            if generations.get(partition) != self.generation_of(partition):
+                continue
+            committable = self._committable.get(partition)
+            if committable is None or committable < offset_and_metadata.offset:
+                self._committable[partition] = offset_and_metadata.offset
+
+    def num_pending_in(self, partitions: Iterable[TopicPartition]) -> int:
+        return sum(len(self._pending.get(partition, ())) for partition in partitions)
+
+    @property
+    def num_pending(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())